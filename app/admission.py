@@ -0,0 +1,134 @@
+""" Admission control (load shedding) of the threaded engine:
+instead of blocking the accept loop when all workers are busy (-> sockets
+pile up in the kernel backlog, clients see timeouts), the server answers
+extra connections with a cheap pre-serialized `503` + `Retry-After`:
+- queue limit: at most `max_tasks` connections are queued or in work,
+  more are rejected right in the accept loop
+- queue delay (CoDel-style): when a worker takes a connection from the
+  queue, its wait time (sojourn) is checked. if waits stayed above
+  `target` for a whole `interval`, the server is overloaded (not just a
+  burst) -> connections which waited too long are dropped, the oldest
+  first (the queue is FIFO), at a rate growing with sqrt(drops) until a
+  wait below `target` is seen again
+decisions are reported by `metrics` (http_shed_connections_total)
+"""
+
+import math
+import time
+import socket
+from threading import Lock
+
+from app.http.response import HTTPResponse, PreSerializedResponse
+from app.http.status import STATUS_MESSAGES
+
+
+def service_unavailable(retry_after: int) -> PreSerializedResponse:
+    return PreSerializedResponse(HTTPResponse(
+        status_code=503,
+        headers={"retry-after": str(retry_after), "connection": "close"},
+        body=STATUS_MESSAGES[503].encode(),
+        mem_type="text/plain",
+    ))
+
+
+class AdmissionController:
+
+    def __init__(
+        self,
+        max_tasks: int,
+        retry_after: int = 1,
+        codel_enabled: bool = True,
+        target: float = 0.05,
+        interval: float = 0.5
+    ):
+        self.max_tasks: int = max_tasks
+        self.codel_enabled: bool = codel_enabled
+        self.target: float = target
+        self.interval: float = interval
+        self.rejection: PreSerializedResponse = service_unavailable(
+            retry_after
+        )
+        self._tasks: int = 0  # queued + in work
+        self._queued: int = 0
+        self._lock = Lock()
+        # CoDel state
+        self._first_above_time: float = 0.0
+        self._dropping: bool = False
+        self._drop_next: float = 0.0
+        self._drop_count: int = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def tasks(self) -> int:
+        """ connections queued or in work """
+        return self._tasks
+
+    def try_admit(self) -> bool:
+        """ (accept loop) reserve a place in the queue, or False if full """
+        with self._lock:
+            if self._tasks >= self.max_tasks:
+                return False
+            self._tasks += 1
+            self._queued += 1
+            return True
+
+    def dequeue(self, queued_at: float) -> bool:
+        """ (worker-thread) a queued connection is taken for work.
+        returns False if it must be dropped (queue delay is too high) """
+        now = time.perf_counter()
+        sojourn = now - queued_at
+        with self._lock:
+            self._queued -= 1
+            if not self.codel_enabled:
+                return True
+            return not self._should_drop(sojourn, now)
+
+    def release(self):
+        """ (done-callback) the connection is done """
+        with self._lock:
+            self._tasks -= 1
+
+    def reject(self, connection: socket.socket, respond: bool = True):
+        """ send the pre-serialized 503 (without blocking) and close.
+        (respond=False -> only close: before a TLS handshake, nothing can
+        be sent, and the handshake itself would block) """
+        if not respond:
+            connection.close()
+            return
+        try:
+            connection.setblocking(False)
+            connection.sendmsg(self.rejection.buffers())
+            connection.shutdown(socket.SHUT_WR)
+            # (unread request bytes would turn close() into a reset, which
+            # may discard the 503 before the client reads it)
+            while connection.recv(65536):
+                pass
+        except OSError:
+            pass
+        finally:
+            connection.close()
+
+    def _should_drop(self, sojourn: float, now: float) -> bool:
+        """ (with lock) CoDel control law (RFC 8289), on dequeue """
+        if sojourn < self.target or self._queued == 0:
+            self._first_above_time = 0.0
+            self._dropping = False
+            return False
+        if self._first_above_time == 0.0:
+            self._first_above_time = now + self.interval
+            return False
+        if now < self._first_above_time:
+            return False
+        # waits stayed above target for a whole interval -> drop
+        if not self._dropping:
+            self._dropping = True
+            self._drop_count = 1
+        elif now >= self._drop_next:
+            self._drop_count += 1
+        else:
+            return False
+        self._drop_next = now + self.interval / math.sqrt(self._drop_count)
+        return True
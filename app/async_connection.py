@@ -0,0 +1,478 @@
+import os
+import time
+import asyncio
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import settings
+from app.logging import logger, connection_logger, access_log
+from app.buffer import ReceiveBuffer
+
+from app.http.parser import HTTPParser, HTTPParseError
+from app.http.body import SpooledRequestBody, READ_CHUNK_SIZE
+from app.http.streaming import ChunkedWriter, iterate_on_loop
+from app.http.status import STATUS_MESSAGES
+from app.http.response import HTTPResponse, BodyType, FileBody
+from app.http.request import HTTPRequest
+from app.handler import RequestHandler
+from app.connection import (
+    ConnectionHandler, CONTINUE_RESPONSE, LINGER_TIMEOUT
+)
+from app.metrics import metrics
+from app.timers import TimerWheel, ConnectionDeadlines, KeepAlivePolicy
+from app.http.h2 import (
+    PREFACE, PREFACE_TAIL, SWITCHING_PROTOCOLS_RESPONSE, upgrade_settings
+)
+from app.h2_connection import AsyncH2ConnectionHandler
+
+
+class AsyncConnectionHandler:
+    """
+    Handle a single client connection lifecycle on the asyncio event-loop.
+    (same work cycle as `ConnectionHandler`, but waiting for the client
+    never blocks a thread -> idle keep-alive connections are almost free)
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        conn_timeout: float,
+        timers: TimerWheel,
+        policy: KeepAlivePolicy,
+        executor: Optional[ThreadPoolExecutor] = None
+    ):
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self.address = writer.get_extra_info("peername")
+        # (handshake is done already, by the transport)
+        self._tls: bool = writer.get_extra_info("ssl_object") is not None
+        self._running: bool = True
+        # (max wait of a single read of the body without any progress)
+        self.conn_timeout: float = conn_timeout
+        self.policy: KeepAlivePolicy = policy
+        # (the wheel is advanced on the event-loop -> so are callbacks)
+        self._timers: TimerWheel = timers
+        self._deadlines = ConnectionDeadlines(timers, self._on_deadline)
+        self._expired: Optional[str] = None  # (name of expired deadline)
+        self._body_decoder = None  # (of the current request)
+        # if provided, `RequestHandler` runs on it (not on the loop)
+        self._executor: Optional[ThreadPoolExecutor] = executor
+
+    async def handle_connection(self):
+        """
+        Main connection loop to handle Http-Requests-Response cycle.
+        steps are the same as `ConnectionHandler.handle_connection()`:
+        1- extracts raw-request and builds HTTPRequest-Obj
+        2- analyze HTTPRequest-Obj and build a proper HTTPResponse-Obj
+           (on the loop, or on the executor if it's provided). the body is
+           received (after `100 Continue`, if expected) only if the request
+           passes the pre-body admission hook
+        3- send Http-Response bytes ('chunked' or 'at once')
+        4- decide whether to keep connection alive or not
+        (deadlines are the same as `ConnectionHandler`'s)
+        """
+
+        if self._alpn_protocol() == "h2":  # (negotiated by TLS ALPN)
+            await self._serve_h2(PREFACE)
+            return
+
+        requests_count = 0  # num of requests is served on this connection
+        max_requests = self.policy.max_requests()
+        self._deadlines.phase("header", settings.HEADER_READ_TIMEOUT)
+        self._deadlines.start_request(settings.REQUEST_TIMEOUT)
+        while self._running and requests_count < max_requests:
+            try:
+                # step_1: raw-request -> HTTPRequest-Obj
+                status_code = 400
+                try:
+                    request = await self._extract_raw_request(
+                        requests_count > 0
+                    )
+                except HTTPParseError as err:  # malformed / too large
+                    logger.info("[!] Failed to parse request: %s", err)
+                    request, status_code = None, err.status_code
+                if request is None:
+                    response_obj = HTTPResponse(
+                        status_code=status_code,
+                        body=STATUS_MESSAGES[status_code].encode(),
+                        mem_type="text/plain"
+                    )
+                    await self._send(response_obj.build_response_buffers())
+                    await self._lingering_close()
+                    break
+
+                # HTTP/2 (prior knowledge / `Upgrade: h2c`) -> the rest of
+                # the connection is handled by `AsyncH2ConnectionHandler`
+                if await self._switch_to_h2(request):
+                    break
+
+                # step_2: analyze HTTPRequest-Obj -> proper HTTPResponse-Obj
+                try:
+                    request_started = time.perf_counter()
+                    body_time = 0.0
+                    request.client = self.address
+                    response_obj = RequestHandler.admit_request(
+                        request, self.address
+                    )
+                    if response_obj is None:  # (accepted)
+                        body_time = await self._receive_body(request)
+                        response_obj = await self._handle_request(request)
+                    self._deadlines.end_request()
+                    metrics.observe_phase(
+                        "handler",
+                        time.perf_counter() - request_started - body_time,
+                    )
+                except HTTPParseError as err:  # (while reading the body)
+                    logger.info("[!] Failed to read request body: %s", err)
+                    response_obj = HTTPResponse(
+                        status_code=err.status_code,
+                        body=STATUS_MESSAGES[err.status_code].encode(),
+                        mem_type="text/plain"
+                    )
+                    await self._send(response_obj.build_response_buffers())
+                    await self._lingering_close()
+                    break
+                except Exception as e:
+                    if self._expired is not None:
+                        raise asyncio.TimeoutError(f"{self._expired} deadline")
+                    logger.exception("Error while handling request: %s", e)
+                    response_obj = HTTPResponse(
+                        status_code=500,
+                        body=b"Internal Server Error",
+                        mem_type="text/plain"
+                    )
+                    await self._send(response_obj.build_response_buffers())
+                    break
+
+                # step_3: send Http-Response bytes
+                try:
+                    started = time.perf_counter()
+                    await self._send_response_obj(response_obj)
+                    sent_at = time.perf_counter()
+                    metrics.observe_phase("send", sent_at - started)
+                    metrics.request_done(
+                        response_obj.status_code, requests_count > 0
+                    )
+                    access_log.log(
+                        self.address, request, response_obj,
+                        sent_at - request_started,
+                    )
+                finally:
+                    response_obj.close()
+                    if request.stream is not None:
+                        request.stream.close()  # (spooled body)
+
+                # step_4 : decide whether to keep connection alive or not
+                # (a rejected body is never received -> lingering close)
+                if not (
+                    self._body_decoder is None or self._body_decoder.done
+                ):
+                    await self._lingering_close()
+                    break
+                if ConnectionHandler._keep_connection_alive(request):
+                    requests_count += 1
+                    max_requests = self.policy.max_requests()
+                    self._deadlines.phase(
+                        "idle", self.policy.keepalive_timeout()
+                    )
+                    continue
+                break
+
+            except asyncio.TimeoutError:
+                if self._expired in ("header", "body"):
+                    await self._send_timeout_response()
+                logger.debug(
+                    "Connection timed out (%s)", self._expired or "read"
+                )
+                break
+            except (ConnectionResetError, BrokenPipeError):
+                logger.debug("Connection reset by peer")
+                break
+            except Exception as e:
+                if self._expired is not None:
+                    logger.debug("Request deadline exceeded: %s", e)
+                    break
+                logger.exception("Unexpected connection error: %s", e)
+                break
+        else:
+            if requests_count >= max_requests:
+                connection_logger.info(
+                    "Connection from '%s:%s' reached max-requests-limitation",
+                    *self.address[:2]
+                )
+
+        self._deadlines.cancel()
+        self._running = False
+
+    async def _lingering_close(self):
+        """ same as `ConnectionHandler._lingering_close()`: EOF (if the
+        transport can send it, TLS can't), then drain what's in flight """
+        self._deadlines.cancel()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + LINGER_TIMEOUT
+        drained = 0
+        try:
+            if self.writer.can_write_eof():
+                self.writer.write_eof()
+            while drained < settings.MAX_BODY_DRAIN_SIZE:
+                data = await asyncio.wait_for(
+                    self.reader.read(65536), deadline - loop.time()
+                )
+                if not data:
+                    break
+                drained += len(data)
+        except (OSError, asyncio.TimeoutError):
+            pass
+
+    async def _switch_to_h2(self, request: HTTPRequest) -> bool:
+        """ same as `ConnectionHandler._switch_to_h2()` (the preface's tail
+        & frames are still in StreamReader's buffer) """
+        if not settings.HTTP2_ENABLED or self._tls:
+            return False
+        upgrade = None
+        if (request.method, request.path, request.version) == (
+            "PRI", "*", "HTTP/2.0"
+        ):
+            preface = PREFACE_TAIL
+        else:
+            h2_settings = upgrade_settings(request)
+            if h2_settings is None:
+                return False
+            upgrade, preface = (request, h2_settings), PREFACE
+            await self._send([SWITCHING_PROTOCOLS_RESPONSE])
+        await self._serve_h2(preface, upgrade)
+        return True
+
+    async def _serve_h2(self, preface: bytes, upgrade=None):
+        self._deadlines.cancel()
+        await AsyncH2ConnectionHandler(
+            self.reader, self.writer, self._timers, self.policy,
+            self._executor, preface, upgrade,
+        ).handle_connection()
+
+    def _alpn_protocol(self) -> Optional[str]:
+        if not self._tls:
+            return None
+        ssl_object = self.writer.get_extra_info("ssl_object")
+        return ssl_object.selected_alpn_protocol()
+
+    def _on_deadline(self, name: str):
+        """ (on the loop) a deadline expired -> the pending read fails with
+        TimeoutError (a `408` can still be sent), the transport is aborted
+        too for `request` """
+        if name == "body" and self._body_decoder is None:
+            return
+        self._expired = name
+        self.reader.set_exception(asyncio.TimeoutError(f"{name} deadline"))
+        if name == "request":
+            self.writer.transport.abort()
+
+    async def _send_timeout_response(self):
+        """ `408` (then the connection is closed) """
+        response_obj = HTTPResponse(
+            status_code=408,
+            headers={"connection": "close"},
+            body=STATUS_MESSAGES[408].encode(),
+            mem_type="text/plain",
+        )
+        try:
+            await self._send(response_obj.build_response_buffers())
+        except OSError:
+            pass
+
+    async def _extract_raw_request(
+        self, keep_alive: bool = False
+    ) -> HTTPRequest | None:
+        """ extract raw Http-Request from stream and make HTTPRequest-Obj
+        (raise HTTPParseError if request is malformed or exceeds limits) """
+
+        header_part = await self._read_until_body_header_terminator(
+            keep_alive
+        )
+        if not header_part:
+            connection_logger.info(
+                "[-] Empty request from '%s:%d'", *self.address[:2]
+            )
+            return None
+
+        started = time.perf_counter()
+        method, path, version, headers = HTTPParser.parse_request_head(
+            header_part
+        )
+
+        # (body is received later, only if the request is admitted)
+        self._body_decoder = HTTPParser.get_body_decoder(headers)
+        metrics.observe_phase("parse", time.perf_counter() - started)
+        return HTTPRequest(method, path, version, headers)
+
+    async def _receive_body(self, request: HTTPRequest) -> float:
+        """ send `100 Continue` if client waits for it, then receive the
+        body into `request.stream` (a spooled body).
+        returns the time it took (seconds) """
+        if self._body_decoder is None:
+            return 0.0
+        started = time.perf_counter()
+        self._deadlines.phase("body", settings.BODY_READ_TIMEOUT)
+        if ConnectionHandler._expects_continue(request):
+            await self._send([CONTINUE_RESPONSE])
+        request.stream = SpooledRequestBody(
+            await self._spool_body(self._body_decoder),
+            HTTPParser.get_content_length(request.headers),
+        )
+        self._deadlines.end_phase()
+        elapsed = time.perf_counter() - started
+        metrics.observe_phase("body", elapsed)
+        return elapsed
+
+    async def _spool_body(self, decoder) -> BinaryIO:
+        """
+        receive & decode the whole body (Content-Length or chunked) into a
+        temporary file, which spills to disk past `BODY_SPOOL_THRESHOLD`.
+        never reads more than what belongs to the body from the stream
+        (-> next pipelined request stays in StreamReader's buffer)
+        raise HTTPParseError: for malformed/too large bodies
+        """
+        buffer = ReceiveBuffer(4096)
+        file = SpooledTemporaryFile(max_size=settings.BODY_SPOOL_THRESHOLD)
+        try:
+            while True:
+                piece = decoder.decode(buffer, READ_CHUNK_SIZE)
+                if piece is None:  # decoder needs more bytes
+                    if decoder.needs_line:
+                        read = self.reader.readuntil(b"\r\n")
+                    else:
+                        read = self.reader.read(
+                            min(decoder.pending, READ_CHUNK_SIZE)
+                        )
+                    data = await asyncio.wait_for(read, self.conn_timeout)
+                    if not data:
+                        raise asyncio.IncompleteReadError(b"", None)
+                    buffer.write(data)
+                elif piece:
+                    file.write(piece)
+                else:  # end of body
+                    break
+        except asyncio.IncompleteReadError:
+            file.close()
+            raise HTTPParseError("Client closed while sending body")
+        except asyncio.LimitOverrunError:
+            file.close()
+            raise HTTPParseError("Chunk-size line is too long")
+        except BaseException:
+            file.close()
+            raise
+        file.seek(0)
+        return file
+
+    async def _read_until_body_header_terminator(
+        self, keep_alive: bool = False
+    ) -> bytes:
+        """
+        Read from stream until the terminator ('\r\n\r\n') is found.
+        Extra bytes (start of body / next request) stay in StreamReader's
+        buffer. returns the header_part (data before terminator)
+        (on a keep-alive connection, the first byte is awaited under the
+        idle deadline, the rest under the header & request deadlines)
+        """
+
+        terminator = b"\r\n\r\n"
+        first = b""
+        try:
+            if keep_alive:
+                first = await self.reader.read(1)
+                if not first:
+                    return b""
+                self._deadlines.phase("header", settings.HEADER_READ_TIMEOUT)
+                self._deadlines.start_request(settings.REQUEST_TIMEOUT)
+            data = first + await self.reader.readuntil(terminator)
+        except asyncio.IncompleteReadError as err:
+            logger.debug("socket closed by peer while waiting for terminator")
+            return first + err.partial
+        except asyncio.LimitOverrunError:  # (limit of StreamReader)
+            raise HTTPParseError("Request header fields too large", 431)
+        self._deadlines.end_phase()
+        return data[:-len(terminator)]
+
+    async def _handle_request(self, request: HTTPRequest) -> HTTPResponse:
+        """ run `RequestHandler` on the loop, or on the executor if any """
+
+        if self._executor is None:
+            return RequestHandler.get_response(request)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, RequestHandler.get_response, request
+        )
+
+    async def _send_response_obj(self, response_obj: HTTPResponse):
+        """ send Http-Response: 'chunked transferring', a file (sendfile)
+        or the whole Response 'at once' """
+
+        if (
+            response_obj.is_streamed()
+            and not response_obj.is_for_head_method
+        ):
+            await self._send(response_obj.build_response_buffers())
+            await self._stream_chunks(response_obj)
+        elif response_obj.has_file_parts():
+            await self._send(response_obj.build_response_buffers())
+            if response_obj.file_body is not None:
+                await self._sendfile(response_obj.file_body)
+            else:
+                for part in response_obj.body_parts:
+                    if isinstance(part, FileBody):
+                        await self._sendfile(part)
+                    else:
+                        self.writer.write(part)
+                await self.writer.drain()
+        else:
+            await self._send(response_obj.build_response_buffers())
+
+    async def _stream_chunks(self, response_obj: HTTPResponse):
+        """
+        send chunks of body as coalesced chunk frames (see
+        `app/http/streaming.py`), waiting for `drain()` after each frame
+        (backpressure). pending chunks are flushed when the producer is
+        idle until they're due (`CHUNKED_FLUSH_INTERVAL`)
+        """
+        writer = ChunkedWriter(
+            settings.CHUNKED_COALESCE_SIZE,
+            settings.CHUNKED_FLUSH_INTERVAL,
+            framed=response_obj.chunked,
+        )
+        chunks = iterate_on_loop(response_obj.iter_body(), writer)
+        try:
+            async for chunk in chunks:
+                frame = writer.write(chunk)
+                if frame:
+                    await self._send_frame(frame)
+        finally:
+            await chunks.aclose()
+        await self._send_frame(writer.finish(response_obj.trailers))
+
+    async def _send_frame(self, frame: list[BodyType]):
+        """ write a chunk frame: small frames are written at once (one
+        segment on the wire), large payloads are written without joining """
+        if sum(len(buf) for buf in frame) <= settings.CHUNKED_COALESCE_SIZE:
+            self.writer.writelines(frame)
+            await self.writer.drain()
+        else:
+            await self._send(frame)
+
+    async def _sendfile(self, file_body: FileBody):
+        """ send a file region by `loop.sendfile()` (uses `os.sendfile()`
+        where possible, otherwise falls back to read + write) """
+        loop = asyncio.get_running_loop()
+        # (a private file-object, the cached fd is shared between requests)
+        with os.fdopen(os.dup(file_body.fd), "rb") as file:
+            await loop.sendfile(
+                self.writer.transport, file, file_body.offset, file_body.count
+            )
+
+    async def _send(self, buffers: list[BodyType]):
+        """ write buffers (without joining them) to the transport and wait
+        until it's flushed enough """
+        for buf in buffers:
+            self.writer.write(buf)
+        await self.writer.drain()
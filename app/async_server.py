@@ -0,0 +1,211 @@
+from typing import Optional
+import ssl
+import asyncio
+import socket
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import settings
+from app.logging import logger, connection_logger
+from app.async_connection import AsyncConnectionHandler
+from app.metrics import metrics
+from app.admission import service_unavailable
+from app.timers import TimerWheel, KeepAlivePolicy
+from app.tls import create_server_context
+
+
+class AsyncHTTPServer:
+    """
+    An event-loop based TCP server (asyncio) -> alternative for `HTTPServer`.
+    All connections are multiplexed on a single thread, so idle keep-alive
+    connections don't pin worker-threads and the accept loop never stalls.
+    (`RequestHandler` can still be offloaded to a ThreadPool if needed)
+    """
+
+    def __init__(
+        self,
+        sock: Optional[socket.socket] = None,
+        reuse_port: bool = False,
+        tls_context: Optional[ssl.SSLContext] = None
+    ):
+        # Socket/Connection attributes:
+        self.host: str = settings.SOCKET_HOST
+        self.port: int = settings.SOCKET_PORT
+        self.backlog: int = settings.SOCKET_BACKLOG_CONNECTIONS
+        self.conn_timeout: float = settings.TCP_CONNECTION_TIMEOUT
+        self._sock: Optional[socket.socket] = sock  # (inherited listener)
+        self._reuse_port: bool = reuse_port
+        # TLS (inherited from pre-fork master, or by settings. None: TCP)
+        self._tls: Optional[ssl.SSLContext] = (
+            tls_context or create_server_context()
+        )
+        self._server: Optional[asyncio.Server] = None
+        # max size of a request-head which StreamReader accepts
+        self._stream_limit: int = (
+            settings.MAX_REQUEST_LINE_SIZE + settings.MAX_HEADER_SIZE + 4
+        )
+
+        # Connections attributes:
+        self._max_connections: int = settings.ASYNC_MAX_CONNECTIONS
+        self._active_connections: int = 0
+        self._rejection = service_unavailable(settings.ADMISSION_RETRY_AFTER)
+
+        # deadlines of connections (the wheel is advanced on the loop) &
+        # keep-alive limits (adapted to the share of used connections)
+        self._timers = TimerWheel(
+            settings.TIMER_WHEEL_TICK, settings.TIMER_WHEEL_SLOTS
+        )
+        self._keepalive_policy = KeepAlivePolicy(
+            lambda: self._active_connections / self._max_connections,
+            settings.KEEPALIVE_TIMEOUT,
+            settings.KEEPALIVE_TIMEOUT_MIN,
+            settings.MAX_REQUESTS_PER_CONNECTION,
+            settings.MAX_REQUESTS_PER_CONNECTION_MIN,
+            settings.KEEPALIVE_LOW_WATERMARK,
+        )
+
+        # ThreadPool attributes (only used for offloading `RequestHandler`):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._handler_in_threads: bool = settings.ASYNC_HANDLER_IN_THREADS
+
+        # general attributes:
+        self._dev_mode: bool = settings.DEVELOPMENT_MODE
+        self._running: bool = False
+
+    def start(self):
+        logger.info(
+            "Server is running on %s://%s:%d (asyncio engine)\n",
+            "https" if self._tls else "http", self.host, self.port
+        )
+        self._raise_open_files_limit()
+
+        # SIGTERM (e.g. from pre-fork master) -> shut down like CTRL+C
+        def _sigterm(signum, frame):
+            raise KeyboardInterrupt()
+
+        signal.signal(signal.SIGTERM, _sigterm)
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            print("\nShutting down server...")
+        finally:
+            self._shutdown()
+
+    async def _serve(self):
+        if self._handler_in_threads:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.THREADPOOL_MAX_WORKERS
+            )
+        # (TLS handshakes run on the loop, before `_handle_connection`)
+        tls = {}
+        if self._tls is not None:
+            tls = {
+                "ssl": self._tls,
+                "ssl_handshake_timeout": settings.TLS_HANDSHAKE_TIMEOUT,
+            }
+        if self._sock is not None:
+            self._server = await asyncio.start_server(
+                self._handle_connection,
+                sock=self._sock,
+                backlog=self.backlog,
+                limit=self._stream_limit,
+                **tls,
+            )
+        else:
+            self._server = await asyncio.start_server(
+                self._handle_connection,
+                host=self.host,
+                port=self.port,
+                family=socket.AF_INET,
+                backlog=self.backlog,
+                reuse_address=self._dev_mode,
+                reuse_port=self._reuse_port or None,
+                limit=self._stream_limit,
+                **tls,
+            )
+        self._running = True
+        self._advance_timers()
+        logger.info("Waiting for a connection...")
+        async with self._server:
+            await self._server.serve_forever()
+
+    def _advance_timers(self):
+        """ fire due deadlines, then run again after one tick """
+        self._timers.advance()
+        if self._running:
+            asyncio.get_running_loop().call_later(
+                self._timers.tick, self._advance_timers
+            )
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """
+        this coroutine is run (as a new task) for each new-established
+        connection. (connection-handling is done by `AsyncConnectionHandler`)
+        """
+        address = writer.get_extra_info("peername")[:2]
+        if self._active_connections >= self._max_connections:
+            logger.warning(
+                "Max connections reached, dropping '%s:%d'", *address
+            )
+            metrics.connection_shed("max_connections")
+            try:  # (pre-serialized `503`, the request is never read)
+                writer.writelines(self._rejection.buffers())
+                writer.write_eof()
+            except (OSError, RuntimeError):
+                pass
+            writer.close()
+            return
+
+        ssl_object = writer.get_extra_info("ssl_object")
+        if ssl_object is not None:
+            metrics.tls_handshake(ssl_object.session_reused)
+        self._active_connections += 1
+        metrics.connection_opened()
+        connection_logger.info(
+            "[+] Accepted connection from '%s:%d'", *address
+        )
+        try:
+            handler = AsyncConnectionHandler(
+                reader, writer, self.conn_timeout, self._timers,
+                self._keepalive_policy, self._executor,
+            )
+            await handler.handle_connection()
+        except Exception as e:
+            logger.exception("Error handling client %s:%d: %s", *address, e)
+        finally:
+            self._active_connections -= 1
+            metrics.connection_closed()
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+            connection_logger.info("[x] Closed connection: '%s:%d'", *address)
+
+    @staticmethod
+    def _raise_open_files_limit():
+        """ every connection is a file-descriptor -> raise soft limit of
+        open files up to the hard limit (where `resource` is available) """
+        try:
+            import resource
+        except ImportError:  # (e.g. on Windows)
+            return
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        target = hard if hard != resource.RLIM_INFINITY else 65536
+        if soft != resource.RLIM_INFINITY and soft < target:
+            try:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            except (ValueError, OSError):
+                logger.debug("Couldn't raise open files limit")
+
+    def _shutdown(self):
+        if self._running:
+            logger.info("Server shut down!")
+        self._running = False
+        self._server = None
+
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,153 @@
+""" <ReceiveBuffer> & <BufferPool> classes:
+per-connection receive buffer which is filled in-place by `recv_into()`
+(no `bytes +=` copying), and a pool to reuse these buffers across
+connections (no allocation churn per connection).
+
+    ReceiveBuffer layout:
+    +----------------+--------------------------+-----------------+
+    │ consumed bytes │ unread bytes (pending)   │ free space      │
+    +----------------+--------------------------+-----------------+
+    0              start                       end            capacity
+"""
+
+import socket
+from threading import Lock
+from typing import Optional
+
+
+class ReceiveBuffer:
+
+    def __init__(self, capacity: int = 8192):
+        self._data: bytearray = bytearray(capacity)
+        self._view: memoryview = memoryview(self._data)  # (for recv_into)
+        self._start: int = 0  # first unread byte
+        self._end: int = 0  # end of received data
+        # where the last unsuccessful `find()` of each pattern stopped
+        self._scan_pos: dict[bytes, int] = {}
+        self._initial_capacity: int = capacity
+
+    def __len__(self) -> int:
+        """ number of unread bytes """
+        return self._end - self._start
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    def view(self) -> memoryview:
+        """ zero-copy view of unread bytes (release it before next recv) """
+        return memoryview(self._data)[self._start:self._end]
+
+    def recv_into(self, connection: socket.socket, size: int = 4096) -> int:
+        """
+        receive (at least 1 and at most `size`) bytes from connection directly
+        into the free space of buffer. returns number of received bytes
+        (0 -> connection is closed by peer)
+        """
+        if len(self._data) - self._end < size:
+            self._reserve(size)
+        n = connection.recv_into(self._view[self._end:], size)
+        self._end += n
+        return n
+
+    def fill(self, connection: socket.socket, size: int) -> bool:
+        """ receive until at least `size` unread bytes are in buffer.
+        returns False if connection is closed by peer before that """
+        while len(self) < size:
+            if not self.recv_into(connection, max(size - len(self), 4096)):
+                return False
+        return True
+
+    def write(self, data: bytes):
+        """ append `data` (received elsewhere, e.g. from asyncio streams) """
+        self._reserve(len(data))
+        self._data[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def find(self, sub: bytes) -> int:
+        """
+        find `sub` in unread bytes, and return its index (relative to the
+        start of unread bytes) or -1. the search is resumed from where the
+        previous unsuccessful search of `sub` stopped (no re-scanning -> not
+        O(n^2), even if searches of different patterns are interleaved)
+        """
+        begin = self._start
+        scan_pos = self._scan_pos.get(sub)
+        if scan_pos is not None:
+            begin = max(begin, scan_pos - len(sub) + 1)
+        idx = self._data.find(sub, begin, self._end)
+        if idx == -1:
+            self._scan_pos[sub] = self._end
+            return -1
+        if scan_pos is not None:
+            del self._scan_pos[sub]
+        return idx - self._start
+
+    def startswith(self, prefix: bytes) -> bool:
+        return self._data.startswith(prefix, self._start, self._end)
+
+    def consume(self, n: int) -> bytes:
+        """ pop `n` unread bytes out of buffer (as bytes) """
+        start = self._start
+        data = bytes(self._data[start:start + n])
+        self.skip(len(data))
+        return data
+
+    def skip(self, n: int):
+        """ drop `n` unread bytes without copying them """
+        start = self._start + n
+        if start >= self._end:  # everything is consumed -> rewind
+            self._start = self._end = 0
+            self._scan_pos.clear()
+            return
+        self._start = start  # (scans resume at `start` at least)
+
+    def clear(self):
+        """ drop all bytes (and shrink buffer if it's grown a lot) """
+        self._start = self._end = 0
+        self._scan_pos.clear()
+        if len(self._data) > 4 * self._initial_capacity:
+            self._view.release()
+            self._data = bytearray(self._initial_capacity)
+            self._view = memoryview(self._data)
+
+    def _reserve(self, size: int):
+        """ make sure `size` bytes of free space are available at the end
+        (compact pending bytes to the beginning, or grow the buffer) """
+        if self.capacity - self._end >= size:
+            return
+        pending = len(self)
+        if self._start:  # compact: move pending bytes to the beginning
+            self._data[:pending] = self._data[self._start:self._end]
+            for sub, scan_pos in self._scan_pos.items():
+                self._scan_pos[sub] = max(scan_pos - self._start, 0)
+            self._start, self._end = 0, pending
+        if self.capacity - self._end < size:  # still not enough -> grow
+            new_capacity = max(self.capacity * 2, pending + size)
+            self._view.release()  # (exported buffers can't be resized)
+            self._data.extend(bytes(new_capacity - self.capacity))
+            self._view = memoryview(self._data)
+
+
+class BufferPool:
+    """ thread-safe pool of `ReceiveBuffer`s reused across connections """
+
+    def __init__(self, buffer_size: int = 8192, max_buffers: int = 64):
+        self._buffer_size: int = buffer_size
+        self._max_buffers: int = max_buffers
+        self._free: list[ReceiveBuffer] = []
+        self._lock = Lock()
+
+    def acquire(self) -> ReceiveBuffer:
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return ReceiveBuffer(self._buffer_size)
+
+    def release(self, buffer: Optional[ReceiveBuffer]):
+        if buffer is None:
+            return
+        buffer.clear()
+        with self._lock:
+            if len(self._free) < self._max_buffers:
+                self._free.append(buffer)
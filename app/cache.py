@@ -0,0 +1,263 @@
+""" In-memory response cache (between the connection and `RequestHandler`):
+- responses of GET requests which are explicitly fresh (`Cache-Control:
+  max-age` / `s-maxage`, and not no-store / no-cache / private, no
+  `Set-Cookie`) are stored, already serialized, for max-age seconds
+- entries are keyed by (path + query, values of the request headers named
+  in the response's `Vary`), so e.g. gzip & identity variants are
+  separate entries. (HEAD requests are served from the GET entry)
+- a hit is sent as [Status-Line, fresh `date`, `age`, stored bytes] by one
+  scatter-gather write, without running the handler at all
+- LRU eviction under a byte budget. the `Vary` of a path is kept while
+  the path has entries (it's dropped with its last one)
+- concurrent misses for the same key are coalesced: one thread runs the
+  handler, the others wait for (and are served from) its result
+"""
+
+import time
+from collections import OrderedDict
+from threading import Event, Lock
+from typing import Callable, Optional
+
+from app.http.request import HTTPRequest
+from app.http.response import (
+    HTTPResponse, BodyType, date_header, get_header,
+)
+
+
+# max time (in seconds) to wait for a coalesced miss, before calling the
+# handler anyway
+COALESCE_TIMEOUT = 5.0
+
+
+class CacheEntry:
+
+    __slots__ = (
+        "status_code", "status_line", "head", "body", "expires", "stored_at",
+        "size",
+    )
+
+    def __init__(
+        self,
+        status_code: int,
+        header_block: bytes,
+        body: bytes,
+        max_age: int
+    ):
+        self.status_code: int = status_code
+        # header block is stored without its `date` line (the 2nd line),
+        # which is rebuilt when the entry is served
+        status_end = header_block.index(b"\r\n") + 2
+        date_end = header_block.index(b"\r\n", status_end) + 2
+        self.status_line: bytes = header_block[:status_end]
+        self.head: bytes = header_block[date_end:]
+        self.body: bytes = body
+        self.stored_at: float = time.monotonic()
+        self.expires: float = self.stored_at + max_age
+        self.size: int = len(header_block) + len(body)
+
+
+class CachedHTTPResponse(HTTPResponse):
+    """ HTTPResponse which is sent from a `CacheEntry` (nothing to build) """
+
+    def __init__(self, entry: CacheEntry, is_for_head_method: bool = False):
+        super().__init__(
+            status_code=entry.status_code,
+            is_for_head_method=is_for_head_method,
+        )
+        self.entry: CacheEntry = entry
+
+    def build_response_buffers(self) -> list[BodyType]:
+        entry = self.entry
+        age = int(time.monotonic() - entry.stored_at)
+        buffers = [
+            entry.status_line,
+            date_header.get(),
+            b"age: %d\r\n" % age,
+            entry.head,
+        ]
+        if entry.body and not self.is_for_head_method:
+            buffers.append(entry.body)
+        return buffers
+
+    def build_response(self) -> bytes:
+        return b"".join(self.build_response_buffers())
+
+    def build_header_block(self) -> bytes:
+        return b"".join(self.build_response_buffers()[:4])
+
+    def body_buffers(self) -> list[BodyType]:
+        if self.is_for_head_method or not self.entry.body:
+            return []
+        return [self.entry.body]
+
+
+class ResponseCache:
+
+    def __init__(self, max_bytes: int, max_entry_size: int):
+        self._max_bytes: int = max_bytes
+        self._max_entry_size: int = max_entry_size
+        self._size: int = 0
+        self._entries: OrderedDict[tuple, CacheEntry] = OrderedDict()
+        # path -> header names of its `Vary` (from its last stored response)
+        self._vary: dict[str, tuple[str, ...]] = {}
+        self._path_entries: dict[str, int] = {}  # (path -> its entries)
+        self._inflight: dict[tuple, Event] = {}
+        self._lock = Lock()
+
+    def get_response(
+        self,
+        request: HTTPRequest,
+        handler: Callable[[HTTPRequest], HTTPResponse]
+    ) -> HTTPResponse:
+        """ cached response for request, or `handler(request)` (which is
+        stored if it's cacheable). concurrent misses of a key are
+        coalesced into one handler call """
+        method = request.method.upper()
+        if method not in ("GET", "HEAD") or not self._request_cacheable(
+            request
+        ):
+            return handler(request)
+
+        key = self._key(request)
+        is_head = method == "HEAD"
+        while True:
+            with self._lock:
+                entry = self._get(key)
+                if entry is not None:
+                    return CachedHTTPResponse(entry, is_head)
+                event = self._inflight.get(key)
+                if event is None:  # -> this thread builds the response
+                    event = self._inflight[key] = Event()
+                    break
+            if not event.wait(COALESCE_TIMEOUT):
+                return handler(request)
+            key = self._key(request)  # (`Vary` may be known now)
+            with self._lock:
+                entry = self._get(key)
+            if entry is not None:
+                return CachedHTTPResponse(entry, is_head)
+            if key not in self._inflight:  # (result wasn't cacheable)
+                return handler(request)
+
+        try:
+            response = handler(request)
+            if not is_head:
+                self._store(request, response)
+            return response
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._vary.clear()
+            self._path_entries.clear()
+            self._size = 0
+
+    @staticmethod
+    def _request_cacheable(request: HTTPRequest) -> bool:
+        headers = request.headers
+        if (
+            "authorization" in headers
+            or "range" in headers
+            or "if-none-match" in headers
+            or "if-modified-since" in headers
+        ):
+            return False
+        cache_control = (headers.get("cache-control") or "").lower()
+        return "no-store" not in cache_control and (
+            "no-cache" not in cache_control
+        )
+
+    def _key(
+        self, request: HTTPRequest, vary: Optional[tuple[str, ...]] = None
+    ) -> tuple:
+        if vary is None:
+            vary = self._vary.get(request.path, ())
+        return (request.path,) + tuple(
+            request.headers.get(name, "") for name in vary
+        )
+
+    def _get(self, key: tuple) -> Optional[CacheEntry]:
+        """ (with lock) fresh entry of key, or None """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, request: HTTPRequest, response: HTTPResponse):
+        max_age = self._max_age(response)
+        if max_age is None:
+            return
+        vary = tuple(sorted(
+            v.strip().lower()
+            for v in get_header(response.headers, "vary", "").split(",")
+            if v.strip()
+        ))
+        if "*" in vary:
+            return
+        body = bytes(response.body)
+        header_block = response.build_header_block()
+        if len(header_block) + len(body) > self._max_entry_size:
+            return
+        entry = CacheEntry(response.status_code, header_block, body, max_age)
+        path = request.path
+        key = self._key(request, vary)
+        with self._lock:
+            self._remove(key)
+            self._vary[path] = vary
+            self._path_entries[path] = self._path_entries.get(path, 0) + 1
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._size > self._max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: tuple):
+        """ (with lock) remove an entry (and the `Vary` of its path, if
+        it was the last entry of the path) """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._size -= entry.size
+        path = key[0]
+        count = self._path_entries[path] - 1
+        if count:
+            self._path_entries[path] = count
+        else:
+            del self._path_entries[path]
+            del self._vary[path]
+
+    @staticmethod
+    def _max_age(response: HTTPResponse) -> Optional[int]:
+        """ freshness lifetime of a (storable) response, or None """
+        if (
+            response.status_code not in (200, 203, 301, 404, 410)
+            or response.is_for_head_method
+            or response.chunked
+            or response.iter_body is not None
+            or response.file_body is not None
+            or response.body_parts is not None
+            or get_header(response.headers, "set-cookie") is not None
+        ):
+            return None
+        max_age = None
+        cache_control = get_header(response.headers, "cache-control", "")
+        for directive in cache_control.lower().split(","):
+            name, _, value = directive.strip().partition("=")
+            if name in ("no-store", "no-cache", "private"):
+                return None
+            value = value.strip('"')
+            if name in ("max-age", "s-maxage") and (
+                value.isascii() and value.isdigit()
+            ):
+                age = int(value)
+                # (s-maxage overrides max-age for shared caches)
+                if name == "s-maxage" or max_age is None:
+                    max_age = age
+        return max_age or None
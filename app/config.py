@@ -1,3 +1,4 @@
+from typing import Optional
 from dataclasses import dataclass
 
 
@@ -5,11 +6,71 @@ from dataclasses import dataclass
 class Settings:
     """
     TCP_CONNECTION_TIMEOUT:
-        amount of time (in secondes) the server sets as keep-alive timeout
-        for each TCP connection
+        max time (in seconds) a single socket operation (recv / send) may
+        wait without any progress (a safety net, deadlines of request
+        phases are tracked by the timer wheel, see `app/timers.py`)
+
+    KEEPALIVE_TIMEOUT:
+        max time (in seconds) an idle keep-alive connection waits for its
+        next request, while the server isn't loaded
+    KEEPALIVE_TIMEOUT_MIN:
+        keep-alive timeout (in seconds) when the server is fully loaded
+    KEEPALIVE_LOW_WATERMARK:
+        load (0.0 - 1.0) above which keep-alive timeout & max requests per
+        connection are tightened (linearly, down to their minimums)
+    HEADER_READ_TIMEOUT:
+        max time (in seconds) to receive a request-head, from its first
+        byte (or from the connection's start) -> `408`
+    BODY_READ_TIMEOUT:
+        max time (in seconds) to receive a request body -> `408`
+    REQUEST_TIMEOUT:
+        max time (in seconds) from the first byte of a request until its
+        response starts to be sent (None -> no limit)
+    TIMER_WHEEL_TICK:
+        resolution (in seconds) of connection deadlines
+    TIMER_WHEEL_SLOTS:
+        number of slots of the timer wheel (one turn = slots x tick)
 
     MAX_REQUESTS_PER_CONNECTION:
         max number of requests the server will serve on a single connection
+        while the server isn't loaded
+    MAX_REQUESTS_PER_CONNECTION_MIN:
+        max number of requests per connection when the server is fully
+        loaded
+
+    MAX_PIPELINED_REQUESTS:
+        max number of pipelined requests whose responses are queued and
+        then sent together in one write (`sendmsg`) on a connection
+
+    MAX_REQUEST_LINE_SIZE:
+        max length (in bytes) of request-line (longer ones -> 414)
+
+    MAX_HEADER_SIZE:
+        max length (in bytes) of header fields block (larger ones -> 431)
+
+    MAX_HEADERS_COUNT:
+        max number of header fields in a request (more -> 431)
+
+    MAX_BODY_SIZE:
+        max length (in bytes) of request body (larger ones -> 413)
+        (for chunked bodies, checked while they're decoded)
+
+    BODY_SPOOL_THRESHOLD:
+        request bodies collected by `RequestBody.spool()` (and all bodies
+        on the asyncio engine) are kept in memory up to this size (in
+        bytes), larger ones spill to a temporary file on disk
+
+    MAX_BODY_DRAIN_SIZE:
+        unread rest of a request body (not read by the handler) is
+        received & discarded up to this size to keep the connection alive,
+        otherwise the connection is closed
+
+    RECV_BUFFER_SIZE:
+        initial size (in bytes) of per-connection receive buffers
+        (a buffer grows if a request doesn't fit in it)
+
+    RECV_BUFFER_POOL_SIZE:
+        max number of idle receive buffers kept for reuse by next connections
 
     THREADPOOL_MAX_WORKERS:
         max number of worker-threads (connection handler threads) in ThreadPool
@@ -17,6 +78,180 @@ class Settings:
     THREADPOOL_MAX_TASKS_SEMAPHORE:
         max number of (`submitted` or `queued`) tasks in ThreadPoolExecutor
         (prevent unlimited queued sockets in executor’s internal task-queue)
+        more connections are answered with `503` (see `app/admission.py`)
+
+    ADMISSION_RETRY_AFTER:
+        `Retry-After` (in seconds) of `503` responses of load shedding
+    ADMISSION_CODEL_ENABLED:
+        drop queued connections (with `503`) when the queue delay stays
+        above ADMISSION_QUEUE_TARGET for ADMISSION_QUEUE_INTERVAL (CoDel)
+    ADMISSION_QUEUE_TARGET:
+        acceptable time (in seconds) a connection waits for a worker-thread
+    ADMISSION_QUEUE_INTERVAL:
+        how long (in seconds) the queue delay may stay above target, before
+        connections are dropped
+
+    RATE_LIMIT_ENABLED:
+        limit requests per client IP (token buckets, rejected with `429`,
+        see `app/ratelimit.py`). routes can have their own limits
+    RATE_LIMIT_PER_IP:
+        requests per second allowed per client IP (refill rate of buckets)
+    RATE_LIMIT_BURST:
+        max requests a client IP can send at once (size of buckets)
+    RATE_LIMIT_TABLE_SIZE:
+        max number of buckets kept in memory (least recently used ones are
+        evicted)
+    RATE_LIMIT_STRIPES:
+        number of (separately locked) shards of the bucket table
+
+    SERVER_ENGINE:
+        which connection engine runs the server:
+        - "threads": one worker-thread per connection (`HTTPServer`)
+        - "asyncio": all connections multiplexed on a single event-loop
+          (`AsyncHTTPServer`), idle keep-alive sockets cost no thread
+
+    ASYNC_MAX_CONNECTIONS:
+        max number of concurrently open connections on the asyncio engine
+        (extra connections get `503` and are closed right after accepted)
+
+    ASYNC_HANDLER_IN_THREADS:
+        if True, the asyncio engine runs `RequestHandler` on a ThreadPool
+        (for CPU-heavy/blocking handlers); otherwise runs it on the loop
+
+    PREFORK_ENABLED:
+        if True, `main.py` runs a master process which forks worker
+        processes (each one runs a whole server with the selected engine)
+
+    PREFORK_WORKERS:
+        number of worker processes (None -> `os.cpu_count()`)
+
+    PREFORK_REUSEPORT:
+        if True, every worker binds its own listener with `SO_REUSEPORT`
+        (kernel load-balances connections between them); otherwise all
+        workers accept on one listener inherited from the master
+
+    STATIC_ROOT:
+        directory whose files are served by `StaticFilesHandler`
+        (None -> static files serving is disabled)
+
+    STATIC_URL_PREFIX:
+        request paths starting with this prefix are mapped to STATIC_ROOT
+
+    STATIC_FILE_CACHE_SIZE:
+        max number of open files (fd + stat metadata) kept in LRU cache
+
+    CHUNKED_COALESCE_SIZE:
+        small chunks of a chunked response are coalesced into one chunk
+        (sent by one scatter-gather write) up to this size (in bytes)
+
+    CHUNKED_FLUSH_INTERVAL:
+        max time (in seconds) a coalesced chunk waits for more data before
+        it's sent (producers can also yield `FLUSH` to send it right away)
+
+    COMPRESSION_ENABLED:
+        if True, response bodies of compressible types (text, JSON, ...)
+        are compressed (gzip / deflate) when the client accepts it
+
+    COMPRESSION_MIN_SIZE:
+        smaller bodies (in bytes) are never compressed (not worth it)
+
+    COMPRESSION_LEVEL:
+        zlib compression level (1: fastest ... 9: smallest)
+
+    COMPRESSION_CACHE_SIZE:
+        max total size (in bytes) of compressed variants of responses kept
+        in LRU cache (hot resources are compressed only once). only
+        responses with a validator (ETag / Last-Modified) are cached
+
+    COMPRESSION_MAX_FILE_SIZE:
+        larger static files (in bytes) are sent uncompressed (by sendfile)
+
+    ROUTER_CACHE_SIZE:
+        max number of recent (path -> route) resolutions kept in LRU cache
+
+    WSGI_APP:
+        WSGI application ("module:callable") serving the requests which
+        match neither a static file nor a route (see `app/wsgi.py`)
+        (None -> no WSGI application)
+    WSGI_SCRIPT_NAME:
+        mount point of WSGI_APP: only paths under it are passed to it (it's
+        the `SCRIPT_NAME` of its `environ`) ("" -> every path)
+
+    HTTP2_ENABLED:
+        if True, connections can switch to HTTP/2 over cleartext (h2c):
+        by the preface of prior knowledge or by `Upgrade: h2c` (see
+        `app/h2_connection.py`)
+    HTTP2_MAX_CONCURRENT_STREAMS:
+        max number of requests (streams) in progress on one connection
+    HTTP2_INITIAL_WINDOW_SIZE:
+        flow-control window (in bytes) of each stream & of the connection
+        for request bodies (how much a client can send before it waits)
+    HTTP2_MAX_FRAME_SIZE:
+        max size (in bytes) of a received frame's payload
+    HTTP2_HEADER_TABLE_SIZE:
+        size (in bytes) of the HPACK dynamic table for received headers
+    HTTP2_STREAM_WORKERS:
+        (threads engine) number of threads which handle the requests of
+        HTTP/2 connections (their connection's thread only reads frames)
+    HTTP2_RESET_RATE:
+        streams a client may reset per second (refill rate of a
+        per-connection budget). a connection which resets faster is
+        closed (GOAWAY `ENHANCE_YOUR_CALM`, "rapid reset" floods)
+    HTTP2_RESET_BURST:
+        max number of stream resets in a burst (size of that budget)
+
+    TLS_CERTFILE:
+        PEM file of the server's certificate chain: if set, the listener
+        serves TLS (HTTPS) itself (see `app/tls.py`) (None -> plain TCP)
+    TLS_KEYFILE:
+        PEM file of the private key (None -> it's in TLS_CERTFILE)
+    TLS_SESSION_TICKETS:
+        if True, sessions are resumed by TLS session tickets (stateless,
+        shared by pre-forked workers), otherwise by the server-side
+        session cache (per process)
+    TLS_NUM_TICKETS:
+        number of TLS 1.3 session tickets sent after a full handshake (a
+        client can resume that many connections, e.g. parallel ones)
+    TLS_HANDSHAKE_TIMEOUT:
+        max time (in seconds) of a client's TLS handshake
+
+    RESPONSE_CACHE_ENABLED:
+        cache fresh responses (`Cache-Control: max-age`) of GET requests in
+        memory, already serialized (see `app/cache.py`)
+    RESPONSE_CACHE_SIZE:
+        max total size (in bytes) of cached responses (LRU eviction)
+    RESPONSE_CACHE_MAX_ENTRY_SIZE:
+        responses larger than this (in bytes) are never cached
+
+    METRICS_ENABLED:
+        collect per-phase latency histograms & connection/request metrics
+        (see `app/metrics.py`)
+    METRICS_PATH:
+        path where metrics are served in Prometheus text format, if
+        `METRICS_ENABLED` (empty -> not served; opt-in, since they show
+        internals of the server to any client)
+
+    LOG_LEVEL:
+        level of the root logger (None -> DEBUG in development mode,
+        INFO otherwise)
+    LOG_QUEUE_SIZE:
+        max number of log records waiting for the writer thread (the
+        oldest ones are dropped, instead of blocking the caller)
+    LOG_BATCH_SIZE:
+        max number of log records written at once by the writer thread
+    LOG_FLUSH_INTERVAL:
+        how often (in seconds) the writer thread writes buffered records
+    ACCESS_LOG_ENABLED:
+        write an access-line for each response
+    ACCESS_LOG_FORMAT:
+        "compact" (fixed-format line) or "json" (one object per line)
+    ACCESS_LOG_SAMPLE_RATE:
+        fraction (0.0 - 1.0) of responses which get an access-line
+    CONNECTION_LOG_LEVEL:
+        level of connection lifecycle messages' logger (accepted / closed)
+        (None -> INFO in development mode, WARNING (= off) otherwise)
+    CONNECTION_LOG_SAMPLE_RATE:
+        fraction (0.0 - 1.0) of connection lifecycle messages which are kept
     """
 
     PROJECT_NAME = "HTTPServer-by-hamidgh01"
@@ -30,10 +265,124 @@ class Settings:
     # Connection settings
     TCP_CONNECTION_TIMEOUT: float = 10.0
     MAX_REQUESTS_PER_CONNECTION: int = 8
+    MAX_REQUESTS_PER_CONNECTION_MIN: int = 4
+    MAX_PIPELINED_REQUESTS: int = 16
+
+    # Deadline settings
+    KEEPALIVE_TIMEOUT: float = 10.0
+    KEEPALIVE_TIMEOUT_MIN: float = 0.5
+    KEEPALIVE_LOW_WATERMARK: float = 0.5
+    HEADER_READ_TIMEOUT: float = 10.0
+    BODY_READ_TIMEOUT: float = 60.0
+    REQUEST_TIMEOUT: Optional[float] = 120.0
+    TIMER_WHEEL_TICK: float = 0.1
+    TIMER_WHEEL_SLOTS: int = 512
+
+    # Request limits
+    MAX_REQUEST_LINE_SIZE: int = 8190
+    MAX_HEADER_SIZE: int = 65536  # 64 KB
+    MAX_HEADERS_COUNT: int = 100
+    MAX_BODY_SIZE: int = 10 * 1024 * 1024  # 10 MB
+    BODY_SPOOL_THRESHOLD: int = 1024 * 1024  # 1 MB
+    MAX_BODY_DRAIN_SIZE: int = 1024 * 1024  # 1 MB
+
+    # Receive buffers
+    RECV_BUFFER_SIZE: int = 8192  # 8 KB
+    RECV_BUFFER_POOL_SIZE: int = 128
 
     # ThreadPool settings
     THREADPOOL_MAX_WORKERS: int = 32
     THREADPOOL_MAX_TASKS_SEMAPHORE: int = 96  # (32 in work / 64 in queue)
 
+    # Admission control settings
+    ADMISSION_RETRY_AFTER: int = 1
+    ADMISSION_CODEL_ENABLED: bool = True
+    ADMISSION_QUEUE_TARGET: float = 0.05
+    ADMISSION_QUEUE_INTERVAL: float = 0.5
+
+    # Rate limiting settings
+    RATE_LIMIT_ENABLED: bool = False
+    RATE_LIMIT_PER_IP: float = 100.0
+    RATE_LIMIT_BURST: int = 200
+    RATE_LIMIT_TABLE_SIZE: int = 65536
+    RATE_LIMIT_STRIPES: int = 64
+
+    # Engine settings
+    SERVER_ENGINE: str = "threads"  # "threads" | "asyncio"
+    ASYNC_MAX_CONNECTIONS: int = 10240
+    ASYNC_HANDLER_IN_THREADS: bool = False
+
+    # Pre-fork (multi-process) settings
+    PREFORK_ENABLED: bool = False
+    PREFORK_WORKERS: Optional[int] = None
+    PREFORK_REUSEPORT: bool = True
+
+    # Static files settings
+    STATIC_ROOT: Optional[str] = None
+    STATIC_URL_PREFIX: str = "/static/"
+    STATIC_FILE_CACHE_SIZE: int = 256
+
+    # Chunked response streaming
+    CHUNKED_COALESCE_SIZE: int = 16384  # 16 KB
+    CHUNKED_FLUSH_INTERVAL: float = 0.02
+
+    # Compression settings
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # 1 KB
+    COMPRESSION_LEVEL: int = 6
+    COMPRESSION_CACHE_SIZE: int = 16 * 1024 * 1024  # 16 MB
+    COMPRESSION_MAX_FILE_SIZE: int = 8 * 1024 * 1024  # 8 MB
+
+    # Routing settings
+    ROUTER_CACHE_SIZE: int = 1024
+
+    # WSGI settings
+    WSGI_APP: Optional[str] = None
+    WSGI_SCRIPT_NAME: str = ""
+
+    # HTTP/2 settings
+    HTTP2_ENABLED: bool = True
+    HTTP2_MAX_CONCURRENT_STREAMS: int = 100
+    HTTP2_INITIAL_WINDOW_SIZE: int = 1024 * 1024  # 1 MB
+    HTTP2_MAX_FRAME_SIZE: int = 16384  # 16 KB
+    HTTP2_HEADER_TABLE_SIZE: int = 4096  # 4 KB
+    HTTP2_STREAM_WORKERS: int = 32
+    HTTP2_RESET_RATE: float = 100.0
+    HTTP2_RESET_BURST: int = 200
+
+    # TLS settings
+    TLS_CERTFILE: Optional[str] = None
+    TLS_KEYFILE: Optional[str] = None
+    TLS_SESSION_TICKETS: bool = True
+    TLS_NUM_TICKETS: int = 2
+    TLS_HANDSHAKE_TIMEOUT: float = 10.0
+
+    # Response cache settings
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_SIZE: int = 32 * 1024 * 1024  # 32 MB
+    RESPONSE_CACHE_MAX_ENTRY_SIZE: int = 1024 * 1024  # 1 MB
+
+    # Metrics settings
+    METRICS_ENABLED: bool = True
+    METRICS_PATH: str = ""  # (e.g. "/metrics")
+
+    # Logging settings
+    LOG_LEVEL: Optional[str] = None
+    LOG_QUEUE_SIZE: int = 65536
+    LOG_BATCH_SIZE: int = 256
+    LOG_FLUSH_INTERVAL: float = 0.05
+    ACCESS_LOG_ENABLED: bool = True
+    ACCESS_LOG_FORMAT: str = "compact"
+    ACCESS_LOG_SAMPLE_RATE: float = 1.0
+    CONNECTION_LOG_LEVEL: Optional[str] = None
+    CONNECTION_LOG_SAMPLE_RATE: float = 1.0
+
+    def __post_init__(self):
+        # (buckets are refilled at this rate -> it's a divisor)
+        if not self.RATE_LIMIT_PER_IP > 0 or self.RATE_LIMIT_BURST < 1:
+            raise ValueError(
+                "RATE_LIMIT_PER_IP must be > 0 and RATE_LIMIT_BURST >= 1"
+            )
+
 
 settings = Settings()
@@ -1,12 +1,48 @@
+import os
+import time
+import ssl
 import socket
+import selectors
+from typing import Optional
+from concurrent.futures import Executor
 
 from app.config import settings
-from app.logging import logger
+from app.logging import logger, connection_logger, access_log
+from app.buffer import BufferPool, ReceiveBuffer
 
-from app.http.parser import HTTPParser
-from app.http.response import HTTPResponse
+from app.http.parser import HTTPParser, HTTPRequestParser, HTTPParseError
+from app.http.status import STATUS_MESSAGES
+from app.http.response import (
+    HTTPResponse, BodyType, FileBody, STATUS_LINES
+)
 from app.http.request import HTTPRequest
+from app.http.streaming import ChunkedWriter, iterate_in_thread
 from app.handler import RequestHandler
+from app.metrics import metrics
+from app.timers import TimerWheel, ConnectionDeadlines, KeepAlivePolicy
+from app.http.h2 import (
+    PREFACE, PREFACE_TAIL, SWITCHING_PROTOCOLS_RESPONSE, upgrade_settings
+)
+from app.h2_connection import H2ConnectionHandler
+from app.tls import alpn_protocol, shutdown_socket, send_close_notify
+
+
+# max number of buffers in a single `sendmsg()` call (POSIX `IOV_MAX`)
+IOV_MAX = 1024
+
+# max time to drain a rejected request's bytes before closing
+LINGER_TIMEOUT = 2.0
+
+# interim response for `Expect: 100-continue`
+CONTINUE_RESPONSE: bytes = STATUS_LINES[100] + b"\r\n"
+
+# (poll() has no FD_SETSIZE limit and, unlike epoll, needs no extra fd)
+_WriteSelector = getattr(selectors, "PollSelector", selectors.SelectSelector)
+
+# receive buffers are reused across connections (see `app/buffer.py`)
+buffer_pool = BufferPool(
+    settings.RECV_BUFFER_SIZE, settings.RECV_BUFFER_POOL_SIZE
+)
 
 
 class ConnectionHandler:
@@ -16,14 +52,36 @@ class ConnectionHandler:
     """
 
     def __init__(
-        self, connection: socket.socket, address, conn_timeout: float
+        self,
+        connection: socket.socket,
+        address,
+        conn_timeout: float,
+        timers: TimerWheel,
+        policy: KeepAlivePolicy,
+        executor: Optional[Executor] = None
     ):
         self.conn: socket.socket = connection
         self.address = address
-        self.buffer: bytes = b""
+        # (handshake is done already. no `sendmsg()` / `sendfile()` on it)
+        self._tls: bool = isinstance(connection, ssl.SSLSocket)
+        self.buffer: ReceiveBuffer = buffer_pool.acquire()
+        self.parser: HTTPRequestParser = HTTPRequestParser()
+        # responses of pipelined requests, waiting to be sent in one write
+        self._pending_buffers: list[BodyType] = []
+        self._pending_responses: int = 0
+        self._max_pipelined: int = settings.MAX_PIPELINED_REQUESTS
         self._running: bool = True
-        self.keepalive_timeout: float = conn_timeout
+        # (per-operation safety net, request phases have their deadlines)
         self.conn.settimeout(conn_timeout)
+        self.policy: KeepAlivePolicy = policy
+        self._timers: TimerWheel = timers
+        self._deadlines = ConnectionDeadlines(timers, self._on_deadline)
+        self._expired: Optional[str] = None  # (name of expired deadline)
+        # requests of an HTTP/2 connection are handled on it (if provided)
+        self._executor: Optional[Executor] = executor
+        self._body_stream = None  # (body being received, if any)
+        # time spent by `self.parser` on the current request-head
+        self._parse_time: float = 0.0
 
     def handle_connection(self):
         """
@@ -32,27 +90,46 @@ class ConnectionHandler:
         client requests keep-alive.
         how it works (generally)? steps:
         1- extracts raw-request and builds HTTPRequest-Obj
+        (body is not received yet, then the request is either rejected by
+        the pre-body admission hook, or `100 Continue` is armed for it)
         2- analyze HTTPRequest-Obj and build a proper HTTPResponse-Obj
         3- decide how to send Http-Response bytes ('chunked transferring' or
         send whole Response 'at once' -> if chunked transferring -> handle it)
+        (if next request is already in buffer (pipelining), the response is
+        queued and responses are sent together later in one `sendmsg()`)
         4- decide whether to keep connection alive or not
+        (deadlines of idle / header / body / whole request are armed on the
+        timer wheel, max requests & keep-alive timeout depend on load)
         """
 
+        if alpn_protocol(self.conn) == "h2":  # (negotiated by TLS ALPN)
+            self._serve_h2(PREFACE)
+            buffer_pool.release(self.buffer)
+            self.buffer = None
+            return
+
         requests_count = 0  # num of requests is served on this connection
-        max_requests = settings.MAX_REQUESTS_PER_CONNECTION
+        max_requests = self.policy.max_requests()
+        self._deadlines.phase("header", settings.HEADER_READ_TIMEOUT)
         while self._running and requests_count < max_requests:
             try:
                 # step_1: raw-request -> HTTPRequest-Obj
                 try:
-                    request = self._extract_raw_request()
+                    status_code = 400
+                    try:
+                        request = self._extract_raw_request()
+                    except HTTPParseError as err:  # malformed / too large
+                        logger.info("[!] Failed to parse request: %s", err)
+                        request, status_code = None, err.status_code
                     if request is None:
                         response_obj = HTTPResponse(
-                            status_code=400,
-                            body=b"Bad Request",
+                            status_code=status_code,
+                            body=STATUS_MESSAGES[status_code].encode(),
                             mem_type="text/plain"
                         )
-                        response = response_obj.build_response()
-                        self.conn.sendall(response)
+                        response = response_obj.build_response_buffers()
+                        self._send_response(response, flush=True)
+                        self._lingering_close()
                         break
                         # first: make self._running=False
                         # then: back to `server.py:line70`: connection.close()
@@ -60,9 +137,39 @@ class ConnectionHandler:
                 except socket.timeout:
                     raise
 
+                # HTTP/2 (prior knowledge / `Upgrade: h2c`) -> the rest of
+                # the connection is handled by `H2ConnectionHandler`
+                if self._switch_to_h2(request):
+                    break
+
                 # step_2: analyze HTTPRequest-Obj -> proper HTTPResponse-Obj
                 try:
-                    response_obj = RequestHandler.handle_request(request)
+                    request_started = time.perf_counter()
+                    request.client = self.address
+                    response_obj = RequestHandler.admit_request(
+                        request, self.address
+                    )
+                    admitted = response_obj is None
+                    if admitted:
+                        self._expect_continue(request)
+                        self._arm_body_deadline(request)
+                        response_obj = RequestHandler.get_response(request)
+                    metrics.observe_phase(
+                        "handler", time.perf_counter() - request_started
+                    )
+                except HTTPParseError as err:  # (while reading the body)
+                    logger.info("[!] Failed to read request body: %s", err)
+                    if self._expired is not None:
+                        raise socket.timeout(f"{self._expired} deadline")
+                    response_obj = HTTPResponse(
+                        status_code=err.status_code,
+                        body=STATUS_MESSAGES[err.status_code].encode(),
+                        mem_type="text/plain"
+                    )
+                    response = response_obj.build_response_buffers()
+                    self._send_response(response, flush=True)
+                    self._lingering_close()
+                    break
                 except Exception as e:
                     logger.exception("Error while handling request: %s", e)
                     response_obj = HTTPResponse(
@@ -70,111 +177,447 @@ class ConnectionHandler:
                         body=b"Internal Server Error",
                         mem_type="text/plain"
                     )
-                    response = response_obj.build_response()
-                    self.conn.sendall(response)
+                    response = response_obj.build_response_buffers()
+                    self._send_response(response, flush=True)
                     break  # same as previous 'break' -> connection.close()
 
-                # step_3: decide how to send Http-Response bytes
-                if response_obj.chunked and callable(response_obj.iter_body):
-                    # If chunked response provided:
-                    # first: send headers with `Transfer-Encoding: chunked`
-                    http_header = response_obj.build_response()
-                    self.conn.sendall(http_header)
-                    # then: stream chunks
-                    for chunk in response_obj.iter_body():
-                        if not chunk:
-                            continue
-                        size_hex = f"{len(chunk):X}\r\n".encode("ascii")
-                        self.conn.sendall(size_hex + chunk + b"\r\n")
-                    # after streaming finished, send terminating chunk
-                    self.conn.sendall(b"0\r\n\r\n")
+                # unread body must be dropped before the next request (and
+                # before pipelining checks of `self.buffer`) is possible.
+                # a rejected body isn't drained (-> rejection is sent first)
+                if admitted:
+                    body_done = self._discard_request_body(request)
                 else:
-                    response = response_obj.build_response()
-                    self.conn.sendall(response)
+                    body_done = (
+                        request.stream is None or request.stream.at_eof
+                    )
+                self._deadlines.end_phase()
+                self._body_stream = None
+                self._deadlines.end_request()
+
+                # step_3: decide how to send Http-Response bytes
+                try:
+                    started = time.perf_counter()
+                    self._send_response_obj(response_obj)
+                    sent_at = time.perf_counter()
+                    metrics.observe_phase("send", sent_at - started)
+                    metrics.request_done(
+                        response_obj.status_code, requests_count > 0
+                    )
+                    access_log.log(
+                        self.address, request, response_obj,
+                        sent_at - request_started,
+                    )
+                finally:
+                    response_obj.close()
 
                 # step_4 : decide whether to keep connection alive or not
+                if not body_done:
+                    # (closing with unread data -> RST may drop the response)
+                    self._lingering_close()
+                    break
                 if self._keep_connection_alive(request):
-                    # keep alive -> continue loop, but reset timeout
+                    # keep alive -> continue loop, idle deadline by load
                     requests_count += 1
-                    self.conn.settimeout(self.keepalive_timeout)
+                    max_requests = self.policy.max_requests()
+                    self._deadlines.phase(
+                        "idle", self.policy.keepalive_timeout()
+                    )
                     continue
                 break  # self._keep_connection_alive(request) -> False
 
             except socket.timeout:
-                logger.debug("Connection timed out (idle)")
+                if self._expired in ("header", "body"):
+                    self._send_timeout_response()
+                logger.debug(
+                    "Connection timed out (%s)", self._expired or "socket"
+                )
                 break
             except ConnectionResetError:
                 logger.debug("Connection reset by peer")
                 break
             except Exception as e:
+                if self._expired is not None:
+                    logger.debug("Request deadline exceeded: %s", e)
+                    break
                 logger.exception("Unexpected connection error: %s", e)
                 break
         else:
-            if requests_count == max_requests:
-                logger.info(
+            if requests_count >= max_requests:
+                connection_logger.info(
                     "Connection from '%s:%s' reached max-requests-limitation",
                     *self.address
                 )
 
+        self._deadlines.cancel()
+        try:  # send queued responses (if loop is broken while pipelining)
+            self._flush_pending_responses()
+        except OSError as e:
+            logger.debug("Couldn't send pending responses: %s", e)
         self._running = False
+        buffer_pool.release(self.buffer)  # give buffer back for reuse
+        self.buffer = None
 
     def _extract_raw_request(self) -> HTTPRequest | None:
-        """ extract raw Http-Request from buffer and make HTTPRequest-Obj """
+        """ extract raw Http-Request from buffer and make HTTPRequest-Obj
+        (raise HTTPParseError if request is malformed or exceeds limits) """
 
         try:
-            header_part, remaining = self._read_until_body_header_terminator()
-            if not header_part:
-                logger.info("[-] Empty request from '%s:%d'", *self.address)
+            if not self._read_request_head():
+                connection_logger.info(
+                    "[-] Empty request from '%s:%d'", *self.address
+                )
                 return None
         except socket.timeout:
             raise
 
+        parser = self.parser
+        started = time.perf_counter()
+        request = HTTPParser.parse_http_request(
+            parser.method,
+            parser.path,
+            parser.version,
+            parser.headers,
+            self.buffer,
+            self.conn
+        )
+        parser.reset()
+        metrics.observe_phase(
+            "parse", self._parse_time + time.perf_counter() - started
+        )
+        return request
+
+    def _switch_to_h2(self, request: HTTPRequest) -> bool:
+        """ switch the connection to HTTP/2 if the request is the preface
+        of prior knowledge (its tail & frames are still in `self.buffer`)
+        or asks for `Upgrade: h2c` (it's answered as HTTP/2 stream 1).
+        returns True when the HTTP/2 connection is over.
+        (cleartext only: with TLS, HTTP/2 is negotiated by ALPN) """
+        if not settings.HTTP2_ENABLED or self._tls:
+            return False
+        upgrade = None
+        if (request.method, request.path, request.version) == (
+            "PRI", "*", "HTTP/2.0"
+        ):
+            preface = PREFACE_TAIL
+        else:
+            h2_settings = upgrade_settings(request)
+            if h2_settings is None:
+                return False
+            upgrade, preface = (request, h2_settings), PREFACE
+            self._flush_pending_responses()
+            self.conn.sendall(SWITCHING_PROTOCOLS_RESPONSE)
+        self._serve_h2(preface, upgrade)
+        return True
+
+    def _serve_h2(self, preface: bytes, upgrade=None):
+        self._deadlines.cancel()
+        data = self.buffer.consume(len(self.buffer))
+        H2ConnectionHandler(
+            self.conn, self.address, self._timers, self.policy,
+            self._executor, data, preface, upgrade,
+        ).handle_connection()
+
+    def _on_deadline(self, name: str):
+        """ (timer wheel thread) a deadline expired -> wake up the worker
+        blocked on the socket: reading side is shut down (recv returns
+        EOF, a `408` can still be sent), or both sides for `request` """
+        if name == "body" and (
+            self._body_stream is None or self._body_stream.at_eof
+        ):
+            return  # (body was received already, the handler is working)
+        self._expired = name
         try:
-            request = HTTPParser.parse_http_request(
-                header_part, remaining, self.conn
+            shutdown_socket(
+                self.conn,
+                socket.SHUT_RDWR if name == "request" else socket.SHUT_RD,
             )
-            logger.info(
-                "%s %s %s (from: %s:%d)",
-                request.method,
-                request.path,
-                request.version,
-                *self.address
+        except OSError:
+            pass
+
+    def _arm_body_deadline(self, request: HTTPRequest):
+        if request.stream is not None and not request.stream.at_eof:
+            self._body_stream = request.stream
+            self._deadlines.phase("body", settings.BODY_READ_TIMEOUT)
+
+    def _send_timeout_response(self):
+        """ `408` (then the connection is closed) """
+        response_obj = HTTPResponse(
+            status_code=408,
+            headers={"connection": "close"},
+            body=STATUS_MESSAGES[408].encode(),
+            mem_type="text/plain",
+        )
+        try:
+            self._send_response(
+                response_obj.build_response_buffers(), flush=True
             )
-            return request
-        except Exception as err:
-            logger.info("[!] Failed to parse request: %s", err)
-            return None
+        except OSError:
+            pass
+
+    def _lingering_close(self):
+        """ after an error response to a request which is still arriving
+        (e.g. too large head / body): shut the sending side down (the
+        client sees the response & EOF), then drain what's in flight
+        (bounded). closing with unread bytes would send a reset, which may
+        discard the response before the client reads it """
+        self._deadlines.cancel()
+        try:
+            if self._tls:
+                send_close_notify(self.conn)
+            else:
+                shutdown_socket(self.conn, socket.SHUT_WR)
+            self.conn.settimeout(LINGER_TIMEOUT)
+            deadline = time.monotonic() + LINGER_TIMEOUT
+            drained = 0
+            while (
+                drained < settings.MAX_BODY_DRAIN_SIZE
+                and time.monotonic() < deadline
+            ):
+                data = self.conn.recv(65536)
+                if not data:
+                    break
+                drained += len(data)
+        except OSError:  # (timeout / reset: nothing left to protect)
+            pass
 
-    def _read_until_body_header_terminator(self) -> tuple[bytes, bytes]:
+    def _expect_continue(self, request: HTTPRequest):
+        """ if client waits for `100 Continue` before sending the body, send
+        it when the body is read for the first time (not at all, if the
+        handler answers without reading the body) """
+        if request.stream is not None and self._expects_continue(request):
+            request.stream.before_receive = self._send_continue
+
+    def _send_continue(self):
+        self._flush_pending_responses()  # (keep responses in order)
+        self.conn.sendall(CONTINUE_RESPONSE)
+
+    @staticmethod
+    def _expects_continue(request: HTTPRequest) -> bool:
+        expect = request.headers.get("expect")
+        return (
+            expect is not None
+            and request.version == "HTTP/1.1"
+            and expect.strip().lower() == "100-continue"
+        )
+
+    @staticmethod
+    def _discard_request_body(request: HTTPRequest) -> bool:
+        """ skip the part of request body which the handler hasn't read
+        (up to `MAX_BODY_DRAIN_SIZE`). returns False if it's left unread
+        (-> connection can't be reused). a body which the client is still
+        holding back (no `100 Continue` sent) is never drained """
+        if request.stream is None or request.stream.at_eof:
+            return True
+        if request.stream.before_receive is not None or (
+            "expect" in request.headers and request.stream.bytes_read == 0
+        ):
+            return False
+        try:
+            return request.stream.skip(settings.MAX_BODY_DRAIN_SIZE)
+        except HTTPParseError as err:
+            logger.debug("Couldn't discard request body: %s", err)
+            return False
+
+    def _read_request_head(self) -> bool:
         """
-        Read from socket until the terminator ('\r\n\r\n') is found.
-        This uses a buffer and may read more bytes than strictly necessary;
-        the extra bytes are returned as 'remaining' so caller can process them.
-        Returns a tuple (header_part, remaining).
-        header_part: data before terminator / remaining: remaining bytes
-        after terminator on buffer (starting bytes of body)
+        Feed `self.parser` with bytes which are already in `self.buffer`
+        (left from the previous request on this connection, e.g. pipelined
+        requests) and then with bytes received from socket, until the
+        request-head (request-line + headers) is completely parsed.
+        the rest (start of body / next request) stays in buffer.
+        Returns False if socket is closed by peer before that.
+        (time of reception is measured from the first byte of request-head,
+        so idle keep-alive time isn't counted)
         """
 
-        terminator = b"\r\n\r\n"
+        first_byte_at = None
+        if self.buffer:
+            first_byte_at = time.perf_counter()
+            self._start_request_deadlines()
+        parse_time = 0.0
         while True:
+            started = time.perf_counter()
+            done = self.parser.feed(self.buffer)
+            parse_time += time.perf_counter() - started
+            if done:
+                break
             try:
-                chunk = self.conn.recv(2048)  # 2 KB
+                received = self.buffer.recv_into(self.conn, 2048)  # 2 KB
             except socket.timeout:
                 raise
-            if not chunk:
+            if not received:
+                if self._expired is not None:
+                    raise socket.timeout(f"{self._expired} deadline")
                 logger.debug(
-                    "socket closed by peer while waiting for terminator"
+                    "socket closed by peer while waiting for request-head"
                 )
-                break
-            self.buffer += chunk
-            idx = self.buffer.find(terminator)  # Returns -1 on failure.
-            if idx != -1:
-                header_part = bytes(self.buffer[:idx])
-                start_of_body = bytes(self.buffer[idx + len(terminator):])
-                return header_part, start_of_body
-
-        # Terminator not found, return all we have as header_part
-        return self.buffer, b""
+                return False
+            if first_byte_at is None:
+                first_byte_at = time.perf_counter()
+                self._start_request_deadlines()
+        self._deadlines.end_phase()
+        self._parse_time = parse_time
+        metrics.observe_phase(
+            "read", time.perf_counter() - first_byte_at - parse_time
+        )
+        return True
+
+    def _start_request_deadlines(self):
+        """ (first byte of a request-head) """
+        self._deadlines.phase("header", settings.HEADER_READ_TIMEOUT)
+        self._deadlines.start_request(settings.REQUEST_TIMEOUT)
+
+    def _send_response_obj(self, response_obj: HTTPResponse):
+        """ send Http-Response: 'chunked transferring', a file (sendfile)
+        or the whole Response 'at once' """
+
+        if (
+            response_obj.is_streamed()
+            and not response_obj.is_for_head_method
+        ):
+            # If chunked (or streamed, of known length) response provided:
+            # first: send headers with `Transfer-Encoding: chunked`
+            # (and responses of previous pipelined requests, if any)
+            http_header = response_obj.build_response_buffers()
+            self._send_response(http_header, flush=True)
+            # then: stream (coalesced) chunks + terminating chunk
+            self._stream_chunks(response_obj)
+        elif response_obj.has_file_parts():
+            # send headers, then file content by `os.sendfile()`
+            http_header = response_obj.build_response_buffers()
+            self._send_response(http_header, flush=True)
+            if response_obj.file_body is not None:
+                self._sendfile_all(response_obj.file_body)
+            else:
+                self._send_body_parts(response_obj.body_parts)
+        else:
+            # header-block & body are sent by one `sendmsg()`
+            # (body is not copied into a new bytes object)
+            response = response_obj.build_response_buffers()
+            self._send_response(response)
+
+    def _stream_chunks(self, response_obj: HTTPResponse):
+        """
+        send chunks of body (from a sync or async producer) by scatter-gather
+        writes of coalesced chunk frames (see `app/http/streaming.py`).
+        blocking writes -> producer is paused while the socket buffer is
+        full (backpressure)
+        """
+        writer = ChunkedWriter(
+            settings.CHUNKED_COALESCE_SIZE,
+            settings.CHUNKED_FLUSH_INTERVAL,
+            framed=response_obj.chunked,
+        )
+        chunks = iterate_in_thread(
+            response_obj.iter_body(), writer.flush_interval, writer
+        )
+        for chunk in chunks:
+            frame = writer.write(chunk)
+            if frame:
+                self._sendmsg_all(frame)
+        self._sendmsg_all(writer.finish(response_obj.trailers))
+
+    def _send_response(self, response: list[BodyType], flush: bool = False):
+        """
+        queue the response buffers while next pipelined request is already in
+        buffer (up to `MAX_PIPELINED_REQUESTS` responses), otherwise send all
+        queued responses at once
+        """
+        self._pending_buffers.extend(response)
+        self._pending_responses += 1
+        if (
+            flush
+            or self._pending_responses >= self._max_pipelined
+            or self.buffer.find(b"\r\n\r\n") == -1  # no complete request
+        ):
+            self._flush_pending_responses()
+
+    def _flush_pending_responses(self):
+        """ send all queued responses using a single scatter-gather write """
+        if not self._pending_buffers:
+            return
+        buffers, self._pending_buffers = self._pending_buffers, []
+        self._pending_responses = 0
+        self._sendmsg_all(buffers)
+
+    def _sendmsg_all(self, buffers: list[BodyType]):
+        """
+        like `sendall()` for a list of buffers: writes them by `sendmsg()`
+        (without joining them into a new bytes object) and handles partial
+        writes. falls back to `sendall()` where `sendmsg()` is unavailable
+        (TLS: buffers are joined -> encrypted into as few records as can be)
+        """
+        if self._tls and len(buffers) > 1:
+            self.conn.sendall(b"".join(buffers))
+            return
+        if len(buffers) == 1 or not hasattr(self.conn, "sendmsg"):
+            for buf in buffers:
+                self.conn.sendall(buf)
+            return
+
+        views = [memoryview(buf) for buf in buffers]
+        while views:
+            sent = self.conn.sendmsg(views[:IOV_MAX])
+            # drop fully sent buffers / cut the partially sent one
+            while views and sent >= len(views[0]):
+                sent -= len(views.pop(0))
+            if views and sent:
+                views[0] = views[0][sent:]
+
+    def _send_body_parts(self, parts: list[BodyType | FileBody]):
+        """ send mixed body parts in order: consecutive in-memory buffers by
+        one `sendmsg()`, file regions by `os.sendfile()` """
+        buffers = []
+        for part in parts:
+            if isinstance(part, FileBody):
+                if buffers:
+                    self._sendmsg_all(buffers)
+                    buffers = []
+                self._sendfile_all(part)
+            else:
+                buffers.append(part)
+        if buffers:
+            self._sendmsg_all(buffers)
+
+    def _sendfile_all(self, file_body: FileBody):
+        """
+        send a file region using `os.sendfile()` (zero-copy: kernel sends
+        file pages to the socket directly). the socket is non-blocking
+        under a timeout, so wait until it's writable when its buffer is full.
+        falls back to `os.pread()` + `sendall()` where sendfile is missing
+        (and for TLS: the kernel can't encrypt what it sends).
+        """
+        offset, remaining = file_body.offset, file_body.count
+        if self._tls or not hasattr(os, "sendfile"):
+            while remaining > 0:
+                data = os.pread(file_body.fd, min(remaining, 65536), offset)
+                if not data:
+                    break
+                self.conn.sendall(data)
+                offset += len(data)
+                remaining -= len(data)
+            return
+
+        out_fd = self.conn.fileno()
+        while remaining > 0:
+            try:
+                sent = os.sendfile(out_fd, file_body.fd, offset, remaining)
+            except BlockingIOError:
+                self._wait_writable()
+                continue
+            if sent == 0:  # file is shorter than expected (truncated)
+                raise ConnectionAbortedError("file truncated while sending")
+            offset += sent
+            remaining -= sent
+
+    def _wait_writable(self):
+        """ wait until socket is writable (raise socket.timeout if it takes
+        longer than the socket's timeout) """
+        timeout = self.conn.gettimeout()
+        with _WriteSelector() as selector:
+            selector.register(self.conn, selectors.EVENT_WRITE)
+            if not selector.select(timeout):
+                raise socket.timeout("timed out while sending file")
 
     @staticmethod
     def _keep_connection_alive(request: HTTPRequest) -> bool:
@@ -0,0 +1,758 @@
+""" HTTP/2 connections (h2c, protocol in `app/http/h2.py`) of both engines.
+a connection is switched to HTTP/2 by `ConnectionHandler` /
+`AsyncConnectionHandler` (preface of prior knowledge, or `Upgrade: h2c`):
+- <H2ConnectionHandler> (threads engine): the connection's worker-thread
+  only reads & dispatches frames. requests (streams) are handled
+  concurrently by the server's executor, whose threads send their own
+  responses (under the connection's lock, waiting for flow-control
+  windows) -> many concurrent requests on one connection & one reader
+- <AsyncH2ConnectionHandler> (asyncio engine): the same, with a task per
+  stream (handlers run on the loop, or on the executor if provided)
+request bodies are received into spooled temporary files (like the
+asyncio engine does) and handed to handlers as `SpooledRequestBody`,
+after the pre-body admission hook accepted the request. the connection
+is closed (GOAWAY) when it stays idle (no open streams) for the keep-alive
+timeout.
+"""
+
+import os
+import ssl
+import time
+import socket
+import selectors
+import asyncio
+import threading
+from tempfile import SpooledTemporaryFile
+from typing import Iterator, Optional
+from concurrent.futures import Executor, wait as wait_futures
+
+from app.config import settings
+from app.logging import logger, access_log
+from app.http.body import SpooledRequestBody
+from app.http.errors import HTTPParseError
+from app.http.request import HTTPRequest
+from app.http.response import HTTPResponse, FileBody
+from app.http.status import STATUS_MESSAGES
+from app.http.streaming import (
+    ChunkedWriter, FLUSH, iterate_in_thread, iterate_on_loop,
+    is_async_iterable,
+)
+from app.http.h2 import (
+    H2Connection, H2Error, H2StreamError, PREFACE,
+    RequestReceived, DataReceived, StreamReset, ConnectionClosed,
+    NO_ERROR, REFUSED_STREAM, CANCEL, ENHANCE_YOUR_CALM, build_request,
+    response_fields,
+)
+from app.handler import RequestHandler
+from app.metrics import metrics
+from app.timers import TimerWheel, ConnectionDeadlines, KeepAlivePolicy
+from app.tls import shutdown_socket
+
+
+# max size of the DATA sent at once (-> other streams get their turn)
+SEND_SLICE_SIZE = 64 * 1024
+# file regions are read by this size (DATA frames can't be sendfile'd)
+FILE_READ_SIZE = 64 * 1024
+
+_ReadSelector = getattr(selectors, "PollSelector", selectors.SelectSelector)
+
+
+class _GoneStream(Exception):
+    """ the stream was reset / the connection is closed -> stop sending """
+
+
+class _Stream:
+    """ a request of the connection (until its response is sent) """
+
+    __slots__ = (
+        "request", "body", "body_size", "rejected", "started", "dispatched",
+        "reset",
+    )
+
+    def __init__(self, request: HTTPRequest):
+        self.request: HTTPRequest = request
+        self.body = None  # (spooled body being received)
+        self.body_size: int = 0
+        self.rejected: Optional[HTTPResponse] = None  # (by admission)
+        self.started: float = time.perf_counter()
+        self.dispatched: bool = False  # (handed to a handler)
+        self.reset: bool = False  # (by the peer: response isn't wanted)
+
+
+def new_h2_connection(preface: bytes = PREFACE) -> H2Connection:
+    return H2Connection(
+        settings.HTTP2_MAX_CONCURRENT_STREAMS,
+        settings.HTTP2_INITIAL_WINDOW_SIZE,
+        settings.HTTP2_MAX_FRAME_SIZE,
+        settings.HTTP2_HEADER_TABLE_SIZE,
+        settings.MAX_HEADER_SIZE,
+        preface,
+    )
+
+
+class _H2Streams:
+    """ engine-independent part: events -> requests & bodies
+    (each engine's handler defines `_on_deadline()` of its deadlines) """
+
+    def _init_streams(
+        self,
+        address,
+        timers: TimerWheel,
+        policy: KeepAlivePolicy,
+        preface: bytes,
+        upgrade: Optional[tuple[HTTPRequest, bytes]]
+    ):
+        self.address = address
+        self.policy: KeepAlivePolicy = policy
+        self._h2: H2Connection = new_h2_connection(preface)
+        self._streams: dict[int, _Stream] = {}
+        self._upgrade = upgrade
+        self._running: bool = True
+        self._deadlines = ConnectionDeadlines(timers, self._on_deadline)
+        # budget of stream resets (token bucket, see `_on_reset()`)
+        self._reset_tokens: float = settings.HTTP2_RESET_BURST
+        self._reset_time: float = time.monotonic()
+
+    def _start(self) -> list[int]:
+        """ our SETTINGS (+ stream 1 of an upgraded request).
+        returns ids of streams which are ready to be handled """
+        request, upgrade_settings = self._upgrade or (None, None)
+        self._h2.initiate(upgrade_settings)
+        if request is None:
+            self._arm_idle_deadline()
+            return []
+        self._upgrade = None
+        self._streams[1] = _Stream(request)
+        self._admit(1)
+        return self._ready([1])
+
+    def _process(self, events: list) -> list[int]:
+        """ apply events of received frames. returns ids of streams which
+        are ready to be handled (request complete, or rejected) """
+        ready = []
+        for event in events:
+            if isinstance(event, RequestReceived):
+                if self._on_request(event):
+                    ready.append(event.stream_id)
+            elif isinstance(event, DataReceived):
+                if self._on_data(event):
+                    ready.append(event.stream_id)
+            elif isinstance(event, StreamReset):
+                self._on_reset(event)
+            elif isinstance(event, ConnectionClosed):
+                self._running = False
+        return self._ready(ready)
+
+    def _ready(self, ready: list[int]) -> list[int]:
+        """ streams to dispatch (the ones reset meanwhile are gone) """
+        ready = [i for i in ready if i in self._streams]
+        for stream_id in ready:
+            self._streams[stream_id].dispatched = True
+        return ready
+
+    def _on_request(self, event: RequestReceived) -> bool:
+        if len(self._streams) >= self._h2.max_concurrent_streams:
+            # (streams reset by the peer are closed for `H2Connection`, but
+            # their handlers may still be running: they count too)
+            self._h2.reset_stream(event.stream_id, REFUSED_STREAM)
+            return False
+        try:
+            request = build_request(event.stream_id, event.fields)
+        except H2StreamError as err:
+            self._h2.reset_stream(err.stream_id, err.code)
+            return False
+        stream = self._streams[event.stream_id] = _Stream(request)
+        self._deadlines.end_phase()
+        if self._admit(event.stream_id):
+            return True
+        if not event.end_stream:
+            stream.body = SpooledTemporaryFile(
+                max_size=settings.BODY_SPOOL_THRESHOLD
+            )
+            return False
+        return True
+
+    def _admit(self, stream_id: int) -> bool:
+        """ pre-body admission hook. True if the request is rejected (its
+        response is ready, the body is never received) """
+        stream = self._streams[stream_id]
+        request = stream.request
+        request.client = self.address
+        try:
+            stream.rejected = RequestHandler.admit_request(
+                request, self.address
+            )
+        except HTTPParseError as err:  # (e.g. Content-Length too large)
+            logger.info("[!] Rejected request: %s", err)
+            stream.rejected = _error_response(err.status_code)
+        except Exception as e:
+            logger.exception("Error while admitting request: %s", e)
+            stream.rejected = _error_response(500)
+        return stream.rejected is not None
+
+    def _on_data(self, event: DataReceived) -> bool:
+        stream = self._streams.get(event.stream_id)
+        if stream is None or stream.body is None:
+            # (rejected / reset stream: only given back to the windows)
+            self._h2.acknowledge(event.stream_id, event.flow_length)
+            return False
+        stream.body.write(event.data)
+        stream.body_size += len(event.data)
+        self._h2.acknowledge(event.stream_id, event.flow_length)
+        if stream.body_size > settings.MAX_BODY_SIZE:
+            stream.body.close()
+            stream.body = None
+            stream.rejected = _error_response(413)
+            return True
+        if not event.end_stream:
+            return False
+        stream.body.seek(0)
+        stream.request.stream = SpooledRequestBody(
+            stream.body, stream.body_size
+        )
+        stream.body = None
+        return True
+
+    def _on_reset(self, event: StreamReset):
+        """ a stream was reset: it's forgotten at once if it isn't handled
+        yet (otherwise its handler's response is dropped). a peer which
+        resets streams faster than its budget allows is a "rapid reset"
+        flood -> GOAWAY """
+        stream = self._streams.get(event.stream_id)
+        if stream is not None:
+            stream.reset = True
+            if not stream.dispatched:
+                self._drop_stream(event.stream_id)
+        now = time.monotonic()
+        self._reset_tokens = min(
+            settings.HTTP2_RESET_BURST,
+            self._reset_tokens
+            + (now - self._reset_time) * settings.HTTP2_RESET_RATE,
+        )
+        self._reset_time = now
+        self._reset_tokens -= 1.0
+        if self._reset_tokens < 0 and self._running:
+            logger.info("[!] Too many HTTP/2 stream resets: %s", self.address)
+            self._h2.close(ENHANCE_YOUR_CALM, "Too many stream resets")
+            self._running = False
+
+    def _drop_stream(self, stream_id: int):
+        """ forget a reset stream (no response, no access-line) """
+        stream = self._streams.pop(stream_id, None)
+        if stream is None:
+            return
+        if stream.body is not None:
+            stream.body.close()
+        if stream.request.stream is not None:
+            stream.request.stream.close()
+        if self._running:
+            self._arm_idle_deadline()
+
+    def _arm_idle_deadline(self):
+        if not self._streams:
+            self._deadlines.phase("idle", self.policy.keepalive_timeout())
+
+    def _finish_stream(
+        self, stream_id: int, response: HTTPResponse, started: float
+    ):
+        stream = self._streams.pop(stream_id, None)
+        if stream is None:
+            return
+        request = stream.request
+        if request.stream is not None:
+            request.stream.close()  # (spooled body)
+        sent_at = time.perf_counter()
+        metrics.request_done(response.status_code, True)
+        access_log.log(self.address, request, response, sent_at - started)
+        if self._running:
+            self._arm_idle_deadline()
+
+
+def _error_response(status_code: int) -> HTTPResponse:
+    return HTTPResponse(
+        status_code=status_code,
+        body=STATUS_MESSAGES[status_code].encode(),
+        mem_type="text/plain",
+    )
+
+
+def _file_chunks(file_body: FileBody) -> Iterator[bytes]:
+    offset, remaining = file_body.offset, file_body.count
+    while remaining > 0:
+        data = os.pread(
+            file_body.fd, min(remaining, FILE_READ_SIZE), offset
+        )
+        if not data:
+            break
+        offset += len(data)
+        remaining -= len(data)
+        yield data
+
+
+def _body_chunks(response: HTTPResponse) -> Iterator:
+    """ chunks of a (not streamed) response body, file regions included """
+    if response.file_body is not None:
+        yield from _file_chunks(response.file_body)
+    elif response.body_parts is not None:
+        for part in response.body_parts:
+            if isinstance(part, FileBody):
+                yield from _file_chunks(part)
+            else:
+                yield part
+    else:
+        yield from response.body_buffers()
+
+
+def _with_last(chunks) -> Iterator[tuple[bytes, bool]]:
+    """ (chunk, is it the last one) pairs. (b"", True) if there is none """
+    previous = None
+    for chunk in chunks:
+        if previous is not None:
+            yield previous, False
+        previous = chunk
+    yield (b"" if previous is None else previous), True
+
+
+def _trailer_fields(trailers: dict[str, str]) -> list[tuple[bytes, bytes]]:
+    return [
+        (name.lower().encode("utf-8"), value.encode("utf-8"))
+        for name, value in trailers.items()
+    ]
+
+
+class H2ConnectionHandler(_H2Streams):
+    """ HTTP/2 connection of the threads engine (see module docstring) """
+
+    def __init__(
+        self,
+        connection: socket.socket,
+        address,
+        timers: TimerWheel,
+        policy: KeepAlivePolicy,
+        executor: Optional[Executor] = None,
+        data: bytes = b"",
+        preface: bytes = PREFACE,
+        upgrade: Optional[tuple[HTTPRequest, bytes]] = None
+    ):
+        self.conn: socket.socket = connection
+        self._tls: bool = isinstance(connection, ssl.SSLSocket)
+        # (frames of many streams are interleaved in small writes, which
+        # mustn't wait for ACKs of each other. asyncio does the same)
+        self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._init_streams(address, timers, policy, preface, upgrade)
+        # if None, streams are handled one by one by the reading thread
+        self._executor: Optional[Executor] = executor
+        self._data: bytes = data  # (received already, by HTTP/1 parsing)
+        # protects `self._h2` & writes. (senders wait for windows on it)
+        self._lock = threading.Condition()
+        self._futures: set = set()
+
+    def handle_connection(self):
+        try:
+            with self._lock:
+                ready = self._start()
+                self._flush()
+            self._dispatch(ready)
+            if self._data:
+                self._receive(self._data)
+                self._data = b""
+            while self._running:
+                try:
+                    data = self._recv()
+                except socket.timeout:
+                    if self._streams:  # (waiting for handlers)
+                        continue
+                    break
+                if not data:
+                    break
+                self._receive(data)
+        except (ConnectionResetError, BrokenPipeError):
+            logger.debug("Connection reset by peer")
+        except OSError as e:
+            logger.debug("HTTP/2 connection error: %s", e)
+        finally:
+            self._close()
+
+    def _recv(self) -> bytes:
+        if not self._tls:
+            return self.conn.recv(65536)
+        # an SSL object mustn't read & write in two threads at once: wait
+        # for data without the lock, then read it (non-blocking) under it
+        while True:
+            if not self.conn.pending():
+                with _ReadSelector() as selector:
+                    selector.register(self.conn, selectors.EVENT_READ)
+                    if not selector.select(self.conn.gettimeout()):
+                        raise socket.timeout("timed out")
+            with self._lock:
+                timeout = self.conn.gettimeout()
+                self.conn.setblocking(False)
+                try:
+                    return self.conn.recv(65536)
+                except ssl.SSLWantReadError:  # (a part of a TLS record)
+                    continue
+                finally:
+                    self.conn.settimeout(timeout)
+
+    def _receive(self, data: bytes):
+        with self._lock:
+            try:
+                events = self._h2.receive(data)
+            except H2Error as err:
+                logger.info("[!] HTTP/2 protocol error: %s", err)
+                self._h2.close(err.code, str(err))
+                self._running = False
+                self._flush()
+                return
+            ready = self._process(events)
+            self._flush()
+            self._lock.notify_all()  # (windows / resets -> senders)
+        self._dispatch(ready)
+
+    def _dispatch(self, ready: list[int]):
+        for stream_id in ready:
+            if self._executor is None:
+                self._serve_stream(stream_id)
+                continue
+            try:
+                future = self._executor.submit(self._serve_stream, stream_id)
+            except RuntimeError:  # (executor is shut down)
+                with self._lock:
+                    self._streams.pop(stream_id, None)
+                    self._h2.reset_stream(stream_id, REFUSED_STREAM)
+                    self._flush()
+                continue
+            self._futures.add(future)
+            future.add_done_callback(self._futures.discard)
+
+    def _serve_stream(self, stream_id: int):
+        """ (executor thread) handle a request and send its response """
+        with self._lock:
+            stream = self._streams.get(stream_id)
+            if stream is None:
+                return
+            if stream.reset:  # (reset while it was waiting for a thread)
+                self._drop_stream(stream_id)
+                return
+        response = stream.rejected
+        if response is None:
+            try:
+                response = RequestHandler.get_response(stream.request)
+            except Exception as e:
+                logger.exception("Error while handling request: %s", e)
+                response = _error_response(500)
+        try:
+            self._send_response(stream_id, response)
+            if stream.rejected is not None:
+                with self._lock:  # (body isn't wanted: stop the client)
+                    self._h2.reset_stream(stream_id, NO_ERROR)
+                    self._flush()
+        except _GoneStream:
+            logger.debug("HTTP/2 stream %d is gone", stream_id)
+        except OSError as e:
+            logger.debug("Couldn't send HTTP/2 response: %s", e)
+        finally:
+            response.close()
+            with self._lock:
+                self._finish_stream(stream_id, response, stream.started)
+
+    def _send_response(self, stream_id: int, response: HTTPResponse):
+        fields = response_fields(response)
+        head_only = response.is_for_head_method
+        if not head_only and not response.is_streamed():
+            # (headers go out with the first DATA, in the same write)
+            with self._lock:
+                self._h2.send_headers(stream_id, fields)
+            for chunk, last in _with_last(_body_chunks(response)):
+                self._send_data(stream_id, chunk, last)
+            return
+        with self._lock:
+            self._h2.send_headers(stream_id, fields, head_only)
+            self._flush()
+        if head_only:
+            return
+        writer = ChunkedWriter(
+            settings.CHUNKED_COALESCE_SIZE,
+            settings.CHUNKED_FLUSH_INTERVAL,
+            framed=False,
+        )
+        chunks = self._coalesced(writer, iterate_in_thread(
+            response.iter_body(), writer.flush_interval, writer
+        ))
+        try:
+            for chunk in chunks:
+                self._send_data(stream_id, chunk)
+        finally:
+            chunks.close()
+        if not response.trailers:
+            self._send_data(stream_id, b"", end_stream=True)
+            return
+        with self._lock:
+            self._h2.send_headers(
+                stream_id, _trailer_fields(response.trailers), True
+            )
+            self._flush()
+
+    @staticmethod
+    def _coalesced(writer: ChunkedWriter, chunks) -> Iterator[bytes]:
+        for chunk in chunks:
+            frame = writer.write(chunk)
+            if frame:
+                yield b"".join(frame)
+        frame = writer.finish()
+        if frame:
+            yield b"".join(frame)
+
+    def _send_data(self, stream_id: int, data, end_stream: bool = False):
+        """ DATA within the flow-control windows (waits for the peer's
+        WINDOW_UPDATE while they are exhausted) """
+        view = memoryview(data).cast("B")
+        while True:
+            with self._lock:
+                window = self._h2.window(stream_id)
+                while window == 0 and (len(view) or not end_stream):
+                    self._flush()  # (e.g. headers of the stream)
+                    if not self._lock.wait(settings.TCP_CONNECTION_TIMEOUT):
+                        self._h2.reset_stream(stream_id, CANCEL)
+                        self._flush()
+                        raise _GoneStream()
+                    window = self._h2.window(stream_id)
+                if window < 0:
+                    raise _GoneStream()
+                size = min(window, len(view), SEND_SLICE_SIZE)
+                last = size == len(view)
+                self._h2.send_data(
+                    stream_id, view[:size], end_stream and last
+                )
+                self._flush()
+            view = view[size:]
+            if last:
+                return
+
+    def _flush(self):
+        """ (with lock) send queued frames """
+        data = self._h2.data_to_send()
+        if data:
+            self.conn.sendall(data)
+
+    def _on_deadline(self, name: str):
+        """ (timer wheel thread) idle -> stop reading (then GOAWAY) """
+        with self._lock:
+            if self._streams:
+                return
+            self._running = False
+        try:
+            shutdown_socket(self.conn, socket.SHUT_RD)
+        except OSError:
+            pass
+
+    def _close(self):
+        """ GOAWAY, then let the streams in progress finish """
+        self._running = False
+        self._deadlines.cancel()
+        with self._lock:
+            self._h2.close()
+            try:
+                self._flush()
+            except OSError:
+                pass
+        if self._futures:
+            wait_futures(list(self._futures), settings.REQUEST_TIMEOUT)
+        with self._lock:
+            for stream in self._streams.values():
+                if stream.body is not None:
+                    stream.body.close()
+            self._streams.clear()
+            self._lock.notify_all()
+
+
+class AsyncH2ConnectionHandler(_H2Streams):
+    """ HTTP/2 connection of the asyncio engine (see module docstring) """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        timers: TimerWheel,
+        policy: KeepAlivePolicy,
+        executor: Optional[Executor] = None,
+        preface: bytes = PREFACE,
+        upgrade: Optional[tuple[HTTPRequest, bytes]] = None
+    ):
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self._init_streams(
+            writer.get_extra_info("peername"), timers, policy, preface,
+            upgrade,
+        )
+        self._executor: Optional[Executor] = executor
+        self._window_changed = asyncio.Event()
+        self._tasks: set[asyncio.Task] = set()
+
+    async def handle_connection(self):
+        try:
+            self._dispatch(self._start())
+            await self._flush()
+            while self._running:
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                try:
+                    events = self._h2.receive(data)
+                except H2Error as err:
+                    logger.info("[!] HTTP/2 protocol error: %s", err)
+                    self._h2.close(err.code, str(err))
+                    break
+                ready = self._process(events)
+                self._window_changed.set()
+                await self._flush()
+                self._dispatch(ready)
+        except asyncio.TimeoutError:
+            logger.debug("HTTP/2 connection is idle")
+        except (ConnectionResetError, BrokenPipeError):
+            logger.debug("Connection reset by peer")
+        except OSError as e:
+            logger.debug("HTTP/2 connection error: %s", e)
+        finally:
+            await self._close()
+
+    def _dispatch(self, ready: list[int]):
+        for stream_id in ready:
+            task = asyncio.ensure_future(self._serve_stream(stream_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _serve_stream(self, stream_id: int):
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            return
+        if stream.reset:
+            self._drop_stream(stream_id)
+            return
+        response = stream.rejected
+        if response is None:
+            try:
+                response = await self._handle_request(stream.request)
+            except Exception as e:
+                logger.exception("Error while handling request: %s", e)
+                response = _error_response(500)
+        try:
+            await self._send_response(stream_id, response)
+            if stream.rejected is not None:
+                self._h2.reset_stream(stream_id, NO_ERROR)
+                await self._flush()
+        except _GoneStream:
+            logger.debug("HTTP/2 stream %d is gone", stream_id)
+        except OSError as e:
+            logger.debug("Couldn't send HTTP/2 response: %s", e)
+        finally:
+            response.close()
+            self._finish_stream(stream_id, response, stream.started)
+
+    async def _handle_request(self, request: HTTPRequest) -> HTTPResponse:
+        if self._executor is None:
+            return RequestHandler.get_response(request)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, RequestHandler.get_response, request
+        )
+
+    async def _send_response(self, stream_id: int, response: HTTPResponse):
+        fields = response_fields(response)
+        head_only = response.is_for_head_method
+        if not head_only and not response.is_streamed():
+            self._h2.send_headers(stream_id, fields)  # (sent with DATA)
+            for chunk, last in _with_last(_body_chunks(response)):
+                await self._send_data(stream_id, chunk, last)
+            return
+        self._h2.send_headers(stream_id, fields, head_only)
+        await self._flush()
+        if head_only:
+            return
+        body = response.iter_body()
+        if is_async_iterable(body):  # (each chunk is sent at once)
+            async for chunk in body:
+                if chunk is not FLUSH:
+                    await self._send_data(stream_id, chunk)
+        else:  # (small chunks are coalesced, see `iterate_on_loop()`)
+            writer = ChunkedWriter(
+                settings.CHUNKED_COALESCE_SIZE,
+                settings.CHUNKED_FLUSH_INTERVAL,
+                framed=False,
+            )
+            chunks = iterate_on_loop(body, writer)
+            try:
+                async for chunk in chunks:
+                    frame = writer.write(chunk)
+                    if frame:
+                        await self._send_data(stream_id, b"".join(frame))
+            finally:
+                await chunks.aclose()
+            frame = writer.finish()
+            if frame:
+                await self._send_data(stream_id, b"".join(frame))
+        if not response.trailers:
+            await self._send_data(stream_id, b"", end_stream=True)
+            return
+        self._h2.send_headers(
+            stream_id, _trailer_fields(response.trailers), True
+        )
+        await self._flush()
+
+    async def _send_data(
+        self, stream_id: int, data, end_stream: bool = False
+    ):
+        view = memoryview(data).cast("B")
+        while True:
+            window = self._h2.window(stream_id)
+            while window == 0 and (len(view) or not end_stream):
+                await self._flush()  # (e.g. headers of the stream)
+                self._window_changed.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._window_changed.wait(),
+                        settings.TCP_CONNECTION_TIMEOUT,
+                    )
+                except asyncio.TimeoutError:
+                    self._h2.reset_stream(stream_id, CANCEL)
+                    await self._flush()
+                    raise _GoneStream()
+                window = self._h2.window(stream_id)
+            if window < 0:
+                raise _GoneStream()
+            size = min(window, len(view), SEND_SLICE_SIZE)
+            last = size == len(view)
+            self._h2.send_data(stream_id, view[:size], end_stream and last)
+            await self._flush()
+            view = view[size:]
+            if last:
+                return
+
+    async def _flush(self):
+        data = self._h2.data_to_send()
+        if data:
+            self.writer.write(data)
+            await self.writer.drain()
+
+    def _on_deadline(self, name: str):
+        """ (on the loop) idle -> the pending read fails (then GOAWAY) """
+        if not self._streams:
+            self.reader.set_exception(asyncio.TimeoutError(f"{name}"))
+
+    async def _close(self):
+        self._running = False
+        self._deadlines.cancel()
+        self._h2.close()
+        try:
+            await self._flush()
+        except OSError:
+            pass
+        self._window_changed.set()
+        if self._tasks:
+            await asyncio.wait(
+                list(self._tasks), timeout=settings.REQUEST_TIMEOUT
+            )
+        for stream in self._streams.values():
+            if stream.body is not None:
+                stream.body.close()
+        self._streams.clear()
@@ -1,24 +1,179 @@
+import zlib
+from typing import Optional
+
+from app.config import settings
 from app.http.request import HTTPRequest
+from app.http.parser import HTTPParser
 from app.http.response import HTTPResponse
+from app.http.status import STATUS_MESSAGES
+from app.http.conditional import (
+    make_etag,
+    is_not_modified,
+    not_modified_response,
+    range_applies,
+    range_response,
+)
+from app.http.compression import ResponseCompressor
+from app.static import StaticFilesHandler
+from app.routing import Router
+from app.cache import ResponseCache
+from app.ratelimit import RateLimiter
+from app.wsgi import WSGIAdapter, load_app
+from app.metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+
+
+# static files handler (mounted only if `STATIC_ROOT` is configured)
+static_files = (
+    StaticFilesHandler(
+        settings.STATIC_ROOT,
+        settings.STATIC_URL_PREFIX,
+        settings.STATIC_FILE_CACHE_SIZE,
+    )
+    if settings.STATIC_ROOT
+    else None
+)
+
+# application routes (e.g. `@router.route("/users/{user_id:int}")`)
+router = Router(settings.ROUTER_CACHE_SIZE)
+
+
+def metrics_endpoint(request: HTTPRequest) -> HTTPResponse:
+    """ metrics of this (worker) process in Prometheus text format """
+    return HTTPResponse(
+        body=metrics.render(),
+        mem_type=METRICS_CONTENT_TYPE,
+        headers={"cache-control": "no-store"},
+    )
+
+
+if settings.METRICS_ENABLED and settings.METRICS_PATH:
+    router.add(("GET",), settings.METRICS_PATH, metrics_endpoint)
+
+
+# WSGI application, for requests which match no static file / route
+wsgi_app = (
+    WSGIAdapter(load_app(settings.WSGI_APP), settings.WSGI_SCRIPT_NAME)
+    if settings.WSGI_APP
+    else None
+)
+
+
+# response compression (gzip / deflate)
+compressor = (
+    ResponseCompressor(
+        settings.COMPRESSION_MIN_SIZE,
+        settings.COMPRESSION_LEVEL,
+        settings.COMPRESSION_CACHE_SIZE,
+        settings.COMPRESSION_MAX_FILE_SIZE,
+    )
+    if settings.COMPRESSION_ENABLED
+    else None
+)
+
+# in-memory cache of (serialized) fresh responses, in front of the handler
+response_cache = (
+    ResponseCache(
+        settings.RESPONSE_CACHE_SIZE,
+        settings.RESPONSE_CACHE_MAX_ENTRY_SIZE,
+    )
+    if settings.RESPONSE_CACHE_ENABLED
+    else None
+)
+
+# per-client (IP) / per-route rate limiting, in front of the handler
+rate_limiter = (
+    RateLimiter(
+        settings.RATE_LIMIT_PER_IP,
+        settings.RATE_LIMIT_BURST,
+        settings.RATE_LIMIT_TABLE_SIZE,
+        settings.RATE_LIMIT_STRIPES,
+    )
+    if settings.RATE_LIMIT_ENABLED
+    else None
+)
 
 
 class RequestHandler:
     """ Analyze HTTPRequest-Objects and build proper HTTPResponse-Objects """
 
+    @staticmethod
+    def admit_request(
+        request: HTTPRequest, address=None
+    ) -> Optional[HTTPResponse]:
+        """
+        pre-body admission hook: runs right after the request-head is parsed
+        (body is not received yet). returns None to accept the request
+        (-> `100 Continue` is sent if the client expects it), or a final
+        (4xx) response which is sent instead (the body never crosses the
+        network if the client waits for `100 Continue`)
+        (rate limiting comes first: a pre-serialized `429` for the client
+        `address`, without running any handler code)
+        """
+        if rate_limiter is not None and address:
+            response = rate_limiter.check(
+                address[0], request,
+                router.resolve(request.method, request.path).route,
+            )
+            if response is not None:
+                return response
+        expect = request.headers.get("expect")
+        if expect is not None and request.version == "HTTP/1.1":
+            if expect.strip().lower() != "100-continue":
+                return HTTPResponse(
+                    status_code=417,
+                    body=STATUS_MESSAGES[417].encode(),
+                    mem_type="text/plain",
+                )
+        if static_files is not None and static_files.matches(request.path):
+            if request.method.upper() not in ("GET", "HEAD"):
+                return static_files.handle(request)  # (405)
+            return None
+        return router.admit(
+            request, HTTPParser.get_content_length(request.headers)
+        )
+
+    @staticmethod
+    def get_response(request: HTTPRequest) -> HTTPResponse:
+        """ response for request: from the response cache (if enabled and
+        there's a fresh entry), otherwise by `handle_request()` """
+        if response_cache is not None:
+            return response_cache.get_response(
+                request, RequestHandler.handle_request
+            )
+        return RequestHandler.handle_request(request)
+
     @staticmethod
     def handle_request(request: HTTPRequest) -> HTTPResponse:
         """
         gets a HTTPRequest-Obj, analyze it, and build a proper HTTPResponse-Obj
+        (then compress its body, if client accepts it & it's worth it)
         """
+        response = RequestHandler._build_response(request)
+        if compressor is not None:
+            response = compressor.apply(request, response)
+        return response
+
+    @staticmethod
+    def _build_response(request: HTTPRequest) -> HTTPResponse:
+        if static_files is not None and static_files.matches(request.path):
+            return static_files.handle(request)
+        response = router.dispatch(request)
+        if response is not None:  # (matched route, or 405)
+            return response
+        if wsgi_app is not None and wsgi_app.matches(request.path):
+            return wsgi_app(request)
         if request.method.upper() == "HEAD":  # just send `Headers`
             response_obj = HTTPResponse(body=b"", is_for_head_method=True)
             return response_obj
         # elif ...:
-        #   handle 'routing'
-        #   handle "Expect: 100-continue"
-        #   handle "provide chunk body transferring properly"
         #   etc...
         else:
+            # the page only depends on the path -> its (weak) ETag is known
+            # before the body is built, so a revalidation costs no body
+            etag = make_etag("page", zlib.crc32(request.path.encode()),
+                             weak=True)
+            if is_not_modified(request, etag):
+                return not_modified_response(etag)
             body = (
                 f"<br>"
                 f"<h1 style='text-align: center;'>"
@@ -26,5 +181,14 @@ class RequestHandler:
                 f"You requested {request.path!r}\n"
                 f"</h1>"
             ).encode("utf-8")
-            response = HTTPResponse(body=body, mem_type="text/html")
+            if range_applies(request, etag):
+                response = range_response(
+                    request, len(body), "text/html", body,
+                    headers={"etag": etag},
+                )
+                if response is not None:
+                    return response
+            response = HTTPResponse(
+                body=body, mem_type="text/html", headers={"etag": etag}
+            )
             return response
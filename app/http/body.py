@@ -0,0 +1,277 @@
+""" Request bodies:
+- <ContentLengthDecoder> / <ChunkedDecoder> incremental (sans-IO) body
+  decoders: they are fed with a `ReceiveBuffer` and return the next piece
+  of payload, or None when more bytes must be received first.
+  (chunked decoding remembers its state between calls -> nothing is
+  re-scanned, and payload is never joined in memory)
+- <RequestBody> a lazy stream of the request body, exposed to handlers as
+  `request.stream`. bytes are received from the socket only when the
+  handler reads them (iterate / read / readinto), or skips them.
+  `spool()` collects the whole body into a temporary file which stays in
+  memory only up to `BODY_SPOOL_THRESHOLD` bytes (then spills to disk).
+- <SpooledRequestBody> the same interface over an already spooled body
+  (used by the asyncio engine, which reads bodies before the handler runs)
+"""
+
+import string
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Callable, Iterator, Optional
+
+from app.config import settings
+from app.buffer import ReceiveBuffer
+from .errors import HTTPParseError
+
+
+READ_CHUNK_SIZE = 65536  # default size of pieces returned by iteration
+MAX_CHUNK_SIZE_LINE = 1024  # chunk-size line (+ chunk extensions)
+_HEX_DIGITS = frozenset(string.hexdigits.encode())
+
+
+class ContentLengthDecoder:
+    """ body framed by `Content-Length` """
+
+    __slots__ = ("remaining",)
+
+    def __init__(self, length: int):
+        self.remaining: int = length
+
+    @property
+    def done(self) -> bool:
+        return self.remaining == 0
+
+    @property
+    def needs_line(self) -> bool:
+        return False
+
+    @property
+    def pending(self) -> int:
+        """ max number of bytes which belong to the body (not more should
+        be read from a stream, the rest is the next request) """
+        return self.remaining
+
+    def decode(self, buffer: ReceiveBuffer, max_size: int) -> Optional[bytes]:
+        """ next piece of body (b"" -> end of body, None -> need more) """
+        if self.remaining == 0:
+            return b""
+        if not buffer:
+            return None
+        n = min(len(buffer), self.remaining, max_size)
+        self.remaining -= n
+        return buffer.consume(n)
+
+
+class ChunkedDecoder:
+    """
+    body framed by `Transfer-Encoding: chunked`:
+
+        <size-hex>[;ext]\r\n <data> \r\n ... 0\r\n [trailer-fields\r\n] \r\n
+
+    states:  SIZE -> DATA -> DATA_END -> SIZE ... -(0)-> TRAILER -> DONE
+    chunk extensions and trailer fields are validated for size & ignored.
+    raise HTTPParseError: 400 (malformed), 413 (body larger than limit)
+    """
+
+    SIZE = 0
+    DATA = 1
+    DATA_END = 2
+    TRAILER = 3
+    DONE = 4
+
+    __slots__ = ("state", "remaining", "received", "_max_body", "_trailers")
+
+    def __init__(self, max_body_size: int):
+        self.state: int = self.SIZE
+        self.remaining: int = 0  # unread bytes of current chunk
+        self.received: int = 0  # total payload size (so far)
+        self._max_body: int = max_body_size
+        self._trailers: int = 0  # total size of trailer-fields
+
+    @property
+    def done(self) -> bool:
+        return self.state == self.DONE
+
+    @property
+    def needs_line(self) -> bool:
+        return self.state in (self.SIZE, self.TRAILER)
+
+    @property
+    def pending(self) -> int:
+        if self.state == self.DATA:
+            return self.remaining
+        return 2 if self.state == self.DATA_END else 0
+
+    def decode(self, buffer: ReceiveBuffer, max_size: int) -> Optional[bytes]:
+        """ next piece of body (b"" -> end of body, None -> need more) """
+        while True:
+            if self.state == self.DATA:
+                if not buffer:
+                    return None
+                n = min(len(buffer), self.remaining, max_size)
+                self.remaining -= n
+                if self.remaining == 0:
+                    self.state = self.DATA_END
+                return buffer.consume(n)
+
+            if self.state == self.SIZE:
+                idx = buffer.find(b"\r\n")
+                if idx == -1:
+                    if len(buffer) > MAX_CHUNK_SIZE_LINE:
+                        raise HTTPParseError("Chunk-size line is too long")
+                    return None
+                if idx > MAX_CHUNK_SIZE_LINE:
+                    raise HTTPParseError("Chunk-size line is too long")
+                line = buffer.consume(idx)
+                buffer.skip(2)
+                size = line.split(b";", 1)[0].strip()
+                if not size or not _HEX_DIGITS.issuperset(size):
+                    raise HTTPParseError(f"Invalid chunk size: {line!r}")
+                size = int(size, 16)
+                if size == 0:
+                    self.state = self.TRAILER
+                    continue
+                self.received += size
+                if self.received > self._max_body:
+                    raise HTTPParseError("Request body is too large", 413)
+                self.remaining = size
+                self.state = self.DATA
+
+            elif self.state == self.DATA_END:
+                if len(buffer) < 2:
+                    return None
+                if not buffer.startswith(b"\r\n"):
+                    raise HTTPParseError("Missing CRLF after chunk data")
+                buffer.skip(2)
+                self.state = self.SIZE
+
+            elif self.state == self.TRAILER:
+                idx = buffer.find(b"\r\n")
+                if idx == -1:
+                    if self._trailers + len(buffer) > settings.MAX_HEADER_SIZE:
+                        raise HTTPParseError("Trailer fields too large", 431)
+                    return None
+                buffer.skip(idx + 2)
+                self._trailers += idx + 2
+                if self._trailers > settings.MAX_HEADER_SIZE:
+                    raise HTTPParseError("Trailer fields too large", 431)
+                if idx == 0:  # empty line -> end of chunked body
+                    self.state = self.DONE
+
+            else:  # DONE
+                return b""
+
+
+class RequestBody:
+    """
+    lazy request body stream. `receive()` is called (it receives more bytes
+    into `buffer`, returns 0 when the peer is closed) only when the
+    decoder needs more bytes. length is Content-Length (None for chunked)
+    """
+
+    def __init__(
+        self,
+        decoder,
+        buffer: ReceiveBuffer,
+        receive: Callable[[], int],
+        length: Optional[int] = None
+    ):
+        self._decoder = decoder
+        self._buffer: ReceiveBuffer = buffer
+        self._receive: Callable[[], int] = receive
+        self.length: Optional[int] = length
+        self.bytes_read: int = 0
+        # called once, before bytes of body are received for the first time
+        # (e.g. to send `100 Continue` only if the handler reads the body)
+        self.before_receive: Optional[Callable[[], None]] = None
+
+    @property
+    def at_eof(self) -> bool:
+        return self._decoder.done
+
+    def read(self, size: int = -1) -> bytes:
+        """ read up to `size` bytes (the whole rest of body if size < 0) """
+        if size < 0:
+            return b"".join(self)
+        pieces = []
+        while size > 0:
+            piece = self._next(size)
+            if not piece:
+                break
+            pieces.append(piece)
+            size -= len(piece)
+        return b"".join(pieces)
+
+    def readinto(self, b) -> int:
+        """ read up to len(b) bytes into a writable buffer (0 -> end) """
+        view = memoryview(b).cast("B")
+        piece = self._next(len(view))
+        view[:len(piece)] = piece
+        return len(piece)
+
+    def __iter__(self) -> Iterator[bytes]:
+        """ iterate over pieces of body (at most `READ_CHUNK_SIZE` each) """
+        while piece := self._next(READ_CHUNK_SIZE):
+            yield piece
+
+    def skip(self, limit: Optional[int] = None) -> bool:
+        """ discard the rest of body (e.g. before the next request on a
+        keep-alive connection). returns False if more than `limit` bytes
+        would have to be received for that (-> rest is left unread) """
+        skipped = 0
+        while not self.at_eof:
+            if limit is not None and skipped > limit:
+                return False
+            skipped += len(self._next(READ_CHUNK_SIZE))
+        return True
+
+    def spool(self) -> BinaryIO:
+        """ read the whole rest of body into a temporary file (kept in
+        memory up to `BODY_SPOOL_THRESHOLD` bytes, then spilled to disk).
+        returns the file, positioned at its beginning """
+        file = SpooledTemporaryFile(max_size=settings.BODY_SPOOL_THRESHOLD)
+        for piece in self:
+            file.write(piece)
+        file.seek(0)
+        return file
+
+    def close(self):
+        pass
+
+    def _next(self, max_size: int) -> bytes:
+        while True:
+            piece = self._decoder.decode(self._buffer, max_size)
+            if piece is not None:
+                self.bytes_read += len(piece)
+                return piece
+            if self.before_receive is not None:
+                callback, self.before_receive = self.before_receive, None
+                callback()
+            if not self._receive():
+                raise HTTPParseError("Client closed while sending body")
+
+
+class SpooledRequestBody(RequestBody):
+    """ `RequestBody` interface over an already received (spooled) body """
+
+    def __init__(self, file: BinaryIO, length: Optional[int] = None):
+        self._file: BinaryIO = file
+        self._eof: bool = False
+        self.length: Optional[int] = length
+        self.bytes_read: int = 0
+        self.before_receive: Optional[Callable[[], None]] = None
+
+    @property
+    def at_eof(self) -> bool:
+        return self._eof
+
+    def spool(self) -> BinaryIO:
+        return self._file
+
+    def close(self):
+        self._file.close()
+
+    def _next(self, max_size: int) -> bytes:
+        piece = self._file.read(max_size)
+        if not piece:
+            self._eof = True
+        self.bytes_read += len(piece)
+        return piece
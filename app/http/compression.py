@@ -0,0 +1,312 @@
+""" Response compression (gzip / deflate by stdlib `zlib`):
+- content-coding is negotiated from `Accept-Encoding` (with q-values)
+- only bodies of compressible types (MIME allowlist) and at least
+  `min_size` bytes are compressed, and every response which could have been
+  compressed gets `Vary: Accept-Encoding` (for caches), HEAD and 206
+  responses of such a resource too
+- ETag of a compressed representation is weakened (W/"...") like a proxy
+  would do, so revalidation (If-None-Match) still matches it
+- compressed variants of cacheable bodies (responses with a validator:
+  ETag or Last-Modified, of the requested path) are kept in a bounded LRU
+  (by total size) -> hot resources are compressed once. dynamic bodies
+  (no validator) are compressed per response, never cached
+- chunked bodies (sync / async producers) are compressed while they're
+  streamed (`FLUSH` of the producer -> Z_SYNC_FLUSH of the compressor)
+"""
+
+import os
+import zlib
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from .request import HTTPRequest
+from .response import HTTPResponse, get_header, header_key
+from .streaming import FLUSH, is_async_iterable
+
+
+# content-coding -> zlib `wbits` (31: gzip container, 15: zlib container,
+# which is what HTTP calls "deflate")
+ENCODINGS: dict[str, int] = {"gzip": 31, "deflate": 15}
+
+COMPRESSIBLE_TYPES = frozenset((
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/xml",
+    "application/xhtml+xml",
+    "image/svg+xml",
+))
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    if not content_type:
+        return False
+    mime = content_type.split(";", 1)[0].strip().lower()
+    return mime.startswith("text/") or mime in COMPRESSIBLE_TYPES
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """ best supported content-coding for `Accept-Encoding` (or None ->
+    identity). gzip is preferred over deflate at equal q-values. codings
+    with `q=0` are refused, `*` only covers codings which aren't listed """
+    if not accept_encoding:
+        return None
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding] = q
+    best, best_q = None, 0.0
+    for candidate in ENCODINGS:  # (gzip first: it wins ties)
+        q = weights.get(candidate, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = candidate, q
+    return best
+
+
+def compress(data, encoding: str, level: int = 6) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+    return compressor.compress(data) + compressor.flush()
+
+
+class CompressedVariantCache:
+    """ thread-safe LRU of compressed bodies, bounded by their total size """
+
+    def __init__(self, max_bytes: int):
+        self._max_bytes: int = max_bytes
+        self._size: int = 0
+        self._entries: OrderedDict[tuple[str, ...], bytes] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: tuple[str, ...]) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key: tuple[str, ...], data: bytes):
+        if len(data) > self._max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class ResponseCompressor:
+
+    def __init__(
+        self,
+        min_size: int = 1024,
+        level: int = 6,
+        cache_size: int = 16 * 1024 * 1024,
+        max_file_size: int = 8 * 1024 * 1024
+    ):
+        self.min_size: int = min_size
+        self.level: int = level
+        self.max_file_size: int = max_file_size
+        self._cache = CompressedVariantCache(cache_size)
+
+    def apply(
+        self, request: HTTPRequest, response: HTTPResponse
+    ) -> HTTPResponse:
+        """ compress body of `response` (in place) if it's eligible and
+        the client accepts a supported content-coding """
+        if get_header(response.headers, "content-encoding") is not None:
+            return response
+        if response.status_code == 206 or response.is_for_head_method:
+            # (not compressed, but they stand for a representation which
+            # is compressed for GET -> same `Vary` as the GET response)
+            if self._could_compress(response):
+                _add_vary(response.headers, "accept-encoding")
+            return response
+        if (
+            response.status_code != 200
+            or response.body_parts is not None
+            or response.length is not None  # (streamed, length is promised)
+            or not is_compressible(
+                response.mem_type
+                or get_header(response.headers, "content-type")
+            )
+        ):
+            return response
+
+        streamed = response.chunked and callable(response.iter_body)
+        if response.file_body is not None:
+            size = response.file_body.count
+            if size > self.max_file_size:
+                return response
+        elif not streamed:
+            size = len(response.body)
+        if not streamed and size < self.min_size:
+            return response
+
+        _add_vary(response.headers, "accept-encoding")
+        encoding = negotiate(request.headers.get("accept-encoding"))
+        if encoding is None:
+            return response
+
+        if streamed:
+            response.iter_body = self._streaming(response.iter_body, encoding)
+        else:
+            response.body = self._compressed_body(
+                request, response, encoding
+            )
+            if response.file_body is not None:
+                response.file_body.close()  # (body is in memory now)
+                response.file_body = None
+        response.headers["content-encoding"] = encoding
+        etag_key = header_key(response.headers, "etag")
+        if etag_key is not None:
+            etag = response.headers[etag_key]
+            if not etag.startswith("W/"):
+                response.headers[etag_key] = "W/" + etag
+        return response
+
+    def _could_compress(self, response: HTTPResponse) -> bool:
+        """ whether the full representation of a HEAD / 206 response is
+        compressed for GET (its type & size, as far as they're known) """
+        content_type, size = _represented(response)
+        if not is_compressible(content_type):
+            return False
+        if size is None:
+            return True
+        from_file = response.file_body is not None or (
+            response.body_parts is not None and response.has_file_parts()
+        )
+        if from_file and size > self.max_file_size:
+            return False
+        return size >= self.min_size
+
+    def _compressed_body(
+        self, request: HTTPRequest, response: HTTPResponse, encoding: str
+    ) -> bytes:
+        """ compressed body from the variant cache, or compress (and cache
+        it, if the response has a validator & may be stored) """
+        key = _variant_key(request, response, encoding)
+        if key is not None:
+            data = self._cache.get(key)
+            if data is not None:
+                return data
+        if response.file_body is not None:
+            source = os.pread(
+                response.file_body.fd,
+                response.file_body.count,
+                response.file_body.offset,
+            )
+        else:
+            source = response.body
+        data = compress(source, encoding, self.level)
+        if key is not None:
+            self._cache.put(key, data)
+        return data
+
+    def _streaming(self, iter_body, encoding: str):
+        """ wrap a chunk producer with a streaming compressor """
+        level = self.level
+
+        def iter_compressed():
+            body = iter_body()
+            compressor = zlib.compressobj(
+                level, zlib.DEFLATED, ENCODINGS[encoding]
+            )
+            if is_async_iterable(body):
+                return _compressed_async(body, compressor)
+            return _compressed_sync(body, compressor)
+
+        return iter_compressed
+
+
+def _represented(
+    response: HTTPResponse
+) -> tuple[Optional[str], Optional[int]]:
+    """ (content-type, size) of the full representation of a HEAD response
+    or a 206 (single part, or first part of multipart/byteranges) """
+    headers = response.headers
+    content_type = response.mem_type or get_header(headers, "content-type")
+    if response.is_for_head_method:
+        length = get_header(headers, "content-length") or ""
+        return content_type, int(length) if length.isdigit() else None
+    content_range = get_header(headers, "content-range")
+    if (
+        content_type
+        and content_type.startswith("multipart/byteranges")
+        and response.body_parts
+    ):
+        part_head = bytes(response.body_parts[0]).decode("latin-1")
+        fields = {}
+        for line in part_head.split("\r\n"):
+            name, sep, value = line.partition(":")
+            if sep:
+                fields[name.strip().lower()] = value.strip()
+        content_type = fields.get("content-type")
+        content_range = fields.get("content-range")
+    total = content_range.rpartition("/")[2] if content_range else ""
+    return content_type, int(total) if total.isdigit() else None
+
+
+def _variant_key(
+    request: HTTPRequest, response: HTTPResponse, encoding: str
+) -> Optional[tuple[str, ...]]:
+    """ key of the compressed variant in the cache (None: don't cache).
+    validators are unique within a resource only -> keyed by the path
+    (query included) too """
+    cache_control = get_header(response.headers, "cache-control") or ""
+    if "no-store" in cache_control.lower():
+        return None
+    etag = get_header(response.headers, "etag")
+    if etag is not None:
+        return (request.path, etag, encoding)
+    last_modified = get_header(response.headers, "last-modified")
+    if last_modified is not None:
+        return (request.path, last_modified, encoding)
+    return None
+
+
+def _compress_chunk(compressor, chunk):
+    if chunk is FLUSH:  # (send what is compressed so far)
+        data = compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+        yield FLUSH
+        return
+    data = compressor.compress(chunk)
+    if data:
+        yield data
+
+
+def _compressed_sync(body, compressor):
+    for chunk in body:
+        yield from _compress_chunk(compressor, chunk)
+    yield compressor.flush()
+
+
+async def _compressed_async(body, compressor):
+    async for chunk in body:
+        for data in _compress_chunk(compressor, chunk):
+            yield data
+    yield compressor.flush()
+
+
+def _add_vary(headers: dict[str, str], name: str):
+    key = header_key(headers, "vary")
+    if key is None:
+        headers["vary"] = name
+        return
+    values = [v.strip().lower() for v in headers[key].split(",")]
+    if name not in values and "*" not in values:
+        headers[key] = f"{headers[key]}, {name}"
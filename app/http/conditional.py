@@ -0,0 +1,246 @@
+""" Conditional requests & Range requests helpers:
+- validators: ETag (strong/weak) and Last-Modified
+- `If-None-Match` / `If-Modified-Since` evaluation -> 304 Not Modified
+- `Range` (+ `If-Range`) evaluation -> 206 Partial Content (single part or
+  multipart/byteranges) or 416 Range Not Satisfiable.
+  ranges are served as slices/regions of the original source (memoryview
+  slices of in-memory bodies, or `FileBody` regions of files), so the
+  whole body is never loaded/copied to serve a range
+"""
+
+import hashlib
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Union
+
+from .request import HTTPRequest
+from .response import HTTPResponse, BodyType, FileBody
+
+
+MAX_RANGES = 16  # more ranges in a request -> Range header is ignored
+
+
+def make_etag(*parts, weak: bool = False) -> str:
+    """ build an ETag from (cheap) version identifiers of a resource
+    e.g. make_etag(inode, size, mtime_ns) -> '"2b1-1f4-17d2..."' """
+    tag = "-".join(f"{p:x}" if isinstance(p, int) else str(p) for p in parts)
+    return f'W/"{tag}"' if weak else f'"{tag}"'
+
+
+def etag_for_body(body: BodyType) -> str:
+    """ strong ETag of an in-memory body (content hash) """
+    return '"%s"' % hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+def http_date(timestamp: float) -> str:
+    """ IMF-fixdate (e.g. for `last-modified` header) """
+    return formatdate(timestamp, usegmt=True)
+
+
+def _parse_http_date(value: str) -> Optional[int]:
+    try:
+        return int(parsedate_to_datetime(value).timestamp())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def _etag_matches(etag: str, header_value: str, weak: bool = True) -> bool:
+    """ compare `etag` with a list of entity-tags (weak or strong compare) """
+    if header_value.strip() == "*":
+        return True
+    if weak:
+        etag = etag.removeprefix("W/")
+    for candidate in header_value.split(","):
+        candidate = candidate.strip()
+        if weak:
+            candidate = candidate.removeprefix("W/")
+        elif candidate.startswith("W/") or etag.startswith("W/"):
+            continue  # (weak tags never match in strong comparison)
+        if candidate == etag:
+            return True
+    return False
+
+
+def is_not_modified(
+    request: HTTPRequest,
+    etag: Optional[str] = None,
+    last_modified: Optional[float] = None
+) -> bool:
+    """
+    evaluate `If-None-Match` (weak comparison) or, only if it's absent,
+    `If-Modified-Since` for GET/HEAD requests (RFC 9110, 13.2.2)
+    """
+    if request.method.upper() not in ("GET", "HEAD"):
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag is not None and _etag_matches(etag, if_none_match)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        since = _parse_http_date(if_modified_since)
+        return since is not None and int(last_modified) <= since
+    return False
+
+
+def validator_headers(
+    etag: Optional[str] = None, last_modified: Optional[float] = None
+) -> dict[str, str]:
+    headers = {}
+    if etag is not None:
+        headers["etag"] = etag
+    if last_modified is not None:
+        headers["last-modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified_response(
+    etag: Optional[str] = None,
+    last_modified: Optional[float] = None,
+    headers: Optional[dict[str, str]] = None
+) -> HTTPResponse:
+    """ 304 response (headers only, the body is never built) """
+    response_headers = validator_headers(etag, last_modified)
+    response_headers.update(headers or {})
+    return HTTPResponse(status_code=304, headers=response_headers)
+
+
+def parse_range(
+    header_value: str, size: int
+) -> Union[list[tuple[int, int]], None, bool]:
+    """
+    parse `Range: bytes=...` for a representation of `size` bytes.
+    returns:
+    - list of (start, end) [inclusive, sorted, overlapping ones merged]
+    - False  -> no range is satisfiable (-> 416)
+    - None   -> header is invalid/unsupported (-> ignore it, send 200)
+    """
+    unit, _, ranges_spec = header_value.partition("=")
+    if unit.strip().lower() != "bytes" or not ranges_spec:
+        return None
+    specs = ranges_spec.split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, sep, last = spec.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if first == "":  # suffix range: last N bytes
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < size and start <= end:
+            ranges.append((start, end))
+
+    if not ranges:
+        return False
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def range_applies(request: HTTPRequest, etag: Optional[str]) -> bool:
+    """ Range is used only for GET, and (if `If-Range` is sent) only if the
+    representation is unchanged (strong ETag comparison) """
+    if request.method.upper() != "GET" or "range" not in request.headers:
+        return False
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    return etag is not None and _etag_matches(etag, if_range, weak=False)
+
+
+def range_response(
+    request: HTTPRequest,
+    size: int,
+    content_type: str,
+    source: Union[BodyType, FileBody],
+    headers: Optional[dict[str, str]] = None
+) -> Optional[HTTPResponse]:
+    """
+    build a 206/416 response for the `Range` of request (or None, if range
+    is invalid -> caller sends the full representation).
+    `source` is the full representation: an in-memory body, or a
+    `FileBody` (parts are regions of the same file, sent by sendfile).
+    """
+    ranges = parse_range(request.headers.get("range", ""), size)
+    if ranges is None:
+        return None
+    response_headers = dict(headers or {})
+    response_headers["accept-ranges"] = "bytes"
+    if ranges is False:
+        response_headers["content-range"] = f"bytes */{size}"
+        return HTTPResponse(
+            status_code=416,
+            headers=response_headers,
+            body=b"Range Not Satisfiable",
+            mem_type="text/plain",
+        )
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        response_headers["content-range"] = f"bytes {start}-{end}/{size}"
+        part = _slice(source, start, end, last=True)
+        if isinstance(part, FileBody):
+            return HTTPResponse(
+                status_code=206,
+                headers=response_headers,
+                mem_type=content_type,
+                file_body=part,
+            )
+        return HTTPResponse(
+            status_code=206,
+            headers=response_headers,
+            body=part,
+            mem_type=content_type,
+        )
+
+    # multipart/byteranges: boundary-headers + slices of the source
+    boundary = secrets.token_hex(12)
+    parts = []
+    for i, (start, end) in enumerate(ranges):
+        parts.append((
+            f"\r\n--{boundary}\r\n"
+            f"content-type: {content_type}\r\n"
+            f"content-range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("utf-8"))
+        parts.append(_slice(source, start, end, last=i == len(ranges) - 1))
+    parts.append(f"\r\n--{boundary}--\r\n".encode("ascii"))
+    return HTTPResponse(
+        status_code=206,
+        headers=response_headers,
+        mem_type=f"multipart/byteranges; boundary={boundary}",
+        body_parts=parts,
+    )
+
+
+def _slice(
+    source: Union[BodyType, FileBody], start: int, end: int, last: bool
+) -> Union[memoryview, FileBody]:
+    """ [start, end] of source without copying it. for files, only the last
+    region releases the (shared) file when it's closed """
+    if isinstance(source, FileBody):
+        return FileBody(
+            source.fd,
+            source.offset + start,
+            end - start + 1,
+            release=source.close if last else None,
+        )
+    return memoryview(source)[start:end + 1]
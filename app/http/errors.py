@@ -0,0 +1,7 @@
+class HTTPParseError(ValueError):
+    """ raised when a request is malformed or exceeds a limit.
+    `status_code` is the status the server should respond with """
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code: int = status_code
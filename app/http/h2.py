@@ -0,0 +1,648 @@
+""" HTTP/2 (RFC 9113) over cleartext TCP ("h2c"), sans-IO:
+- <H2Connection> the state of one connection (server side): it parses the
+  frames of received bytes into events (`receive()`), keeps the streams,
+  the flow-control windows of both directions & HPACK tables, and queues
+  the frames to send (`data_to_send()`). the socket belongs to the engine
+  (see `app/h2_connection.py`)
+- a request becomes an `HTTPRequest` (`build_request()`), and a
+  `HTTPResponse` is turned into header fields (`response_fields()`, from
+  its HTTP/1.1 header-block, so every response type works as it is) and
+  DATA frames, sent within the peer's flow-control windows
+- selection: the connection preface (prior knowledge, the HTTP/1 parser
+  sees a `PRI * HTTP/2.0` request-head) or `Upgrade: h2c` on an HTTP/1.1
+  request (`101`, then the request is answered on stream 1)
+- not supported: server push (`SETTINGS_ENABLE_PUSH` is ignored) and
+  priorities (PRIORITY frames / fields are ignored)
+"""
+
+import base64
+import struct
+from typing import Optional
+
+from app.http.hpack import HPACKDecoder, HPACKEncoder, HPACKError
+from app.http.headers import HTTPHeaders
+from app.http.request import HTTPRequest
+from app.http.response import HTTPResponse, STATUS_LINES
+
+
+PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+# rest of the preface after a `PRI * HTTP/2.0` request-head
+PREFACE_TAIL = PREFACE[18:]
+
+# frame types
+DATA = 0x0
+HEADERS = 0x1
+PRIORITY = 0x2
+RST_STREAM = 0x3
+SETTINGS = 0x4
+PUSH_PROMISE = 0x5
+PING = 0x6
+GOAWAY = 0x7
+WINDOW_UPDATE = 0x8
+CONTINUATION = 0x9
+
+# frame flags
+FLAG_END_STREAM = 0x1
+FLAG_ACK = 0x1
+FLAG_END_HEADERS = 0x4
+FLAG_PADDED = 0x8
+FLAG_PRIORITY = 0x20
+
+# error codes
+NO_ERROR = 0x0
+PROTOCOL_ERROR = 0x1
+INTERNAL_ERROR = 0x2
+FLOW_CONTROL_ERROR = 0x3
+STREAM_CLOSED = 0x5
+FRAME_SIZE_ERROR = 0x6
+REFUSED_STREAM = 0x7
+CANCEL = 0x8
+COMPRESSION_ERROR = 0x9
+ENHANCE_YOUR_CALM = 0xb
+
+# settings
+SETTINGS_HEADER_TABLE_SIZE = 0x1
+SETTINGS_ENABLE_PUSH = 0x2
+SETTINGS_MAX_CONCURRENT_STREAMS = 0x3
+SETTINGS_INITIAL_WINDOW_SIZE = 0x4
+SETTINGS_MAX_FRAME_SIZE = 0x5
+SETTINGS_MAX_HEADER_LIST_SIZE = 0x6
+
+DEFAULT_WINDOW_SIZE = 65535
+DEFAULT_MAX_FRAME_SIZE = 16384
+MAX_WINDOW_SIZE = 2 ** 31 - 1
+MAX_FRAME_SIZE_LIMIT = 2 ** 24 - 1
+
+_FRAME_HEADER = struct.Struct(">HBBBL")  # (length is 24 bits: H + B)
+
+# header fields which are HTTP/1.1-only (never in HTTP/2 messages)
+CONNECTION_HEADERS = frozenset((
+    b"connection", b"keep-alive", b"proxy-connection", b"transfer-encoding",
+    b"upgrade",
+))
+_REQUEST_PSEUDO_HEADERS = frozenset((
+    b":method", b":path", b":scheme", b":authority",
+))
+
+
+class H2Error(Exception):
+    """ connection error (-> GOAWAY with `code`, then the connection is
+    closed) """
+
+    def __init__(self, message: str, code: int = PROTOCOL_ERROR):
+        super().__init__(message)
+        self.code: int = code
+
+
+class H2StreamError(H2Error):
+    """ stream error (-> RST_STREAM, the connection goes on) """
+
+    def __init__(
+        self, stream_id: int, message: str, code: int = PROTOCOL_ERROR
+    ):
+        super().__init__(message, code)
+        self.stream_id: int = stream_id
+
+
+# events (of received frames)
+
+class RequestReceived:
+    """ a complete request header block (`end_stream` -> no body) """
+
+    __slots__ = ("stream_id", "fields", "end_stream")
+
+    def __init__(self, stream_id: int, fields: list, end_stream: bool):
+        self.stream_id: int = stream_id
+        self.fields: list[tuple[bytes, bytes]] = fields
+        self.end_stream: bool = end_stream
+
+
+class DataReceived:
+    """ a piece of request body. `flow_length` (with padding) must be
+    given back by `acknowledge()` once the data is consumed """
+
+    __slots__ = ("stream_id", "data", "flow_length", "end_stream")
+
+    def __init__(
+        self, stream_id: int, data: bytes, flow_length: int, end_stream: bool
+    ):
+        self.stream_id: int = stream_id
+        self.data: bytes = data
+        self.flow_length: int = flow_length
+        self.end_stream: bool = end_stream
+
+
+class StreamReset:
+    """ a stream was reset (by the peer, or for a stream error) """
+
+    __slots__ = ("stream_id", "code")
+
+    def __init__(self, stream_id: int, code: int):
+        self.stream_id: int = stream_id
+        self.code: int = code
+
+
+class WindowUpdated:
+    """ send windows were enlarged (-> blocked senders can go on) """
+
+    __slots__ = ()
+
+
+class ConnectionClosed:
+    """ the peer sent GOAWAY """
+
+    __slots__ = ("code", "last_stream_id")
+
+    def __init__(self, code: int, last_stream_id: int):
+        self.code: int = code
+        self.last_stream_id: int = last_stream_id
+
+
+class H2Stream:
+
+    __slots__ = (
+        "stream_id", "send_window", "recv_window", "unacked",
+        "remote_closed", "local_closed",
+    )
+
+    def __init__(self, stream_id: int, send_window: int, recv_window: int):
+        self.stream_id: int = stream_id
+        self.send_window: int = send_window
+        self.recv_window: int = recv_window
+        self.unacked: int = 0  # (received & consumed, not acknowledged)
+        self.remote_closed: bool = False
+        self.local_closed: bool = False
+
+
+class H2Connection:
+
+    def __init__(
+        self,
+        max_concurrent_streams: int = 100,
+        initial_window_size: int = DEFAULT_WINDOW_SIZE,
+        max_frame_size: int = DEFAULT_MAX_FRAME_SIZE,
+        header_table_size: int = 4096,
+        max_header_list_size: int = 65536,
+        preface: bytes = PREFACE
+    ):
+        # our settings (limits of what we receive)
+        self.max_concurrent_streams: int = max_concurrent_streams
+        self.initial_window_size: int = initial_window_size
+        self.max_frame_size: int = max_frame_size
+        self.header_table_size: int = header_table_size
+        self.max_header_list_size: int = max_header_list_size
+        # peer's settings (limits of what we send)
+        self.remote_initial_window_size: int = DEFAULT_WINDOW_SIZE
+        self.remote_max_frame_size: int = DEFAULT_MAX_FRAME_SIZE
+
+        self.streams: dict[int, H2Stream] = {}
+        self.last_stream_id: int = 0
+        self.send_window: int = DEFAULT_WINDOW_SIZE
+        self.recv_window: int = initial_window_size
+        self._unacked: int = 0
+        self._decoder = HPACKDecoder(header_table_size)
+        self._encoder = HPACKEncoder()
+        self._preface: bytes = preface  # (still expected)
+        self._buffer = bytearray()
+        self._out: list[bytes] = []
+        # header block in progress: (stream id, flags, fragments)
+        self._header_block: Optional[tuple[int, int, list[bytes]]] = None
+        self.closed: bool = False
+
+    # -- sending
+
+    def initiate(self, upgrade_settings: Optional[bytes] = None):
+        """ queue our SETTINGS (first frame of the server). for `Upgrade:
+        h2c`, the client's settings (`HTTP2-Settings`, base64url) are
+        applied and its request becomes stream 1 (half-closed remote) """
+        settings = [
+            (SETTINGS_MAX_CONCURRENT_STREAMS, self.max_concurrent_streams),
+            (SETTINGS_INITIAL_WINDOW_SIZE, self.initial_window_size),
+            (SETTINGS_MAX_FRAME_SIZE, self.max_frame_size),
+            (SETTINGS_MAX_HEADER_LIST_SIZE, self.max_header_list_size),
+            (SETTINGS_ENABLE_PUSH, 0),
+        ]
+        if self.header_table_size != 4096:
+            settings.append((SETTINGS_HEADER_TABLE_SIZE,
+                             self.header_table_size))
+        self._frame(SETTINGS, 0, 0, b"".join(
+            struct.pack(">HL", key, value) for key, value in settings
+        ))
+        if self.initial_window_size > DEFAULT_WINDOW_SIZE:
+            # (the connection window can only be enlarged by WINDOW_UPDATE)
+            self._frame(WINDOW_UPDATE, 0, 0, struct.pack(
+                ">L", self.initial_window_size - DEFAULT_WINDOW_SIZE
+            ))
+        if upgrade_settings is not None:
+            payload = base64.urlsafe_b64decode(
+                upgrade_settings + b"=" * (-len(upgrade_settings) % 4)
+            )
+            self._apply_settings(payload)
+            stream = self._open_stream(1)
+            stream.remote_closed = True
+
+    def data_to_send(self) -> bytes:
+        out, self._out = self._out, []
+        return b"".join(out)
+
+    def send_headers(
+        self, stream_id: int, fields: list[tuple[bytes, bytes]],
+        end_stream: bool = False
+    ):
+        """ HEADERS (+ CONTINUATION frames, if the block is too large) """
+        stream = self.streams.get(stream_id)
+        if stream is None or stream.local_closed:
+            return
+        block = self._encoder.encode(fields)
+        size = self.remote_max_frame_size
+        flags = FLAG_END_STREAM if end_stream else 0
+        if len(block) <= size:
+            self._frame(HEADERS, flags | FLAG_END_HEADERS, stream_id, block)
+        else:
+            self._frame(HEADERS, flags, stream_id, block[:size])
+            for start in range(size, len(block), size):
+                last = start + size >= len(block)
+                self._frame(
+                    CONTINUATION, FLAG_END_HEADERS if last else 0,
+                    stream_id, block[start:start + size],
+                )
+        if end_stream:
+            self._close_local(stream)
+
+    def window(self, stream_id: int) -> int:
+        """ how many bytes of DATA can be sent on the stream now (-1: the
+        stream is gone -> nothing will ever be sent) """
+        stream = self.streams.get(stream_id)
+        if stream is None or stream.local_closed or self.closed:
+            return -1
+        return max(min(self.send_window, stream.send_window), 0)
+
+    def send_data(self, stream_id: int, data, end_stream: bool = False):
+        """ DATA frames of `data` (at most `window()` bytes) """
+        stream = self.streams.get(stream_id)
+        if stream is None or stream.local_closed:
+            return
+        size = self.remote_max_frame_size
+        length = len(data)
+        self.send_window -= length
+        stream.send_window -= length
+        if length == 0:
+            self._frame(DATA, FLAG_END_STREAM if end_stream else 0,
+                        stream_id, b"")
+        for start in range(0, length, size):
+            last = start + size >= length
+            self._frame(
+                DATA, FLAG_END_STREAM if end_stream and last else 0,
+                stream_id, data[start:start + size],
+            )
+        if end_stream:
+            self._close_local(stream)
+
+    def reset_stream(self, stream_id: int, code: int = CANCEL):
+        stream = self.streams.pop(stream_id, None)
+        if stream is not None:
+            self._frame(RST_STREAM, 0, stream_id, struct.pack(">L", code))
+
+    def acknowledge(self, stream_id: int, length: int):
+        """ `length` bytes of received DATA were consumed -> give them back
+        to the peer (WINDOW_UPDATE), in batches of half a window """
+        if not length:
+            return
+        self._unacked += length
+        if self._unacked >= self.initial_window_size // 2:
+            self._frame(WINDOW_UPDATE, 0, 0,
+                        struct.pack(">L", self._unacked))
+            self.recv_window += self._unacked
+            self._unacked = 0
+        stream = self.streams.get(stream_id)
+        if stream is None or stream.remote_closed:
+            return
+        stream.unacked += length
+        if stream.unacked >= self.initial_window_size // 2:
+            self._frame(WINDOW_UPDATE, 0, stream_id,
+                        struct.pack(">L", stream.unacked))
+            stream.recv_window += stream.unacked
+            stream.unacked = 0
+
+    def close(self, code: int = NO_ERROR, message: str = ""):
+        """ GOAWAY (streams up to `last_stream_id` may still complete) """
+        if self.closed:
+            return
+        self.closed = True
+        self._frame(GOAWAY, 0, 0, struct.pack(
+            ">LL", self.last_stream_id, code
+        ) + message.encode("utf-8", "replace"))
+
+    def _frame(self, kind: int, flags: int, stream_id: int, payload=b""):
+        length = len(payload)
+        self._out.append(_FRAME_HEADER.pack(
+            length >> 8, length & 0xFF, kind, flags, stream_id
+        ))
+        if length:
+            self._out.append(bytes(payload))
+
+    def _close_local(self, stream: H2Stream):
+        stream.local_closed = True
+        if stream.remote_closed:
+            self.streams.pop(stream.stream_id, None)
+
+    # -- receiving
+
+    def receive(self, data: bytes) -> list:
+        """ received bytes -> events. raise H2Error on a connection error
+        (then `close(err.code)` & close the connection) """
+        self._buffer += data
+        if self._preface:
+            expected = self._preface[:len(self._buffer)]
+            if not self._buffer.startswith(expected):
+                raise H2Error("Invalid connection preface")
+            if len(self._buffer) < len(self._preface):
+                return []
+            del self._buffer[:len(self._preface)]
+            self._preface = b""
+
+        events = []
+        buffer = self._buffer
+        while len(buffer) >= 9:
+            high, low, kind, flags, stream_id = _FRAME_HEADER.unpack_from(
+                buffer
+            )
+            length = (high << 8) | low
+            if length > self.max_frame_size:
+                raise H2Error("Frame is too large", FRAME_SIZE_ERROR)
+            if len(buffer) < 9 + length:
+                break
+            payload = bytes(buffer[9:9 + length])
+            del buffer[:9 + length]
+            stream_id &= 0x7FFFFFFF
+            try:
+                self._handle_frame(kind, flags, stream_id, payload, events)
+            except H2StreamError as err:
+                self.reset_stream(err.stream_id, err.code)
+                events.append(StreamReset(err.stream_id, err.code))
+        return events
+
+    def _handle_frame(
+        self, kind: int, flags: int, stream_id: int, payload: bytes,
+        events: list
+    ):
+        if self._header_block is not None and (
+            kind != CONTINUATION or stream_id != self._header_block[0]
+        ):
+            raise H2Error("Expected CONTINUATION frame")
+        if kind == DATA:
+            self._on_data(flags, stream_id, payload, events)
+        elif kind == HEADERS:
+            self._on_headers(flags, stream_id, payload, events)
+        elif kind == CONTINUATION:
+            if self._header_block is None:
+                raise H2Error("Unexpected CONTINUATION frame")
+            self._header_block[2].append(payload)
+            if flags & FLAG_END_HEADERS:
+                stream_id, flags, fragments = self._header_block
+                self._header_block = None
+                self._on_header_block(
+                    stream_id, flags, b"".join(fragments), events
+                )
+            elif sum(map(len, self._header_block[2])) > (
+                self.max_header_list_size * 2
+            ):
+                raise H2Error("Header block is too large")
+        elif kind == SETTINGS:
+            if stream_id:
+                raise H2Error("SETTINGS frame on a stream")
+            if flags & FLAG_ACK:
+                return
+            self._apply_settings(payload)
+            self._frame(SETTINGS, FLAG_ACK, 0)
+            events.append(WindowUpdated())
+        elif kind == WINDOW_UPDATE:
+            self._on_window_update(stream_id, payload, events)
+        elif kind == PING:
+            if len(payload) != 8 or stream_id:
+                raise H2Error("Invalid PING frame", FRAME_SIZE_ERROR)
+            if not flags & FLAG_ACK:
+                self._frame(PING, FLAG_ACK, 0, payload)
+        elif kind == RST_STREAM:
+            if len(payload) != 4 or not stream_id:
+                raise H2Error("Invalid RST_STREAM frame", FRAME_SIZE_ERROR)
+            if self.streams.pop(stream_id, None) is not None:
+                (code,) = struct.unpack(">L", payload)
+                events.append(StreamReset(stream_id, code))
+        elif kind == GOAWAY:
+            if len(payload) < 8:
+                raise H2Error("Invalid GOAWAY frame", FRAME_SIZE_ERROR)
+            last_stream_id, code = struct.unpack_from(">LL", payload)
+            events.append(ConnectionClosed(code, last_stream_id))
+        elif kind == PUSH_PROMISE:
+            raise H2Error("PUSH_PROMISE from a client")
+        # (PRIORITY & unknown frame types are ignored)
+
+    def _on_data(self, flags, stream_id, payload, events):
+        if not stream_id:
+            raise H2Error("DATA frame on stream 0")
+        length = len(payload)
+        self.recv_window -= length
+        if self.recv_window < 0:
+            raise H2Error("Connection window exceeded", FLOW_CONTROL_ERROR)
+        stream = self.streams.get(stream_id)
+        if stream is None or stream.remote_closed:
+            # (the whole frame is consumed for the connection window)
+            self.acknowledge(0, length)
+            if stream_id > self.last_stream_id:
+                raise H2Error("DATA frame on an idle stream")
+            raise H2StreamError(stream_id, "Stream is closed", STREAM_CLOSED)
+        stream.recv_window -= length
+        if stream.recv_window < 0:
+            raise H2StreamError(
+                stream_id, "Stream window exceeded", FLOW_CONTROL_ERROR
+            )
+        data = _strip_padding(flags, payload)
+        end_stream = bool(flags & FLAG_END_STREAM)
+        if end_stream:
+            stream.remote_closed = True
+            if stream.local_closed:
+                self.streams.pop(stream_id, None)
+        events.append(DataReceived(stream_id, data, length, end_stream))
+
+    def _on_headers(self, flags, stream_id, payload, events):
+        if not stream_id:
+            raise H2Error("HEADERS frame on stream 0")
+        payload = _strip_padding(flags, payload)
+        if flags & FLAG_PRIORITY:
+            payload = payload[5:]
+        if flags & FLAG_END_HEADERS:
+            self._on_header_block(stream_id, flags, payload, events)
+        else:
+            self._header_block = (stream_id, flags, [payload])
+
+    def _on_header_block(self, stream_id, flags, block, events):
+        try:  # (always decoded: the HPACK tables must stay in sync)
+            fields = self._decoder.decode(block)
+        except HPACKError as err:
+            raise H2Error(str(err), COMPRESSION_ERROR)
+        end_stream = bool(flags & FLAG_END_STREAM)
+
+        stream = self.streams.get(stream_id)
+        if stream is not None:  # (trailers)
+            if stream.remote_closed or not end_stream:
+                raise H2StreamError(stream_id, "Unexpected HEADERS frame")
+            stream.remote_closed = True
+            if stream.local_closed:
+                self.streams.pop(stream_id, None)
+            events.append(DataReceived(stream_id, b"", 0, True))
+            return
+        if stream_id % 2 == 0 or stream_id <= self.last_stream_id:
+            raise H2Error("Invalid stream id of a request")
+        self.last_stream_id = stream_id
+        if self.closed:
+            return  # (after GOAWAY: new streams are ignored)
+        if len(self.streams) >= self.max_concurrent_streams:
+            self._frame(RST_STREAM, 0, stream_id,
+                        struct.pack(">L", REFUSED_STREAM))
+            return
+        size = sum(len(name) + len(value) + 32 for name, value in fields)
+        if size > self.max_header_list_size:
+            self._frame(RST_STREAM, 0, stream_id,
+                        struct.pack(">L", PROTOCOL_ERROR))
+            return
+        stream = self._open_stream(stream_id)
+        stream.remote_closed = end_stream
+        events.append(RequestReceived(stream_id, fields, end_stream))
+
+    def _on_window_update(self, stream_id, payload, events):
+        if len(payload) != 4:
+            raise H2Error("Invalid WINDOW_UPDATE frame", FRAME_SIZE_ERROR)
+        (increment,) = struct.unpack(">L", payload)
+        increment &= 0x7FFFFFFF
+        if not stream_id:
+            if not increment:
+                raise H2Error("WINDOW_UPDATE of 0")
+            self.send_window += increment
+            if self.send_window > MAX_WINDOW_SIZE:
+                raise H2Error("Window is too large", FLOW_CONTROL_ERROR)
+        else:
+            stream = self.streams.get(stream_id)
+            if stream is None:
+                return  # (closed stream: allowed & ignored)
+            if not increment:
+                raise H2StreamError(stream_id, "WINDOW_UPDATE of 0")
+            stream.send_window += increment
+            if stream.send_window > MAX_WINDOW_SIZE:
+                raise H2StreamError(
+                    stream_id, "Window is too large", FLOW_CONTROL_ERROR
+                )
+        events.append(WindowUpdated())
+
+    def _apply_settings(self, payload: bytes):
+        if len(payload) % 6:
+            raise H2Error("Invalid SETTINGS frame", FRAME_SIZE_ERROR)
+        for key, value in struct.iter_unpack(">HL", payload):
+            if key == SETTINGS_INITIAL_WINDOW_SIZE:
+                if value > MAX_WINDOW_SIZE:
+                    raise H2Error("Window is too large", FLOW_CONTROL_ERROR)
+                delta = value - self.remote_initial_window_size
+                self.remote_initial_window_size = value
+                for stream in self.streams.values():
+                    stream.send_window += delta
+            elif key == SETTINGS_MAX_FRAME_SIZE:
+                if not DEFAULT_MAX_FRAME_SIZE <= value <= (
+                    MAX_FRAME_SIZE_LIMIT
+                ):
+                    raise H2Error("Invalid SETTINGS_MAX_FRAME_SIZE")
+                self.remote_max_frame_size = value
+            elif key == SETTINGS_HEADER_TABLE_SIZE:
+                self._encoder.set_table_size(value)
+            elif key == SETTINGS_ENABLE_PUSH and value > 1:
+                raise H2Error("Invalid SETTINGS_ENABLE_PUSH")
+
+    def _open_stream(self, stream_id: int) -> H2Stream:
+        stream = H2Stream(
+            stream_id, self.remote_initial_window_size,
+            self.initial_window_size,
+        )
+        self.streams[stream_id] = stream
+        self.last_stream_id = max(self.last_stream_id, stream_id)
+        return stream
+
+
+def _strip_padding(flags: int, payload: bytes) -> bytes:
+    if not flags & FLAG_PADDED:
+        return payload
+    if not payload or payload[0] >= len(payload):
+        raise H2Error("Invalid padding")
+    return payload[1:len(payload) - payload[0]]
+
+
+def build_request(stream_id: int, fields: list) -> HTTPRequest:
+    """ HTTPRequest of a request header block (body is added later).
+    raise H2StreamError for a malformed request """
+    pseudo = {}
+    lines = []
+    for name, value in fields:
+        if name.startswith(b":"):
+            if lines or name not in _REQUEST_PSEUDO_HEADERS or (
+                name in pseudo
+            ):
+                raise H2StreamError(stream_id, "Malformed pseudo-headers")
+            pseudo[name] = value
+        elif name in CONNECTION_HEADERS or name != name.lower() or (
+            name == b"te" and value != b"trailers"
+        ):
+            raise H2StreamError(stream_id, "Malformed header field")
+        else:
+            lines.append(b"%s: %s" % (name, value))
+    method = pseudo.get(b":method")
+    path = pseudo.get(b":path")
+    if not method or (not path and method != b"CONNECT"):
+        raise H2StreamError(stream_id, "Missing pseudo-headers")
+    authority = pseudo.get(b":authority")
+    if authority and not any(line[:5] == b"host:" for line in lines):
+        lines.insert(0, b"host: %s" % authority)
+    return HTTPRequest(
+        method.decode("iso-8859-1"),
+        path.decode("iso-8859-1"),
+        "HTTP/2.0",
+        HTTPHeaders(b"\r\n".join(lines)),
+    )
+
+
+def response_fields(response: HTTPResponse) -> list[tuple[bytes, bytes]]:
+    """ header fields of a response: from its HTTP/1.1 header-block (as
+    built by the response itself), without connection-specific fields """
+    block = response.build_header_block()
+    fields = [(b":status", b"%d" % response.status_code)]
+    for line in block.split(b"\r\n")[1:]:
+        name, sep, value = line.partition(b":")
+        if not sep:
+            continue
+        name = name.strip().lower()
+        if name not in CONNECTION_HEADERS:
+            fields.append((name, value.strip()))
+    return fields
+
+
+def upgrade_settings(request: HTTPRequest) -> Optional[bytes]:
+    """ `HTTP2-Settings` of an HTTP/1.1 request which asks for `Upgrade:
+    h2c` (and can be upgraded: no body), otherwise None """
+    headers = request.headers
+    if request.version != "HTTP/1.1" or "transfer-encoding" in headers or (
+        headers.get("content-length", "0").strip() != "0"
+    ):
+        return None
+    upgrade = headers.get("upgrade", "")
+    if "h2c" not in (token.strip().lower() for token in upgrade.split(",")):
+        return None
+    connection = headers.get("connection", "").lower()
+    settings = headers.get("http2-settings")
+    if settings is None or "http2-settings" not in connection or (
+        not settings.isascii()  # (not base64url -> isn't upgraded)
+    ):
+        return None
+    return settings.strip().encode("ascii")
+
+
+# interim response which switches an HTTP/1.1 connection to h2c
+SWITCHING_PROTOCOLS_RESPONSE: bytes = (
+    STATUS_LINES[101] + b"connection: Upgrade\r\nupgrade: h2c\r\n\r\n"
+)
@@ -0,0 +1,120 @@
+""" <HTTPHeaders class> A lazy, case-insensitive, multi-value view over the
+raw header-block of a request, as follows:
+
+    raw:    b"Host: localhost\r\nCookie: a=1\r\nCookie: b=2"
+    index:  {b"cookie": [(24, 29), (38, 43)], ...}
+                         ^ (start, end) offsets of values in `raw`
+
+- nothing is decoded while parsing (only the raw bytes are kept)
+- offsets of a header are found (by a C-level search) and added to the
+  index only when that header is accessed for the first time
+- a value is decoded/stripped only when it's accessed (and then cached)
+- malformed lines (without ':' or with whitespace around the field-name)
+  are ignored
+"""
+
+from collections.abc import Mapping
+from typing import Iterator, Optional
+
+
+class HTTPHeaders(Mapping):
+
+    __slots__ = ("_raw", "_lowered", "_index", "_cache")
+
+    def __init__(self, raw: bytes = b""):
+        self._raw: bytes = raw
+        # b"\r\n" + lower-cased raw (built on first access, for searching)
+        self._lowered: Optional[bytes] = None
+        self._index: dict[bytes, list[tuple[int, int]]] = {}
+        self._cache: dict[str, str] = {}  # decoded (comma-joined) values
+
+    @classmethod
+    def from_pairs(cls, pairs) -> "HTTPHeaders":
+        """ build headers from (name, value) pairs (str or bytes) """
+        lines = []
+        for name, value in pairs:
+            if isinstance(name, str):
+                name = name.encode("iso-8859-1")
+            if isinstance(value, str):
+                value = value.encode("iso-8859-1")
+            lines.append(b"%s: %s" % (name, value))
+        return cls(b"\r\n".join(lines))
+
+    @property
+    def raw(self) -> bytes:
+        return self._raw
+
+    def get(self, name: str, default=None):
+        """ value of header `name` (case-insensitive). repeated fields are
+        joined with ', ' (use `get_all()` for fields like Set-Cookie) """
+        key = name.lower()
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+        spans = self._spans(key.encode("iso-8859-1"))
+        if not spans:
+            return default
+        if len(spans) == 1:  # (common case)
+            start, end = spans[0]
+            value = self._raw[start:end].strip().decode("iso-8859-1")
+        else:
+            value = ", ".join(self.get_all(key))
+        self._cache[key] = value
+        return value
+
+    def get_all(self, name: str) -> list[str]:
+        """ all values of header `name` (case-insensitive), in order """
+        raw = self._raw
+        return [
+            raw[s:e].strip().decode("iso-8859-1")
+            for s, e in self._spans(name.lower().encode("iso-8859-1"))
+        ]
+
+    def __getitem__(self, name: str) -> str:
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name) -> bool:
+        if not isinstance(name, str):
+            return False
+        return bool(self._spans(name.lower().encode("iso-8859-1")))
+
+    def __iter__(self) -> Iterator[str]:
+        """ iterate over (lower-cased, unique) header names """
+        names = {}
+        for line in self._raw.split(b"\r\n"):
+            name, sep, _ = line.partition(b":")
+            if sep and name == name.strip():  # (malformed lines: ignored)
+                names[name.lower().decode("iso-8859-1")] = None
+        return iter(names)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"<HTTPHeaders {dict(self.items())!r}>"
+
+    def _spans(self, key: bytes) -> list[tuple[int, int]]:
+        """ (start, end) offsets of values of header `key` (lower-cased)
+        -> looked up once, then kept in the index """
+        spans = self._index.get(key)
+        if spans is not None:
+            return spans
+
+        if self._lowered is None:
+            self._lowered = b"\r\n" + self._raw.lower()
+        lowered, raw = self._lowered, self._raw
+        needle = b"\r\n" + key + b":"
+        spans = []
+        pos = lowered.find(needle)
+        while pos != -1:
+            start = pos + len(needle) - 2  # (`lowered` has 2 extra bytes)
+            end = raw.find(b"\r\n", start)
+            if end == -1:
+                end = len(raw)
+            spans.append((start, end))
+            pos = lowered.find(needle, end + 2)
+        self._index[key] = spans
+        return spans
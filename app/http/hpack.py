@@ -0,0 +1,451 @@
+""" HPACK (RFC 7541): header compression of HTTP/2, stdlib-only
+- <HPACKDecoder> decodes header blocks of requests: static & dynamic table
+  (indexed fields, literals with / without / never indexing, table size
+  updates) and Huffman-coded strings
+- <HPACKEncoder> encodes header lists of responses: exact (name, value)
+  matches in the static / dynamic table -> a single index, otherwise a
+  literal which is added to the dynamic table (so a header repeated on
+  the next response of the connection costs 1-2 bytes). strings are
+  Huffman-coded when it's shorter
+- Huffman decoding walks a 4-bits-at-a-time state machine (built once from
+  the code table: 256 states x 16 nibbles) instead of bit by bit
+"""
+
+from collections import deque
+from functools import lru_cache
+from typing import Optional
+
+
+class HPACKError(Exception):
+    """ malformed header block (-> `COMPRESSION_ERROR` of the connection) """
+
+
+# RFC 7541 Appendix A
+STATIC_TABLE: tuple[tuple[bytes, bytes], ...] = (
+    (b":authority", b""),
+    (b":method", b"GET"),
+    (b":method", b"POST"),
+    (b":path", b"/"),
+    (b":path", b"/index.html"),
+    (b":scheme", b"http"),
+    (b":scheme", b"https"),
+    (b":status", b"200"),
+    (b":status", b"204"),
+    (b":status", b"206"),
+    (b":status", b"304"),
+    (b":status", b"400"),
+    (b":status", b"404"),
+    (b":status", b"500"),
+    (b"accept-charset", b""),
+    (b"accept-encoding", b"gzip, deflate"),
+    (b"accept-language", b""),
+    (b"accept-ranges", b""),
+    (b"accept", b""),
+    (b"access-control-allow-origin", b""),
+    (b"age", b""),
+    (b"allow", b""),
+    (b"authorization", b""),
+    (b"cache-control", b""),
+    (b"content-disposition", b""),
+    (b"content-encoding", b""),
+    (b"content-language", b""),
+    (b"content-length", b""),
+    (b"content-location", b""),
+    (b"content-range", b""),
+    (b"content-type", b""),
+    (b"cookie", b""),
+    (b"date", b""),
+    (b"etag", b""),
+    (b"expect", b""),
+    (b"expires", b""),
+    (b"from", b""),
+    (b"host", b""),
+    (b"if-match", b""),
+    (b"if-modified-since", b""),
+    (b"if-none-match", b""),
+    (b"if-range", b""),
+    (b"if-unmodified-since", b""),
+    (b"last-modified", b""),
+    (b"link", b""),
+    (b"location", b""),
+    (b"max-forwards", b""),
+    (b"proxy-authenticate", b""),
+    (b"proxy-authorization", b""),
+    (b"range", b""),
+    (b"referer", b""),
+    (b"refresh", b""),
+    (b"retry-after", b""),
+    (b"server", b""),
+    (b"set-cookie", b""),
+    (b"strict-transport-security", b""),
+    (b"transfer-encoding", b""),
+    (b"user-agent", b""),
+    (b"vary", b""),
+    (b"via", b""),
+    (b"www-authenticate", b""),
+)
+# (name, value) -> index, name -> (first) index
+_STATIC_FIELDS: dict[tuple[bytes, bytes], int] = {}
+_STATIC_NAMES: dict[bytes, int] = {}
+for _index, _field in enumerate(STATIC_TABLE, 1):
+    _STATIC_FIELDS.setdefault(_field, _index)
+    _STATIC_NAMES.setdefault(_field[0], _index)
+
+# RFC 7541 Appendix B: (code, length in bits) of symbols 0..255 & EOS (256)
+HUFFMAN_CODES: tuple[tuple[int, int], ...] = (
+    (0x1ff8, 13), (0x7fffd8, 23), (0xfffffe2, 28), (0xfffffe3, 28),
+    (0xfffffe4, 28), (0xfffffe5, 28), (0xfffffe6, 28), (0xfffffe7, 28),
+    (0xfffffe8, 28), (0xffffea, 24), (0x3ffffffc, 30), (0xfffffe9, 28),
+    (0xfffffea, 28), (0x3ffffffd, 30), (0xfffffeb, 28), (0xfffffec, 28),
+    (0xfffffed, 28), (0xfffffee, 28), (0xfffffef, 28), (0xffffff0, 28),
+    (0xffffff1, 28), (0xffffff2, 28), (0x3ffffffe, 30), (0xffffff3, 28),
+    (0xffffff4, 28), (0xffffff5, 28), (0xffffff6, 28), (0xffffff7, 28),
+    (0xffffff8, 28), (0xffffff9, 28), (0xffffffa, 28), (0xffffffb, 28),
+    (0x14, 6), (0x3f8, 10), (0x3f9, 10), (0xffa, 12), (0x1ff9, 13), (0x15, 6),
+    (0xf8, 8), (0x7fa, 11), (0x3fa, 10), (0x3fb, 10), (0xf9, 8), (0x7fb, 11),
+    (0xfa, 8), (0x16, 6), (0x17, 6), (0x18, 6), (0x0, 5), (0x1, 5), (0x2, 5),
+    (0x19, 6), (0x1a, 6), (0x1b, 6), (0x1c, 6), (0x1d, 6), (0x1e, 6),
+    (0x1f, 6), (0x5c, 7), (0xfb, 8), (0x7ffc, 15), (0x20, 6), (0xffb, 12),
+    (0x3fc, 10), (0x1ffa, 13), (0x21, 6), (0x5d, 7), (0x5e, 7), (0x5f, 7),
+    (0x60, 7), (0x61, 7), (0x62, 7), (0x63, 7), (0x64, 7), (0x65, 7),
+    (0x66, 7), (0x67, 7), (0x68, 7), (0x69, 7), (0x6a, 7), (0x6b, 7),
+    (0x6c, 7), (0x6d, 7), (0x6e, 7), (0x6f, 7), (0x70, 7), (0x71, 7),
+    (0x72, 7), (0xfc, 8), (0x73, 7), (0xfd, 8), (0x1ffb, 13), (0x7fff0, 19),
+    (0x1ffc, 13), (0x3ffc, 14), (0x22, 6), (0x7ffd, 15), (0x3, 5), (0x23, 6),
+    (0x4, 5), (0x24, 6), (0x5, 5), (0x25, 6), (0x26, 6), (0x27, 6), (0x6, 5),
+    (0x74, 7), (0x75, 7), (0x28, 6), (0x29, 6), (0x2a, 6), (0x7, 5), (0x2b, 6),
+    (0x76, 7), (0x2c, 6), (0x8, 5), (0x9, 5), (0x2d, 6), (0x77, 7), (0x78, 7),
+    (0x79, 7), (0x7a, 7), (0x7b, 7), (0x7ffe, 15), (0x7fc, 11), (0x3ffd, 14),
+    (0x1ffd, 13), (0xffffffc, 28), (0xfffe6, 20), (0x3fffd2, 22),
+    (0xfffe7, 20), (0xfffe8, 20), (0x3fffd3, 22), (0x3fffd4, 22),
+    (0x3fffd5, 22), (0x7fffd9, 23), (0x3fffd6, 22), (0x7fffda, 23),
+    (0x7fffdb, 23), (0x7fffdc, 23), (0x7fffdd, 23), (0x7fffde, 23),
+    (0xffffeb, 24), (0x7fffdf, 23), (0xffffec, 24), (0xffffed, 24),
+    (0x3fffd7, 22), (0x7fffe0, 23), (0xffffee, 24), (0x7fffe1, 23),
+    (0x7fffe2, 23), (0x7fffe3, 23), (0x7fffe4, 23), (0x1fffdc, 21),
+    (0x3fffd8, 22), (0x7fffe5, 23), (0x3fffd9, 22), (0x7fffe6, 23),
+    (0x7fffe7, 23), (0xffffef, 24), (0x3fffda, 22), (0x1fffdd, 21),
+    (0xfffe9, 20), (0x3fffdb, 22), (0x3fffdc, 22), (0x7fffe8, 23),
+    (0x7fffe9, 23), (0x1fffde, 21), (0x7fffea, 23), (0x3fffdd, 22),
+    (0x3fffde, 22), (0xfffff0, 24), (0x1fffdf, 21), (0x3fffdf, 22),
+    (0x7fffeb, 23), (0x7fffec, 23), (0x1fffe0, 21), (0x1fffe1, 21),
+    (0x3fffe0, 22), (0x1fffe2, 21), (0x7fffed, 23), (0x3fffe1, 22),
+    (0x7fffee, 23), (0x7fffef, 23), (0xfffea, 20), (0x3fffe2, 22),
+    (0x3fffe3, 22), (0x3fffe4, 22), (0x7ffff0, 23), (0x3fffe5, 22),
+    (0x3fffe6, 22), (0x7ffff1, 23), (0x3ffffe0, 26), (0x3ffffe1, 26),
+    (0xfffeb, 20), (0x7fff1, 19), (0x3fffe7, 22), (0x7ffff2, 23),
+    (0x3fffe8, 22), (0x1ffffec, 25), (0x3ffffe2, 26), (0x3ffffe3, 26),
+    (0x3ffffe4, 26), (0x7ffffde, 27), (0x7ffffdf, 27), (0x3ffffe5, 26),
+    (0xfffff1, 24), (0x1ffffed, 25), (0x7fff2, 19), (0x1fffe3, 21),
+    (0x3ffffe6, 26), (0x7ffffe0, 27), (0x7ffffe1, 27), (0x3ffffe7, 26),
+    (0x7ffffe2, 27), (0xfffff2, 24), (0x1fffe4, 21), (0x1fffe5, 21),
+    (0x3ffffe8, 26), (0x3ffffe9, 26), (0xffffffd, 28), (0x7ffffe3, 27),
+    (0x7ffffe4, 27), (0x7ffffe5, 27), (0xfffec, 20), (0xfffff3, 24),
+    (0xfffed, 20), (0x1fffe6, 21), (0x3fffe9, 22), (0x1fffe7, 21),
+    (0x1fffe8, 21), (0x7ffff3, 23), (0x3fffea, 22), (0x3fffeb, 22),
+    (0x1ffffee, 25), (0x1ffffef, 25), (0xfffff4, 24), (0xfffff5, 24),
+    (0x3ffffea, 26), (0x7ffff4, 23), (0x3ffffeb, 26), (0x7ffffe6, 27),
+    (0x3ffffec, 26), (0x3ffffed, 26), (0x7ffffe7, 27), (0x7ffffe8, 27),
+    (0x7ffffe9, 27), (0x7ffffea, 27), (0x7ffffeb, 27), (0xffffffe, 28),
+    (0x7ffffec, 27), (0x7ffffed, 27), (0x7ffffee, 27), (0x7ffffef, 27),
+    (0x7fffff0, 27), (0x3ffffee, 26), (0x3fffffff, 30),
+)
+
+EOS = 256
+# size of a table entry = len(name) + len(value) + ENTRY_OVERHEAD
+ENTRY_OVERHEAD = 32
+
+
+def _build_decoder() -> tuple[list[int], list[int], list[bool]]:
+    """
+    Huffman decoding state machine: states are the internal nodes of the
+    code tree (0 = root). transition (state * 16 + nibble) -> next state &
+    emitted symbol (-1: none, EOS: error). (codes are >= 5 bits -> at most
+    one symbol per nibble). a state is accepting if the bits since the last
+    symbol are < 8 one-bits (= a valid padding)
+    """
+    children: list[list] = [[None, None]]  # (int: node, tuple: symbol)
+    for symbol, (code, length) in enumerate(HUFFMAN_CODES):
+        node = 0
+        for shift in range(length - 1, 0, -1):
+            bit = (code >> shift) & 1
+            if children[node][bit] is None:
+                children.append([None, None])
+                children[node][bit] = len(children) - 1
+            node = children[node][bit]
+        children[node][code & 1] = (symbol,)
+
+    next_states, symbols = [], []
+    for state in range(len(children)):
+        for nibble in range(16):
+            node, emitted = state, -1
+            for shift in (3, 2, 1, 0):
+                child = children[node][(nibble >> shift) & 1]
+                if isinstance(child, tuple):
+                    if emitted != -1 or child[0] == EOS:
+                        emitted = EOS
+                    else:
+                        emitted = child[0]
+                    node = 0
+                else:
+                    node = child
+            next_states.append(node)
+            symbols.append(emitted)
+
+    accepting = [False] * len(children)
+    node = 0
+    for _ in range(8):  # (the all-ones path from the root, < 8 bits)
+        accepting[node] = True
+        node = children[node][1]
+    return next_states, symbols, accepting
+
+
+_NEXT_STATES, _SYMBOLS, _ACCEPTING = _build_decoder()
+
+
+def huffman_decode(data: bytes) -> bytes:
+    next_states, symbols = _NEXT_STATES, _SYMBOLS
+    out = bytearray()
+    state = 0
+    for byte in data:
+        transition = state * 16 + (byte >> 4)
+        symbol = symbols[transition]
+        state = next_states[transition]
+        if symbol >= 0:
+            if symbol == EOS:
+                raise HPACKError("EOS in Huffman-coded string")
+            out.append(symbol)
+        transition = state * 16 + (byte & 0x0F)
+        symbol = symbols[transition]
+        state = next_states[transition]
+        if symbol >= 0:
+            if symbol == EOS:
+                raise HPACKError("EOS in Huffman-coded string")
+            out.append(symbol)
+    if not _ACCEPTING[state]:
+        raise HPACKError("Invalid padding of Huffman-coded string")
+    return bytes(out)
+
+
+@lru_cache(maxsize=1024)  # (response header values repeat a lot)
+def huffman_encode(data: bytes) -> bytes:
+    codes = HUFFMAN_CODES
+    bits = 0
+    size = 0
+    for byte in data:
+        code, length = codes[byte]
+        bits = (bits << length) | code
+        size += length
+    padding = -size % 8  # (most significant bits of EOS -> all ones)
+    bits = (bits << padding) | ((1 << padding) - 1)
+    return bits.to_bytes((size + padding) // 8, "big")
+
+
+def encode_integer(value: int, prefix: int, first: int = 0) -> bytes:
+    """ integer with an N-bit prefix (`first`: flag bits of first byte) """
+    limit = (1 << prefix) - 1
+    if value < limit:
+        return bytes((first | value,))
+    out = bytearray((first | limit,))
+    value -= limit
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_integer(data: bytes, pos: int, prefix: int) -> tuple[int, int]:
+    """ -> (value, position after it) """
+    limit = (1 << prefix) - 1
+    value = data[pos] & limit
+    pos += 1
+    if value < limit:
+        return value, pos
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise HPACKError("Truncated integer")
+        byte = data[pos]
+        pos += 1
+        value += (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+        if shift > 28:
+            raise HPACKError("Integer is too large")
+
+
+def encode_string(data: bytes) -> bytes:
+    if len(data) > 3:  # (Huffman-coding only pays off from a few bytes)
+        coded = huffman_encode(data)
+        if len(coded) < len(data):
+            return encode_integer(len(coded), 7, 0x80) + coded
+    return encode_integer(len(data), 7) + data
+
+
+def decode_string(data: bytes, pos: int) -> tuple[bytes, int]:
+    if pos >= len(data):
+        raise HPACKError("Truncated string")
+    huffman = data[pos] & 0x80
+    length, pos = decode_integer(data, pos, 7)
+    end = pos + length
+    if end > len(data):
+        raise HPACKError("Truncated string")
+    value = data[pos:end]
+    return (huffman_decode(value) if huffman else value), end
+
+
+class HPACKDecoder:
+
+    def __init__(self, max_table_size: int = 4096):
+        # (limit of table size updates = our SETTINGS_HEADER_TABLE_SIZE)
+        self.max_table_size: int = max_table_size
+        self._table_size: int = max_table_size
+        self._entries: deque[tuple[bytes, bytes]] = deque()
+        self._size: int = 0
+
+    def decode(self, data: bytes) -> list[tuple[bytes, bytes]]:
+        """ header block -> [(name, value), ...] """
+        fields = []
+        pos = 0
+        allow_size_update = True
+        while pos < len(data):
+            byte = data[pos]
+            if byte & 0x80:  # indexed field
+                index, pos = decode_integer(data, pos, 7)
+                fields.append(self._field(index))
+                allow_size_update = False
+                continue
+            if byte & 0xE0 == 0x20:  # dynamic table size update
+                if not allow_size_update:
+                    raise HPACKError("Late dynamic table size update")
+                size, pos = decode_integer(data, pos, 5)
+                if size > self.max_table_size:
+                    raise HPACKError("Dynamic table size update too large")
+                self._table_size = size
+                self._evict(0)
+                continue
+            allow_size_update = False
+            if byte & 0x40:  # literal with incremental indexing
+                index, pos = decode_integer(data, pos, 6)
+            else:  # literal without indexing / never indexed
+                index, pos = decode_integer(data, pos, 4)
+            if index:
+                name = self._field(index)[0]
+            else:
+                name, pos = decode_string(data, pos)
+            value, pos = decode_string(data, pos)
+            fields.append((name, value))
+            if byte & 0x40:
+                self._add(name, value)
+        return fields
+
+    def _field(self, index: int) -> tuple[bytes, bytes]:
+        if 0 < index <= len(STATIC_TABLE):
+            return STATIC_TABLE[index - 1]
+        index -= len(STATIC_TABLE) + 1
+        if 0 <= index < len(self._entries):
+            return self._entries[index]
+        raise HPACKError(f"Invalid table index: {index}")
+
+    def _add(self, name: bytes, value: bytes):
+        size = len(name) + len(value) + ENTRY_OVERHEAD
+        self._evict(size)
+        if size <= self._table_size:
+            self._entries.appendleft((name, value))
+            self._size += size
+
+    def _evict(self, room: int):
+        while self._entries and self._size + room > self._table_size:
+            name, value = self._entries.pop()
+            self._size -= len(name) + len(value) + ENTRY_OVERHEAD
+
+
+class HPACKEncoder:
+    """ fields in `never_indexed` are sent as never-indexed literals
+    (kept out of tables of intermediaries too, e.g. cookies) """
+
+    def __init__(
+        self,
+        table_size: int = 4096,
+        never_indexed: frozenset = frozenset((b"set-cookie",))
+    ):
+        self._table_size: int = table_size
+        self._pending_size_update: Optional[int] = None
+        self.never_indexed: frozenset = never_indexed
+        # entries: (name, value, insertion number), newest first
+        self._entries: deque[tuple[bytes, bytes, int]] = deque()
+        self._size: int = 0
+        self._inserted: int = 0
+        self._fields: dict[tuple[bytes, bytes], int] = {}
+        self._names: dict[bytes, int] = {}
+
+    def set_table_size(self, size: int):
+        """ peer's SETTINGS_HEADER_TABLE_SIZE changed -> (announced at the
+        start of the next header block) """
+        size = min(size, 4096)  # (never more than the default)
+        if size != self._table_size:
+            self._table_size = size
+            self._pending_size_update = size
+            self._evict(0)
+
+    def encode(self, fields: list[tuple[bytes, bytes]]) -> bytes:
+        out = []
+        if self._pending_size_update is not None:
+            out.append(encode_integer(self._pending_size_update, 5, 0x20))
+            self._pending_size_update = None
+        for name, value in fields:
+            if name in self.never_indexed:
+                index = self._name_index(name)
+                out.append(encode_integer(index, 4, 0x10))
+                if not index:
+                    out.append(encode_string(name))
+                out.append(encode_string(value))
+                continue
+            index = _STATIC_FIELDS.get((name, value))
+            if index is None:
+                inserted = self._fields.get((name, value))
+                if inserted is not None:
+                    index = self._index_of(inserted)
+            if index is not None:
+                out.append(encode_integer(index, 7, 0x80))
+                continue
+            index = self._name_index(name)
+            out.append(encode_integer(index, 6, 0x40))
+            if not index:
+                out.append(encode_string(name))
+            out.append(encode_string(value))
+            self._add(name, value)
+        return b"".join(out)
+
+    def _name_index(self, name: bytes) -> int:
+        """ (0 -> the name isn't in any table) """
+        index = _STATIC_NAMES.get(name)
+        if index is not None:
+            return index
+        inserted = self._names.get(name)
+        return 0 if inserted is None else self._index_of(inserted)
+
+    def _index_of(self, inserted: int) -> int:
+        return len(STATIC_TABLE) + 1 + self._inserted - inserted
+
+    def _add(self, name: bytes, value: bytes):
+        size = len(name) + len(value) + ENTRY_OVERHEAD
+        self._evict(size)
+        if size > self._table_size:
+            return
+        self._inserted += 1
+        self._entries.appendleft((name, value, self._inserted))
+        self._size += size
+        self._fields[(name, value)] = self._inserted
+        self._names[name] = self._inserted
+
+    def _evict(self, room: int):
+        while self._entries and self._size + room > self._table_size:
+            name, value, inserted = self._entries.pop()
+            self._size -= len(name) + len(value) + ENTRY_OVERHEAD
+            if self._fields.get((name, value)) == inserted:
+                del self._fields[(name, value)]
+            if self._names.get(name) == inserted:
+                del self._names[name]
@@ -1,7 +1,13 @@
 import socket
+from typing import Optional
 
+from app.config import settings
 from app.logging import logger
+from app.buffer import ReceiveBuffer
+from .errors import HTTPParseError
+from .headers import HTTPHeaders
 from .request import HTTPRequest
+from .body import ContentLengthDecoder, ChunkedDecoder, RequestBody
 
 
 class HTTPParser:
@@ -9,110 +15,212 @@ class HTTPParser:
 
     @staticmethod
     def parse_http_request(
-        header_part: bytes, start_of_body: bytes, connection: socket.socket
+        method: str,
+        path: str,
+        version: str,
+        headers: HTTPHeaders,
+        buffer: ReceiveBuffer,
+        connection: socket.socket
     ) -> HTTPRequest:
         """
-        Parse raw HTTP request bytes into a 'HTTPRequest' object
+        Build a 'HTTPRequest' object from an already parsed request-head
+        (by 'HTTPRequestParser' or 'HTTPParser.parse_request_head()')
         steps:
-        1: decode header_part bytes / split every line to a list
-        2: parse request-line (first line of header-part) to extract
-           <METHOD> <PATH> <VERSION> using 'HTTPParser._parse_request_line()'
-        3: parse raw headers into a dict using 'HTTPParser._parse_headers()'
-        4: read the rest of body if there is, via '_extract_body_from_buffer()'
-        5: build 'HTTPRequest' object using extracted data in previous steps
+        1: pick the body decoder via 'get_body_decoder()' (Content-Length or
+           chunked. raise 413 if declared length is bigger than limit)
+        2: wrap it into a lazy 'RequestBody' stream: the body is NOT read
+           here, but when the handler reads it (from `buffer` first, then
+           from connection. bytes after the body are left in `buffer` ->
+           start of the next (pipelined) request)
+        3: build 'HTTPRequest' object using extracted data
         """
 
-        try:
-            header_text = header_part.decode("iso-8859-1")
-        except Exception:
-            logger.debug("Failed to decode header_part")
-            raise ValueError("Invalid header encoding")
+        decoder = HTTPParser.get_body_decoder(headers)
+        if decoder is None:
+            return HTTPRequest(method, path, version, headers)
 
-        header_lines = header_text.split("\r\n")
-        if not header_lines:
-            raise ValueError("Empty request-line")
+        def receive() -> int:
+            try:
+                return buffer.recv_into(connection, 8192)
+            except socket.timeout:
+                raise
 
-        req_line = header_lines[0]
-        try:
-            method, path, version = HTTPParser._parse_request_line(req_line)
-            headers = HTTPParser._parse_headers(header_lines[1:])
-        except ValueError:
-            raise
+        stream = RequestBody(
+            decoder, buffer, receive, HTTPParser.get_content_length(headers)
+        )
+        return HTTPRequest(method, path, version, headers, stream=stream)
 
-        body = b""
-        content_length = headers.get("content-length", None)
-        # If Content-Length present, read the rest of the body
-        if content_length is not None:
-            try:
-                content_length = int(content_length)
-                body = HTTPParser._extract_body_from_buffer(
-                    start_of_body, content_length, connection
+    @staticmethod
+    def get_body_decoder(headers: HTTPHeaders):
+        """
+        decoder of request body, based on its framing (or None -> no body):
+        - `Transfer-Encoding: chunked` -> ChunkedDecoder
+        - `Content-Length: n`          -> ContentLengthDecoder
+        raise HTTPParseError: 400 for unsupported transfer-codings, or both
+        framings at once (request smuggling) / 413 for large bodies
+        """
+        transfer_encoding = headers.get("transfer-encoding", None)
+        if transfer_encoding is not None:
+            if transfer_encoding.strip().lower() != "chunked":
+                raise HTTPParseError(
+                    f"Unsupported Transfer-Encoding: {transfer_encoding!r}"
                 )
-            except ValueError:
-                logger.warning(
-                    "Invalid Content-Length value: %r", content_length
+            if "content-length" in headers:
+                raise HTTPParseError(
+                    "Both Transfer-Encoding and Content-Length are sent"
                 )
-                # should I raise it?
-            except socket.timeout:
-                raise
+            return ChunkedDecoder(settings.MAX_BODY_SIZE)
+        content_length = HTTPParser.get_content_length(headers)
+        if not content_length:
+            return None
+        return ContentLengthDecoder(content_length)
 
-        return HTTPRequest(method, path, version, headers, body)
+    @staticmethod
+    def get_content_length(headers: HTTPHeaders) -> Optional[int]:
+        """ validated Content-Length of request (None if it's not provided)
+        raise HTTPParseError: 400 for invalid values / 413 for large ones """
+
+        content_length = headers.get("content-length", None)
+        if content_length is None:
+            return None
+        # (`isdigit()` alone accepts non-ASCII digits, e.g. "²")
+        if not (content_length.isascii() and content_length.isdigit()):
+            logger.warning("Invalid Content-Length value: %r", content_length)
+            raise HTTPParseError("Invalid Content-Length")
+        content_length = int(content_length)
+        if content_length > settings.MAX_BODY_SIZE:
+            raise HTTPParseError("Request body is too large", 413)
+        return content_length
 
     @staticmethod
-    def _parse_request_line(request_line: str) -> tuple[str, str, str]:
+    def parse_request_head(
+        header_part: bytes
+    ) -> tuple[str, str, str, HTTPHeaders]:
+        """
+        Parse a complete header-part (request-line + headers) of a request.
+        (doesn't touch the socket, so it's usable by both the threaded
+        `ConnectionHandler` and the asyncio `AsyncConnectionHandler`)
+        returns: (method, path, version, headers)
+        """
+        if header_part.startswith(b"\r\n"):  # (empty lines before
+            header_part = header_part.lstrip(b"\r\n")  # request-line)
+        req_line, _, header_block = header_part.partition(b"\r\n")
+        if not req_line:
+            raise HTTPParseError("Empty request-line")
+        if len(req_line) > settings.MAX_REQUEST_LINE_SIZE:
+            raise HTTPParseError("Request-line is too long", 414)
+        if len(header_block) > settings.MAX_HEADER_SIZE:
+            raise HTTPParseError("Request header fields too large", 431)
+
+        method, path, version = HTTPParser._parse_request_line(req_line)
+        headers = HTTPParser._parse_headers(header_block)
+        return method, path, version, headers
+
+    @staticmethod
+    def _parse_request_line(request_line: bytes) -> tuple[str, str, str]:
         """Parse <METHOD> <PATH> <VERSION> from request line"""
-        parts = request_line.strip().split()
+        parts = request_line.decode("iso-8859-1").split()
         if len(parts) != 3:
-            raise ValueError(f"Malformed request line: {request_line!r}")
+            raise HTTPParseError(f"Malformed request line: {request_line!r}")
         return parts[0], parts[1], parts[2]
 
     @staticmethod
-    def _parse_headers(lines: list[str]) -> dict[str, str]:
+    def _parse_headers(header_block: bytes) -> HTTPHeaders:
         """
-        Parse raw headers into a dict[str, str] with lower-cased header names.
-        NOTE: Combine multiple header fields with the same name into a
-              single comma-separated value (mentioned in related line)
+        Wrap raw header-block (without request-line) into a lazy
+        `HTTPHeaders` (header fields are decoded only when accessed).
+        only the number of header fields is checked here.
         """
-        headers = {}
-        for raw in lines:
-            if raw == "":
-                continue
-            if ":" not in raw:
-                logger.debug("Skipping malformed header line: %r", raw)
-                continue
-            name, _, value = raw.partition(":")
-            name = name.strip().lower()  # lower-cased header names
-            value = value.strip()
-            if name in headers:  # Noted in docstring
-                headers[name] += f", {value}"
-            else:
-                headers[name] = value
-
-        return headers
-
-    @staticmethod
-    def _extract_body_from_buffer(
-        start_of_body: bytes, content_length: int, connection: socket.socket
-    ) -> bytes:
-        """ read the rest of body using 'connection.recv()' if there is """
-
-        body = start_of_body or b""
-        to_read = content_length - len(body)
-        while to_read > 0:
-            try:
-                chunk = connection.recv(min(10240, to_read))  # 10 KB
-            except socket.timeout:
-                raise
-            if not chunk:
-                logger.debug("Client closed while sending body")
-                break
-            body += chunk
-            to_read -= len(chunk)
-
-        return body
-
-    # @staticmethod
-    # def _extract_body_chunks_from_buffer(connection: socket.socket) -> bytes:
-    #     """ ... """
-    #     body = b""
-    #     ...
+        if header_block.count(b"\r\n") >= settings.MAX_HEADERS_COUNT:
+            raise HTTPParseError("Too many header fields", 431)
+        return HTTPHeaders(header_block)
+
+
+class HTTPRequestParser:
+    """
+    Resumable (incremental) parser of request-heads, one per connection.
+    It's fed with a `ReceiveBuffer` every time new bytes arrive, consumes
+    what is complete and remembers where it stopped (parser state + scan
+    position of the buffer), so nothing is parsed/scanned twice.
+    Limits are checked as soon as possible (even before a line is complete)
+    -> oversized request-lines/headers are rejected early (414/431).
+
+    states:  REQUEST_LINE --(CRLF)--> HEADERS --(CRLF CRLF)--> DONE
+    (if the whole request-head is already in buffer -> REQUEST_LINE -> DONE)
+    """
+
+    REQUEST_LINE = 0
+    HEADERS = 1
+    DONE = 2
+
+    __slots__ = (
+        "state", "method", "path", "version", "headers",
+        "_max_request_line", "_max_header_size",
+    )
+
+    def __init__(self):
+        self._max_request_line: int = settings.MAX_REQUEST_LINE_SIZE
+        self._max_header_size: int = settings.MAX_HEADER_SIZE
+        self.reset()
+
+    def reset(self):
+        """ prepare parser for the next request on the connection """
+        self.state: int = self.REQUEST_LINE
+        self.method: str = ""
+        self.path: str = ""
+        self.version: str = ""
+        self.headers: Optional[HTTPHeaders] = None
+
+    def feed(self, buffer: ReceiveBuffer) -> bool:
+        """
+        parse as much as possible from `buffer` (consumed bytes are removed
+        from it). returns True when the request-head is complete.
+        raise HTTPParseError on malformed/oversized request-heads
+        """
+        if self.state == self.REQUEST_LINE:
+            if not buffer:
+                return False
+            while buffer.startswith(b"\r\n"):  # ignore empty lines before
+                buffer.skip(2)                # request-line
+            # fast path: the whole request-head is already in buffer
+            idx = buffer.find(b"\r\n\r\n")
+            if 0 < idx <= self._max_request_line + self._max_header_size:
+                self.method, self.path, self.version, self.headers = (
+                    HTTPParser.parse_request_head(buffer.consume(idx))
+                )
+                buffer.skip(4)
+                self.state = self.DONE
+                return True
+
+            idx = buffer.find(b"\r\n")
+            if idx == -1:
+                if len(buffer) > self._max_request_line:
+                    raise HTTPParseError("Request-line is too long", 414)
+                return False
+            if idx > self._max_request_line:
+                raise HTTPParseError("Request-line is too long", 414)
+            self.method, self.path, self.version = (
+                HTTPParser._parse_request_line(buffer.consume(idx))
+            )
+            buffer.skip(2)
+            self.state = self.HEADERS
+
+        if self.state == self.HEADERS:
+            if buffer.startswith(b"\r\n"):  # no header fields at all
+                buffer.skip(2)
+                self.state = self.DONE
+                return True
+            idx = buffer.find(b"\r\n\r\n")
+            if idx == -1:
+                if len(buffer) > self._max_header_size:
+                    raise HTTPParseError(
+                        "Request header fields too large", 431
+                    )
+                return False
+            if idx > self._max_header_size:
+                raise HTTPParseError("Request header fields too large", 431)
+            self.headers = HTTPParser._parse_headers(buffer.consume(idx))
+            buffer.skip(4)
+            self.state = self.DONE
+
+        return self.state == self.DONE
@@ -14,24 +14,52 @@ as follows:
 +---------------------------+
 """
 
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
+
+from .headers import HTTPHeaders
+
+if TYPE_CHECKING:
+    from .body import RequestBody
 
 
 class HTTPRequest:
+    """
+    compact request object (`__slots__` -> no per-instance `__dict__`).
+    `headers` is a lazy `HTTPHeaders` view over the raw header-block, so
+    header fields are decoded only if a handler really accesses them.
+    the body is a lazy `stream` (see `app/http/body.py`): it's received
+    only when the handler reads it. `body` reads the whole of it (at once).
+    `client` is the (host, port) of the peer, set by the connection
+    """
+
+    __slots__ = (
+        "method", "path", "version", "headers", "stream", "client", "_body"
+    )
 
     def __init__(
         self,
         method: str,
         path: str,
         version: str,
-        headers: dict[str, str],
-        body: Optional[bytes] = None
+        headers: HTTPHeaders,
+        body: Optional[bytes] = None,
+        stream: Optional["RequestBody"] = None
     ):
-        self.method = method
-        self.path = path
-        self.version = version
-        self.headers = headers
-        self.body = body or b""
+        self.method: str = method
+        self.path: str = path
+        self.version: str = version
+        self.headers: HTTPHeaders = headers
+        self.stream: Optional["RequestBody"] = stream
+        self.client: Optional[tuple] = None
+        self._body: Optional[bytes] = body
+
+    @property
+    def body(self) -> bytes:
+        """ the whole body in memory (read from stream on first access)
+        -> for large uploads, use `stream` (iterate/readinto/spool) """
+        if self._body is None:
+            self._body = self.stream.read() if self.stream else b""
+        return self._body
 
     def __repr__(self):
         return f"<HTTPRequest {self.method} {self.path} {self.version}>"
@@ -16,99 +16,366 @@ as follows:
 +-----------------------------------------+
 """
 
-from typing import Optional, Callable
-from datetime import datetime, timezone
+from typing import AsyncIterable, Iterable, Optional, Callable, Union
+import time
+from email.utils import formatdate
 
 from app.config import settings
 from .status import STATUS_MESSAGES
 
 
+# pre-encoded Status-Lines for every known status code
+STATUS_LINES: dict[int, bytes] = {
+    code: f"HTTP/1.1 {code} {message}\r\n".encode("ascii")
+    for code, message in STATUS_MESSAGES.items()
+}
+# pre-encoded static header line(s)
+SERVER_HEADER: bytes = f"server: {settings.PROJECT_NAME}\r\n".encode()
+
+# base headers which can't be overwritten by provided headers
+_RESERVED_HEADERS = frozenset(("date", "server"))
+_RESERVED_HEADERS_WITH_LENGTH = _RESERVED_HEADERS | {"content-length"}
+_RESERVED_HEADERS_CHUNKED = _RESERVED_HEADERS | {
+    "transfer-encoding", "content-length"
+}
+# responses which never have a body (-> no `content-length`)
+_BODYLESS_STATUS_CODES = frozenset((100, 101, 204, 304))
+
+
+class _DateHeaderCache:
+    """
+    `date` header line, rebuilt at most once per second (instead of
+    datetime.now() + strftime() for every response) and shared by all
+    threads. (a (second, line) tuple is swapped atomically -> no lock)
+    """
+
+    def __init__(self):
+        self._cached: tuple[int, bytes] = (0, b"")
+
+    def get(self) -> bytes:
+        now = int(time.time())
+        second, line = self._cached
+        if second != now:
+            date = formatdate(now, usegmt=True)  # RFC 9110 IMF-fixdate
+            line = f"date: {date}\r\n".encode("ascii")
+            self._cached = (now, line)
+        return line
+
+
+date_header = _DateHeaderCache()
+
+# response body can be any (contiguous) bytes-like object
+BodyType = Union[bytes, bytearray, memoryview]
+
+
+def header_key(headers: dict[str, str], name: str) -> Optional[str]:
+    """ actual key of header `name` (lower-case) in a (case-sensitive)
+    headers dict, e.g. `HTTPResponse.headers` """
+    if name in headers:
+        return name
+    for key in headers:
+        if key.lower() == name:
+            return key
+    return None
+
+
+def get_header(headers: dict[str, str], name: str, default=None):
+    """ value of header `name` (lower-case) in a headers dict """
+    key = header_key(headers, name)
+    return headers[key] if key is not None else default
+
+
+class FileBody:
+    """
+    a region of an open file, used as response body instead of bytes
+    -> sent by `os.sendfile()` (kernel -> socket, no copy into Python).
+    `release` is called (once) when the response is sent or dropped
+    """
+
+    __slots__ = ("fd", "offset", "count", "_release")
+
+    def __init__(
+        self,
+        fd: int,
+        offset: int,
+        count: int,
+        release: Optional[Callable[[], None]] = None
+    ):
+        self.fd: int = fd
+        self.offset: int = offset
+        self.count: int = count
+        self._release: Optional[Callable[[], None]] = release
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
 class HTTPResponse:
 
     def __init__(
         self,
         status_code: int = 200,
         headers: Optional[dict[str, str]] = None,
-        body: bytes = b"",
+        body: BodyType = b"",
         mem_type: Optional[str] = None,
         chunked: bool = False,
-        iter_body: Optional[Callable[[], bytes]] = None,
-        is_for_head_method: bool = False
+        iter_body: Optional[
+            Callable[[], Union[Iterable, AsyncIterable]]
+        ] = None,
+        is_for_head_method: bool = False,
+        file_body: Optional[FileBody] = None,
+        body_parts: Optional[list[Union[BodyType, FileBody]]] = None,
+        trailers: Optional[dict[str, str]] = None,
+        length: Optional[int] = None
     ):
         self.status_code: int = status_code
         self.headers: dict[str, str] = headers or {}
-        self.body: bytes = body
+        if not isinstance(body, (bytes, bytearray)):
+            # buffer-protocol objects -> flat bytes view (never copied)
+            body = memoryview(body).cast("B")
+        self.body: BodyType = body
         self.mem_type: Optional[str] = mem_type
         self.chunked: bool = chunked
-        self.iter_body: Callable[[], bytes] = iter_body
+        # returns a (sync or async) iterable of body chunks (+ `FLUSH`)
+        self.iter_body: Optional[
+            Callable[[], Union[Iterable, AsyncIterable]]
+        ] = iter_body
+        # trailer fields of chunked body (sent after the last chunk, so it
+        # can be filled by `iter_body` while streaming)
+        self.trailers: Optional[dict[str, str]] = trailers
+        # known length of a (not chunked) `iter_body`: chunks are sent as-is
+        # after a `content-length` header (producer must yield exactly it)
+        self.length: Optional[int] = length
         self.is_for_head_method: bool = is_for_head_method
+        self.file_body: Optional[FileBody] = file_body
+        # body made of several parts (in-memory buffers and/or file regions)
+        # sent one after another (e.g. multipart/byteranges)
+        self.body_parts: Optional[list[Union[BodyType, FileBody]]] = (
+            body_parts
+        )
 
     def build_response(self) -> bytes:
         """ builds and returns a simple HTTP/1.1 HttpResponse (in bytes)
         steps:
-        1- build and initialize `headers` dict using self._base_headers()
-        2- few changes in `headers` base on 'self.chunked' and 'self.iter_body'
-        3- add provided headers for response (self.headers) to `headers` dict
-        4- get Status-line / join `headers` into a string / add an empty-line
-           -> concatenate them -> convert to 'bytes' -> "HttpHeader block"
+        1- build "HttpHeader block" directly in bytes using
+           self.build_header_block() (pre-encoded Status-line, cached `date`
+           & static `server` header lines, and provided headers)
         then:
         _ if HEAD method is requested -> return "HttpHeader block" (bytes)
         _ for chunked body transferring -> first send "HttpHeader" (bytes),
-          then send body-chunks using 'self.iter_body'
+          then send body-chunks using 'self.iter_body' (the same for a
+          streamed body of known `self.length`, sent without chunk framing)
         _ to build HttpResponse completely -> add Response-Body (self.body)
           to "HttpHeader" and build the whole HttpResponse and return
+        (for `self.file_body` & `self.body_parts`, only "HttpHeader" is
+        returned, file regions are sent separately by `os.sendfile()`)
         """
 
-        headers = self._base_headers()
-        if self.chunked and self.iter_body:  # chunked transferring provided
-            headers["transfer-encoding"] = "chunked"
-            headers.pop("content-length", None)
-        # add user headers:
-        for k, v in self.headers.items():
-            # don't overwrite headers provided by `self._base_headers()`
-            if (key := k.lower()) not in headers:
-                headers[key] = v
-
-        status_line = self._status_line()
-        headers_lines = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
-        empty_line = "\r\n"
-        http_header_block = status_line + headers_lines + empty_line
-        http_header_block_bytes = http_header_block.encode("utf-8")
-
-        if self.is_for_head_method or (self.chunked and self.iter_body):
+        http_header_block_bytes = self.build_header_block()
+
+        if (
+            self.is_for_head_method
+            or self.is_streamed()
+            or self.file_body
+            or self.body_parts
+        ):
             return http_header_block_bytes
             # when self.chunked is True and self.iter_body is provided:
             # we have "chunked body transferring" -> so:
             # send only Http-Header first / then stream body chunks
 
-        if not self.chunked and self.body:
+        if self.body:
             return http_header_block_bytes + self.body
-        else:
-            raise ...  # ToDo: handle here later (Internal server error)
+        return http_header_block_bytes  # (empty body, `content-length: 0`)
 
-    def _status_line(self) -> str:
+    def build_response_buffers(self) -> list[BodyType]:
         """
-        builds the first line of Http-Header (Status-Line) for HttpResponse.
-        HttpResponse Status-Line schema: `<version> <status-code> <reason>`
+        same as `build_response()`, but returns [header-block, body] without
+        concatenating them (body is never copied) -> to be sent together by
+        a scatter-gather write (`socket.sendmsg()`)
+        (in-memory `body_parts` are added as separate buffers too, but
+        file regions are sent separately by `os.sendfile()`)
         """
-        message = STATUS_MESSAGES.get(self.status_code, "Unknown")
-        return f"HTTP/1.1 {self.status_code} {message}\r\n"
+        http_header_block_bytes = self.build_header_block()
+        if (
+            self.body_parts
+            and not self.is_for_head_method
+            and not self.has_file_parts()
+        ):
+            return [http_header_block_bytes, *self.body_parts]
+        if (
+            self.is_for_head_method
+            or self.is_streamed()
+            or self.file_body
+            or self.body_parts
+            or not self.body
+        ):
+            return [http_header_block_bytes]
+        return [http_header_block_bytes, self.body]
+
+    def body_buffers(self) -> list[BodyType]:
+        """ the in-memory body, without header-block (e.g. for HTTP/2 DATA
+        frames). empty for HEAD, streamed bodies & file regions """
+        if (
+            self.is_for_head_method
+            or self.is_streamed()
+            or self.file_body is not None
+        ):
+            return []
+        if self.body_parts is not None:
+            return [
+                part for part in self.body_parts
+                if not isinstance(part, FileBody)
+            ]
+        return [self.body] if self.body else []
+
+    def close(self):
+        """ release resources of response (e.g. cached file of file_body) """
+        if self.file_body is not None:
+            self.file_body.close()
+        for part in self.body_parts or ():
+            if isinstance(part, FileBody):
+                part.close()
 
-    def _base_headers(self) -> dict[str, str]:
+    def is_streamed(self) -> bool:
+        """ True if body is produced by `iter_body` while sending (chunked,
+        or of known `length`) """
+        return callable(self.iter_body) and (
+            self.chunked or self.length is not None
+        )
+
+    def has_file_parts(self) -> bool:
+        """ True if body must be sent by sendfile (file_body / body_parts
+        with file regions) -> can't be sent by one scatter-gather write """
+        if self.is_for_head_method:
+            return False
+        return self.file_body is not None or any(
+            isinstance(part, FileBody) for part in self.body_parts or ()
+        )
+
+    def content_length(self) -> int:
+        if self.length is not None and self.iter_body is not None:
+            return self.length
+        if self.file_body is not None:
+            return self.file_body.count
+        if self.body_parts is not None:
+            return sum(
+                part.count if isinstance(part, FileBody) else len(part)
+                for part in self.body_parts
+            )
+        return len(self.body)
+
+    def build_header_block(self) -> bytes:
+        """
+        builds "HttpHeader block" (Status-Line + headers + empty-line) as
+        bytes, without building an intermediate dict or str:
+        1- pre-encoded Status-Line / cached `date` / static `server` header
+        2- base headers: `content-length` & `content-type` (not for HEAD
+           method), or `transfer-encoding` (for chunked transferring)
+        3- add provided headers for response (self.headers)
+           (base headers can't be overwritten by provided headers; a list
+           value -> one header line per item, e.g. several `set-cookie`)
         """
-        provides base (default) Headers for HttpResponse
-        (doesn't add 'content-length' & 'content-type' headers if
-        the Http-Response is preparing for HEAD method)
+        lines = [self._status_line(), date_header.get(), SERVER_HEADER]
+        reserved = _RESERVED_HEADERS
+        if self.chunked and self.iter_body:  # chunked transferring provided
+            lines.append(b"transfer-encoding: chunked\r\n")
+            if self.trailers:  # (names of trailers which are known already)
+                names = ", ".join(self.trailers)
+                lines.append(b"trailer: %s\r\n" % names.encode("utf-8"))
+            reserved = _RESERVED_HEADERS_CHUNKED
+        elif not (
+            self.is_for_head_method
+            or self.status_code in _BODYLESS_STATUS_CODES
+        ):
+            lines.append(b"content-length: %d\r\n" % self.content_length())
+            reserved = _RESERVED_HEADERS_WITH_LENGTH
+        has_type = bool(self.mem_type) and not self.is_for_head_method
+        if has_type:
+            lines.append(b"content-type: %s\r\n" % self.mem_type.encode())
+
+        if self.headers:
+            provided = []
+            for k, v in self.headers.items():
+                key = k.lower()
+                # don't overwrite base headers
+                if key in reserved or (has_type and key == "content-type"):
+                    continue
+                if isinstance(v, list):
+                    provided.extend(f"{key}: {item}\r\n" for item in v)
+                else:
+                    provided.append(f"{key}: {v}\r\n")
+            lines.append("".join(provided).encode("utf-8"))
+        lines.append(b"\r\n")  # empty-line
+        return b"".join(lines)
+
+    def _status_line(self) -> bytes:
         """
-        now_ = datetime.now(tz=timezone.utc)
-        default_headers = {
-            "date": now_.strftime("%a, %d %b %Y %H:%M:%S GMT"),
-            "server": settings.PROJECT_NAME,
-        }
-        if not self.is_for_head_method:
-            if not self.chunked and self.body:
-                default_headers["content-length"] = str(len(self.body))
-            if self.mem_type:
-                default_headers["content-type"] = self.mem_type
-
-        return default_headers
+        returns the first line of Http-Header (Status-Line) for HttpResponse.
+        HttpResponse Status-Line schema: `<version> <status-code> <reason>`
+        """
+        line = STATUS_LINES.get(self.status_code)
+        if line is None:
+            line = f"HTTP/1.1 {self.status_code} Unknown\r\n".encode("ascii")
+        return line
+
+
+class PreSerializedResponse:
+    """
+    a response which is serialized once and then sent many times (e.g. a
+    503 of load shedding, a 429 of rate limiting): only its `date` line is
+    rebuilt -> [Status-Line, `date`, rest of header-block + body]
+    """
+
+    __slots__ = ("status_code", "status_line", "rest", "head_rest", "length")
+
+    def __init__(self, response: HTTPResponse):
+        data = bytes(response.build_response())
+        status_end = data.index(b"\r\n") + 2
+        date_end = data.index(b"\r\n", status_end) + 2  # (2nd line)
+        head_end = data.index(b"\r\n\r\n") + 4
+        self.status_code: int = response.status_code
+        self.status_line: bytes = data[:status_end]
+        self.rest: bytes = data[date_end:]
+        self.head_rest: bytes = data[date_end:head_end]  # (for HEAD)
+        self.length: int = len(data) - head_end
+
+    def buffers(self, head: bool = False) -> list[bytes]:
+        rest = self.head_rest if head else self.rest
+        return [self.status_line, date_header.get(), rest]
+
+    def response(self, is_for_head_method: bool = False) -> HTTPResponse:
+        """ as an HTTPResponse (-> sent by the usual response path) """
+        return PreSerializedHTTPResponse(self, is_for_head_method)
+
+
+class PreSerializedHTTPResponse(HTTPResponse):
+    """ HTTPResponse which is sent from a `PreSerializedResponse` """
+
+    def __init__(
+        self, data: PreSerializedResponse, is_for_head_method: bool = False
+    ):
+        super().__init__(
+            status_code=data.status_code,
+            is_for_head_method=is_for_head_method,
+        )
+        self.data: PreSerializedResponse = data
+
+    def build_response_buffers(self) -> list[BodyType]:
+        return self.data.buffers(self.is_for_head_method)
+
+    def build_response(self) -> bytes:
+        return b"".join(self.build_response_buffers())
+
+    def build_header_block(self) -> bytes:
+        return b"".join(self.data.buffers(head=True))
+
+    def body_buffers(self) -> list[BodyType]:
+        if self.is_for_head_method or not self.data.length:
+            return []
+        return [self.data.rest[len(self.data.head_rest):]]
+
+    def content_length(self) -> int:
+        return self.data.length
@@ -3,13 +3,16 @@
 STATUS_MESSAGES = {
     # 1** : Informational
     100: "Continue",
+    101: "Switching Protocols",
     # 2** : Successful
     200: "OK",
     201: "Created",
     202: "Accepted",
     204: "No Content",
+    206: "Partial Content",
     # 3** : Redirection
     301: "Moved Permanently",
+    304: "Not Modified",
     307: "Temporary Redirect",
     308: "Permanent Redirect",
     # 4** : Client Error
@@ -18,9 +21,15 @@ STATUS_MESSAGES = {
     403: "Forbidden",
     404: "Not Found",
     405: "Method Not Allowed",
+    408: "Request Timeout",
     411: "Length Required",
     413: "Content Too Large",
+    414: "URI Too Long",
+    416: "Range Not Satisfiable",
+    417: "Expectation Failed",
     429: "Too Many Requests",
+    431: "Request Header Fields Too Large",
     # 5** : Server Error
     500: "Internal Server Error",
+    503: "Service Unavailable",
 }
@@ -0,0 +1,396 @@
+""" Chunked response streaming (`Transfer-Encoding: chunked`):
+- <ChunkedWriter> (sans-IO) turns the chunks of a response body into
+  frames (lists of buffers for one scatter-gather write). payloads are
+  never copied: a frame is [b"<size>\r\n", payload, payload, ..., b"\r\n"].
+  small chunks are coalesced into one frame until `coalesce_size` bytes
+  are pending, or `flush_interval` seconds passed since the first pending
+  chunk, or the producer yields `FLUSH` (e.g. after each SSE event)
+- the body producer (`HTTPResponse.iter_body()`) can return a sync or
+  an async iterable (e.g. generator / async generator). pending chunks
+  are also flushed when the producer is idle until their `flush_interval`
+  is over (see `iterate_in_thread()` / `iterate_on_loop()`). a sync
+  producer is advanced by batches on a (daemon) thread of its own
+  (<SyncProducer>), so an idle producer never holds up the ones of other
+  responses: always on the asyncio engine, only while chunks are pending
+  on the threads engine (in place, on the worker, otherwise)
+- trailers (`HTTPResponse.trailers`) are sent with the last-chunk. it's
+  read when the stream ends, so the producer can fill it while streaming
+- a streamed body of known length (`HTTPResponse.length`) goes through the
+  same writer with `framed=False`: chunks are coalesced the same way, but
+  sent as-is (no chunk framing, no last-chunk)
+"""
+
+import time
+import asyncio
+import contextvars
+from threading import Condition, Thread
+from typing import AsyncIterator, Iterator, Optional
+
+from .response import BodyType
+
+
+class _Flush:
+    def __repr__(self):
+        return "FLUSH"
+
+
+# yield it from a body producer to send pending (coalesced) chunks now
+FLUSH = _Flush()
+
+_END = object()  # (end of a sync producer)
+
+
+class ChunkedWriter:
+
+    __slots__ = (
+        "coalesce_size", "flush_interval", "_pending", "_pending_size",
+        "_first_pending_at", "framed",
+    )
+
+    def __init__(
+        self, coalesce_size: int, flush_interval: float, framed: bool = True
+    ):
+        self.coalesce_size: int = coalesce_size
+        self.flush_interval: float = flush_interval
+        self.framed: bool = framed
+        self._pending: list[BodyType] = []
+        self._pending_size: int = 0
+        self._first_pending_at: float = 0.0
+
+    @property
+    def has_pending(self) -> bool:
+        return bool(self._pending)
+
+    def write(self, chunk) -> Optional[list[BodyType]]:
+        """ add a chunk (or `FLUSH`). returns a frame to send now, or None
+        if the chunk is kept for coalescing with the next ones """
+        if chunk is FLUSH:
+            return self.flush()
+        if not chunk:
+            return None
+        now = time.monotonic()
+        if not self._pending:
+            if len(chunk) >= self.coalesce_size:  # (big -> its own frame)
+                if not self.framed:
+                    return [chunk]
+                return [b"%X\r\n" % len(chunk), chunk, b"\r\n"]
+            self._first_pending_at = now
+        self._pending.append(chunk)
+        self._pending_size += len(chunk)
+        if (
+            self._pending_size >= self.coalesce_size
+            or now - self._first_pending_at >= self.flush_interval
+        ):
+            return self.flush()
+        return None
+
+    def flush_timeout(self) -> Optional[float]:
+        """ seconds left until pending chunks must be sent (None: nothing
+        is pending) """
+        if not self._pending:
+            return None
+        return max(
+            self._first_pending_at + self.flush_interval - time.monotonic(),
+            0.0,
+        )
+
+    def flush(self) -> Optional[list[BodyType]]:
+        """ frame of all pending chunks (one chunk of their total size) """
+        if not self._pending:
+            return None
+        if not self.framed:
+            frame = self._pending
+        else:
+            frame = [
+                b"%X\r\n" % self._pending_size, *self._pending, b"\r\n"
+            ]
+        self._pending, self._pending_size = [], 0
+        return frame
+
+    def finish(self, trailers: Optional[dict[str, str]] = None) -> list:
+        """ pending chunks + last-chunk (+ trailer fields) """
+        frame = self.flush() or []
+        if not self.framed:
+            return frame
+        frame.append(b"0\r\n")
+        if trailers:
+            frame.append("".join(
+                f"{k.lower()}: {v}\r\n" for k, v in trailers.items()
+            ).encode("utf-8"))
+        frame.append(b"\r\n")
+        return frame
+
+
+def is_async_iterable(body) -> bool:
+    return hasattr(body, "__aiter__")
+
+
+class _Raised:
+    """ (an exception of a producer, passed to the waiting side) """
+
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error: BaseException = error
+
+
+class SyncProducer:
+    """
+    a sync body producer (iterable): advanced in place by `next()` (only
+    by a worker thread, while no chunk is pending), or by a batch (up to
+    `batch_size` bytes, or a `FLUSH`) on its own thread. the waiting side
+    takes the chunks collected so far by `take()`, so it can flush them
+    when the producer is idle. (one thread hand-off per batch, not per
+    chunk. the producer runs in the same context on any thread)
+    the thread is started by the first batch and lives until the producer
+    ends or is closed: a producer blocked for long (e.g. SSE) only holds
+    its own thread, which is a daemon (it never holds up the exit)
+    """
+
+    def __init__(self, body, batch_size: int, loop=None):
+        self._iterator = iter(body)
+        self._context = contextvars.copy_context()
+        self.batch_size: int = batch_size
+        self.running: bool = False  # (a batch is being collected)
+        self._chunks: list = []
+        self._stopped: bool = False
+        self._finished: bool = False  # (the iterator ended / raised)
+        self._thread: Optional[Thread] = None
+        self._lock = Condition()
+        self._loop: Optional[asyncio.AbstractEventLoop] = loop
+        self._event = asyncio.Event() if loop is not None else None
+
+    def next(self):
+        """ (in place) the next chunk, or `_END` """
+        return self._context.run(next, self._iterator, _END)
+
+    def start_batch(self):
+        with self._lock:
+            self.running = True
+            if self._thread is not None:
+                self._lock.notify_all()
+                return
+        self._thread = Thread(target=self._run, name="producer", daemon=True)
+        self._thread.start()
+
+    def take(self, timeout: Optional[float]) -> list:
+        """ chunks collected by the batch (waits up to `timeout` for the
+        first one. [] -> the producer is idle, or the batch is over) """
+        with self._lock:
+            if not self._chunks and self.running:
+                self._lock.wait(timeout)
+            chunks, self._chunks = self._chunks, []
+        return chunks
+
+    async def take_async(self, timeout: Optional[float]) -> list:
+        """ same as `take()`, for the loop of this producer """
+        deadline = None if timeout is None else self._loop.time() + timeout
+        while True:
+            with self._lock:
+                chunks, self._chunks = self._chunks, []
+                if chunks or not self.running:
+                    return chunks
+                self._event.clear()
+            remaining = None if deadline is None else (
+                deadline - self._loop.time()
+            )
+            try:
+                await asyncio.wait_for(self._event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return []
+
+    def close(self):
+        with self._lock:
+            self._stopped = True
+            self._lock.notify_all()  # (an idle producer thread exits)
+            if self.running:
+                return  # (the batch closes it when it's over)
+        self._context.run(_close, self._iterator)
+
+    def _run(self):
+        """ (producer thread) collect a batch whenever one is started """
+        while True:
+            with self._lock:
+                while not self.running and not self._stopped:
+                    self._lock.wait()
+                if not self.running:
+                    return  # (closed while idle, by `close()`)
+            try:
+                self._context.run(self._collect)
+            finally:
+                with self._lock:
+                    self.running = False
+                    stopped = self._stopped
+                    self._wake()
+            if stopped:
+                self._context.run(_close, self._iterator)
+                return
+            if self._finished:
+                return
+
+    def _collect(self):
+        size = 0
+        try:
+            while size < self.batch_size and not self._stopped:
+                chunk = next(self._iterator, _END)
+                self._put(chunk)
+                if chunk is _END:
+                    self._finished = True
+                    break
+                if chunk is FLUSH:
+                    break
+                size += len(chunk)
+        except BaseException as e:
+            self._finished = True
+            self._put(_Raised(e))
+
+    def _put(self, chunk):
+        with self._lock:
+            if not self._chunks:
+                self._wake()
+            self._chunks.append(chunk)
+
+    def _wake(self):
+        """ (with lock) the waiting side has something to take """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+        else:
+            self._lock.notify_all()  # (the producer thread waits on it too)
+
+
+def _close(iterator):
+    if hasattr(iterator, "close"):
+        iterator.close()
+
+
+def iterate_in_thread(
+    body, flush_interval: float, writer: Optional[ChunkedWriter] = None
+) -> Iterator:
+    """
+    iterate over the body of a chunked response in a (worker) thread.
+    `FLUSH` is yielded whenever the producer doesn't produce a chunk in
+    time: within `flush_interval` for an async iterable (driven by a
+    private event-loop), before pending chunks of `writer` are due for a
+    sync one (advanced on a thread of its own while chunks are pending)
+    """
+    if not is_async_iterable(body):
+        yield from _iterate_sync(body, writer)
+        return
+
+    loop = asyncio.new_event_loop()
+    iterator = body.__aiter__()
+    step = None
+    try:
+        while True:
+            if step is None:
+                step = asyncio.ensure_future(iterator.__anext__(), loop=loop)
+            done, _ = loop.run_until_complete(
+                asyncio.wait({step}, timeout=flush_interval)
+            )
+            if not done:  # (producer is idle -> send what is pending)
+                yield FLUSH
+                continue
+            try:
+                chunk = step.result()
+            except StopAsyncIteration:
+                break
+            step = None
+            yield chunk
+    finally:
+        if step is not None and not step.done():
+            step.cancel()
+            loop.run_until_complete(
+                asyncio.gather(step, return_exceptions=True)
+            )
+        if hasattr(iterator, "aclose"):
+            loop.run_until_complete(iterator.aclose())
+        loop.close()
+
+
+def _iterate_sync(body, writer: Optional[ChunkedWriter]) -> Iterator:
+    if writer is None:  # (nothing is coalesced -> nothing to flush)
+        yield from body
+        return
+    producer = SyncProducer(body, writer.coalesce_size)
+    try:
+        while True:
+            timeout = writer.flush_timeout()
+            if not producer.running:
+                if timeout is None:  # (nothing pending -> in place)
+                    chunk = producer.next()
+                    if chunk is _END:
+                        return
+                    yield chunk
+                    continue
+                producer.start_batch()
+            chunks = producer.take(timeout)
+            if not chunks:
+                if producer.running:  # (idle -> send what is pending)
+                    yield FLUSH
+                continue
+            for chunk in chunks:
+                if chunk is _END:
+                    return
+                if isinstance(chunk, _Raised):
+                    raise chunk.error
+                yield chunk
+    finally:
+        producer.close()
+
+
+async def iterate_on_loop(body, writer: ChunkedWriter) -> AsyncIterator:
+    """
+    iterate over the body of a chunked response on the running loop (the
+    asyncio engine). `FLUSH` is yielded whenever the producer doesn't
+    produce a chunk before pending chunks of `writer` are due. a sync
+    producer is a <SyncProducer>, always advanced by batches on its
+    thread (it may block between chunks, the loop never waits for it).
+    (closed by `aclose()`)
+    """
+    if not is_async_iterable(body):
+        producer = SyncProducer(
+            body, writer.coalesce_size, asyncio.get_running_loop()
+        )
+        try:
+            while True:
+                if not producer.running:
+                    producer.start_batch()
+                chunks = await producer.take_async(writer.flush_timeout())
+                if not chunks:
+                    if producer.running:  # (idle -> send what is pending)
+                        yield FLUSH
+                    continue
+                for chunk in chunks:
+                    if chunk is _END:
+                        return
+                    if isinstance(chunk, _Raised):
+                        raise chunk.error
+                    yield chunk
+        finally:
+            producer.close()
+        return
+
+    iterator = body.__aiter__()
+    step = None
+    try:
+        while True:
+            if step is None:
+                step = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait(
+                {step}, timeout=writer.flush_timeout()
+            )
+            if not done:  # (producer is idle -> send what is pending)
+                yield FLUSH
+                continue
+            try:
+                chunk = step.result()
+            except StopAsyncIteration:
+                break
+            step = None
+            yield chunk
+    finally:
+        if step is not None and not step.done():
+            step.cancel()
+            await asyncio.gather(step, return_exceptions=True)
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
@@ -1,11 +1,266 @@
+""" Logging (kept off the request hot path):
+- loggers only append records to a bounded buffer (`QueueHandler` over a
+  `deque`: no lock, no I/O and no formatting on the caller's thread; when
+  the buffer is full the oldest records are dropped, and counted).
+  a background writer thread wakes up every `LOG_FLUSH_INTERVAL` seconds,
+  formats what is buffered and writes it in batches (one `write()` +
+  `flush()` per up to `LOG_BATCH_SIZE` lines)
+- message classes have their own loggers, level & sampling rate:
+  - `access_log`:        one access-line per response (compact or JSON).
+                         its entries are plain tuples, not `LogRecord`s
+  - `connection_logger`: connection lifecycle (accepted / handling / closed)
+  - `logger`:            everything else
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import random
 import logging
+import threading
+from collections import deque
+from logging.handlers import QueueHandler
+from typing import Optional, TextIO
+
 from app.config import settings
 
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="[%(levelname)s] %(asctime)s | %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
+DEFAULT_FORMAT = "[%(levelname)s] %(asctime)s | %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+_ACCESS_FIELDS = (
+    "time", "remote", "method", "path", "version", "status", "bytes",
+    "duration_ms",
 )
 
-logger = logging.getLogger(settings.PROJECT_NAME)
+
+class AccessFormatter:
+    """ formats access entries (tuples of `_ACCESS_FIELDS`) as a compact
+    fixed-format line, or as one JSON object per line """
+
+    def __init__(self, json_lines: bool = False):
+        self.json_lines: bool = json_lines
+        self._second: int = -1
+        self._date: str = ""
+
+    def format(self, entry: tuple) -> str:
+        if self.json_lines:
+            line = dict(zip(_ACCESS_FIELDS, entry))
+            line["time"] = round(line["time"], 3)
+            line["duration_ms"] = round(line["duration_ms"], 3)
+            return json.dumps(line, separators=(",", ":"))
+        created, remote, method, path, version, status, size, ms = entry
+        second = int(created)
+        if second != self._second:  # (date is formatted once per second)
+            self._second = second
+            self._date = time.strftime(DATE_FORMAT, time.localtime(second))
+        return (
+            f'{self._date} {remote} "{method} {path} {version}" '
+            f"{status} {size} {ms:.3f}ms"
+        )
+
+
+class BufferQueueHandler(QueueHandler):
+    """ `QueueHandler` over a bounded `deque`. records are not formatted on
+    the caller's thread (messages are built by the writer thread) """
+
+    def __init__(self, maxsize: int):
+        super().__init__(deque(maxlen=maxsize))
+        self.dropped: int = 0
+
+    def emit(self, record: logging.LogRecord):
+        self.put(record)
+
+    def put(self, item):
+        """ add a log record or an access entry (drop the oldest if full) """
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(item)  # (atomic, thread-safe)
+
+    def reset(self):
+        """ (in a forked child) drop records which the parent will write """
+        self.queue = deque(maxlen=self.queue.maxlen)
+        self.dropped = 0
+
+
+class BatchWriter:
+    """ background thread: formats buffered records / access entries and
+    writes them to `stream` in batches """
+
+    def __init__(
+        self,
+        handler: BufferQueueHandler,
+        stream: TextIO,
+        batch_size: int,
+        flush_interval: float,
+        access_formatter: AccessFormatter
+    ):
+        self._handler: BufferQueueHandler = handler
+        self._stream: TextIO = stream
+        self._batch_size: int = batch_size
+        self._flush_interval: float = flush_interval
+        self._access_formatter: AccessFormatter = access_formatter
+        self._formatter = logging.Formatter(DEFAULT_FORMAT, DATE_FORMAT)
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        """ write what is buffered, then stop the thread """
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self._flush_interval):
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        buffer = self._handler.queue
+        while buffer:
+            lines = []
+            while buffer and len(lines) < self._batch_size:
+                lines.append(self._format(buffer.popleft()))
+            if self._handler.dropped:
+                dropped, self._handler.dropped = self._handler.dropped, 0
+                lines.append(f"[!] {dropped} log records dropped (full)")
+            try:
+                self._stream.write("\n".join(lines) + "\n")
+                self._stream.flush()
+            except (OSError, ValueError):
+                pass
+
+    def _format(self, item) -> str:
+        try:
+            if isinstance(item, tuple):
+                return self._access_formatter.format(item)
+            return self._formatter.format(item)
+        except Exception:  # (a broken record mustn't kill the writer)
+            return f"[!] unformattable log record: {item!r}"
+
+
+class SamplingFilter(logging.Filter):
+    """ passes each record with probability `rate` """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate: float = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class AccessLog:
+    """ one line per response. level & sampling are checked first, then
+    only a tuple is buffered (no `LogRecord`, no formatting) """
+
+    def __init__(
+        self,
+        access_logger: logging.Logger,
+        handler: BufferQueueHandler,
+        sample_rate: float
+    ):
+        self.logger: logging.Logger = access_logger
+        self.sample_rate: float = sample_rate
+        self._handler: BufferQueueHandler = handler
+
+    def log(self, address, request, response, duration: float):
+        """ access-line of request -> response (sent in duration secs) """
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        self._handler.put((
+            time.time(),
+            address[0] if address else "-",
+            request.method,
+            request.path,
+            request.version,
+            response.status_code,
+            "-" if response.chunked else response.content_length(),
+            duration * 1000,
+        ))
+
+
+def _find_no_caller(stack_info: bool = False, stacklevel: int = 1):
+    return "(unknown file)", 0, "(unknown function)", None
+
+
+def _server_logger(name: str) -> logging.Logger:
+    """ a logger of the server itself. its records are formatted without
+    the caller's file / line / function -> the caller's frame isn't looked
+    up for them (other loggers, e.g. of a WSGI application, keep it) """
+    server_logger = logging.getLogger(name)
+    server_logger.findCaller = _find_no_caller
+    return server_logger
+
+
+def _level(name: Optional[str], default: str) -> int:
+    return logging.getLevelName((name or default).upper())
+
+
+def _configure() -> tuple[BufferQueueHandler, BatchWriter]:
+    dev_mode = settings.DEVELOPMENT_MODE
+    handler = BufferQueueHandler(settings.LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(_level(settings.LOG_LEVEL, "DEBUG" if dev_mode else "INFO"))
+
+    connection = logging.getLogger(f"{settings.PROJECT_NAME}.connection")
+    connection.setLevel(_level(
+        settings.CONNECTION_LOG_LEVEL, "INFO" if dev_mode else "WARNING"
+    ))
+    if settings.CONNECTION_LOG_SAMPLE_RATE < 1.0:
+        connection.addFilter(
+            SamplingFilter(settings.CONNECTION_LOG_SAMPLE_RATE)
+        )
+
+    access = logging.getLogger(f"{settings.PROJECT_NAME}.access")
+    access.setLevel(
+        logging.INFO if settings.ACCESS_LOG_ENABLED else logging.CRITICAL
+    )
+
+    writer = BatchWriter(
+        handler,
+        sys.stderr,
+        settings.LOG_BATCH_SIZE,
+        settings.LOG_FLUSH_INTERVAL,
+        AccessFormatter(json_lines=settings.ACCESS_LOG_FORMAT == "json"),
+    )
+    writer.start()
+    return handler, writer
+
+
+def _restart_in_child():
+    """ (threads don't survive `fork()` -> start the writer again) """
+    _buffer_handler.reset()
+    _writer.start()
+
+
+def shutdown_logging():
+    """ write buffered records (e.g. before `os._exit()`) """
+    _writer.stop()
+
+
+_buffer_handler, _writer = _configure()
+atexit.register(shutdown_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_in_child)
+
+logger = _server_logger(settings.PROJECT_NAME)
+connection_logger = _server_logger(f"{settings.PROJECT_NAME}.connection")
+access_log = AccessLog(
+    _server_logger(f"{settings.PROJECT_NAME}.access"),
+    _buffer_handler,
+    settings.ACCESS_LOG_SAMPLE_RATE,
+)
@@ -0,0 +1,309 @@
+""" Low-overhead server metrics, exposed in Prometheus text format:
+- <Counter>, <Gauge>, <Histogram> are updated without any lock: every
+  thread writes only its own shard (a plain dict, created on the first
+  update of that thread), and shards are merged when metrics are scraped
+- <ServerMetrics> (`metrics`) holds the instruments of the server:
+  latency of each phase of a request (measured by the monotonic
+  `time.perf_counter()`), connections & requests counters, and gauges of
+  active / queued connections. it's served at `METRICS_PATH` (if set) by
+  the server itself (see `app/handler.py`)
+(with pre-fork workers, every worker process has its own metrics)
+
+phases:
+- queue:     connection waited for a free worker-thread (threaded engine)
+- read:      request-head reception, from its first byte (threaded engine)
+- parse:     parsing request-head (`HTTPParser`)
+- body:      receiving request body before the handler (asyncio engine,
+             the threaded engine reads it lazily, inside `handler`)
+- handshake: TLS handshake (threaded engine, see `app/tls.py`)
+- handler:   admission + `RequestHandler` (+ response cache)
+- send:      sending the response
+"""
+
+import threading
+from bisect import bisect_left
+from typing import Callable, Optional
+
+from app.config import settings
+
+
+# upper bounds (seconds) of latency histogram buckets (+Inf is implicit)
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Metric:
+    """ base of sharded metrics: one shard (dict: labels -> value) per
+    thread. only the owning thread writes a shard -> no lock on updates
+    (the lock only guards registration of a new shard) """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name: str = name
+        self.help: str = help
+        self.labelnames: tuple[str, ...] = labelnames
+        self._local = threading.local()
+        self._shards: list[dict] = []
+        self._lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def _snapshots(self) -> list[dict]:
+        """ copies of all shards (`dict(shard)` is atomic under the GIL) """
+        with self._lock:
+            shards = list(self._shards)
+        return [dict(shard) for shard in shards]
+
+    def _labels(self, values: tuple, extra: str = "") -> str:
+        pairs = [
+            f'{name}="{_escape(str(value))}"'
+            for name, value in zip(self.labelnames, values)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(_Metric):
+
+    kind = "counter"
+
+    def inc(self, value: float = 1, labels: tuple = ()):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + value
+
+    def values(self) -> dict[tuple, float]:
+        merged: dict[tuple, float] = {}
+        for shard in self._snapshots():
+            for labels, value in shard.items():
+                merged[labels] = merged.get(labels, 0) + value
+        return merged
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for labels, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{self._labels(labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """ sum of per-thread increments/decrements, or the value of `fn`
+    (called at scrape time, e.g. for a queue size) """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple = (),
+        fn: Optional[Callable[[], float]] = None
+    ):
+        super().__init__(name, help, labelnames)
+        self.fn: Optional[Callable[[], float]] = fn
+
+    def dec(self, value: float = 1, labels: tuple = ()):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) - value
+
+    def values(self) -> dict[tuple, float]:
+        if self.fn is not None:
+            return {(): self.fn()}
+        return super().values()
+
+
+class Histogram(_Metric):
+    """ shard values are [count of bucket 0, ..., count of +Inf, sum] """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets: tuple[float, ...] = buckets
+
+    def observe(self, value: float, labels: tuple = ()):
+        try:  # (inlined `self._shard()`, it's on the hot path)
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        data = shard.get(labels)
+        if data is None:
+            data = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    def values(self) -> dict[tuple, list]:
+        merged: dict[tuple, list] = {}
+        for shard in self._snapshots():
+            for labels, data in shard.items():
+                data = list(data)
+                total = merged.get(labels)
+                if total is None:
+                    merged[labels] = data
+                else:
+                    merged[labels] = [a + b for a, b in zip(total, data)]
+        return merged
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        bounds = [f"{b:g}" for b in self.buckets] + ["+Inf"]
+        for labels, data in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, data):
+                cumulative += count
+                le = self._labels(labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {data[-1]}")
+            lines.append(
+                f"{self.name}_count{self._labels(labels)} {cumulative}"
+            )
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames=(), fn=None) -> Gauge:
+        return self._register(Gauge(name, help, labelnames, fn))
+
+    def histogram(
+        self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> bytes:
+        """ all metrics in Prometheus text exposition format (0.0.4) """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.append("")
+        return "\n".join(lines).encode("utf-8")
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+class ServerMetrics:
+    """ instruments of the server. if disabled, updates are no-ops (but
+    metrics can still be rendered) """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled: bool = enabled
+        self.registry = MetricsRegistry()
+        self.phase_seconds = self.registry.histogram(
+            "http_phase_duration_seconds",
+            "Latency of each phase of request handling",
+            ("phase",),
+        )
+        self._observe_phase = self.phase_seconds.observe
+        self.requests = self.registry.counter(
+            "http_requests_total", "Responses sent, by status code", ("code",)
+        )
+        self.connections = self.registry.counter(
+            "http_connections_total", "Accepted connections"
+        )
+        self.keepalive_reuses = self.registry.counter(
+            "http_keepalive_reuses_total",
+            "Requests served on an already used (keep-alive) connection",
+        )
+        self.active_connections = self.registry.gauge(
+            "http_active_connections", "Connections being handled"
+        )
+        self.queued_connections = self.registry.gauge(
+            "http_queued_connections",
+            "Accepted connections waiting for a worker-thread",
+        )
+        self.shed_connections = self.registry.counter(
+            "http_shed_connections_total",
+            "Connections answered with 503 by admission control, by reason",
+            ("reason",),
+        )
+        self.tls_handshakes = self.registry.counter(
+            "tls_handshakes_total",
+            "Completed TLS handshakes, full or resumed (session reused)",
+            ("kind",),
+        )
+
+    def observe_phase(self, phase: str, seconds: float):
+        if self.enabled:
+            self._observe_phase(seconds, (phase,))
+
+    def request_done(self, status_code: int, reused: bool):
+        if self.enabled:
+            self.requests.inc(1, (status_code,))
+            if reused:
+                self.keepalive_reuses.inc()
+
+    def connection_opened(self, queued: bool = False):
+        if self.enabled:
+            self.connections.inc()
+            if queued:
+                self.queued_connections.inc()
+            else:
+                self.active_connections.inc()
+
+    def connection_started(self):
+        """ (a queued connection is picked by a worker-thread) """
+        if self.enabled:
+            self.queued_connections.dec()
+            self.active_connections.inc()
+
+    def connection_closed(self):
+        if self.enabled:
+            self.active_connections.dec()
+
+    def connection_shed(self, reason: str, queued: bool = False):
+        """ (a connection is rejected by admission control) """
+        if self.enabled:
+            self.shed_connections.inc(1, (reason,))
+            if queued:
+                self.queued_connections.dec()
+
+    def tls_handshake(self, resumed: bool, seconds: Optional[float] = None):
+        if self.enabled:
+            self.tls_handshakes.inc(1, ("resumed" if resumed else "full",))
+            if seconds is not None:
+                self._observe_phase(seconds, ("handshake",))
+
+    def render(self) -> bytes:
+        return self.registry.render()
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+    )
+
+
+# metrics of this (worker) process
+metrics = ServerMetrics(settings.METRICS_ENABLED)
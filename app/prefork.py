@@ -0,0 +1,164 @@
+from typing import Optional, Callable
+import os
+import ssl
+import time
+import socket
+import signal
+
+from app.config import settings
+from app.logging import logger, shutdown_logging
+from app.tls import create_server_context
+
+
+class PreforkMaster:
+    """
+    Master process of the pre-fork (multi-process) mode.
+    It forks N worker processes, each one runs a whole server (any engine)
+    -> parsing/response-building is spread across cores (not limited by GIL).
+    The master doesn't serve any request, it only:
+    - prepares one shared listener (if `SO_REUSEPORT` is not used)
+    - creates the TLS context (if configured): workers share its session
+      ticket keys -> a client resumes its TLS session on any worker
+    - supervises workers and re-forks crashed ones
+    - on SIGINT/SIGTERM, forwards SIGTERM to workers and waits for them
+    """
+
+    # re-forking a worker which dies faster than this is throttled
+    MIN_WORKER_LIFETIME: float = 1.0
+
+    def __init__(
+        self,
+        server_factory: Callable[..., object],
+        workers: Optional[int] = None,
+        reuse_port: bool = True
+    ):
+        # `server_factory(sock=..., reuse_port=..., tls_context=...)` ->
+        # server with `.start()`
+        self._server_factory = server_factory
+        self._num_workers: int = workers or os.cpu_count() or 1
+        self._reuse_port: bool = reuse_port and hasattr(
+            socket, "SO_REUSEPORT"
+        )
+        self._sock: Optional[socket.socket] = None
+        self._tls: Optional[ssl.SSLContext] = None
+        self._workers: dict[int, float] = {}  # pid -> start time
+        self._running: bool = False
+
+    def start(self):
+        if not hasattr(os, "fork"):  # (e.g. on Windows)
+            logger.warning("os.fork() is not available, running 1 process")
+            self._server_factory().start()
+            return
+
+        if not self._reuse_port:  # all workers accept on this listener
+            self._sock = self._create_shared_listener()
+        self._tls = create_server_context()
+
+        logger.info(
+            "Pre-fork master (pid=%d) starts %d workers (%s)",
+            os.getpid(),
+            self._num_workers,
+            "SO_REUSEPORT" if self._reuse_port else "shared listener"
+        )
+        self._running = True
+        signal.signal(signal.SIGINT, self._on_shutdown_signal)
+        signal.signal(signal.SIGTERM, self._on_shutdown_signal)
+
+        for _ in range(self._num_workers):
+            self._spawn_worker()
+        try:
+            self._supervise()
+        finally:
+            self._shutdown()
+
+    def _spawn_worker(self):
+        pid = os.fork()
+        if pid == 0:  # in worker process
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            exit_code = 0
+            try:
+                server = self._server_factory(
+                    sock=self._sock, reuse_port=self._reuse_port,
+                    tls_context=self._tls,
+                )
+                server.start()
+            except BaseException as e:
+                logger.exception("Worker (pid=%d) crashed: %s", os.getpid(), e)
+                exit_code = 1
+            finally:
+                shutdown_logging()  # (write queued records)
+                os._exit(exit_code)  # never return into master's code
+
+        self._workers[pid] = time.monotonic()
+        logger.info("Worker (pid=%d) started", pid)
+
+    def _supervise(self):
+        """ wait for worker exits and re-fork them while running """
+        while self._running:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except InterruptedError:
+                continue
+            except ChildProcessError:  # no more workers
+                break
+            started_at = self._workers.pop(pid, None)
+            if started_at is None or not self._running:
+                continue
+
+            logger.warning(
+                "Worker (pid=%d) exited unexpectedly (code=%d), re-forking",
+                pid, os.waitstatus_to_exitcode(status)
+            )
+            if time.monotonic() - started_at < self.MIN_WORKER_LIFETIME:
+                time.sleep(self.MIN_WORKER_LIFETIME)  # avoid fork-loops
+            if self._running:
+                self._spawn_worker()
+
+    def _on_shutdown_signal(self, signum, frame):
+        if self._running:
+            print("\nShutting down workers...")
+        self._running = False
+        for pid in list(self._workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self._workers.pop(pid, None)
+
+    def _shutdown(self, timeout: float = 10.0):
+        """ wait for all workers (kill the ones which don't exit in time) """
+        self._running = False
+        deadline = time.monotonic() + timeout
+        while self._workers and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._workers.clear()
+                break
+            if pid == 0:
+                time.sleep(0.05)
+                continue
+            self._workers.pop(pid, None)
+
+        for pid in list(self._workers):
+            logger.warning("Worker (pid=%d) didn't exit in time, killing", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self._workers.clear()
+
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        logger.info("Pre-fork master shut down!")
+
+    @staticmethod
+    def _create_shared_listener() -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if settings.DEVELOPMENT_MODE:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((settings.SOCKET_HOST, settings.SOCKET_PORT))
+        sock.listen(settings.SOCKET_BACKLOG_CONNECTIONS)
+        return sock
@@ -0,0 +1,118 @@
+""" Per-client rate limiting (token buckets):
+- every client IP has a bucket of `burst` tokens, refilled at `rate`
+  tokens/second. a request takes one token, or is rejected with a
+  pre-serialized `429` + `Retry-After` (the handler is never called)
+- routes can have their own limit (`router.route(..., rate_limit=(rate,
+  burst))`), kept in a separate bucket per (IP, route)
+- buckets live in a fixed-size table split into lock-striped shards (a
+  bucket is found by the hash of its key -> threads mostly lock different
+  stripes). each stripe is an LRU: when it's full, its least recently used
+  bucket is evicted -> memory stays bounded with millions of distinct IPs
+  (an evicted client just starts again with a full bucket)
+"""
+
+import time
+from math import ceil
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from app.http.request import HTTPRequest
+from app.http.response import HTTPResponse, PreSerializedResponse
+from app.http.status import STATUS_MESSAGES
+
+
+MAX_RETRY_AFTER = 3600  # (seconds) upper bound of `Retry-After`
+
+
+class TokenBucketTable:
+
+    def __init__(self, size: int, stripes: int = 64):
+        self._stripes_count: int = stripes
+        self._stripe_size: int = max(1, size // stripes)
+        self._stripes: list[OrderedDict] = [
+            OrderedDict() for _ in range(stripes)
+        ]
+        self._locks: list[Lock] = [Lock() for _ in range(stripes)]
+
+    def __len__(self) -> int:
+        return sum(len(stripe) for stripe in self._stripes)
+
+    def take(self, key, rate: float, burst: int, now: float) -> float:
+        """ take a token from the bucket of key. returns 0.0 on success,
+        otherwise the time (in seconds) until a token is available """
+        index = hash(key) % self._stripes_count
+        stripe = self._stripes[index]
+        with self._locks[index]:
+            bucket = stripe.get(key)
+            if bucket is None:  # new bucket (full)
+                if len(stripe) >= self._stripe_size:
+                    stripe.popitem(last=False)  # (evict LRU bucket)
+                stripe[key] = [burst - 1.0, now]
+                return 0.0
+            stripe.move_to_end(key)
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1.0:
+                bucket[0] = tokens - 1.0
+                return 0.0
+            bucket[0] = tokens
+            return (1.0 - tokens) / rate
+
+    def refund(self, key, burst: int):
+        """ give back a token taken by `take()` (e.g. when the request is
+        rejected by another bucket) """
+        index = hash(key) % self._stripes_count
+        with self._locks[index]:
+            bucket = self._stripes[index].get(key)
+            if bucket is not None:
+                bucket[0] = min(burst, bucket[0] + 1.0)
+
+
+class RateLimiter:
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        table_size: int = 65536,
+        stripes: int = 64
+    ):
+        self.rate: float = rate
+        self.burst: int = burst
+        self._table = TokenBucketTable(table_size, stripes)
+        # Retry-After (seconds) -> pre-serialized 429
+        self._rejections: dict[int, PreSerializedResponse] = {}
+
+    def check(
+        self, client: str, request: HTTPRequest, route=None
+    ) -> Optional[HTTPResponse]:
+        """ None if the request is allowed, otherwise a (pre-serialized)
+        `429` response. `route` (a matched `Route`) may have its own limit
+        """
+        now = time.monotonic()
+        wait = self._table.take(client, self.rate, self.burst, now)
+        if not wait and route is not None and route.rate_limit is not None:
+            rate, burst = route.rate_limit
+            wait = self._table.take((client, route), rate, burst, now)
+            if wait:  # (rejected by the route -> IP's token isn't used)
+                self._table.refund(client, self.burst)
+        if not wait:
+            return None
+        return self._rejection(wait).response(
+            request.method.upper() == "HEAD"
+        )
+
+    def _rejection(self, wait: float) -> PreSerializedResponse:
+        retry_after = min(max(1, ceil(wait)), MAX_RETRY_AFTER)
+        rejection = self._rejections.get(retry_after)
+        if rejection is None:
+            rejection = self._rejections[retry_after] = PreSerializedResponse(
+                HTTPResponse(
+                    status_code=429,
+                    headers={"retry-after": str(retry_after)},
+                    body=STATUS_MESSAGES[429].encode(),
+                    mem_type="text/plain",
+                )
+            )
+        return rejection
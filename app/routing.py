@@ -0,0 +1,330 @@
+""" Routing subsystem:
+- routes are registered by method(s) + path pattern, e.g.
+      router.add("GET", "/users/{user_id:int}/posts/{slug}", handler)
+      router.add("GET", "/files/{rest:path}", handler)    # wildcard
+      router.add("GET", "/assets/*", handler)             # (unnamed)
+  converters: `str` (default, one segment), `int`, `float`, `path`
+  (the rest of the path, must be the last segment)
+- patterns are compiled into a prefix (radix) tree over path segments:
+
+      (root) ─ users ─ {user_id:int} ─ posts ─ {slug:str}  -> {GET: ...}
+             └ files ─ {rest:path}                         -> {GET: ...}
+
+  a lookup walks the tree once per segment (static children by a dict
+  lookup, then typed params, then wildcard), so its cost depends on the
+  path length, not on the number of routes
+- a path which matches only routes of other methods -> 405 + `Allow`
+- a route can have a pre-body admission hook (`admit`) and a body size
+  limit (`max_body_size`): they're checked by `Router.admit()` as soon as
+  the request-head is parsed, before the body is received (e.g. to reject
+  an `Expect: 100-continue` upload without it crossing the network)
+- a route can have its own rate limit (`rate_limit=(rate, burst)`, per
+  client IP, see `app/ratelimit.py`), checked before its admission hook
+- recent (path -> matched node + params) resolutions are kept in an LRU
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Optional
+
+from app.http.request import HTTPRequest
+from app.http.response import HTTPResponse
+from app.http.status import STATUS_MESSAGES
+
+
+RouteHandler = Callable[..., HTTPResponse]  # handler(request, **params)
+# admit(request, **params) -> None (accepted) or a (4xx) HTTPResponse
+AdmissionHook = Callable[..., Optional[HTTPResponse]]
+
+
+def _to_int(segment: str):
+    # (`isdigit()` alone accepts non-ASCII digits, e.g. "²")
+    return int(segment) if segment.isascii() and segment.isdigit() else None
+
+
+def _to_float(segment: str):
+    try:
+        return float(segment)
+    except ValueError:
+        return None
+
+
+def _to_str(segment: str):
+    return segment or None
+
+
+# converter name -> (priority, segment -> value or None if it doesn't match)
+# (more specific converters are tried first)
+CONVERTERS: dict[str, tuple[int, Callable[[str], object]]] = {
+    "int": (0, _to_int),
+    "float": (1, _to_float),
+    "str": (2, _to_str),
+}
+
+
+class Route:
+    __slots__ = ("handler", "admit", "max_body_size", "rate_limit")
+
+    def __init__(
+        self,
+        handler: RouteHandler,
+        admit: Optional[AdmissionHook] = None,
+        max_body_size: Optional[int] = None,
+        rate_limit: Optional[tuple[float, int]] = None
+    ):
+        self.handler: RouteHandler = handler
+        self.admit: Optional[AdmissionHook] = admit
+        self.max_body_size: Optional[int] = max_body_size
+        # (tokens per second, burst) per client IP
+        self.rate_limit: Optional[tuple[float, int]] = rate_limit
+
+
+class RouteMatch:
+    """ result of `Router.resolve()`:
+    - route is set            -> matched (call handler(request, **params))
+    - route is None & allowed -> path exists for other methods (405)
+    - otherwise               -> no route (404) """
+
+    __slots__ = ("route", "params", "allowed")
+
+    def __init__(
+        self,
+        route: Optional[Route] = None,
+        params: Optional[dict] = None,
+        allowed: tuple[str, ...] = ()
+    ):
+        self.route: Optional[Route] = route
+        self.params: dict = params or {}
+        self.allowed: tuple[str, ...] = allowed
+
+    @property
+    def handler(self) -> Optional[RouteHandler]:
+        return self.route.handler if self.route is not None else None
+
+
+class _Node:
+    __slots__ = ("static", "params", "wildcard", "wildcard_name", "routes")
+
+    def __init__(self):
+        self.static: dict[str, _Node] = {}
+        # (priority, name, converter-name, convert, child), sorted
+        self.params: list[tuple[int, str, str, Callable, _Node]] = []
+        self.wildcard: Optional[_Node] = None
+        self.wildcard_name: Optional[str] = None
+        self.routes: dict[str, Route] = {}  # method -> route
+
+
+class Router:
+
+    def __init__(self, cache_size: int = 1024):
+        self._root = _Node()
+        self._cache: OrderedDict[str, tuple[_Node, dict]] = OrderedDict()
+        self._cache_size: int = cache_size
+        self._lock = Lock()
+
+    def add(
+        self,
+        methods,
+        pattern: str,
+        handler: RouteHandler,
+        admit: Optional[AdmissionHook] = None,
+        max_body_size: Optional[int] = None,
+        rate_limit: Optional[tuple[float, int]] = None
+    ):
+        """ register `handler` for method(s) (str or iterable) & pattern.
+        `admit` & `max_body_size` are checked before the body is received,
+        `rate_limit` (rate, burst) too (if rate limiting is enabled).
+        raise ValueError for invalid patterns / duplicated routes """
+        if rate_limit is not None and not (
+            rate_limit[0] > 0 and rate_limit[1] >= 1
+        ):
+            raise ValueError(f"invalid rate limit {rate_limit!r}")
+        if isinstance(methods, str):
+            methods = (methods,)
+        node = self._root
+        segments = pattern.lstrip("/").split("/")
+        for i, segment in enumerate(segments):
+            if segment == "*" or segment.endswith(":path}"):
+                if i != len(segments) - 1:
+                    raise ValueError(
+                        f"wildcard must be the last segment: {pattern!r}"
+                    )
+                name = "*" if segment == "*" else segment[1:-6]
+                if node.wildcard is None:
+                    node.wildcard = _Node()
+                    node.wildcard_name = name
+                elif node.wildcard_name != name:
+                    raise ValueError(f"conflicting wildcard in {pattern!r}")
+                node = node.wildcard
+            elif segment.startswith("{") and segment.endswith("}"):
+                node = self._param_child(node, segment[1:-1], pattern)
+            else:
+                node = node.static.setdefault(segment, _Node())
+
+        # (one route for all its methods -> e.g. they share a rate limit)
+        route = Route(handler, admit, max_body_size, rate_limit)
+        for method in methods:
+            method = method.upper()
+            if method in node.routes:
+                raise ValueError(f"route {method} {pattern!r} already exists")
+            node.routes[method] = route
+        with self._lock:
+            self._cache.clear()
+
+    def route(
+        self,
+        pattern: str,
+        methods=("GET",),
+        admit: Optional[AdmissionHook] = None,
+        max_body_size: Optional[int] = None,
+        rate_limit: Optional[tuple[float, int]] = None
+    ):
+        """ decorator version of `add()` """
+        def decorator(handler: RouteHandler) -> RouteHandler:
+            self.add(
+                methods, pattern, handler, admit, max_body_size, rate_limit
+            )
+            return handler
+        return decorator
+
+    def resolve(self, method: str, path: str) -> RouteMatch:
+        """ find the route of (method, path). HEAD falls back to GET """
+        path = path.split("?", 1)[0]
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None:
+                self._cache.move_to_end(path)
+        if cached is None:
+            cached = self._lookup(path)
+            with self._lock:
+                self._cache[path] = cached
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+
+        node, params = cached
+        if node is None:
+            return RouteMatch()
+        method = method.upper()
+        route = node.routes.get(method)
+        if route is None and method == "HEAD":
+            route = node.routes.get("GET")
+        if route is not None:
+            return RouteMatch(route, params)
+        return RouteMatch(allowed=self._allowed_methods(node))
+
+    def admit(
+        self, request: HTTPRequest, content_length: Optional[int]
+    ) -> Optional[HTTPResponse]:
+        """
+        pre-body admission (request-head only, body isn't received yet):
+        returns a rejection response (405 / 413 / from route's `admit`
+        hook), or None if the request is accepted (or matches no route)
+        """
+        match = self.resolve(request.method, request.path)
+        if match.route is None:
+            if match.allowed:
+                return self._method_not_allowed(match.allowed)
+            return None
+        route = match.route
+        if (
+            route.max_body_size is not None
+            and content_length is not None
+            and content_length > route.max_body_size
+        ):
+            return HTTPResponse(
+                status_code=413,
+                body=STATUS_MESSAGES[413].encode(),
+                mem_type="text/plain",
+            )
+        if route.admit is not None:
+            return route.admit(request, **match.params)
+        return None
+
+    def dispatch(self, request: HTTPRequest) -> Optional[HTTPResponse]:
+        """ call the matched handler, or build a 405 response.
+        returns None if no route matches the path """
+        match = self.resolve(request.method, request.path)
+        if match.handler is not None:
+            response = match.handler(request, **match.params)
+            if request.method.upper() == "HEAD":
+                response.is_for_head_method = True
+            return response
+        if match.allowed:
+            return self._method_not_allowed(match.allowed)
+        return None
+
+    def _lookup(self, path: str) -> tuple[Optional[_Node], dict]:
+        segments = path.lstrip("/").split("/")
+        params = {}
+        node = self._match(self._root, segments, 0, params)
+        return node, params
+
+    def _match(
+        self, node: _Node, segments: list[str], i: int, params: dict
+    ) -> Optional[_Node]:
+        """ depth-first walk (static > typed params > wildcard), with
+        backtracking when a more specific branch leads to no route """
+        if i == len(segments):
+            if node.routes:
+                return node
+            # (a wildcard also matches an empty rest)
+            if node.wildcard is not None and node.wildcard.routes:
+                if node.wildcard_name != "*":
+                    params[node.wildcard_name] = ""
+                return node.wildcard
+            return None
+
+        segment = segments[i]
+        child = node.static.get(segment)
+        if child is not None:
+            found = self._match(child, segments, i + 1, params)
+            if found is not None:
+                return found
+        for _, name, _, convert, child in node.params:
+            value = convert(segment)
+            if value is None:
+                continue
+            found = self._match(child, segments, i + 1, params)
+            if found is not None:
+                params[name] = value
+                return found
+        if node.wildcard is not None and node.wildcard.routes:
+            if node.wildcard_name != "*":
+                params[node.wildcard_name] = "/".join(segments[i:])
+            return node.wildcard
+        return None
+
+    @staticmethod
+    def _param_child(node: _Node, spec: str, pattern: str) -> _Node:
+        name, _, converter = spec.partition(":")
+        converter = converter or "str"
+        if not name.isidentifier() or converter not in CONVERTERS:
+            raise ValueError(f"invalid path parameter {spec!r} in {pattern!r}")
+        for _, p_name, p_converter, _, child in node.params:
+            if p_converter == converter:
+                if p_name != name:
+                    raise ValueError(
+                        f"conflicting parameter name {name!r} in {pattern!r}"
+                    )
+                return child
+        priority, convert = CONVERTERS[converter]
+        child = _Node()
+        node.params.append((priority, name, converter, convert, child))
+        node.params.sort(key=lambda p: p[0])
+        return child
+
+    @staticmethod
+    def _method_not_allowed(allowed: tuple[str, ...]) -> HTTPResponse:
+        return HTTPResponse(
+            status_code=405,
+            headers={"allow": ", ".join(allowed)},
+            body=STATUS_MESSAGES[405].encode(),
+            mem_type="text/plain",
+        )
+
+    @staticmethod
+    def _allowed_methods(node: _Node) -> tuple[str, ...]:
+        methods = set(node.routes)
+        if "GET" in methods:
+            methods.add("HEAD")
+        return tuple(sorted(methods))
@@ -1,12 +1,17 @@
 from typing import Optional
+import ssl
+import time
 import socket
 import signal
-from threading import Semaphore
 from concurrent.futures import ThreadPoolExecutor, Future
 
 from app.config import settings
-from app.logging import logger
+from app.logging import logger, connection_logger
 from app.connection import ConnectionHandler
+from app.metrics import metrics
+from app.admission import AdmissionController
+from app.timers import TimerWheel, KeepAlivePolicy
+from app.tls import create_server_context, handshake, close_socket
 
 
 class HTTPServer:
@@ -17,19 +22,53 @@ class HTTPServer:
     'ConnectionHandler', 'RequestHandler' and 'HTTPParser' classes!
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        sock: Optional[socket.socket] = None,
+        reuse_port: bool = False,
+        tls_context: Optional[ssl.SSLContext] = None
+    ):
         # Socket/Connection attributes:
         self.host: str = settings.SOCKET_HOST
         self.port: int = settings.SOCKET_PORT
         self.backlog: int = settings.SOCKET_BACKLOG_CONNECTIONS
         self.conn_timeout: float = settings.TCP_CONNECTION_TIMEOUT
-        self._sock: Optional[socket.socket] = None
+        self._sock: Optional[socket.socket] = sock  # (inherited listener)
+        self._reuse_port: bool = reuse_port
+        # TLS (inherited from pre-fork master, or by settings. None: TCP)
+        self._tls: Optional[ssl.SSLContext] = (
+            tls_context or create_server_context()
+        )
 
         # ThreadPool attributes:
         self._executor: Optional[ThreadPoolExecutor] = None
         self._max_workers: int = settings.THREADPOOL_MAX_WORKERS
+        # requests (streams) of HTTP/2 connections are handled on their own
+        # pool (a connection's worker-thread only reads its frames)
+        self._stream_executor: Optional[ThreadPoolExecutor] = None
         # self._futures: list[Future] = []
-        self._semaphore = Semaphore(settings.THREADPOOL_MAX_TASKS_SEMAPHORE)
+        # limits queued tasks: extra connections get `503` (load shedding)
+        self._admission = AdmissionController(
+            settings.THREADPOOL_MAX_TASKS_SEMAPHORE,
+            settings.ADMISSION_RETRY_AFTER,
+            settings.ADMISSION_CODEL_ENABLED,
+            settings.ADMISSION_QUEUE_TARGET,
+            settings.ADMISSION_QUEUE_INTERVAL,
+        )
+
+        # deadlines of connections & keep-alive limits (adapted to the
+        # share of busy worker-threads)
+        self._timers = TimerWheel(
+            settings.TIMER_WHEEL_TICK, settings.TIMER_WHEEL_SLOTS
+        )
+        self._keepalive_policy = KeepAlivePolicy(
+            lambda: self._admission.tasks / self._max_workers,
+            settings.KEEPALIVE_TIMEOUT,
+            settings.KEEPALIVE_TIMEOUT_MIN,
+            settings.MAX_REQUESTS_PER_CONNECTION,
+            settings.MAX_REQUESTS_PER_CONNECTION_MIN,
+            settings.KEEPALIVE_LOW_WATERMARK,
+        )
 
         # general attributes:
         self._dev_mode: bool = settings.DEVELOPMENT_MODE
@@ -37,40 +76,51 @@ class HTTPServer:
 
     def start(self):
         logger.info(
-            "Server is running on http://%s:%d\n", self.host, self.port
+            "Server is running on %s://%s:%d\n",
+            "https" if self._tls else "http", self.host, self.port
         )
 
-        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        if self._dev_mode:  # Allow quick reuse for development
-            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self._sock.bind((self.host, self.port))
-        self._sock.listen(self.backlog)
+        if self._sock is None:
+            self._sock = self._create_listener()
         self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        if settings.HTTP2_ENABLED:
+            self._stream_executor = ThreadPoolExecutor(
+                max_workers=settings.HTTP2_STREAM_WORKERS
+            )
+        self._timers.start()
         self._running = True
 
-        # Allow CTRL+C to break immediately
+        # Allow CTRL+C (or SIGTERM from pre-fork master) to break immediately
         def _sigint(signum, frame):
             raise KeyboardInterrupt()
 
         signal.signal(signal.SIGINT, _sigint)
+        signal.signal(signal.SIGTERM, _sigint)
 
         try:
             logger.info("Waiting for a connection...")
             while True:
                 connection, address = self._sock.accept()
-                logger.info("[+] Accepted connection from '%s:%d'", *address)
+                connection_logger.info(
+                    "[+] Accepted connection from '%s:%d'", *address
+                )
 
-                # block here if semaphore is used (limits queued tasks)
-                self._semaphore.acquire()
+                # never block here: if the queue is full -> `503` & close
+                if not self._admission.try_admit():
+                    metrics.connection_shed("queue_full")
+                    self._admission.reject(connection, self._tls is None)
+                    continue
+                queued_at = time.perf_counter()
+                metrics.connection_opened(queued=True)
                 future = self._executor.submit(
-                    self._handle_connection, connection, address
+                    self._handle_connection, connection, address, queued_at
                 )
                 # self._futures.append(future)
 
                 def _done_callback(fut: Future):
                     """ done-callback function for future-objects
-                    to release semaphore and log exceptions """
-                    self._semaphore.release()
+                    to release admission-slot and log exceptions """
+                    self._admission.release()
                     exc = fut.exception()
                     if exc:
                         logger.exception(
@@ -86,25 +136,60 @@ class HTTPServer:
         finally:
             self._shutdown()
 
-    def _handle_connection(self, connection, address):
+    def _create_listener(self) -> socket.socket:
+        """ create, bind and listen the server socket """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self._dev_mode:  # Allow quick reuse for development
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self._reuse_port:  # (each pre-forked worker has its own listener)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(self.backlog)
+        return sock
+
+    def _handle_connection(self, connection, address, queued_at: float):
         """
         this method is used to handle each new-established connections in a
         new worker-thread. (connection-handling is done by `ConnectionHandler`)
         """
+        metrics.observe_phase("queue", time.perf_counter() - queued_at)
+        if not self._admission.dequeue(queued_at):  # (waited too long)
+            metrics.connection_shed("queue_delay", queued=True)
+            self._admission.reject(connection, self._tls is None)
+            connection_logger.info(
+                "[x] Shed connection: '%s:%d' (queue delay)", *address
+            )
+            return
+        metrics.connection_started()
         try:
+            if self._tls is not None:  # (here, not in the accept loop)
+                try:
+                    connection = handshake(
+                        self._tls, connection, settings.TLS_HANDSHAKE_TIMEOUT
+                    )
+                except (ssl.SSLError, OSError) as e:
+                    connection_logger.info(
+                        "[!] TLS handshake with '%s:%d' failed: %s",
+                        *address, e
+                    )
+                    return
             handler = ConnectionHandler(
-                connection, address, conn_timeout=self.conn_timeout
+                connection, address, self.conn_timeout, self._timers,
+                self._keepalive_policy, self._stream_executor,
+            )
+            connection_logger.info(
+                "Handling connection from '%s:%d'", *address
             )
-            logger.info("Handling connection from '%s:%d'", *address)
             handler.handle_connection()
         except Exception as e:
             logger.exception("Error handling client %s:%d: %s", *address, e)
         finally:
+            metrics.connection_closed()
             try:
-                connection.close()
+                close_socket(connection)
             except Exception:
                 pass
-            logger.info("[x] Closed connection: '%s:%d'", *address)
+            connection_logger.info("[x] Closed connection: '%s:%d'", *address)
 
     def _shutdown(self):
         if self._running:
@@ -122,3 +207,7 @@ class HTTPServer:
             # wait for currently running tasks to finish
             self._executor.shutdown(wait=True)
             self._executor = None
+        if self._stream_executor:
+            self._stream_executor.shutdown(wait=True)
+            self._stream_executor = None
+        self._timers.stop()
@@ -0,0 +1,265 @@
+""" Static files serving:
+- <StaticFilesHandler> maps request paths under a URL prefix to files
+  under a root directory (path traversal is blocked) and builds
+  HTTPResponses whose body is a `FileBody` (sent by `os.sendfile()`)
+- <OpenFileCache> a bounded LRU of open file-descriptors + stat metadata
+  (an entry is re-opened when the file's mtime/size/inode changes)
+- conditional requests (ETag / Last-Modified -> 304) and Range requests
+  (-> 206 with file regions sent by sendfile) are answered from the
+  cached metadata, without reading the file
+"""
+
+import os
+import mimetypes
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+from urllib.parse import unquote
+
+from app.logging import logger
+from app.http.request import HTTPRequest
+from app.http.response import HTTPResponse, FileBody
+from app.http.status import STATUS_MESSAGES
+from app.http.conditional import (
+    make_etag,
+    http_date,
+    is_not_modified,
+    range_applies,
+    range_response,
+)
+
+
+def _build_mime_table() -> dict[str, str]:
+    """ precomputed {'.ext': 'mime/type'} table (no guessing per request) """
+    mimetypes.init()
+    table = {ext.lower(): mime for ext, mime in mimetypes.types_map.items()}
+    table.update({".js": "text/javascript", ".mjs": "text/javascript"})
+    for ext, mime in table.items():
+        if mime.startswith("text/") or mime in (
+            "application/json", "application/xml", "image/svg+xml"
+        ):
+            table[ext] = f"{mime}; charset=utf-8"
+    return table
+
+
+MIME_TYPES: dict[str, str] = _build_mime_table()
+DEFAULT_MIME_TYPE = "application/octet-stream"
+
+
+class CachedFile:
+    """ an open file (+ its metadata) shared by concurrent responses.
+    the fd is closed when it's evicted AND no response uses it anymore """
+
+    __slots__ = (
+        "path", "fd", "size", "mtime_ns", "inode", "mime_type",
+        "etag", "validators", "_refs", "_evicted", "_lock",
+    )
+
+    def __init__(self, path: str, fd: int, stat: os.stat_result, mime: str):
+        self.path: str = path
+        self.fd: int = fd
+        self.size: int = stat.st_size
+        self.mtime_ns: int = stat.st_mtime_ns
+        self.inode: int = stat.st_ino
+        self.mime_type: str = mime
+        # validators are built once per opened file (not per request)
+        self.etag: str = make_etag(self.inode, self.size, self.mtime_ns)
+        self.validators: dict[str, str] = {
+            "etag": self.etag,
+            "last-modified": http_date(stat.st_mtime),
+            "accept-ranges": "bytes",
+        }
+        self._refs: int = 0
+        self._evicted: bool = False
+        self._lock = Lock()
+
+    def is_stale(self, stat: os.stat_result) -> bool:
+        return (
+            stat.st_mtime_ns != self.mtime_ns
+            or stat.st_size != self.size
+            or stat.st_ino != self.inode
+        )
+
+    def acquire(self) -> "CachedFile":
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            close = self._evicted and self._refs == 0
+        if close:
+            os.close(self.fd)
+
+    def evict(self):
+        with self._lock:
+            self._evicted = True
+            close = self._refs == 0
+        if close:
+            os.close(self.fd)
+
+
+class OpenFileCache:
+    """ thread-safe LRU of `CachedFile`s (at most `max_entries` open fds) """
+
+    def __init__(self, max_entries: int = 256):
+        self._max_entries: int = max_entries
+        self._entries: OrderedDict[str, CachedFile] = OrderedDict()
+        self._lock = Lock()
+
+    def open(self, path: str) -> Optional[CachedFile]:
+        """
+        returns an acquired `CachedFile` for `path` (caller must release it)
+        or None if it isn't a regular readable file.
+        file is `stat`ed every time, so modified files are never served
+        from a stale fd.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._invalidate(path)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and not entry.is_stale(stat):
+                self._entries.move_to_end(path)
+                return entry.acquire()
+
+        if not os.path.isfile(path):
+            return None
+        try:
+            fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            stat = os.fstat(fd)  # (metadata of what is really opened)
+        except OSError as e:
+            logger.debug("Couldn't open static file %r: %s", path, e)
+            return None
+        ext = os.path.splitext(path)[1].lower()
+        entry = CachedFile(
+            path, fd, stat, MIME_TYPES.get(ext, DEFAULT_MIME_TYPE)
+        ).acquire()
+
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                evicted.append(old)
+            self._entries[path] = entry
+            while len(self._entries) > self._max_entries:
+                evicted.append(self._entries.popitem(last=False)[1])
+        for old in evicted:
+            old.evict()
+        return entry
+
+    def clear(self):
+        with self._lock:
+            entries, self._entries = self._entries, OrderedDict()
+        for entry in entries.values():
+            entry.evict()
+
+    def _invalidate(self, path: str):
+        with self._lock:
+            entry = self._entries.pop(path, None)
+        if entry is not None:
+            entry.evict()
+
+
+class StaticFilesHandler:
+    """ serve files under `root` directory for request paths which start
+    with `url_prefix` (GET/HEAD only) """
+
+    def __init__(self, root: str, url_prefix: str, cache_size: int = 256):
+        self.root: str = os.path.realpath(root)
+        self.url_prefix: str = "/" + url_prefix.strip("/") + "/"
+        self._cache = OpenFileCache(cache_size)
+        # url path -> resolved real path (`realpath` is costly per request)
+        self._resolved: OrderedDict[str, Optional[str]] = OrderedDict()
+        self._resolved_max: int = cache_size * 4
+        self._lock = Lock()
+
+    def matches(self, path: str) -> bool:
+        return path.startswith(self.url_prefix)
+
+    def handle(self, request: HTTPRequest) -> HTTPResponse:
+        method = request.method.upper()
+        if method not in ("GET", "HEAD"):
+            return self._error(405, headers={"allow": "GET, HEAD"})
+
+        real_path = self._resolve(request.path)
+        if real_path is None:
+            return self._error(404)
+        cached = self._cache.open(real_path)
+        if cached is None:
+            return self._error(404)
+
+        if is_not_modified(request, cached.etag, cached.mtime_ns / 1e9):
+            cached.release()
+            return HTTPResponse(
+                status_code=304, headers=dict(cached.validators)
+            )
+        if method == "HEAD":
+            cached.release()
+            return HTTPResponse(
+                headers={
+                    "content-length": str(cached.size),
+                    "content-type": cached.mime_type,
+                    **cached.validators,
+                },
+                is_for_head_method=True,
+            )
+
+        file_body = FileBody(cached.fd, 0, cached.size, release=cached.release)
+        if range_applies(request, cached.etag):
+            response = range_response(
+                request, cached.size, cached.mime_type, file_body,
+                headers=cached.validators,
+            )
+            if response is not None:
+                if response.status_code == 416:
+                    file_body.close()
+                return response
+        return HTTPResponse(
+            headers=dict(cached.validators),
+            file_body=file_body,
+            mem_type=cached.mime_type,
+        )
+
+    def _resolve(self, url_path: str) -> Optional[str]:
+        """
+        map url-path to a real file path inside `self.root` (or None).
+        blocks path traversal: '..' segments, NUL bytes, and any path
+        (e.g. via symlinks) which resolves outside of root.
+        """
+        with self._lock:
+            if url_path in self._resolved:
+                self._resolved.move_to_end(url_path)
+                return self._resolved[url_path]
+
+        relative = unquote(url_path.split("?", 1)[0].split("#", 1)[0])
+        relative = relative[len(self.url_prefix):]
+        segments = [s for s in relative.replace("\\", "/").split("/") if s]
+        real_path = None
+        if "\x00" not in relative and ".." not in segments:
+            candidate = os.path.join(self.root, *segments)
+            if os.path.isdir(candidate):
+                candidate = os.path.join(candidate, "index.html")
+            # (checked on the final path: `index.html` may be a symlink)
+            candidate = os.path.realpath(candidate)
+            if candidate.startswith(self.root + os.sep):
+                real_path = candidate
+
+        with self._lock:
+            self._resolved[url_path] = real_path
+            if len(self._resolved) > self._resolved_max:
+                self._resolved.popitem(last=False)
+        return real_path
+
+    @staticmethod
+    def _error(status_code: int, headers=None) -> HTTPResponse:
+        return HTTPResponse(
+            status_code=status_code,
+            headers=headers,
+            body=STATUS_MESSAGES[status_code].encode(),
+            mem_type="text/plain",
+        )
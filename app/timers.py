@@ -0,0 +1,205 @@
+""" Connection deadlines (instead of re-armed per-socket timeouts):
+- <TimerWheel>: a hashed timing wheel. time is cut into ticks of `tick`
+  seconds and a timer goes into slot (its deadline tick % slots). arming
+  and cancelling are O(1) (a dict insert / delete), and an advance only
+  visits the slots of the ticks which passed -> tens of thousands of armed
+  timers cost (almost) nothing. timers further away than one turn of the
+  wheel wait in their slot for the next turn(s). a deadline fires at most
+  one tick late, never early. the threaded engine advances it from a
+  background thread, the asyncio engine from its event-loop
+- <ConnectionDeadlines>: deadlines of a connection, by phase:
+  - idle:    waiting for the next request on a keep-alive connection
+  - header:  receiving the request-head (from its first byte)
+  - body:    receiving the request body
+  - request: the whole request, from its first byte until the response
+             starts to be sent (reading + handler)
+  idle / header / body replace each other (one phase at a time), the
+  request deadline runs alongside them
+- <KeepAlivePolicy>: keep-alive timeout & max requests per connection
+  adapted to load: generous while the server is idle, tightened linearly
+  as load goes from `low_watermark` to full
+"""
+
+import time
+import threading
+from math import ceil
+from typing import Callable, Optional
+
+from app.logging import logger
+
+
+class Timer:
+
+    __slots__ = ("tick", "callback", "args", "_wheel")
+
+    def __init__(self, wheel: "TimerWheel", tick: int, callback, args):
+        self.tick: int = tick
+        self.callback: Callable = callback
+        self.args: tuple = args
+        self._wheel: Optional[TimerWheel] = wheel
+
+    def cancel(self):
+        """ (O(1), no-op if it has fired / was cancelled already) """
+        wheel, self._wheel = self._wheel, None
+        if wheel is not None:
+            wheel._remove(self)
+
+
+class TimerWheel:
+
+    def __init__(self, tick: float = 0.1, slots: int = 512):
+        self.tick: float = tick
+        self._slots: list[dict[Timer, None]] = [{} for _ in range(slots)]
+        self._current: int = self._tick_of(time.monotonic())  # (processed)
+        self._count: int = 0
+        # (reentrant: a callback may arm / cancel timers)
+        self._lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """ call `callback(*args)` in `delay` seconds (unless cancelled) """
+        tick = ceil((time.monotonic() + delay) / self.tick)
+        with self._lock:
+            timer = Timer(self, max(tick, self._current + 1), callback, args)
+            self._slots[timer.tick % len(self._slots)][timer] = None
+            self._count += 1
+        return timer
+
+    def advance(self, now: Optional[float] = None):
+        """ fire the timers which are due (by `now`, monotonic time) """
+        target = self._tick_of(time.monotonic() if now is None else now)
+        with self._lock:
+            if target <= self._current:
+                return
+            # (after a long pause, every slot is visited only once)
+            last = min(target, self._current + len(self._slots))
+            for tick in range(self._current + 1, last + 1):
+                slot = self._slots[tick % len(self._slots)]
+                due = [timer for timer in slot if timer.tick <= target]
+                for timer in due:
+                    del slot[timer]
+                    self._count -= 1
+                    timer._wheel = None
+                    try:
+                        timer.callback(*timer.args)
+                    except Exception as e:
+                        logger.exception("Error in timer callback: %s", e)
+            self._current = target
+
+    def start(self):
+        """ advance the wheel every tick from a background thread """
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="timer-wheel", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.tick):
+            self.advance()
+
+    def _remove(self, timer: Timer):
+        with self._lock:
+            slot = self._slots[timer.tick % len(self._slots)]
+            if timer in slot:
+                del slot[timer]
+                self._count -= 1
+
+    def _tick_of(self, moment: float) -> int:
+        return int(moment / self.tick)
+
+
+class ConnectionDeadlines:
+    """ deadlines of a connection's phases. `on_expire(name)` is called
+    (on the wheel's thread / loop) when one of them expires """
+
+    def __init__(
+        self, wheel: TimerWheel, on_expire: Callable[[str], None]
+    ):
+        self._wheel: TimerWheel = wheel
+        self._on_expire: Callable[[str], None] = on_expire
+        self._phase: Optional[Timer] = None
+        self._request: Optional[Timer] = None
+
+    def phase(self, name: str, timeout: Optional[float]):
+        """ start a phase (idle / header / body) -> replaces the deadline of
+        the previous phase. (no timeout -> no deadline) """
+        if self._phase is not None:
+            self._phase.cancel()
+        self._phase = (
+            self._wheel.schedule(timeout, self._on_expire, name)
+            if timeout else None
+        )
+
+    def end_phase(self):
+        if self._phase is not None:
+            self._phase.cancel()
+            self._phase = None
+
+    def start_request(self, timeout: Optional[float]):
+        if self._request is not None:
+            self._request.cancel()
+        self._request = (
+            self._wheel.schedule(timeout, self._on_expire, "request")
+            if timeout else None
+        )
+
+    def end_request(self):
+        if self._request is not None:
+            self._request.cancel()
+            self._request = None
+
+    def cancel(self):
+        self.end_phase()
+        self.end_request()
+
+
+class KeepAlivePolicy:
+    """ keep-alive timeout & max requests per connection, by load.
+    `load()` returns the load of the server (0.0 = idle, 1.0 = full) """
+
+    def __init__(
+        self,
+        load: Callable[[], float],
+        timeout: float,
+        min_timeout: float,
+        max_requests: int,
+        min_max_requests: int,
+        low_watermark: float = 0.5
+    ):
+        self.load: Callable[[], float] = load
+        self._timeout: float = timeout
+        self._min_timeout: float = min_timeout
+        self._max_requests: int = max_requests
+        self._min_max_requests: int = min_max_requests
+        self.low_watermark: float = low_watermark
+
+    def pressure(self) -> float:
+        """ 0.0 (up to low-watermark load) ... 1.0 (full) """
+        load = self.load()
+        if load <= self.low_watermark:
+            return 0.0
+        if load >= 1.0 or self.low_watermark >= 1.0:
+            return 1.0
+        return (load - self.low_watermark) / (1.0 - self.low_watermark)
+
+    def keepalive_timeout(self) -> float:
+        pressure = self.pressure()
+        return self._timeout - (self._timeout - self._min_timeout) * pressure
+
+    def max_requests(self) -> int:
+        pressure = self.pressure()
+        return round(
+            self._max_requests
+            - (self._max_requests - self._min_max_requests) * pressure
+        )
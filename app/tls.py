@@ -0,0 +1,115 @@
+""" TLS termination by the server itself (stdlib `ssl`), if TLS_CERTFILE
+is set:
+- create_server_context(): the server's SSLContext: certificate chain,
+  ALPN (`h2` if HTTP/2 is enabled, `http/1.1`) and session resumption:
+  TLS session tickets (stateless: the client keeps the session), or the
+  server-side session cache of OpenSSL when tickets are disabled
+- handshake(): TLS handshake of an accepted connection. (threads engine:
+  it runs on the connection's worker-thread, the accept loop never waits
+  for a client's handshake. the asyncio engine passes the context to
+  `asyncio.start_server()`, handshakes run on the loop without blocking)
+- alpn_protocol() / shutdown_socket() / send_close_notify() /
+  close_socket(): helpers for the threads engine's connections
+the context is created once per server. a pre-fork master creates it
+before forking, so all workers share its session ticket keys (a client
+resumes its session on any worker). sessions of the server-side cache
+are per process.
+"""
+
+import ssl
+import time
+import socket
+from typing import Optional
+
+from app.config import settings
+from app.metrics import metrics
+
+
+def alpn_protocols() -> list[str]:
+    """ protocols offered by ALPN, in order of preference """
+    if settings.HTTP2_ENABLED:
+        return ["h2", "http/1.1"]
+    return ["http/1.1"]
+
+
+def create_server_context(
+    certfile: Optional[str] = None, keyfile: Optional[str] = None
+) -> Optional[ssl.SSLContext]:
+    """ (certificate of TLS_CERTFILE / TLS_KEYFILE, if no certfile given)
+    None if TLS isn't configured (-> plain TCP) """
+    if certfile is None:
+        certfile, keyfile = settings.TLS_CERTFILE, settings.TLS_KEYFILE
+    if certfile is None:
+        return None
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2  # (required by h2)
+    context.load_cert_chain(certfile, keyfile)
+    if ssl.HAS_ALPN:
+        context.set_alpn_protocols(alpn_protocols())
+    if not settings.TLS_SESSION_TICKETS:
+        # (resumption by session id / stateful tickets -> server's cache)
+        context.options |= ssl.OP_NO_TICKET
+    context.num_tickets = settings.TLS_NUM_TICKETS  # (per handshake)
+    # EOF without close_notify (e.g. a deadline shut the reading side
+    # down) is a plain EOF -> the TLS session can still send a `408`
+    context.options |= getattr(ssl, "OP_IGNORE_UNEXPECTED_EOF", 0)
+    return context
+
+
+def handshake(
+    context: ssl.SSLContext, connection: socket.socket, timeout: float
+) -> ssl.SSLSocket:
+    """ wrap an accepted connection & do the TLS handshake (blocking, on
+    the calling thread). the plain socket is detached by wrapping: only
+    the returned SSLSocket must be closed.
+    raise ssl.SSLError / socket.timeout / OSError if it fails """
+    connection.settimeout(timeout)
+    tls_connection = context.wrap_socket(
+        connection, server_side=True, do_handshake_on_connect=False
+    )
+    started = time.perf_counter()
+    try:
+        tls_connection.do_handshake()
+    except BaseException:
+        tls_connection.close()
+        raise
+    metrics.tls_handshake(
+        tls_connection.session_reused, time.perf_counter() - started
+    )
+    return tls_connection
+
+
+def alpn_protocol(connection) -> Optional[str]:
+    """ protocol selected by ALPN (None: plain TCP / not negotiated) """
+    if isinstance(connection, ssl.SSLSocket):
+        return connection.selected_alpn_protocol()
+    return None
+
+
+def shutdown_socket(connection: socket.socket, how: int):
+    """ `connection.shutdown(how)`, which keeps the TLS layer of an
+    SSLSocket (`SSLSocket.shutdown()` drops it: a `408` written after
+    shutting down the reading side would go out unencrypted) """
+    socket.socket.shutdown(connection, how)
+
+
+def send_close_notify(connection: ssl.SSLSocket):
+    """ send close_notify without waiting for the peer's (the connection
+    can still be read, e.g. to drain it) """
+    timeout = connection.gettimeout()
+    try:
+        connection.setblocking(False)
+        connection.unwrap()
+    except (OSError, ValueError):  # (SSLWantReadError: expected)
+        pass
+    finally:
+        connection.settimeout(timeout)
+
+
+def close_socket(connection: socket.socket):
+    """ close a connection. TLS: close_notify is sent first: OpenSSL drops
+    the session of a connection which isn't shut down properly from the
+    server-side session cache """
+    if isinstance(connection, ssl.SSLSocket):
+        send_close_notify(connection)
+    connection.close()
@@ -0,0 +1,455 @@
+""" WSGI (PEP 3333) adapter: runs a WSGI application as a handler
+- <WSGIAdapter> calls the application with an `environ` built from the
+  HTTPRequest and maps `start_response()` + the returned iterable onto an
+  HTTPResponse:
+  - a list / tuple (already in memory) -> body (or body parts), not copied
+  - `wsgi.file_wrapper` of a regular file -> `FileBody` (`os.sendfile()`)
+  - any other iterable is streamed while the response is sent (never
+    buffered): as-is if the application set `Content-Length`, otherwise
+    by chunked transferring
+- <WSGIEnviron> the `environ` dict. CGI variables are set at once (cheap),
+  `HTTP_*` variables are looked up in the (lazy) request headers only when
+  the application asks for them (iterating / copying it loads all of them)
+- <WSGIInput> `wsgi.input`: a file-like view over the request body stream
+  (the body is received while the application reads it)
+WSGI applications are blocking: with the asyncio engine, run handlers in
+threads (`ASYNC_HANDLER_IN_THREADS`).
+mounting: set `WSGI_APP` ("module:callable") to serve the requests which
+match neither a static file nor a route, or add an adapter as a route
+handler, e.g. `router.add(methods, "/app/{rest:path}", WSGIAdapter(...))`
+"""
+
+import os
+import stat
+import importlib
+from io import BytesIO
+from typing import Callable, Iterable, Optional
+from urllib.parse import unquote
+
+from app.config import settings
+from app.logging import logger
+from app.http.request import HTTPRequest
+from app.http.response import HTTPResponse, FileBody
+from app.http.streaming import FLUSH
+
+
+# response headers which are set by the server (never by the application)
+_HOP_BY_HOP_HEADERS = frozenset((
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade",
+))
+# request headers which are CGI variables without the `HTTP_` prefix
+_UNPREFIXED_HEADERS = frozenset(("content-type", "content-length"))
+
+
+def load_app(spec: str) -> Callable:
+    """ "package.module:callable" (default callable: `application`) """
+    module_name, _, name = spec.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, name or "application")
+
+
+class WSGIInput:
+    """ `wsgi.input` over a request body stream (read / readline /
+    readlines / iteration). lines are cut from an internal buffer """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer: bytes = b""
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if size is None or size < 0:
+            data, self._buffer = self._buffer + self._stream.read(), b""
+            return data
+        if len(self._buffer) >= size:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+            return data
+        data = self._buffer + self._stream.read(size - len(self._buffer))
+        self._buffer = b""
+        return data
+
+    def readline(self, size: Optional[int] = -1) -> bytes:
+        limit = -1 if size is None else size
+        while True:
+            end = self._buffer.find(b"\n") + 1
+            if end or 0 <= limit <= len(self._buffer):
+                break
+            piece = self._stream.read(8192)
+            if not piece:
+                end = len(self._buffer)
+                break
+            self._buffer += piece
+        if 0 <= limit <= (end or len(self._buffer)):
+            end = limit
+        line, self._buffer = self._buffer[:end], self._buffer[end:]
+        return line
+
+    def readlines(self, hint: int = -1) -> list[bytes]:
+        lines, total = [], 0
+        while line := self.readline():
+            lines.append(line)
+            total += len(line)
+            if 0 < hint <= total:
+                break
+        return lines
+
+    def __iter__(self):
+        while line := self.readline():
+            yield line
+
+
+class ErrorStream:
+    """ `wsgi.errors` -> the server's logger (one record per line) """
+
+    def __init__(self):
+        self._line: str = ""
+
+    def write(self, data: str):
+        self._line += data
+        *lines, self._line = self._line.split("\n")
+        for line in lines:
+            logger.error("[wsgi] %s", line)
+
+    def writelines(self, lines: Iterable[str]):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self._line:
+            logger.error("[wsgi] %s", self._line)
+            self._line = ""
+
+
+class FileWrapper:
+    """ `wsgi.file_wrapper`: iterates over the file (PEP 3333), but a
+    regular file is sent by `os.sendfile()` (see `WSGIAdapter`) """
+
+    def __init__(self, file, block_size: int = 8192):
+        self.file = file
+        self.block_size: int = block_size
+
+    def __iter__(self):
+        while data := self.file.read(self.block_size):
+            yield data
+
+    def close(self):
+        if hasattr(self.file, "close"):
+            self.file.close()
+
+
+class WSGIEnviron(dict):
+    """
+    `environ` of a request: `HTTP_*` variables are resolved from the lazy
+    `HTTPHeaders` on first lookup (then kept). anything which needs all
+    the keys (iteration, len, copy, ...) loads all of them first. header
+    names with `_` are never mapped (they'd be ambiguous with `-`)
+    """
+
+    __slots__ = ("_headers",)
+
+    def __init__(self, variables: dict, headers):
+        super().__init__(variables)
+        self._headers = headers  # (None -> all `HTTP_*` are loaded)
+
+    def __missing__(self, key):
+        value = self._lookup(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        value = self._lookup(key)
+        return default if value is None else value
+
+    def __contains__(self, key) -> bool:
+        return dict.__contains__(self, key) or self._lookup(key) is not None
+
+    def _lookup(self, key) -> Optional[str]:
+        """ value of a (not yet loaded) `HTTP_*` variable, or None """
+        if (
+            self._headers is None
+            or not isinstance(key, str)
+            or not key.startswith("HTTP_")
+        ):
+            return None
+        name = key[5:].lower().replace("_", "-")
+        if name in _UNPREFIXED_HEADERS:
+            return None
+        values = self._headers.get_all(name)
+        if not values:
+            return None
+        value = _join(name, values)
+        dict.__setitem__(self, key, value)
+        return value
+
+    def _load(self):
+        headers, self._headers = self._headers, None
+        if headers is None:
+            return
+        for name in headers:
+            if "_" in name or name in _UNPREFIXED_HEADERS:
+                continue
+            key = "HTTP_" + name.upper().replace("-", "_")
+            if not dict.__contains__(self, key):
+                dict.__setitem__(self, key, _join(name, headers.get_all(name)))
+
+    def _loading(method):
+        def wrapper(self, *args, **kwargs):
+            self._load()
+            return method(self, *args, **kwargs)
+        wrapper.__name__ = method.__name__
+        return wrapper
+
+    __iter__ = _loading(dict.__iter__)
+    __len__ = _loading(dict.__len__)
+    __repr__ = _loading(dict.__repr__)
+    __eq__ = _loading(dict.__eq__)
+    __ne__ = _loading(dict.__ne__)
+    __delitem__ = _loading(dict.__delitem__)
+    keys = _loading(dict.keys)
+    values = _loading(dict.values)
+    items = _loading(dict.items)
+    copy = _loading(dict.copy)
+    pop = _loading(dict.pop)
+    popitem = _loading(dict.popitem)
+    setdefault = _loading(dict.setdefault)
+    del _loading
+
+
+def _join(name: str, values: list[str]) -> str:
+    """ repeated header fields -> one CGI variable """
+    return ("; " if name == "cookie" else ", ").join(values)
+
+
+class _ResponseStart:
+    """ state of `start_response()` of one request """
+
+    __slots__ = ("status_code", "headers", "length", "sent", "written")
+
+    def __init__(self):
+        self.status_code: Optional[int] = None
+        self.headers: dict = {}
+        self.length: Optional[int] = None
+        self.sent: bool = False  # (HTTPResponse is built -> headers final)
+        self.written: list[bytes] = []  # (by the legacy `write()`)
+
+    def __call__(self, status: str, headers: list, exc_info=None):
+        if exc_info is not None:
+            try:
+                if self.sent:
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        elif self.status_code is not None:
+            raise RuntimeError("start_response() was called already")
+
+        self.status_code = int(status.split(" ", 1)[0])
+        self.headers, self.length = {}, None
+        for name, value in headers:
+            key = name.lower()
+            if key in _HOP_BY_HOP_HEADERS:
+                continue
+            if key == "content-length":
+                self.length = int(value)
+            previous = self.headers.get(key)
+            if previous is None:
+                self.headers[key] = value
+            elif isinstance(previous, list):
+                previous.append(value)
+            else:
+                self.headers[key] = [previous, value]
+        return self.write
+
+    def write(self, data: bytes):
+        """ (legacy imperative API: kept and sent before the iterable) """
+        self.written.append(data)
+
+
+class WSGIAdapter:
+    """
+    a WSGI application as a handler: `adapter(request) -> HTTPResponse`.
+    `script_name` is the mount point (stripped from `PATH_INFO`)
+    """
+
+    def __init__(self, app: Callable, script_name: str = ""):
+        self.app: Callable = app
+        self.script_name: str = script_name.rstrip("/")
+        self._errors = ErrorStream()
+        self._server_name: str = settings.SOCKET_HOST
+        self._server_port: str = str(settings.SOCKET_PORT)
+
+    def matches(self, path: str) -> bool:
+        if not self.script_name:
+            return True
+        path = path.split("?", 1)[0]
+        return path == self.script_name or path.startswith(
+            self.script_name + "/"
+        )
+
+    def __call__(self, request: HTTPRequest, **params) -> HTTPResponse:
+        """ (route params, if mounted as a route handler, are ignored:
+        the application routes by `PATH_INFO` itself) """
+        start = _ResponseStart()
+        result = self.app(self.environ(request), start)
+        try:
+            return self._response(request, start, result)
+        except BaseException:
+            _close(result)
+            raise
+
+    def environ(self, request: HTTPRequest) -> WSGIEnviron:
+        path, _, query = request.path.partition("?")
+        # (PEP 3333: bytes of the path as latin-1 `str`)
+        path = unquote(path, encoding="latin-1")
+        if self.script_name and path.startswith(self.script_name):
+            path = path[len(self.script_name):]
+        headers = request.headers
+        client = request.client or ("", 0)
+        variables = {
+            "REQUEST_METHOD": request.method.upper(),
+            "SCRIPT_NAME": self.script_name,
+            "PATH_INFO": path,
+            "QUERY_STRING": query,
+            "RAW_URI": request.path,
+            "SERVER_NAME": self._server_name,
+            "SERVER_PORT": self._server_port,
+            "SERVER_PROTOCOL": request.version,
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": (
+                WSGIInput(request.stream)
+                if request.stream is not None else BytesIO(request.body)
+            ),
+            "wsgi.input_terminated": True,  # (chunked bodies too)
+            "wsgi.errors": self._errors,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": settings.PREFORK_ENABLED,
+            "wsgi.run_once": False,
+            "wsgi.file_wrapper": FileWrapper,
+        }
+        content_type = headers.get("content-type")
+        if content_type is not None:
+            variables["CONTENT_TYPE"] = content_type
+        content_length = headers.get("content-length")
+        if content_length is not None:
+            variables["CONTENT_LENGTH"] = content_length
+        return WSGIEnviron(variables, headers)
+
+    def _response(
+        self, request: HTTPRequest, start: _ResponseStart, result
+    ) -> HTTPResponse:
+        is_head = request.method.upper() == "HEAD"
+        file_body = None
+        parts = None
+        iterator = None
+        if isinstance(result, FileWrapper) and not start.written:
+            file_body = _file_body(result, start.length)
+        if file_body is None and isinstance(result, (list, tuple)):
+            parts = list(result)
+        elif file_body is None:
+            # (`start_response()` may be called on the first iteration)
+            iterator = iter(result)
+            for chunk in iterator:
+                if chunk:
+                    start.written.append(chunk)
+                    break
+            else:
+                parts, iterator = [], None
+        if start.status_code is None:
+            raise RuntimeError("start_response() was never called")
+        start.sent = True
+
+        response = HTTPResponse(
+            status_code=start.status_code,
+            headers=start.headers,
+            is_for_head_method=is_head,
+        )
+        if is_head:
+            _close(result)
+        elif file_body is not None:
+            response.file_body = file_body
+        elif iterator is None:  # (whole body is in memory already)
+            _close(result)
+            parts = start.written + parts
+            if len(parts) == 1:
+                response.body = parts[0]
+            else:
+                response.body_parts = [part for part in parts if part]
+        else:
+            response.iter_body = _streamed_body(
+                start.written, iterator, result, start.length
+            )
+            if start.length is not None:
+                response.length = start.length
+            else:
+                response.chunked = True
+        return response
+
+
+def _file_body(wrapper: FileWrapper, length: Optional[int]):
+    """ a region of the wrapped file (from its current position) as a
+    `FileBody` -> None if it's not a regular file """
+    try:
+        fd = wrapper.file.fileno()
+        info = os.fstat(fd)
+        offset = wrapper.file.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+    if not stat.S_ISREG(info.st_mode):
+        return None
+    count = max(info.st_size - offset, 0)
+    if length is not None:
+        count = min(count, length)
+    return FileBody(fd, offset, count, release=wrapper.close)
+
+
+def _streamed_body(
+    written: list[bytes], iterator, result, length: Optional[int]
+) -> Callable[[], Iterable[bytes]]:
+    """ producer of a streamed body: the application's iterable is
+    consumed while sending, then closed. with a known `length`, extra
+    bytes are cut and a short body is an error (-> connection is closed).
+    every block is sent as it comes (`FLUSH`): PEP 3333 doesn't allow
+    the server to delay a block until the application yields more """
+
+    def iter_body():
+        remaining = length
+        try:
+            for chunk in _chain(written, iterator):
+                if remaining is not None:
+                    if len(chunk) > remaining:
+                        chunk = chunk[:remaining]
+                    remaining -= len(chunk)
+                if chunk:
+                    yield chunk
+                    yield FLUSH
+                if remaining == 0:
+                    break
+            if remaining:
+                raise ValueError(
+                    f"WSGI application sent {length - remaining} bytes of "
+                    f"Content-Length {length}"
+                )
+        finally:
+            _close(result)
+
+    return iter_body
+
+
+def _chain(written: list[bytes], iterator):
+    yield from written
+    yield from iterator
+
+
+def _close(result):
+    close = getattr(result, "close", None)
+    if close is not None:
+        try:
+            close()
+        except Exception as e:
+            logger.exception("Error while closing WSGI iterable: %s", e)
+
@@ -0,0 +1,151 @@
+"""
+Benchmark suite: microbenchmarks (`benchmarks/micro.py`) + load scenarios
+(`benchmarks/loadgen.py`) against a local server. results are saved as
+JSON and compared against a stored baseline: a metric which is worse than
+its baseline by more than `--tolerance` (a fraction, e.g. 0.10 = 10%) is
+a regression -> exit status 1.
+compared metrics: microseconds per operation (lower is better), req/s
+(higher is better), p50 & p99 latency (lower is better). p999 is only
+reported (too noisy for short runs).
+(a baseline is only meaningful on the same machine & settings)
+
+run:  python -m benchmarks [--engine threads|asyncio] [--duration 5]
+                           [--output results.json] [--baseline FILE]
+                           [--tolerance 0.10] [--save-baseline]
+                           [--skip-micro] [--skip-load]
+                           [--scenarios keepalive,pipelined,...]
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+
+from benchmarks.micro import run_micro
+from benchmarks.loadgen import SCENARIOS, run_load, format_summary
+
+
+DEFAULT_BASELINE = "benchmarks/baseline.json"
+# load metric -> True if higher is better
+LOAD_METRICS = {"rps": True, "p50_ms": False, "p99_ms": False}
+
+# (`app` logs at DEBUG level in development mode -> asyncio's debug lines)
+logging.getLogger("asyncio").setLevel(logging.WARNING)
+
+
+def flatten(results: dict) -> dict[str, tuple[float, bool]]:
+    """ comparable metrics of results -> {name: (value, higher is better)} """
+    metrics = {}
+    for name, us in results.get("micro", {}).items():
+        metrics[f"micro.{name}_us"] = (us, False)
+    for scenario, summary in results.get("load", {}).items():
+        for metric, higher_is_better in LOAD_METRICS.items():
+            metrics[f"load.{scenario}.{metric}"] = (
+                summary[metric], higher_is_better
+            )
+    return metrics
+
+
+def compare(
+    results: dict, baseline: dict, tolerance: float
+) -> list[tuple[str, float, float, float, bool]]:
+    """ (metric, baseline, current, change, regressed) of every metric
+    which is in both. change is relative (+ = worse) """
+    current, previous = flatten(results), flatten(baseline)
+    rows = []
+    for name, (value, higher_is_better) in current.items():
+        if name not in previous:
+            continue
+        base = previous[name][0]
+        if base == 0:
+            continue
+        change = (value - base) / base
+        if higher_is_better:
+            change = -change
+        rows.append((name, base, value, change, change > tolerance))
+    return rows
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--engine", choices=("threads", "asyncio"),
+                        default="threads")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="seconds per load scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help="comma-separated load scenarios")
+    parser.add_argument("--number", type=int, default=20000,
+                        help="iterations per microbenchmark")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store results as the new baseline")
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--skip-load", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        print(f"unknown scenarios: {', '.join(sorted(unknown))}")
+        return 2
+
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "engine": args.engine,
+            "duration": args.duration,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+    }
+    if not args.skip_micro:
+        print("microbenchmarks:")
+        results["micro"] = run_micro(args.number)
+        for name, us in results["micro"].items():
+            print(f"  {name:<20} {us:8.3f} us")
+    if not args.skip_load:
+        print(f"load ({args.engine} engine, {args.duration:g}s each):")
+        results["load"] = run_load(args.engine, args.duration, scenarios)
+        for name, summary in results["load"].items():
+            print("  " + format_summary(name, summary))
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"results saved to {args.output}")
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        print(f"no baseline ({args.baseline}), nothing to compare")
+        return 0
+    if baseline.get("meta", {}).get("engine") != args.engine:
+        print("[!] baseline was recorded with another engine")
+
+    rows = compare(results, baseline, args.tolerance)
+    print(f"compared to baseline (tolerance {args.tolerance:.0%}):")
+    for name, base, value, change, regressed in rows:
+        mark = "REGRESSION" if regressed else ""
+        print(f"  {name:<28}{base:>12.3f}{value:>12.3f}"
+              f"{change:>+9.1%}  {mark}")
+    regressions = [row for row in rows if row[4]]
+    if regressions:
+        print(f"{len(regressions)} regression(s)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+Benchmark: HTTP/2 (h2c, `app/h2_connection.py`) against HTTP/1.1 on one
+connection to a local server (`benchmarks/server.py`, in a subprocess):
+- header bytes: request + response heads of GET /bench/hello, on the wire
+                (per request, averaged over REQUESTS requests: HPACK
+                indexes repeated fields in its dynamic table)
+- throughput:   requests/sec of one connection: HTTP/1.1 one request at a
+                time, HTTP/1.1 pipelined (PIPELINE_DEPTH), and HTTP/2 with
+                STREAMS concurrent streams (prior knowledge)
+(the client is one Python process: numbers are for comparing, not
+absolute capacity)
+
+run:  python -m benchmarks.bench_h2 [threads|asyncio] [duration]
+"""
+
+import sys
+import time
+import struct
+import asyncio
+
+from app.http.hpack import HPACKEncoder, HPACKDecoder
+from app.http.h2 import (
+    PREFACE, DATA, HEADERS, SETTINGS, WINDOW_UPDATE, GOAWAY, RST_STREAM,
+    FLAG_END_STREAM, FLAG_END_HEADERS, FLAG_ACK,
+)
+from benchmarks.loadgen import (
+    HELLO_REQUEST, PIPELINE_DEPTH, Connection, free_port, start_server,
+    stop_server,
+)
+
+
+REQUESTS = 100
+STREAMS = 100
+CLIENT_WINDOW = 2 ** 31 - 1  # (client never waits for the server's data)
+REQUEST_FIELDS = [
+    (b":method", b"GET"),
+    (b":scheme", b"http"),
+    (b":authority", b"bench"),
+    (b":path", b"/bench/hello"),
+    (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0"),
+    (b"accept", b"text/html,application/xhtml+xml,*/*;q=0.8"),
+    (b"accept-language", b"en-US,en;q=0.5"),
+    (b"accept-encoding", b"gzip, deflate"),
+]
+HTTP1_REQUEST = (
+    b"GET /bench/hello HTTP/1.1\r\nHost: bench\r\n"
+    b"User-Agent: Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0\r\n"
+    b"Accept: text/html,application/xhtml+xml,*/*;q=0.8\r\n"
+    b"Accept-Language: en-US,en;q=0.5\r\n"
+    b"Accept-Encoding: gzip, deflate\r\n\r\n"
+)
+
+
+def frame(kind: int, flags: int, stream_id: int, payload: bytes = b""):
+    length = len(payload)
+    return struct.pack(
+        ">HBBBL", length >> 8, length & 0xFF, kind, flags, stream_id
+    ) + payload
+
+
+class H2Client:
+    """ a minimal HTTP/2 client (prior knowledge): GETs on concurrent
+    streams, counts the bytes of header blocks in both directions """
+
+    def __init__(self, reader, writer):
+        self.reader: asyncio.StreamReader = reader
+        self.writer: asyncio.StreamWriter = writer
+        self.encoder = HPACKEncoder()
+        self.decoder = HPACKDecoder(4096)
+        self.next_stream_id: int = 1
+        self.header_bytes: int = 0  # (frame headers included)
+
+    async def start(self):
+        self.writer.write(
+            PREFACE + frame(SETTINGS, 0, 0, struct.pack(">HL", 0x4, 2 ** 24))
+            + frame(WINDOW_UPDATE, 0, 0, struct.pack(
+                ">L", CLIENT_WINDOW - 65535
+            ))
+        )
+        await self.writer.drain()
+
+    async def get(self, count: int) -> int:
+        """ send `count` requests at once, wait for their responses.
+        returns the number of `200` responses """
+        pending, ok = set(), 0
+        out = []
+        for _ in range(count):
+            stream_id = self.next_stream_id
+            self.next_stream_id += 2
+            block = frame(
+                HEADERS, FLAG_END_STREAM | FLAG_END_HEADERS, stream_id,
+                self.encoder.encode(REQUEST_FIELDS),
+            )
+            self.header_bytes += len(block)
+            out.append(block)
+            pending.add(stream_id)
+        self.writer.write(b"".join(out))
+        await self.writer.drain()
+        received = 0
+        while pending:
+            head = await self.reader.readexactly(9)
+            high, low, kind, flags, stream_id = struct.unpack(">HBBBL", head)
+            payload = await self.reader.readexactly((high << 8) | low)
+            if kind == HEADERS:
+                self.header_bytes += 9 + len(payload)
+                fields = dict(self.decoder.decode(payload))
+                ok += fields.get(b":status") == b"200"
+            elif kind == DATA:
+                received += len(payload)
+            elif kind == SETTINGS and not flags & FLAG_ACK:
+                self.writer.write(frame(SETTINGS, FLAG_ACK, 0))
+            elif kind in (GOAWAY, RST_STREAM):
+                raise ConnectionError("stream / connection was reset")
+            if kind in (HEADERS, DATA) and flags & FLAG_END_STREAM:
+                pending.discard(stream_id)
+        if received:  # (give the connection window back)
+            self.writer.write(frame(
+                WINDOW_UPDATE, 0, 0, struct.pack(">L", received)
+            ))
+        return ok
+
+
+async def _open(port: int):
+    return await asyncio.open_connection("127.0.0.1", port)
+
+
+async def http1_header_bytes(port: int) -> float:
+    reader, writer = await _open(port)
+    total = 0
+    for _ in range(REQUESTS):
+        writer.write(HTTP1_REQUEST)
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        await reader.readexactly(len(b"Hello, World!"))
+        total += len(HTTP1_REQUEST) + len(head)
+    writer.close()
+    return total / REQUESTS
+
+
+async def h2_header_bytes(port: int) -> float:
+    client = H2Client(*await _open(port))
+    await client.start()
+    for _ in range(REQUESTS):
+        await client.get(1)
+    client.writer.close()
+    return client.header_bytes / REQUESTS
+
+
+async def http1_rate(port: int, duration: float, depth: int) -> float:
+    conn, done = Connection("127.0.0.1", port), 0
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        responses = await conn.request(HELLO_REQUEST * depth, count=depth)
+        done += sum(status == 200 for status, _, _ in responses)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return done / elapsed
+
+
+async def h2_rate(port: int, duration: float) -> float:
+    client = H2Client(*await _open(port))
+    await client.start()
+    done = 0
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        done += await client.get(STREAMS)
+    elapsed = time.perf_counter() - started
+    client.writer.close()
+    return done / elapsed
+
+
+def run(engine: str = "threads", duration: float = 3.0):
+    port = free_port()
+    process = start_server(engine, port)
+    try:
+        http1 = asyncio.run(http1_header_bytes(port))
+        h2 = asyncio.run(h2_header_bytes(port))
+        print(f"header bytes / request: HTTP/1.1 {http1:.0f}, "
+              f"HTTP/2 {h2:.0f} ({h2 / http1:.0%})")
+        cases = [
+            ("HTTP/1.1", lambda: http1_rate(port, duration, 1)),
+            (f"HTTP/1.1 x{PIPELINE_DEPTH} pipelined",
+             lambda: http1_rate(port, duration, PIPELINE_DEPTH)),
+            (f"HTTP/2 x{STREAMS} streams", lambda: h2_rate(port, duration)),
+        ]
+        for name, case in cases:
+            print(f"{name:<28}{asyncio.run(case()):>10.0f} req/s")
+    finally:
+        stop_server(process)
+
+
+if __name__ == "__main__":
+    run(
+        sys.argv[1] if len(sys.argv) > 1 else "threads",
+        float(sys.argv[2]) if len(sys.argv) > 2 else 3.0,
+    )
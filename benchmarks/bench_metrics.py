@@ -0,0 +1,88 @@
+"""
+Microbenchmark: overhead of metrics instrumentation (`app/metrics.py`) on
+the per-request work of a worker-thread: receive a request-head (from a
+local socketpair), parse it, run `RequestHandler`, send the response.
+the same cycle is timed with metrics disabled and enabled (same timers &
+updates as `ConnectionHandler`).
+
+run:  python -m benchmarks.bench_metrics
+"""
+
+import time
+import socket
+import timeit
+
+from app.buffer import ReceiveBuffer
+from app.http.parser import HTTPParser, HTTPRequestParser
+from app.handler import RequestHandler
+from app.metrics import metrics
+
+
+REQUEST = (
+    b"GET /api/items/42?page=2 HTTP/1.1\r\n"
+    b"Host: localhost:8080\r\n"
+    b"User-Agent: bench/1.0\r\n"
+    b"Accept: */*\r\n"
+    b"Accept-Encoding: identity\r\n"
+    b"\r\n"
+)
+
+
+def request_cycle(parser: HTTPRequestParser, buffer: ReceiveBuffer, client,
+                  server):
+    """ one request, instrumented like `ConnectionHandler` """
+    client.sendall(REQUEST)
+    buffer.recv_into(server, 2048)
+    first_byte_at = time.perf_counter()
+    started = time.perf_counter()
+    parser.feed(buffer)
+    parse_time = time.perf_counter() - started
+    metrics.observe_phase(
+        "read", time.perf_counter() - first_byte_at - parse_time
+    )
+    started = time.perf_counter()
+    request = HTTPParser.parse_http_request(
+        parser.method, parser.path, parser.version, parser.headers,
+        buffer, None,
+    )
+    parser.reset()
+    metrics.observe_phase("parse", parse_time + time.perf_counter() - started)
+
+    started = time.perf_counter()
+    response = RequestHandler.get_response(request)
+    metrics.observe_phase("handler", time.perf_counter() - started)
+    started = time.perf_counter()
+    server.sendmsg(response.build_response_buffers())
+    metrics.observe_phase("send", time.perf_counter() - started)
+    metrics.request_done(response.status_code, True)
+    client.recv(65536)
+
+
+def run(number: int = 50000):
+    parser, buffer = HTTPRequestParser(), ReceiveBuffer(4096)
+    client, server = socket.socketpair()
+    results = {False: float("inf"), True: float("inf")}
+    for _ in range(5):  # (interleaved -> both see the same noise)
+        for enabled in (False, True):
+            metrics.enabled = enabled
+            elapsed = timeit.timeit(
+                lambda: request_cycle(parser, buffer, client, server),
+                number=number // 5,
+            )
+            results[enabled] = min(results[enabled], elapsed / number * 5e6)
+    metrics.enabled = True
+    client.close()
+    server.close()
+
+    observe = min(timeit.repeat(
+        lambda: metrics.observe_phase("handler", 0.0003),
+        number=number, repeat=5,
+    )) / number * 1e9
+    overhead = (results[True] - results[False]) / results[False] * 100
+    print(f"request cycle, metrics disabled: {results[False]:8.2f} us")
+    print(f"request cycle, metrics enabled:  {results[True]:8.2f} us")
+    print(f"overhead: {overhead:.1f}%  (one histogram update: {observe:.0f} ns)")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,115 @@
+"""
+Microbenchmark: per-request parse cost of the incremental (resumable)
+`HTTPRequestParser` vs the old split-based path (`bytes +=` buffer, whole
+buffer re-scanned for '\r\n\r\n' on every recv, str decode/split/concat).
+both paths read the request from a real socket (socketpair, 2 KB recvs)
+and then read `Connection` header (like `ConnectionHandler` does).
+
+run:  python -m benchmarks.bench_parser
+"""
+
+import socket
+import timeit
+
+from app.buffer import ReceiveBuffer
+from app.http.parser import HTTPRequestParser
+
+
+SMALL_REQUEST = (
+    b"GET /index.html?page=2 HTTP/1.1\r\n"
+    b"Host: localhost:8080\r\n"
+    b"User-Agent: Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0\r\n"
+    b"Accept: text/html,application/xhtml+xml,*/*;q=0.8\r\n"
+    b"Accept-Language: en-US,en;q=0.5\r\n"
+    b"Accept-Encoding: gzip, deflate\r\n"
+    b"Connection: keep-alive\r\n"
+    b"Cookie: a=1\r\n"
+    b"Cookie: b=2\r\n"
+    b"\r\n"
+)
+LARGE_REQUEST = (
+    b"GET /large HTTP/1.1\r\n"
+    + b"".join(b"X-Header-%d: %s\r\n" % (i, b"v" * 200) for i in range(90))
+    + b"Connection: keep-alive\r\n"
+    + b"\r\n"
+)
+
+
+def legacy_parse(conn: socket.socket):
+    """ the old path: `bytes +=` + full re-scan, then decode/split/concat """
+    buffer = b""
+    while True:
+        buffer += conn.recv(2048)
+        idx = buffer.find(b"\r\n\r\n")
+        if idx != -1:
+            header_part = bytes(buffer[:idx])
+            _ = bytes(buffer[idx + 4:])
+            break
+    lines = header_part.decode("iso-8859-1").split("\r\n")
+    method, path, version = lines[0].strip().split()
+    headers = {}
+    for raw in lines[1:]:
+        name, _, value = raw.partition(":")
+        name = name.strip().lower()
+        value = value.strip()
+        if name in headers:
+            headers[name] += f", {value}"
+        else:
+            headers[name] = value
+    return method, path, version, headers.get("connection")
+
+
+def incremental_parse(
+    conn: socket.socket, buffer: ReceiveBuffer, parser: HTTPRequestParser
+):
+    """ the new path (parser/buffer are reused, as on a connection) """
+    while not parser.feed(buffer):
+        buffer.recv_into(conn, 2048)
+    result = (
+        parser.method,
+        parser.path,
+        parser.version,
+        parser.headers.get("connection"),
+    )
+    parser.reset()
+    return result
+
+
+def run(number: int = 20000):
+    sender, receiver = socket.socketpair()
+    buffer = ReceiveBuffer(8192)
+    parser = HTTPRequestParser()
+    cases = [
+        ("small (0.3 KB)", SMALL_REQUEST),
+        ("large (18 KB)", LARGE_REQUEST),
+    ]
+    print(f"{'case':<20}{'split-based':>14}{'incremental':>14}{'speedup':>9}")
+    for name, data in cases:
+        sender.sendall(data)
+        expected = legacy_parse(receiver)
+        sender.sendall(data)
+        assert incremental_parse(receiver, buffer, parser) == expected
+
+        n = number if len(data) < 4096 else number // 10
+        legacy = min(timeit.repeat(
+            lambda: (sender.sendall(data), legacy_parse(receiver)),
+            number=n, repeat=5
+        ))
+        incremental = min(timeit.repeat(
+            lambda: (
+                sender.sendall(data), incremental_parse(receiver, buffer, parser)
+            ),
+            number=n, repeat=5
+        ))
+        print(
+            f"{name:<20}"
+            f"{legacy / n * 1e6:>11.2f} us"
+            f"{incremental / n * 1e6:>11.2f} us"
+            f"{legacy / incremental:>8.2f}x"
+        )
+    sender.close()
+    receiver.close()
+
+
+if __name__ == "__main__":
+    run()
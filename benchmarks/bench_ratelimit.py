@@ -0,0 +1,60 @@
+"""
+Microbenchmark: cost of a rate limiter check (`app/ratelimit.py`) per
+request:
+- one client IP (its bucket is always in the table)
+- distinct client IPs, more than the table can hold (every check creates
+  a bucket and evicts the least recently used one)
+- one client IP on a route with its own limit (two buckets per check)
+- rejected requests (empty bucket -> pre-serialized 429)
+plus the table's memory bound after millions of distinct IPs.
+
+run:  python -m benchmarks.bench_ratelimit
+"""
+
+import timeit
+from itertools import count
+
+from app.http.request import HTTPRequest
+from app.ratelimit import RateLimiter
+from app.routing import Route
+
+
+REQUEST = HTTPRequest(
+    method="GET", path="/api/items/42", version="HTTP/1.1",
+    headers={"host": "localhost"},
+)
+ROUTE = Route(lambda request: None, rate_limit=(1e9, 10 ** 9))
+
+
+def bench(label: str, fn, number: int):
+    elapsed = min(timeit.repeat(fn, number=number, repeat=5))
+    print(f"{label:<40} {elapsed / number * 1e6:8.3f} us")
+
+
+def run(number: int = 200000):
+    allowed = RateLimiter(1e9, 10 ** 9, table_size=65536)
+    bench("one IP (allowed):", lambda: allowed.check(
+        "10.0.0.1", REQUEST
+    ), number)
+
+    ips = (f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in count())
+    bench("distinct IPs (insert + LRU eviction):", lambda: allowed.check(
+        next(ips), REQUEST
+    ), number)
+
+    bench("one IP + per-route limit:", lambda: allowed.check(
+        "10.0.0.1", REQUEST, ROUTE
+    ), number)
+
+    rejected = RateLimiter(1e-9, 1)
+    rejected.check("10.0.0.1", REQUEST)  # (takes the only token)
+    bench("one IP (rejected, 429):", lambda: rejected.check(
+        "10.0.0.1", REQUEST
+    ), number)
+
+    print(f"buckets after {number * 5:,} distinct IPs: "
+          f"{len(allowed._table):,} (table size: 65,536)")
+
+
+if __name__ == "__main__":
+    run()
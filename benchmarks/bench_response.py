@@ -0,0 +1,69 @@
+"""
+Microbenchmark: header-block build cost of `HTTPResponse` (pre-encoded
+Status-Lines, cached `date`, static `server`, bytes-only serialization)
+vs the old path (datetime.now() + strftime, dict of base headers,
+f-strings, then encoding the whole block).
+
+run:  python -m benchmarks.bench_response
+"""
+
+import timeit
+from datetime import datetime, timezone
+
+from app.config import settings
+from app.http.response import HTTPResponse
+from app.http.status import STATUS_MESSAGES
+
+
+def legacy_header_block(response: HTTPResponse) -> bytes:
+    """ the old `build_response()` header path """
+    now_ = datetime.now(tz=timezone.utc)
+    headers = {
+        "date": now_.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        "server": settings.PROJECT_NAME,
+    }
+    if not response.is_for_head_method:
+        if not response.chunked and response.body:
+            headers["content-length"] = str(len(response.body))
+        if response.mem_type:
+            headers["content-type"] = response.mem_type
+    for k, v in response.headers.items():
+        if (key := k.lower()) not in headers:
+            headers[key] = v
+    message = STATUS_MESSAGES.get(response.status_code, "Unknown")
+    status_line = f"HTTP/1.1 {response.status_code} {message}\r\n"
+    headers_lines = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+    return (status_line + headers_lines + "\r\n").encode("utf-8")
+
+
+def run(number: int = 100000):
+    cases = [
+        ("plain", HTTPResponse(body=b"hello", mem_type="text/plain")),
+        ("3 extra headers", HTTPResponse(
+            body=b"{}",
+            mem_type="application/json",
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Request-Id": "abc123",
+                "Vary": "Accept-Encoding",
+            },
+        )),
+    ]
+    print(f"{'case':<20}{'old path':>12}{'fast path':>12}{'speedup':>9}")
+    for name, response in cases:
+        legacy = min(timeit.repeat(
+            lambda: legacy_header_block(response), number=number, repeat=5
+        ))
+        fast = min(timeit.repeat(
+            response.build_header_block, number=number, repeat=5
+        ))
+        print(
+            f"{name:<20}"
+            f"{legacy / number * 1e6:>9.2f} us"
+            f"{fast / number * 1e6:>9.2f} us"
+            f"{legacy / fast:>8.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    run()
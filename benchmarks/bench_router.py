@@ -0,0 +1,71 @@
+"""
+Microbenchmark: route lookup latency of the radix-tree `Router` vs a linear
+list of compiled regexes (what a chain of if/else on `request.path`
+becomes), for a growing number of routes.
+lookups are done for the last registered route (worst case for linear).
+
+run:  python -m benchmarks.bench_router
+"""
+
+import re
+import timeit
+
+from app.routing import Router
+
+
+def _handler(request, **params):
+    return params
+
+
+def build_patterns(count: int) -> list[str]:
+    return [f"/api/v1/resource{i}/{{item_id:int}}/tags/{{tag}}"
+            for i in range(count)]
+
+
+class LinearRouter:
+    """ first-match over a list of (regex, handler) """
+
+    def __init__(self):
+        self._routes: list[tuple[re.Pattern, str, object]] = []
+
+    def add(self, method: str, pattern: str, handler):
+        regex = re.sub(r"\{(\w+):int\}", r"(?P<\1>\\d+)", pattern)
+        regex = re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", regex)
+        self._routes.append((re.compile(f"^{regex}$"), method, handler))
+
+    def resolve(self, method: str, path: str):
+        for regex, route_method, handler in self._routes:
+            match = regex.match(path)
+            if match and route_method == method:
+                params = match.groupdict()
+                params["item_id"] = int(params["item_id"])
+                return handler, params
+        return None
+
+
+def run(number: int = 20000):
+    print(f"{'routes':>7}{'linear':>12}{'radix':>12}{'radix+LRU':>12}")
+    for count in (10, 100, 1000, 5000):
+        patterns = build_patterns(count)
+        linear, radix, cached = LinearRouter(), Router(0), Router(1024)
+        for pattern in patterns:
+            linear.add("GET", pattern, _handler)
+            radix.add("GET", pattern, _handler)
+            cached.add("GET", pattern, _handler)
+        path = f"/api/v1/resource{count - 1}/42/tags/python"
+        assert radix.resolve("GET", path).params == {
+            "item_id": 42, "tag": "python"
+        }
+
+        results = []
+        for router in (linear, radix, cached):
+            n = max(number // count, 20) if router is linear else number
+            best = min(timeit.repeat(
+                lambda: router.resolve("GET", path), number=n, repeat=5
+            ))
+            results.append(best / n * 1e6)
+        print(f"{count:>7}" + "".join(f"{r:>9.2f} us" for r in results))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,51 @@
+"""
+Microbenchmark: cost of connection deadlines on the timer wheel
+(`app/timers.py`) with a growing number of armed timers (= open
+connections): re-arming a deadline (cancel + schedule, what a connection
+does per phase), which stays flat as the number of timers grows, and
+advancing the wheel by one tick, which only visits one slot (~ timers /
+slots entries, firing the due ones).
+
+run:  python -m benchmarks.bench_timers
+"""
+
+import time
+import random
+import timeit
+
+from app.timers import TimerWheel
+
+
+def _noop():
+    pass
+
+
+def run(number: int = 100000):
+    print(f"{'timers':>8}{'re-arm':>12}{'advance (1 tick)':>20}")
+    for count in (1000, 10000, 50000):
+        wheel = TimerWheel(0.1, 512)
+        timers = [
+            wheel.schedule(random.uniform(1.0, 120.0), _noop)
+            for _ in range(count)
+        ]
+        state = {"i": 0}
+
+        def rearm():
+            i = state["i"] = (state["i"] + 1) % count
+            timers[i].cancel()
+            timers[i] = wheel.schedule(random.uniform(1.0, 120.0), _noop)
+
+        rearm_us = min(timeit.repeat(rearm, number=number, repeat=5))
+        rearm_us = rearm_us / number * 1e6
+
+        now = time.monotonic()
+        ticks = 200
+        started = time.perf_counter()
+        for tick in range(1, ticks + 1):  # (simulated time)
+            wheel.advance(now + tick * wheel.tick)
+        advance_us = (time.perf_counter() - started) / ticks * 1e6
+        print(f"{count:>8}{rearm_us:>9.2f} us{advance_us:>17.2f} us")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,146 @@
+"""
+Benchmark: TLS connection rate of a local server (`benchmarks/server.py`
+in a subprocess, with a self-signed certificate made by the `openssl`
+command-line tool):
+- full:     every connection does a full handshake (no session)
+- resumed:  every connection resumes the session of the previous one
+            (session tickets, see `app/tls.py`)
+a connection = TCP connect + TLS handshake + `GET /bench/hello` (which
+also receives the session tickets) + close. connections are opened by
+CLIENTS threads, one at a time each. (the client's side of handshakes
+runs on the same machine: numbers are for comparing, not absolute
+capacity)
+
+run:  python -m benchmarks.bench_tls [threads|asyncio] [duration]
+"""
+
+import os
+import ssl
+import sys
+import time
+import socket
+import tempfile
+import threading
+import subprocess
+from typing import Optional
+
+from benchmarks.loadgen import free_port, start_server, stop_server
+
+
+CLIENTS = 4
+REQUEST = (
+    b"GET /bench/hello HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n"
+)
+
+
+def make_certificate(directory: str) -> tuple[str, str]:
+    """ self-signed certificate (ECDSA P-256) -> (cert file, key file) """
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "ec",
+         "-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes",
+         "-keyout", keyfile, "-out", certfile, "-days", "1",
+         "-subj", "/CN=localhost"],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return certfile, keyfile
+
+
+def client_context() -> ssl.SSLContext:
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE  # (self-signed)
+    return context
+
+
+def connect(
+    context: ssl.SSLContext, port: int, session: Optional[ssl.SSLSession]
+) -> tuple[bool, bool, Optional[ssl.SSLSession]]:
+    """ one connection -> (response is `200`, session was reused, session
+    for the next connection) """
+    with socket.create_connection(("127.0.0.1", port)) as raw:
+        with context.wrap_socket(
+            raw, server_hostname="localhost", session=session
+        ) as conn:
+            conn.sendall(REQUEST)
+            response = b""
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    break
+                response += data
+            return (
+                response.startswith(b"HTTP/1.1 200"),
+                conn.session_reused,
+                conn.session,
+            )
+
+
+def _client(port: int, resume: bool, deadline: float, results: list):
+    context = client_context()
+    session, done, reused, errors = None, 0, 0, 0
+    while time.perf_counter() < deadline:
+        try:
+            ok, was_reused, new_session = connect(context, port, session)
+        except OSError:
+            errors += 1
+            session = None
+            continue
+        done += ok
+        reused += was_reused
+        if resume:  # (TLS 1.3 tickets are used once: take the new one)
+            session = new_session
+    results.append((done, reused, errors))
+
+
+def connection_rate(port: int, resume: bool, duration: float) -> dict:
+    results = []
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(
+            target=_client, args=(port, resume, deadline, results)
+        )
+        for _ in range(CLIENTS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done = sum(result[0] for result in results)
+    return {
+        "rate": done / elapsed,
+        "connections": done,
+        "reused": sum(result[1] for result in results),
+        "errors": sum(result[2] for result in results),
+    }
+
+
+def run(engine: str = "threads", duration: float = 3.0):
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            certfile, keyfile = make_certificate(directory)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"couldn't make a certificate by `openssl`: {e}")
+            return
+        port = free_port()
+        process = start_server(engine, port, args=(certfile, keyfile))
+        try:
+            for name, resume in (("full", False), ("resumed", True)):
+                result = connection_rate(port, resume, duration)
+                print(
+                    f"{name:<10}{result['rate']:>10.0f} conn/s  "
+                    f"({result['reused']}/{result['connections']} "
+                    f"resumed, {result['errors']} errors)"
+                )
+        finally:
+            stop_server(process)
+
+
+if __name__ == "__main__":
+    run(
+        sys.argv[1] if len(sys.argv) > 1 else "threads",
+        float(sys.argv[2]) if len(sys.argv) > 2 else 3.0,
+    )
@@ -0,0 +1,130 @@
+"""
+Microbenchmark: overhead of the WSGI adapter (`app/wsgi.py`) against
+calling a native handler directly, for the same responses:
+- hello:    a small in-memory body (`[b"Hello, World!"]`)
+- download: a large (16 MB) body produced in 64 KB chunks, streamed by
+            chunked transferring / with a known Content-Length
+- file:     a large file (`wsgi.file_wrapper` vs a `FileBody`), sent by
+            sendfile (not measured, the same for both)
+a request = handler / adapter call + building the response buffers (+
+running its body producer through the `ChunkedWriter`, like a connection
+does). (time per request, best of 5)
+
+run:  python -m benchmarks.bench_wsgi
+"""
+
+import os
+import timeit
+import tempfile
+
+from app.buffer import ReceiveBuffer
+from app.http.parser import HTTPParser, HTTPRequestParser
+from app.http.response import HTTPResponse, FileBody
+from app.http.streaming import ChunkedWriter
+from app.wsgi import WSGIAdapter
+from benchmarks.bench_parser import SMALL_REQUEST
+
+
+HELLO = b"Hello, World!"
+CHUNK = b"x" * (64 * 1024)
+CHUNKS = 256  # (16 MB)
+
+
+def make_request():
+    parser, buffer = HTTPRequestParser(), ReceiveBuffer(32768)
+    buffer.write(SMALL_REQUEST)
+    parser.feed(buffer)
+    return HTTPParser.parse_http_request(
+        parser.method, parser.path, parser.version, parser.headers,
+        buffer, None,
+    )
+
+
+def send(response: HTTPResponse) -> int:
+    """ what a connection does with a response (without the socket) """
+    size = sum(len(buf) for buf in response.build_response_buffers())
+    if response.is_streamed():
+        writer = ChunkedWriter(64 * 1024, 0.05, framed=response.chunked)
+        for chunk in response.iter_body():
+            for buf in writer.write(chunk) or ():
+                size += len(buf)
+        size += sum(len(buf) for buf in writer.finish())
+    response.close()
+    return size
+
+
+def native_hello(request):
+    return HTTPResponse(body=HELLO, mem_type="text/plain")
+
+
+def wsgi_hello(environ, start_response):
+    start_response("200 OK", [
+        ("Content-Type", "text/plain"), ("Content-Length", "13"),
+    ])
+    return [HELLO]
+
+
+def native_download(request):
+    return HTTPResponse(
+        mem_type="application/octet-stream",
+        chunked=True,
+        iter_body=lambda: (CHUNK for _ in range(CHUNKS)),
+    )
+
+
+def wsgi_download(environ, start_response):
+    start_response("200 OK", [("Content-Type", "application/octet-stream")])
+    return (CHUNK for _ in range(CHUNKS))
+
+
+def wsgi_download_length(environ, start_response):
+    start_response("200 OK", [
+        ("Content-Type", "application/octet-stream"),
+        ("Content-Length", str(len(CHUNK) * CHUNKS)),
+    ])
+    return (CHUNK for _ in range(CHUNKS))
+
+
+def run(number: int = 20000):
+    request = make_request()
+    with tempfile.NamedTemporaryFile() as file:
+        file.truncate(len(CHUNK) * CHUNKS)
+        path = file.name
+
+        def native_file(request):
+            fd = os.open(path, os.O_RDONLY)
+            return HTTPResponse(
+                mem_type="application/octet-stream",
+                file_body=FileBody(
+                    fd, 0, os.fstat(fd).st_size, lambda: os.close(fd)
+                ),
+            )
+
+        def wsgi_file(environ, start_response):
+            start_response(
+                "200 OK", [("Content-Type", "application/octet-stream")]
+            )
+            return environ["wsgi.file_wrapper"](open(path, "rb"))
+
+        cases = [
+            ("hello", native_hello, wsgi_hello, number),
+            ("download (chunked)", native_download, wsgi_download, 20),
+            ("download (length)", native_download, wsgi_download_length,
+             20),
+            ("file (sendfile)", native_file, wsgi_file, number // 4),
+        ]
+        print(f"{'response':<20}{'direct':>12}{'wsgi':>12}{'overhead':>12}")
+        for name, native, app, count in cases:
+            adapter = WSGIAdapter(app)
+            direct = min(timeit.repeat(
+                lambda: send(native(request)), number=count, repeat=5
+            )) / count * 1e6
+            wrapped = min(timeit.repeat(
+                lambda: send(adapter(request)), number=count, repeat=5
+            )) / count * 1e6
+            print(f"{name:<20}{direct:>9.2f} us{wrapped:>9.2f} us"
+                  f"{wrapped - direct:>9.2f} us")
+
+
+if __name__ == "__main__":
+    run()
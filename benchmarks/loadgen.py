@@ -0,0 +1,336 @@
+"""
+asyncio load generator: runs HTTP/1.1 scenarios against a server started
+locally (`benchmarks/server.py`, in a subprocess) and reports requests/sec
+and p50 / p99 / p999 latency of each scenario:
+- keepalive:  concurrent connections, one request at a time, reused
+- pipelined:  requests are sent in batches of PIPELINE_DEPTH, then their
+              responses are read (latency: from the batch's send)
+- large_body: POST of a LARGE_BODY_SIZE body (`/bench/upload`)
+- chunked:    chunked response (`/bench/chunked`), read chunk by chunk
+- idle:       `keepalive` while IDLE_CONNECTIONS other connections are
+              open (after one request) and idle
+connections are opened again when the server closes them (e.g. max
+requests per connection: requests which found the reused connection
+closed are sent again, like HTTP clients do).
+the generator is one Python process, so its numbers are for comparing
+builds (same machine, same settings), not absolute capacity.
+
+run:  python -m benchmarks.loadgen [threads|asyncio] [duration]
+"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import subprocess
+from typing import Optional
+
+
+CHUNK_SIZE = 4096  # (chunked responses of `benchmarks/server.py`)
+CHUNKS = 16
+PIPELINE_DEPTH = 4  # (divides MAX_REQUESTS_PER_CONNECTION & _MIN)
+LARGE_BODY_SIZE = 1024 * 1024  # 1 MB
+IDLE_CONNECTIONS = {"threads": 16, "asyncio": 500}
+CONCURRENCY = {
+    "keepalive": 16,
+    "pipelined": 16,
+    "large_body": 4,
+    "chunked": 16,
+    "idle": 8,
+}
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HELLO_REQUEST = b"GET /bench/hello HTTP/1.1\r\nHost: bench\r\n\r\n"
+CHUNKED_REQUEST = b"GET /bench/chunked HTTP/1.1\r\nHost: bench\r\n\r\n"
+UPLOAD_HEAD = (
+    b"POST /bench/upload HTTP/1.1\r\nHost: bench\r\n"
+    b"Content-Type: application/octet-stream\r\n"
+    b"Content-Length: %d\r\n\r\n" % LARGE_BODY_SIZE
+)
+UPLOAD_BODY = b"x" * LARGE_BODY_SIZE
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class Stats:
+    """ latencies (seconds) & errors of a scenario """
+
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.errors: int = 0
+
+    def summary(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "rps": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "p999_ms": percentile(latencies, 99.9) * 1000,
+        }
+
+
+def percentile(values: list[float], p: float) -> float:
+    """ nearest-rank percentile of sorted values (0.0 if empty) """
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * p // 100))  # ceil(n * p / 100)
+    return values[min(int(rank), len(values)) - 1]
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple[int, int, bool]:
+    """ read one response -> (status code, body size, connection closes) """
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.lower().split(b"\r\n")
+    parts = lines[0].split(b" ", 2)
+    if len(parts) < 2 or not parts[0].startswith(b"http/"):
+        raise ProtocolError(f"bad status-line: {lines[0]!r}")
+    status = int(parts[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        headers[name.strip()] = value.strip()
+    close = headers.get(b"connection") == b"close" or parts[0] == b"http/1.0"
+    size = 0
+    if headers.get(b"transfer-encoding") == b"chunked":
+        while True:
+            chunk_size = int((await reader.readline()).split(b";")[0], 16)
+            if chunk_size == 0:
+                while await reader.readline() not in (b"\r\n", b""):
+                    pass  # (trailers)
+                break
+            await reader.readexactly(chunk_size + 2)
+            size += chunk_size
+    elif b"content-length" in headers:
+        size = int(headers[b"content-length"])
+        await reader.readexactly(size)
+    return status, size, close
+
+
+class Connection:
+    """ a client connection, opened (again) on demand """
+
+    def __init__(self, host: str, port: int):
+        self.host: str = host
+        self.port: int = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.used: bool = False  # (a response was received already)
+
+    async def open(self):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+            self.used = False
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, *data: bytes, count: int = 1) -> list[tuple]:
+        """ send data (`count` pipelined requests), read their responses.
+        if a reused connection was closed by the server, it's sent again
+        on a new connection """
+        await self.open()
+        try:
+            self.writer.writelines(data)
+            await self.writer.drain()
+            first = await read_response(self.reader)
+        except (OSError, asyncio.IncompleteReadError) as err:
+            partial = getattr(err, "partial", b"")
+            if not self.used or partial:
+                raise
+            self.close()
+            return await self.request(*data, count=count)
+        self.used = True
+        responses = [first]
+        while len(responses) < count and not responses[-1][2]:
+            responses.append(await read_response(self.reader))
+        if responses[-1][2]:
+            self.close()
+        return responses
+
+
+async def _keepalive(conn: Connection, stats: Stats, deadline: float):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        [(status, _, _)] = await conn.request(HELLO_REQUEST)
+        _record(stats, status == 200, started)
+
+
+async def _pipelined(conn: Connection, stats: Stats, deadline: float):
+    batch = HELLO_REQUEST * PIPELINE_DEPTH
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        responses = await conn.request(batch, count=PIPELINE_DEPTH)
+        for status, _, _ in responses:
+            _record(stats, status == 200, started)
+        stats.errors += PIPELINE_DEPTH - len(responses)  # (unanswered)
+
+
+async def _large_body(conn: Connection, stats: Stats, deadline: float):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        [(status, _, _)] = await conn.request(UPLOAD_HEAD, UPLOAD_BODY)
+        _record(stats, status == 200, started)
+
+
+async def _chunked(conn: Connection, stats: Stats, deadline: float):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        [(status, size, _)] = await conn.request(CHUNKED_REQUEST)
+        _record(stats, status == 200 and size == CHUNK_SIZE * CHUNKS, started)
+
+
+def _record(stats: Stats, ok: bool, started: float):
+    if ok:
+        stats.latencies.append(time.perf_counter() - started)
+    else:
+        stats.errors += 1
+
+
+SCENARIOS = {
+    "keepalive": _keepalive,
+    "pipelined": _pipelined,
+    "large_body": _large_body,
+    "chunked": _chunked,
+    "idle": _keepalive,
+}
+
+
+async def _worker(scenario, host: str, port: int, stats: Stats,
+                  deadline: float):
+    conn = Connection(host, port)
+    while time.perf_counter() < deadline:
+        try:
+            await scenario(conn, stats, deadline)
+        except (OSError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError, ProtocolError, ValueError):
+            stats.errors += 1
+            conn.close()
+            await asyncio.sleep(0.001)
+    conn.close()
+
+
+async def _open_idle(host: str, port: int, count: int) -> list[Connection]:
+    """ connections which are used once, then stay open & idle """
+    connections = []
+    for _ in range(count):
+        conn = Connection(host, port)
+        try:
+            await conn.request(HELLO_REQUEST)
+        except (OSError, asyncio.IncompleteReadError):
+            conn.close()
+            continue
+        connections.append(conn)
+    return connections
+
+
+async def run_scenario(
+    name: str,
+    host: str,
+    port: int,
+    duration: float,
+    concurrency: Optional[int] = None,
+    idle: int = 0
+) -> dict:
+    """ run a scenario for `duration` seconds -> its summary """
+    idle_connections = []
+    if name == "idle":
+        idle_connections = await _open_idle(host, port, idle)
+    stats = Stats()
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(
+        _worker(SCENARIOS[name], host, port, stats, deadline)
+        for _ in range(concurrency or CONCURRENCY[name])
+    ))
+    summary = stats.summary(time.perf_counter() - started)
+    if name == "idle":
+        summary["idle_connections"] = len(idle_connections)
+    for conn in idle_connections:
+        conn.close()
+    return summary
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(
+    engine: str, port: int, timeout: float = 10.0, args: tuple = ()
+):
+    """ start `benchmarks.server` in a subprocess, wait until it listens
+    (`args`: extra arguments of the server, e.g. a TLS certificate) """
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.server", engine, str(port),
+         *args],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(
+                f"benchmark server exited ({process.returncode})"
+            )
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("benchmark server didn't start")
+
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_load(
+    engine: str = "threads",
+    duration: float = 5.0,
+    scenarios: Optional[list[str]] = None
+) -> dict[str, dict]:
+    """ {scenario: summary} of scenarios against a fresh local server """
+    port = free_port()
+    process = start_server(engine, port)
+    results = {}
+    try:
+        for name in scenarios or SCENARIOS:
+            results[name] = asyncio.run(run_scenario(
+                name, "127.0.0.1", port, duration,
+                idle=IDLE_CONNECTIONS.get(engine, 16),
+            ))
+    finally:
+        stop_server(process)
+    return results
+
+
+def format_summary(name: str, summary: dict) -> str:
+    return (
+        f"{name:<12}{summary['rps']:>10.0f} req/s"
+        f"{summary['p50_ms']:>9.2f}{summary['p99_ms']:>9.2f}"
+        f"{summary['p999_ms']:>9.2f} ms  ({summary['errors']} errors)"
+    )
+
+
+if __name__ == "__main__":
+    engine = sys.argv[1] if len(sys.argv) > 1 else "threads"
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    print(f"{'scenario':<12}{'throughput':>16}{'p50':>9}{'p99':>9}"
+          f"{'p999':>9}")
+    for name, summary in run_load(engine, duration).items():
+        print(format_summary(name, summary))
@@ -0,0 +1,88 @@
+"""
+Microbenchmarks of the per-request hot paths (used by the benchmark suite,
+see `benchmarks/__main__.py`):
+- parse:     request-head parsing (`HTTPRequestParser` + `HTTPRequest`)
+- serialize: building response buffers (`HTTPResponse`)
+- route:     route resolution (`Router`, with its LRU and without it)
+every result is the best (min) time per operation in microseconds.
+
+run:  python -m benchmarks.micro
+"""
+
+import timeit
+from typing import Callable
+
+from app.buffer import ReceiveBuffer
+from app.http.parser import HTTPParser, HTTPRequestParser
+from app.http.response import HTTPResponse
+from app.routing import Router
+from benchmarks.bench_parser import SMALL_REQUEST, LARGE_REQUEST
+
+
+def _parse(data: bytes) -> Callable[[], object]:
+    parser, buffer = HTTPRequestParser(), ReceiveBuffer(32768)
+
+    def parse():
+        buffer.write(data)
+        parser.feed(buffer)
+        request = HTTPParser.parse_http_request(
+            parser.method, parser.path, parser.version, parser.headers,
+            buffer, None,
+        )
+        request.headers.get("connection")
+        parser.reset()
+        return request
+    return parse
+
+
+def _serialize(body: bytes, **kwargs) -> Callable[[], object]:
+    def serialize():
+        return HTTPResponse(
+            body=body, mem_type="text/html", **kwargs
+        ).build_response_buffers()
+    return serialize
+
+
+def _router(cache_size: int) -> Router:
+    router = Router(cache_size)
+    for i in range(100):
+        router.add(
+            "GET", f"/api/v1/resource{i}/{{item_id:int}}/tags/{{tag}}",
+            lambda request, **params: params,
+        )
+    return router
+
+
+def _route(cache_size: int) -> Callable[[], object]:
+    router = _router(cache_size)
+    return lambda: router.resolve("GET", "/api/v1/resource99/42/tags/new")
+
+
+# name -> (factory of the timed callable, relative number of iterations)
+MICROBENCHMARKS: dict[str, tuple[Callable[[], Callable], float]] = {
+    "parse_small": (lambda: _parse(SMALL_REQUEST), 1.0),
+    "parse_large": (lambda: _parse(LARGE_REQUEST), 0.1),
+    "serialize_small": (lambda: _serialize(b"x" * 100), 1.0),
+    "serialize_headers": (lambda: _serialize(b"x" * 100, headers={
+        "cache-control": "max-age=60", "etag": '"abc"', "vary": "accept",
+        "x-request-id": "0123456789",
+    }), 1.0),
+    "route_cached": (lambda: _route(1024), 1.0),
+    "route_uncached": (lambda: _route(0), 1.0),
+}
+
+
+def run_micro(number: int = 20000, repeat: int = 5) -> dict[str, float]:
+    """ {name: microseconds per operation} of all microbenchmarks """
+    results = {}
+    for name, (factory, scale) in MICROBENCHMARKS.items():
+        fn = factory()
+        n = max(1, int(number * scale))
+        best = min(timeit.repeat(fn, number=n, repeat=repeat))
+        results[name] = best / n * 1e6
+    return results
+
+
+if __name__ == "__main__":
+    for name, us in run_micro().items():
+        print(f"{name:<20} {us:8.3f} us")
@@ -0,0 +1,76 @@
+"""
+Server under test of the load generator (`benchmarks/loadgen.py`): the
+real server (threads or asyncio engine), plus a few routes of benchmark
+scenarios:
+- GET  /bench/hello           small text response
+- POST /bench/upload          reads the (large) request body, returns its size
+- GET  /bench/chunked         chunked response (CHUNKS x CHUNK_SIZE bytes)
+
+(with a certificate & key, it serves TLS: see `app/tls.py`)
+
+run:  python -m benchmarks.server [threads|asyncio] [port] [cert key]
+"""
+
+import sys
+from typing import Optional
+
+from app.handler import router
+from app.http.request import HTTPRequest
+from app.http.response import HTTPResponse
+from app.tls import create_server_context
+from benchmarks.loadgen import CHUNK_SIZE, CHUNKS
+
+
+HELLO = b"Hello, World!"
+
+
+@router.route("/bench/hello")
+def hello(request: HTTPRequest) -> HTTPResponse:
+    return HTTPResponse(body=HELLO, mem_type="text/plain")
+
+
+@router.route("/bench/upload", methods=("POST",))
+def upload(request: HTTPRequest) -> HTTPResponse:
+    size = 0
+    if request.stream is not None:
+        for chunk in request.stream:
+            size += len(chunk)
+    else:
+        size = len(request.body)
+    return HTTPResponse(body=str(size).encode(), mem_type="text/plain")
+
+
+@router.route("/bench/chunked")
+def chunked(request: HTTPRequest) -> HTTPResponse:
+    chunk = b"x" * CHUNK_SIZE
+    return HTTPResponse(
+        mem_type="application/octet-stream",
+        chunked=True,
+        iter_body=lambda: (chunk for _ in range(CHUNKS)),
+    )
+
+
+def main(
+    engine: str,
+    port: int,
+    certfile: Optional[str] = None,
+    keyfile: Optional[str] = None
+):
+    if engine == "asyncio":
+        from app.async_server import AsyncHTTPServer as server_class
+    else:
+        from app.server import HTTPServer as server_class
+    tls_context = None
+    if certfile is not None:
+        tls_context = create_server_context(certfile, keyfile)
+    server = server_class(tls_context=tls_context)
+    server.port = port
+    server.start()
+
+
+if __name__ == "__main__":
+    main(
+        sys.argv[1] if len(sys.argv) > 1 else "threads",
+        int(sys.argv[2]) if len(sys.argv) > 2 else 8080,
+        *sys.argv[3:5],
+    )
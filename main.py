@@ -1,4 +1,6 @@
 from app.server import HTTPServer
+from app.async_server import AsyncHTTPServer
+from app.prefork import PreforkMaster
 from app.config import settings
 
 
@@ -8,5 +10,18 @@ def show_server_settings(settings_obj):
 
 if __name__ == "__main__":
     # show_server_settings(settings)
-    server = HTTPServer()
-    server.start()
+    if settings.SERVER_ENGINE == "asyncio":
+        server_class = AsyncHTTPServer
+    else:
+        server_class = HTTPServer
+
+    if settings.PREFORK_ENABLED:
+        master = PreforkMaster(
+            server_class,
+            workers=settings.PREFORK_WORKERS,
+            reuse_port=settings.PREFORK_REUSEPORT
+        )
+        master.start()
+    else:
+        server = server_class()
+        server.start()
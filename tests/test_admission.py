@@ -0,0 +1,130 @@
+""" AdmissionController: queue limit & CoDel-style shedding by queue delay
+(target, interval, drop rate, recovery) and the pre-serialized 503
+"""
+
+import socket
+from types import SimpleNamespace
+
+import pytest
+
+import app.admission
+from app.admission import AdmissionController
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ a fake `time.perf_counter()` of app.admission """
+    now = [100.0]
+    monkeypatch.setattr(
+        app.admission, "time", SimpleNamespace(perf_counter=lambda: now[0])
+    )
+    return now
+
+
+def _controller(queued: int = 10, **kw) -> AdmissionController:
+    """ a controller with `queued` connections waiting in its queue """
+    controller = AdmissionController(1000, target=0.05, interval=0.5, **kw)
+    for _ in range(queued):
+        assert controller.try_admit()
+    return controller
+
+
+def _dequeue(controller: AdmissionController, clock, wait: float) -> bool:
+    """ a connection which waited `wait` seconds is taken (and a new one
+    is queued -> the queue doesn't run dry) """
+    controller.try_admit()
+    admitted = controller.dequeue(clock[0] - wait)
+    controller.release()
+    return admitted
+
+
+def test_queue_limit():
+    controller = AdmissionController(3)
+    assert all(controller.try_admit() for _ in range(3))
+    assert not controller.try_admit()
+    assert (controller.tasks, controller.queue_depth) == (3, 3)
+    assert controller.dequeue(0.0)
+    assert controller.queue_depth == 2
+    assert not controller.try_admit()  # (still in work)
+    controller.release()
+    assert controller.try_admit()
+
+
+def test_waits_below_target_are_never_dropped(clock):
+    controller = _controller()
+    for _ in range(100):
+        clock[0] += 0.1
+        assert _dequeue(controller, clock, 0.04)
+
+
+def test_burst_shorter_than_interval_is_not_dropped(clock):
+    controller = _controller()
+    for _ in range(4):  # (above target, for 0.4s < interval)
+        assert _dequeue(controller, clock, 0.2)
+        clock[0] += 0.1
+    assert _dequeue(controller, clock, 0.01)  # (burst is over)
+    clock[0] += 0.1
+    assert _dequeue(controller, clock, 0.2)  # (-> a new interval starts)
+
+
+def test_standing_queue_is_shed_at_a_growing_rate(clock):
+    controller = _controller()
+    assert _dequeue(controller, clock, 0.2)  # (interval starts)
+    clock[0] += 0.5
+    drops = []
+    for _ in range(200):  # (2 seconds, a dequeue per 10ms)
+        if not _dequeue(controller, clock, 0.2):
+            drops.append(clock[0])
+        clock[0] += 0.01
+    assert drops[0] == pytest.approx(100.5)
+    gaps = [b - a for a, b in zip(drops, drops[1:])]
+    # (interval / sqrt(count) between drops -> shorter and shorter)
+    assert gaps[0] == pytest.approx(0.5, abs=0.011)
+    assert gaps[1] == pytest.approx(0.5 / 2 ** 0.5, abs=0.011)
+    assert gaps[-1] < gaps[0]
+    assert all(b <= a + 0.011 for a, b in zip(gaps, gaps[1:]))
+
+
+def test_recovery_when_a_wait_is_below_target(clock):
+    controller = _controller()
+    _dequeue(controller, clock, 0.2)
+    clock[0] += 0.5
+    assert not _dequeue(controller, clock, 0.2)  # (dropping)
+    clock[0] += 0.01
+    assert _dequeue(controller, clock, 0.01)  # (below target -> stop)
+    clock[0] += 0.01
+    for _ in range(4):  # (a whole interval is needed again)
+        assert _dequeue(controller, clock, 0.2)
+        clock[0] += 0.1
+    clock[0] += 0.15
+    assert not _dequeue(controller, clock, 0.2)
+
+
+def test_nothing_is_dropped_when_the_queue_runs_dry(clock):
+    controller = _controller(queued=1)
+    assert controller.dequeue(clock[0] - 1.0)
+    clock[0] += 1.0
+    controller.try_admit()
+    assert controller.dequeue(clock[0] - 1.0)
+
+
+def test_codel_disabled(clock):
+    controller = _controller(codel_enabled=False)
+    for _ in range(100):
+        clock[0] += 0.1
+        assert _dequeue(controller, clock, 10.0)
+
+
+def test_reject_sends_503_and_closes():
+    controller = AdmissionController(1, retry_after=3)
+    server, client = socket.socketpair()
+    with client:
+        client.sendall(b"GET / HTTP/1.1\r\nHost: x\r\n\r\n")
+        controller.reject(server)
+        client.settimeout(5)
+        data = b""
+        while chunk := client.recv(65536):
+            data += chunk
+    assert data.startswith(b"HTTP/1.1 503")
+    assert b"retry-after: 3\r\n" in data.lower()
+    assert server.fileno() == -1
@@ -0,0 +1,182 @@
+""" request body decoders (Content-Length / chunked) & RequestBody stream
+"""
+
+import pytest
+
+from app.buffer import ReceiveBuffer
+from app.config import settings
+from app.http.body import (
+    ChunkedDecoder, ContentLengthDecoder, RequestBody, MAX_CHUNK_SIZE_LINE,
+)
+from app.http.errors import HTTPParseError
+from app.http.headers import HTTPHeaders
+from app.http.parser import HTTPParser
+
+
+CHUNKED = b"5\r\nhello\r\n7;ext=1\r\n, world\r\n0\r\nX-Trailer: 1\r\n\r\n"
+
+
+def _decode_all(decoder, data: bytes, step: int, max_size: int = 1 << 20):
+    """ feed `data` `step` bytes at a time -> (payload, unread bytes) """
+    buffer = ReceiveBuffer(16)
+    payload, fed = [], 0
+    while True:
+        piece = decoder.decode(buffer, max_size)
+        if piece is None:
+            assert fed < len(data), "decoder wants more than was sent"
+            buffer.write(data[fed:fed + step])
+            fed += step
+        elif piece == b"":
+            assert decoder.done
+            return b"".join(payload), bytes(buffer.view()) + data[fed:]
+        else:
+            payload.append(piece)
+
+
+def _stream(decoder, pieces: list[bytes]) -> RequestBody:
+    buffer = ReceiveBuffer(16)
+    pieces = list(pieces)
+
+    def receive() -> int:
+        if not pieces:
+            return 0
+        data = pieces.pop(0)
+        buffer.write(data)
+        return len(data)
+
+    return RequestBody(decoder, buffer, receive)
+
+
+@pytest.mark.parametrize("step", [1, 3, 100])
+def test_content_length_leaves_next_request(step):
+    payload, rest = _decode_all(
+        ContentLengthDecoder(10), b"0123456789GET / HTTP/1.1", step
+    )
+    assert payload == b"0123456789"
+    assert rest == b"GET / HTTP/1.1"
+
+
+def test_content_length_max_size():
+    decoder, buffer = ContentLengthDecoder(10), ReceiveBuffer(16)
+    buffer.write(b"0123456789")
+    assert decoder.decode(buffer, 4) == b"0123"
+    assert decoder.pending == 6
+
+
+@pytest.mark.parametrize("step", [1, 2, 5, 1000])
+def test_chunked(step):
+    payload, rest = _decode_all(
+        ChunkedDecoder(1000), CHUNKED + b"NEXT", step
+    )
+    assert payload == b"hello, world"
+    assert rest == b"NEXT"
+
+
+def test_chunked_uppercase_hex_size():
+    payload, _ = _decode_all(
+        ChunkedDecoder(1000), b"A\r\n0123456789\r\n0\r\n\r\n", 4
+    )
+    assert payload == b"0123456789"
+
+
+@pytest.mark.parametrize("data", [
+    b"zz\r\nhello\r\n0\r\n\r\n",  # (not hex)
+    b"\r\nhello\r\n0\r\n\r\n",  # (no size)
+    b"-5\r\nhello\r\n0\r\n\r\n",
+    b"5\r\nhelloXX0\r\n\r\n",  # (no CRLF after data)
+])
+def test_chunked_malformed(data):
+    with pytest.raises(HTTPParseError) as info:
+        _decode_all(ChunkedDecoder(1000), data, 100)
+    assert info.value.status_code == 400
+
+
+def test_chunked_size_line_too_long():
+    data = b"5;" + b"e" * MAX_CHUNK_SIZE_LINE  # (no CRLF yet)
+    with pytest.raises(HTTPParseError) as info:
+        _decode_all(ChunkedDecoder(1000), data, len(data))
+    assert info.value.status_code == 400
+
+
+def test_chunked_body_too_large():
+    data = b"8\r\n01234567\r\n8\r\n01234567\r\n0\r\n\r\n"
+    with pytest.raises(HTTPParseError) as info:
+        _decode_all(ChunkedDecoder(10), data, 100)
+    assert info.value.status_code == 413
+
+
+def test_chunked_trailers_too_large():
+    data = b"0\r\nX: " + b"a" * settings.MAX_HEADER_SIZE
+    with pytest.raises(HTTPParseError) as info:
+        _decode_all(ChunkedDecoder(10), data, len(data))
+    assert info.value.status_code == 431
+
+
+@pytest.mark.parametrize("fields, expected", [
+    (b"", None),
+    (b"Content-Length: 0\r\n", None),
+    (b"Content-Length: 5\r\n", ContentLengthDecoder),
+    (b"Transfer-Encoding: chunked\r\n", ChunkedDecoder),
+    (b"Transfer-Encoding: Chunked \r\n", ChunkedDecoder),
+])
+def test_get_body_decoder(fields, expected):
+    decoder = HTTPParser.get_body_decoder(HTTPHeaders(fields))
+    if expected is None:
+        assert decoder is None
+    else:
+        assert isinstance(decoder, expected)
+
+
+@pytest.mark.parametrize("fields, status_code", [
+    (b"Transfer-Encoding: gzip\r\n", 400),
+    (b"Transfer-Encoding: chunked\r\nContent-Length: 5\r\n", 400),
+    (b"Content-Length: -1\r\n", 400),
+    (b"Content-Length: 1e3\r\n", 400),
+    (b"Content-Length: \xb2\r\n", 400),  # ("\u00b2", a non-ASCII digit)
+    (b"Content-Length: \xd9\xa3\r\n", 400),
+    (b"Content-Length: %d\r\n" % (settings.MAX_BODY_SIZE + 1), 413),
+])
+def test_get_body_decoder_rejects(fields, status_code):
+    with pytest.raises(HTTPParseError) as info:
+        HTTPParser.get_body_decoder(HTTPHeaders(fields))
+    assert info.value.status_code == status_code
+
+
+def test_stream_reads_lazily():
+    stream = _stream(ContentLengthDecoder(6), [b"abc", b"def"])
+    received = []
+    stream.before_receive = lambda: received.append(True)
+    assert stream.read(2) == b"ab"
+    assert received == [True]  # (called once, before the first receive)
+    assert stream.read() == b"cdef"
+    assert stream.at_eof
+    assert stream.bytes_read == 6
+
+
+def test_stream_readinto_and_iteration():
+    stream = _stream(ChunkedDecoder(1000), [CHUNKED[:9], CHUNKED[9:]])
+    target = bytearray(3)
+    assert stream.readinto(target) == 3
+    assert target == b"hel"
+    assert b"".join(stream) == b"lo, world"
+
+
+def test_stream_client_closed_early():
+    stream = _stream(ContentLengthDecoder(10), [b"abc"])
+    with pytest.raises(HTTPParseError):
+        stream.read()
+
+
+def test_stream_skip_limit():
+    stream = _stream(ContentLengthDecoder(300000), [b"x" * 100000] * 3)
+    assert not stream.skip(limit=1000)
+    assert not stream.at_eof
+    stream = _stream(ContentLengthDecoder(300000), [b"x" * 100000] * 3)
+    assert stream.skip()
+    assert stream.at_eof
+
+
+def test_stream_spool():
+    stream = _stream(ContentLengthDecoder(10), [b"0123456789"])
+    with stream.spool() as file:
+        assert file.read() == b"0123456789"
@@ -0,0 +1,183 @@
+""" ResponseCache (freshness, Vary, LRU eviction under the byte budget,
+coalescing of concurrent misses)
+"""
+
+import threading
+
+from app.cache import CachedHTTPResponse, ResponseCache
+from app.http.headers import HTTPHeaders
+from app.http.request import HTTPRequest
+from app.http.response import HTTPResponse
+
+
+def _request(path: str = "/c", method: str = "GET", **fields):
+    raw = "".join(
+        f"{name.replace('_', '-')}: {value}\r\n"
+        for name, value in fields.items()
+    )
+    return HTTPRequest(method, path, "HTTP/1.1", HTTPHeaders(raw.encode()))
+
+
+class _Handler:
+    """ counts its calls, answers with a fresh (cacheable) response """
+
+    def __init__(self, body: bytes = b"cached body", **headers):
+        self.calls = 0
+        self.body = body
+        self.headers = {"cache-control": "max-age=60"}
+        self.headers.update(
+            (name.replace("_", "-"), value) for name, value in headers.items()
+        )
+
+    def __call__(self, request: HTTPRequest) -> HTTPResponse:
+        self.calls += 1
+        return HTTPResponse(
+            body=self.body, mem_type="text/plain", headers=dict(self.headers)
+        )
+
+
+def _body(response: HTTPResponse) -> bytes:
+    return b"".join(bytes(part) for part in response.body_buffers())
+
+
+def test_hit_is_served_without_the_handler():
+    cache, handler = ResponseCache(1 << 20, 1 << 16), _Handler()
+    first = cache.get_response(_request(), handler)
+    second = cache.get_response(_request(), handler)
+    assert handler.calls == 1
+    assert not isinstance(first, CachedHTTPResponse)
+    assert isinstance(second, CachedHTTPResponse)
+    assert _body(second) == b"cached body"
+    response = second.build_response()
+    assert response.startswith(b"HTTP/1.1 200")
+    assert b"age: 0\r\n" in response and b"date: " in response.lower()
+
+
+def test_head_is_served_from_the_get_entry():
+    cache, handler = ResponseCache(1 << 20, 1 << 16), _Handler()
+    cache.get_response(_request(), handler)
+    head = cache.get_response(_request(method="HEAD"), handler)
+    assert handler.calls == 1
+    assert isinstance(head, CachedHTTPResponse)
+    assert _body(head) == b""
+
+
+def test_uncacheable_responses_and_requests():
+    cache = ResponseCache(1 << 20, 1 << 16)
+    for headers in (
+        {"cache_control": "no-store, max-age=60"},
+        {"cache_control": "private, max-age=60"},
+        {"cache_control": "max-age=0"},
+        {"cache_control": "max-age=²"},  # (not ASCII digits)
+        {"set_cookie": "a=1"},
+    ):
+        handler = _Handler(**headers)
+        cache.get_response(_request(), handler)
+        cache.get_response(_request(), handler)
+        assert handler.calls == 2, headers
+    handler = _Handler()
+    for request in (
+        _request(method="POST"),
+        _request(authorization="Basic eDp5"),
+        _request(cache_control="no-cache"),
+    ):
+        cache.get_response(request, handler)
+        cache.get_response(request, handler)
+    assert handler.calls == 6
+
+
+def test_vary_keeps_variants_apart():
+    cache = ResponseCache(1 << 20, 1 << 16)
+    handler = _Handler(vary="Accept-Encoding")
+    for encoding in ("gzip", "identity", "gzip", "identity"):
+        cache.get_response(_request(accept_encoding=encoding), handler)
+    assert handler.calls == 2
+    response = cache.get_response(_request(accept_encoding="br"), handler)
+    assert handler.calls == 3 and not isinstance(response, CachedHTTPResponse)
+    # (other paths don't share the `Vary` of /c)
+    other = _Handler()
+    cache.get_response(_request("/d", accept_encoding="gzip"), other)
+    cache.get_response(_request("/d", accept_encoding="br"), other)
+    assert other.calls == 1
+
+
+def test_vary_star_is_never_cached():
+    cache, handler = ResponseCache(1 << 20, 1 << 16), _Handler(vary="*")
+    cache.get_response(_request(), handler)
+    cache.get_response(_request(), handler)
+    assert handler.calls == 2
+
+
+def test_lru_eviction_under_the_byte_budget():
+    handler = _Handler(body=b"x" * 1000)
+    size = len(handler(_request()).build_response())
+    handler.calls = 0
+    cache = ResponseCache(size * 2 + size // 2, 1 << 16)  # (2 entries)
+    cache.get_response(_request("/a"), handler)
+    cache.get_response(_request("/b"), handler)
+    cache.get_response(_request("/a"), handler)  # (-> /b is the LRU one)
+    cache.get_response(_request("/c"), handler)  # (evicts /b)
+    assert handler.calls == 3
+    cache.get_response(_request("/a"), handler)
+    cache.get_response(_request("/c"), handler)
+    assert handler.calls == 3
+    cache.get_response(_request("/b"), handler)
+    assert handler.calls == 4
+
+
+def test_entries_larger_than_max_entry_size_are_not_stored():
+    cache, handler = ResponseCache(1 << 20, 500), _Handler(body=b"x" * 1000)
+    cache.get_response(_request(), handler)
+    cache.get_response(_request(), handler)
+    assert handler.calls == 2
+
+
+def test_vary_is_dropped_with_the_last_entry_of_a_path():
+    handler = _Handler(body=b"x" * 1000, vary="Accept-Encoding")
+    size = len(handler(_request()).build_response())
+    cache = ResponseCache(size + size // 2, 1 << 16)  # (1 entry)
+    for i in range(50):
+        cache.get_response(_request(f"/p{i}", accept_encoding="gzip"), handler)
+    assert len(cache._vary) == 1
+    cache.clear()
+    assert not cache._vary
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = ResponseCache(1 << 20, 1 << 16)
+    release, calls = threading.Event(), []
+
+    def slow_handler(request: HTTPRequest) -> HTTPResponse:
+        calls.append(request)
+        release.wait(5)
+        return _Handler()(request)
+
+    responses = []
+    threads = [
+        threading.Thread(
+            target=lambda: responses.append(
+                cache.get_response(_request(), slow_handler)
+            )
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    while not calls:
+        release.wait(0.001)
+    release.wait(0.05)  # (the others are waiting for the first one now)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert len(responses) == 8
+    assert all(_body(response) == b"cached body" for response in responses)
+
+
+def test_uncacheable_result_releases_coalesced_misses():
+    cache = ResponseCache(1 << 20, 1 << 16)
+    handler = _Handler(cache_control="no-store")
+    responses = [cache.get_response(_request(), handler) for _ in range(3)]
+    assert handler.calls == 3
+    assert not cache._inflight
+    assert all(_body(response) == b"cached body" for response in responses)
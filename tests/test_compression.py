@@ -0,0 +1,180 @@
+""" content-coding negotiation & ResponseCompressor (Vary, weak ETags,
+variant cache, streamed bodies)
+"""
+
+import zlib
+
+import pytest
+
+from app.http.compression import ResponseCompressor, negotiate
+from app.http.conditional import range_response
+from app.http.headers import HTTPHeaders
+from app.http.request import HTTPRequest
+from app.http.response import HTTPResponse
+from app.http.streaming import FLUSH
+
+
+TEXT = b"hello, compression! " * 200
+
+
+def _request(accept_encoding: str = "gzip", method: str = "GET", **fields):
+    fields["accept_encoding"] = accept_encoding
+    raw = "".join(
+        f"{name.replace('_', '-')}: {value}\r\n"
+        for name, value in fields.items()
+    )
+    return HTTPRequest(method, "/t", "HTTP/1.1", HTTPHeaders(raw.encode()))
+
+
+def _response(body: bytes = TEXT, **headers) -> HTTPResponse:
+    return HTTPResponse(
+        body=body, mem_type="text/plain",
+        headers={k.replace("_", "-"): v for k, v in headers.items()},
+    )
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("deflate", "deflate"),
+    ("GZIP", "gzip"),
+    ("identity", None),
+    ("br", None),
+    ("deflate, gzip", "gzip"),  # (gzip wins ties)
+    ("gzip;q=0.5, deflate", "deflate"),
+    ("gzip;q=1.0, deflate;q=0.9", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=0, deflate;q=0", None),
+    ("*", "gzip"),
+    ("*;q=0", None),
+    ("gzip;q=0, *", "deflate"),  # (`*` doesn't cover listed codings)
+    ("*;q=0, deflate", "deflate"),
+    ("gzip;q=oops, deflate;q=0.1", "deflate"),
+    ("gzip ; q=0.8", "gzip"),
+])
+def test_negotiate(header, expected):
+    assert negotiate(header) == expected
+
+
+def test_apply_compresses_and_weakens_etag():
+    compressor = ResponseCompressor()
+    response = compressor.apply(_request(), _response(etag='"abc"'))
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "accept-encoding"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert zlib.decompress(response.body, 31) == TEXT
+
+
+def test_apply_not_accepted_still_varies():
+    response = ResponseCompressor().apply(
+        _request("identity"), _response(vary="Origin")
+    )
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Origin, accept-encoding"
+    assert response.body == TEXT
+
+
+@pytest.mark.parametrize("response", [
+    _response(b"tiny"),
+    HTTPResponse(body=TEXT, mem_type="image/png"),
+    HTTPResponse(status_code=404, body=TEXT, mem_type="text/plain"),
+    _response(content_encoding="br"),
+])
+def test_apply_leaves_ineligible_responses(response):
+    ResponseCompressor().apply(_request(), response)
+    assert "content-encoding" not in response.headers or (
+        response.headers["content-encoding"] == "br"
+    )
+    assert "vary" not in response.headers
+
+
+def test_head_response_varies():
+    compressor = ResponseCompressor()
+    response = HTTPResponse(
+        headers={"content-length": str(len(TEXT))},
+        mem_type="text/plain", is_for_head_method=True,
+    )
+    compressor.apply(_request(method="HEAD"), response)
+    assert response.headers["vary"] == "accept-encoding"
+    assert "content-encoding" not in response.headers
+    small = HTTPResponse(
+        headers={"content-length": "10"},
+        mem_type="text/plain", is_for_head_method=True,
+    )
+    compressor.apply(_request(method="HEAD"), small)
+    assert "vary" not in small.headers
+
+
+@pytest.mark.parametrize("range_header", ["bytes=0-9", "bytes=0-9,20-29"])
+def test_partial_response_varies(range_header):
+    response = range_response(
+        _request(range=range_header), len(TEXT), "text/plain", TEXT
+    )
+    ResponseCompressor().apply(_request(), response)
+    assert response.status_code == 206
+    assert response.headers["vary"] == "accept-encoding"
+    assert "content-encoding" not in response.headers
+
+
+def test_variant_cache_needs_a_validator():
+    compressor = ResponseCompressor()
+    first = compressor.apply(_request(), _response(etag='"v1"')).body
+    again = compressor.apply(_request(), _response(etag='"v1"')).body
+    assert again is first  # (from the variant cache)
+    deflated = compressor.apply(_request("deflate"), _response(etag='"v1"'))
+    assert zlib.decompress(deflated.body) == TEXT
+
+    dynamic = compressor.apply(_request(), _response()).body
+    assert compressor.apply(_request(), _response()).body is not dynamic
+    no_store = _response(etag='"v2"', cache_control="no-store")
+    compressor.apply(_request(), no_store)
+    assert compressor._cache.get(("/t", '"v2"', "gzip")) is None
+
+
+def test_variant_cache_is_per_path():
+    compressor = ResponseCompressor()
+    other = HTTPRequest(
+        "GET", "/other?page=2", "HTTP/1.1",
+        HTTPHeaders(b"accept-encoding: gzip\r\n"),
+    )
+    compressor.apply(_request(), _response(etag='"1"'))
+    response = compressor.apply(other, _response(b"other " * 500, etag='"1"'))
+    assert zlib.decompress(response.body, 31) == b"other " * 500
+
+
+def test_variant_cache_by_last_modified():
+    compressor = ResponseCompressor()
+    modified = "Tue, 15 Nov 1994 08:12:31 GMT"
+    first = compressor.apply(_request(), _response(last_modified=modified))
+    again = compressor.apply(_request(), _response(last_modified=modified))
+    assert again.body is first.body
+
+
+def test_variant_cache_is_bounded():
+    compressor = ResponseCompressor(cache_size=100)
+    compressor.apply(_request(), _response(etag='"a"'))
+    compressor.apply(_request(), _response(etag='"b"'))
+    assert compressor._cache.get(("/t", '"a"', "gzip")) is None  # (evicted)
+    assert compressor._cache.get(("/t", '"b"', "gzip")) is not None
+    too_big = _response(bytes(range(256)) * 8, etag='"c"')
+    compressor.apply(_request(), too_big)
+    assert compressor._cache.get(("/t", '"c"', "gzip")) is None
+
+
+def test_streamed_body_is_flushed():
+    def produce():
+        yield b"a" * 100
+        yield FLUSH
+        yield b"b" * 100
+
+    response = HTTPResponse(
+        mem_type="text/plain", chunked=True, iter_body=produce
+    )
+    ResponseCompressor().apply(_request("deflate"), response)
+    chunks = list(response.iter_body())
+    flush = chunks.index(FLUSH)
+    decompressor = zlib.decompressobj()
+    assert decompressor.decompress(b"".join(chunks[:flush])) == b"a" * 100
+    rest = b"".join(chunks[flush + 1:])
+    assert decompressor.decompress(rest) + decompressor.flush() == b"b" * 100
@@ -0,0 +1,168 @@
+""" conditional requests (ETag / Last-Modified -> 304) & Range requests
+(-> 206 / 416)
+"""
+
+import tempfile
+
+import pytest
+
+from app.http.conditional import (
+    MAX_RANGES, http_date, is_not_modified, make_etag, parse_range,
+    range_applies, range_response,
+)
+from app.http.headers import HTTPHeaders
+from app.http.request import HTTPRequest
+from app.http.response import FileBody
+
+
+BODY = bytes(range(100))
+ETAG = make_etag(1, 100, 255)
+
+
+def _request(method: str = "GET", **fields) -> HTTPRequest:
+    raw = "".join(
+        f"{name.replace('_', '-')}: {value}\r\n"
+        for name, value in fields.items()
+    )
+    return HTTPRequest(method, "/", "HTTP/1.1", HTTPHeaders(raw.encode()))
+
+
+def test_make_etag():
+    assert ETAG == '"1-64-ff"'
+    assert make_etag("v1", weak=True) == 'W/"v1"'
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", [(0, 9)]),
+    ("bytes=90-", [(90, 99)]),
+    ("bytes=-10", [(90, 99)]),
+    ("bytes=-1000", [(0, 99)]),
+    ("bytes=95-1000", [(95, 99)]),
+    ("bytes=50-59, 0-9", [(0, 9), (50, 59)]),
+    ("bytes=0-9,5-19,20-29", [(0, 29)]),  # (overlapping/adjacent merged)
+    ("bytes=100-, 0-0", [(0, 0)]),  # (unsatisfiable one is dropped)
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, len(BODY)) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=100-", "bytes=100-200", "bytes=-0",
+])
+def test_parse_range_not_satisfiable(header):
+    assert parse_range(header, len(BODY)) is False
+
+
+@pytest.mark.parametrize("header", [
+    "", "items=0-9", "bytes=", "bytes=5", "bytes=9-0", "bytes=a-b",
+    "bytes=" + ",".join(["0-0"] * (MAX_RANGES + 1)),
+])
+def test_parse_range_ignored(header):
+    assert parse_range(header, len(BODY)) is None
+
+
+@pytest.mark.parametrize("if_none_match, expected", [
+    (ETAG, True),
+    (f"W/{ETAG}", True),  # (weak comparison)
+    (f'"other", {ETAG}', True),
+    ("*", True),
+    ('"other"', False),
+])
+def test_if_none_match(if_none_match, expected):
+    request = _request(if_none_match=if_none_match)
+    assert is_not_modified(request, ETAG) is expected
+
+
+def test_if_none_match_only_for_get_and_head():
+    assert is_not_modified(_request("HEAD", if_none_match=ETAG), ETAG)
+    assert not is_not_modified(_request("POST", if_none_match=ETAG), ETAG)
+
+
+def test_if_modified_since():
+    request = _request(if_modified_since=http_date(1_000_000))
+    assert is_not_modified(request, last_modified=1_000_000.5)
+    assert not is_not_modified(request, last_modified=1_000_001)
+    invalid = _request(if_modified_since="yesterday")
+    assert not is_not_modified(invalid, last_modified=1_000_000)
+
+
+def test_if_none_match_takes_precedence():
+    request = _request(
+        if_none_match='"other"', if_modified_since=http_date(1_000_000)
+    )
+    assert not is_not_modified(request, ETAG, 1_000_000)
+
+
+def test_range_applies():
+    assert range_applies(_request(range="bytes=0-9"), ETAG)
+    assert not range_applies(_request("HEAD", range="bytes=0-9"), ETAG)
+    assert not range_applies(_request(), ETAG)
+    assert range_applies(_request(range="bytes=0-9", if_range=ETAG), ETAG)
+    # (If-Range needs a strong comparison)
+    assert not range_applies(
+        _request(range="bytes=0-9", if_range=f"W/{ETAG}"), ETAG
+    )
+    assert not range_applies(
+        _request(range="bytes=0-9", if_range=ETAG), f"W/{ETAG}"
+    )
+    assert not range_applies(_request(range="bytes=0-9", if_range=ETAG), None)
+
+
+def test_single_range_response():
+    response = range_response(
+        _request(range="bytes=10-19"), len(BODY), "application/x", BODY,
+        {"etag": ETAG},
+    )
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 10-19/100"
+    assert response.headers["etag"] == ETAG
+    assert bytes(response.body) == BODY[10:20]
+    assert isinstance(response.body, memoryview)  # (not copied)
+
+
+def test_multipart_range_response():
+    response = range_response(
+        _request(range="bytes=0-1, -2"), len(BODY), "text/plain", BODY
+    )
+    assert response.status_code == 206
+    boundary = response.mem_type.partition("boundary=")[2]
+    assert response.mem_type.startswith("multipart/byteranges")
+    payload = b"".join(bytes(part) for part in response.body_parts)
+    assert payload == (
+        f"\r\n--{boundary}\r\ncontent-type: text/plain\r\n"
+        f"content-range: bytes 0-1/100\r\n\r\n"
+    ).encode() + BODY[:2] + (
+        f"\r\n--{boundary}\r\ncontent-type: text/plain\r\n"
+        f"content-range: bytes 98-99/100\r\n\r\n"
+    ).encode() + BODY[98:] + f"\r\n--{boundary}--\r\n".encode()
+
+
+def test_not_satisfiable_and_ignored_range_response():
+    response = range_response(
+        _request(range="bytes=200-"), len(BODY), "text/plain", BODY
+    )
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */100"
+    assert range_response(
+        _request(range="lines=1-2"), len(BODY), "text/plain", BODY
+    ) is None
+
+
+def test_file_range_response():
+    released = []
+    with tempfile.TemporaryFile() as file:
+        source = FileBody(
+            file.fileno(), 10, 100, release=lambda: released.append(True)
+        )
+        response = range_response(
+            _request(range="bytes=0-4,50-59"), 100, "text/plain", source
+        )
+        regions = [
+            part for part in response.body_parts
+            if isinstance(part, FileBody)
+        ]
+        assert [(r.offset, r.count) for r in regions] == [(10, 5), (60, 10)]
+        regions[0].close()
+        assert not released  # (only the last region releases the file)
+        regions[1].close()
+        assert released == [True]
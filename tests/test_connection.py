@@ -0,0 +1,132 @@
+""" ConnectionHandler over a socketpair: pipelined requests are answered in
+order, their responses batched into one scatter-gather write
+"""
+
+import socket
+import threading
+
+import pytest
+
+from app.connection import ConnectionHandler
+from app.handler import router
+from app.http.response import HTTPResponse
+from app.timers import KeepAlivePolicy, TimerWheel
+
+
+def _echo(request, n: int) -> HTTPResponse:
+    return HTTPResponse(body=b"n=%d" % n, mem_type="text/plain")
+
+
+router.add(("GET", "POST"), "/_pipeline/{n:int}", _echo)
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    """ number of responses in each write of `_sendmsg_all()` """
+    counts = []
+    sendmsg_all = ConnectionHandler._sendmsg_all
+
+    def spy(self, buffers):
+        counts.append(b"".join(buffers).count(b"HTTP/1.1 "))
+        return sendmsg_all(self, buffers)
+
+    monkeypatch.setattr(ConnectionHandler, "_sendmsg_all", spy)
+    return counts
+
+
+def _handler(server: socket.socket) -> ConnectionHandler:
+    policy = KeepAlivePolicy(lambda: 0.0, 5.0, 1.0, 100, 100)
+    return ConnectionHandler(
+        server, ("127.0.0.1", 1), 5.0, TimerWheel(), policy
+    )
+
+
+def _serve(data: bytes, responses: int, max_pipelined: int = 16) -> list:
+    """ send `data` at once, then handle the connection -> bodies of the
+    first `responses` responses (in the order they were received) """
+    server, client = socket.socketpair()
+    handler = _handler(server)
+    handler._max_pipelined = max_pipelined
+    client.sendall(data)  # (all requests are in the buffer at once)
+    thread = threading.Thread(target=handler.handle_connection)
+    thread.start()
+    bodies, received = [], b""
+    client.settimeout(5)
+    try:
+        while len(bodies) < responses:
+            head_end = received.find(b"\r\n\r\n")
+            if head_end == -1:
+                chunk = client.recv(65536)
+                assert chunk, "connection closed early"
+                received += chunk
+                continue
+            head = received[:head_end].lower()
+            length = int(head.split(b"content-length: ")[1].split(b"\r")[0])
+            end = head_end + 4 + length
+            while len(received) < end:
+                received += client.recv(65536)
+            bodies.append(received[head_end + 4:end])
+            received = received[end:]
+    finally:
+        client.close()
+        thread.join(5)
+        server.close()
+    return bodies
+
+
+def _get(n: int, close: bool = False) -> bytes:
+    """ (the last request closes the connection -> no more reads) """
+    return b"GET /_pipeline/%d HTTP/1.1\r\nHost: x\r\n%s\r\n" % (
+        n, b"Connection: close\r\n" if close else b""
+    )
+
+
+def _pipeline(count: int) -> bytes:
+    return b"".join(_get(n, n == count - 1) for n in range(count))
+
+
+def test_pipelined_requests_are_answered_in_order(writes):
+    bodies = _serve(_pipeline(5), 5)
+    assert bodies == [b"n=%d" % n for n in range(5)]
+    assert writes == [5]  # (one `sendmsg()` for all of them)
+
+
+def test_pipelined_responses_are_flushed_every_max_pipelined(writes):
+    bodies = _serve(_pipeline(7), 7, max_pipelined=3)
+    assert bodies == [b"n=%d" % n for n in range(7)]
+    assert writes == [3, 3, 1]
+
+
+def test_unread_bodies_of_pipelined_requests_are_skipped(writes):
+    post = (
+        b"POST /_pipeline/1 HTTP/1.1\r\nHost: x\r\nContent-Length: 11\r\n"
+        b"\r\nGET /nope\r\n"  # (a body which looks like a request)
+    )
+    chunked = (
+        b"POST /_pipeline/2 HTTP/1.1\r\nHost: x\r\n"
+        b"Transfer-Encoding: chunked\r\n\r\n3\r\nabc\r\n0\r\n\r\n"
+    )
+    bodies = _serve(_get(0) + post + chunked + _get(3, True), 4)
+    assert bodies == [b"n=0", b"n=1", b"n=2", b"n=3"]
+    assert writes == [4]
+
+
+def test_request_split_across_reads_is_answered(writes):
+    second = _get(1, True)
+    data = _get(0) + second[:10]  # (2nd request-head isn't complete)
+    server, client = socket.socketpair()
+    handler = _handler(server)
+    client.sendall(data)
+    thread = threading.Thread(target=handler.handle_connection)
+    thread.start()
+    client.settimeout(5)
+    received = b""
+    while b"n=0" not in received:  # (sent without waiting for the rest)
+        received += client.recv(65536)
+    client.sendall(second[10:])
+    while b"n=1" not in received:
+        received += client.recv(65536)
+    client.close()
+    thread.join(5)
+    server.close()
+    assert writes == [1, 1]
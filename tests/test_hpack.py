@@ -0,0 +1,261 @@
+""" HPACK against the examples of RFC 7541 Appendix C (integers, header
+blocks of requests and responses, with and without Huffman coding)
+"""
+
+import pytest
+
+from app.http.hpack import (
+    HPACKDecoder, HPACKEncoder, HPACKError, decode_integer, encode_integer,
+    huffman_decode, huffman_encode,
+)
+
+
+def _hex(text: str) -> bytes:
+    return bytes.fromhex("".join(text.split()))
+
+
+REQUESTS = [
+    [
+        (b":method", b"GET"),
+        (b":scheme", b"http"),
+        (b":path", b"/"),
+        (b":authority", b"www.example.com"),
+    ],
+    [
+        (b":method", b"GET"),
+        (b":scheme", b"http"),
+        (b":path", b"/"),
+        (b":authority", b"www.example.com"),
+        (b"cache-control", b"no-cache"),
+    ],
+    [
+        (b":method", b"GET"),
+        (b":scheme", b"https"),
+        (b":path", b"/index.html"),
+        (b":authority", b"www.example.com"),
+        (b"custom-key", b"custom-value"),
+    ],
+]
+
+# C.3: requests without Huffman coding
+C3 = [
+    "8286 8441 0f77 7777 2e65 7861 6d70 6c65 2e63 6f6d",
+    "8286 84be 5808 6e6f 2d63 6163 6865",
+    "8287 85bf 400a 6375 7374 6f6d 2d6b 6579"
+    "0c63 7573 746f 6d2d 7661 6c75 65",
+]
+
+# C.4: requests with Huffman coding
+C4 = [
+    "8286 8441 8cf1 e3c2 e5f2 3a6b a0ab 90f4 ff",
+    "8286 84be 5886 a8eb 1064 9cbf",
+    "8287 85bf 4088 25a8 49e9 5ba9 7d7f 8925 a849 e95b b8e8 b4bf",
+]
+
+DATE_21 = b"Mon, 21 Oct 2013 20:13:21 GMT"
+DATE_22 = b"Mon, 21 Oct 2013 20:13:22 GMT"
+LOCATION = b"https://www.example.com"
+COOKIE = b"foo=ASDJKHQKBZXOQWEOPIUAXQWEOIU; max-age=3600; version=1"
+
+RESPONSES = [
+    [
+        (b":status", b"302"),
+        (b"cache-control", b"private"),
+        (b"date", DATE_21),
+        (b"location", LOCATION),
+    ],
+    [
+        (b":status", b"307"),
+        (b"cache-control", b"private"),
+        (b"date", DATE_21),
+        (b"location", LOCATION),
+    ],
+    [
+        (b":status", b"200"),
+        (b"cache-control", b"private"),
+        (b"date", DATE_22),
+        (b"location", LOCATION),
+        (b"content-encoding", b"gzip"),
+        (b"set-cookie", COOKIE),
+    ],
+]
+
+# (dynamic table after each response: entries newest first, size)
+RESPONSE_TABLES = [
+    (
+        [
+            (b"location", LOCATION),
+            (b"date", DATE_21),
+            (b"cache-control", b"private"),
+            (b":status", b"302"),
+        ],
+        222,
+    ),
+    (
+        [
+            (b":status", b"307"),
+            (b"location", LOCATION),
+            (b"date", DATE_21),
+            (b"cache-control", b"private"),
+        ],
+        222,
+    ),
+    (
+        [
+            (b"set-cookie", COOKIE),
+            (b"content-encoding", b"gzip"),
+            (b"date", DATE_22),
+        ],
+        215,
+    ),
+]
+
+# C.5: responses without Huffman coding (table size 256)
+C5 = [
+    "4803 3330 3258 0770 7269 7661 7465 611d"
+    "4d6f 6e2c 2032 3120 4f63 7420 3230 3133"
+    "2032 303a 3133 3a32 3120 474d 546e 1768"
+    "7474 7073 3a2f 2f77 7777 2e65 7861 6d70"
+    "6c65 2e63 6f6d",
+    "4803 3330 37c1 c0bf",
+    "88c1 611d 4d6f 6e2c 2032 3120 4f63 7420"
+    "3230 3133 2032 303a 3133 3a32 3220 474d"
+    "54c0 5a04 677a 6970 7738 666f 6f3d 4153"
+    "444a 4b48 514b 425a 584f 5157 454f 5049"
+    "5541 5851 5745 4f49 553b 206d 6178 2d61"
+    "6765 3d33 3630 303b 2076 6572 7369 6f6e"
+    "3d31",
+]
+
+# C.6: responses with Huffman coding (table size 256)
+C6 = [
+    "4882 6402 5885 aec3 771a 4b61 96d0 7abe"
+    "9410 54d4 44a8 2005 9504 0b81 66e0 82a6"
+    "2d1b ff6e 919d 29ad 1718 63c7 8f0b 97c8"
+    "e9ae 82ae 43d3",
+    "4883 640e ffc1 c0bf",
+    "88c1 6196 d07a be94 1054 d444 a820 0595"
+    "040b 8166 e084 a62d 1bff c05a 839b d9ab"
+    "77ad 94e7 821d d7f2 e6c7 b335 dfdf cd5b"
+    "3960 d5af 2708 7f36 72c1 ab27 0fb5 291f"
+    "9587 3160 65c0 03ed 4ee5 b106 3d50 07",
+]
+
+
+@pytest.mark.parametrize("value, prefix, encoded", [
+    (10, 5, "0a"),  # C.1.1
+    (1337, 5, "1f9a0a"),  # C.1.2
+    (42, 8, "2a"),  # C.1.3
+])
+def test_integers(value, prefix, encoded):
+    assert encode_integer(value, prefix) == _hex(encoded)
+    assert decode_integer(_hex(encoded), 0, prefix) == (
+        value, len(_hex(encoded))
+    )
+
+
+@pytest.mark.parametrize("block, fields, table_size", [
+    (  # C.2.1: literal with indexing
+        "400a 6375 7374 6f6d 2d6b 6579 0d63 7573"
+        "746f 6d2d 6865 6164 6572",
+        [(b"custom-key", b"custom-header")],
+        55,
+    ),
+    (  # C.2.2: literal without indexing
+        "040c 2f73 616d 706c 652f 7061 7468",
+        [(b":path", b"/sample/path")],
+        0,
+    ),
+    (  # C.2.3: literal never indexed
+        "1008 7061 7373 776f 7264 0673 6563 7265 74",
+        [(b"password", b"secret")],
+        0,
+    ),
+    ("82", [(b":method", b"GET")], 0),  # C.2.4: indexed field
+])
+def test_field_representations(block, fields, table_size):
+    decoder = HPACKDecoder()
+    assert decoder.decode(_hex(block)) == fields
+    assert decoder._size == table_size
+
+
+@pytest.mark.parametrize("blocks", [C3, C4], ids=["C.3", "C.4"])
+def test_decode_requests(blocks):
+    decoder = HPACKDecoder()
+    for block, fields in zip(blocks, REQUESTS):
+        assert decoder.decode(_hex(block)) == fields
+    assert list(decoder._entries) == [
+        (b"custom-key", b"custom-value"),
+        (b"cache-control", b"no-cache"),
+        (b":authority", b"www.example.com"),
+    ]
+    assert decoder._size == 164
+
+
+@pytest.mark.parametrize("blocks", [C5, C6], ids=["C.5", "C.6"])
+def test_decode_responses_with_eviction(blocks):
+    decoder = HPACKDecoder(max_table_size=256)
+    for block, fields, (entries, size) in zip(
+        blocks, RESPONSES, RESPONSE_TABLES
+    ):
+        assert decoder.decode(_hex(block)) == fields
+        assert list(decoder._entries) == entries
+        assert decoder._size == size
+
+
+def test_encode_requests():
+    # (indexed / incrementally indexed literals, Huffman when it's shorter:
+    # the same choices as the encoder of C.4)
+    encoder = HPACKEncoder()
+    for fields, block in zip(REQUESTS, C4):
+        assert encoder.encode(fields) == _hex(block)
+
+
+def test_encoder_decoder_round_trip():
+    encoder, decoder = HPACKEncoder(table_size=256), HPACKDecoder(256)
+    for fields in RESPONSES * 3:  # (with evictions)
+        assert decoder.decode(encoder.encode(fields)) == fields
+    encoder, decoder = HPACKEncoder(), HPACKDecoder()
+    decoder.decode(encoder.encode(RESPONSES[2]))
+    block = encoder.encode(RESPONSES[2])
+    assert decoder.decode(block) == RESPONSES[2]
+    # (all but the never-indexed set-cookie from the dynamic table)
+    assert len(block) < 10 + len(COOKIE)
+
+
+def test_table_size_update_is_announced():
+    encoder, decoder = HPACKEncoder(), HPACKDecoder()
+    decoder.decode(encoder.encode(RESPONSES[0]))
+    encoder.set_table_size(0)
+    block = encoder.encode(RESPONSES[0])
+    assert block[:1] == b"\x20"
+    assert decoder.decode(block) == RESPONSES[0]
+    assert decoder._size == 0
+
+
+@pytest.mark.parametrize("data", [
+    b"", b"a", b"www.example.com", bytes(range(256)),
+])
+def test_huffman_round_trip(data):
+    assert huffman_decode(huffman_encode(data)) == data
+
+
+def test_huffman_vectors():
+    assert huffman_encode(b"www.example.com") == _hex(
+        "f1e3 c2e5 f23a 6ba0 ab90 f4ff"
+    )
+    assert huffman_decode(_hex("a8eb 1064 9cbf")) == b"no-cache"
+
+
+@pytest.mark.parametrize("block", [
+    "be",  # (index 62: dynamic table is empty)
+    "80",  # (index 0)
+    "82 3f e1 1f",  # (table size update after a field)
+    "3f e2 1f",  # (table size update above the limit: 4097)
+    "1f",  # (truncated integer)
+    "0a 85 ff",  # (truncated string)
+    "00 81 ff 81 ff",  # (Huffman padding longer than 7 bits)
+])
+def test_decode_errors(block):
+    with pytest.raises(HPACKError):
+        HPACKDecoder().decode(_hex(block))
@@ -0,0 +1,150 @@
+""" HTTPRequestParser (resumable request-head parser) & ReceiveBuffer.find
+"""
+
+import pytest
+
+from app.buffer import ReceiveBuffer
+from app.config import settings
+from app.http.errors import HTTPParseError
+from app.http.parser import HTTPParser, HTTPRequestParser
+
+
+REQUEST = (
+    b"GET /users/7?x=1 HTTP/1.1\r\n"
+    b"Host: example.com\r\n"
+    b"Accept: */*\r\n"
+    b"\r\n"
+)
+
+
+def _buffer(data: bytes = b"") -> ReceiveBuffer:
+    buffer = ReceiveBuffer(64)
+    buffer.write(data)
+    return buffer
+
+
+def _feed_in_pieces(data: bytes, step: int):
+    """ feed `data` `step` bytes at a time -> (parser, buffer, feeds) """
+    parser, buffer = HTTPRequestParser(), _buffer()
+    for feeds, i in enumerate(range(0, len(data), step), 1):
+        buffer.write(data[i:i + step])
+        if parser.feed(buffer):
+            return parser, buffer, feeds
+    return parser, buffer, None
+
+
+def test_whole_request_head_at_once():
+    parser, buffer = HTTPRequestParser(), _buffer(REQUEST)
+    assert parser.feed(buffer)
+    assert (parser.method, parser.path, parser.version) == (
+        "GET", "/users/7?x=1", "HTTP/1.1"
+    )
+    assert parser.headers.get("host") == "example.com"
+    assert parser.headers.get("ACCEPT") == "*/*"
+    assert len(buffer) == 0
+
+
+@pytest.mark.parametrize("step", [1, 2, 7, 30])
+def test_request_head_in_pieces(step):
+    parser, buffer, feeds = _feed_in_pieces(REQUEST, step)
+    assert feeds is not None
+    assert parser.path == "/users/7?x=1"
+    assert parser.headers.get("host") == "example.com"
+    assert len(buffer) == 0
+
+
+def test_not_complete_returns_false():
+    parser, buffer = HTTPRequestParser(), _buffer(REQUEST[:-2])
+    assert not parser.feed(buffer)
+    assert parser.state == HTTPRequestParser.HEADERS
+    buffer.write(b"\r\n")
+    assert parser.feed(buffer)
+
+
+def test_no_header_fields():
+    parser, buffer, _ = _feed_in_pieces(b"GET / HTTP/1.0\r\n\r\n", 3)
+    assert parser.state == HTTPRequestParser.DONE
+    assert parser.version == "HTTP/1.0"
+    assert len(parser.headers) == 0
+
+
+def test_empty_lines_before_request_line_are_ignored():
+    parser, buffer = HTTPRequestParser(), _buffer(b"\r\n\r\n" + REQUEST)
+    assert parser.feed(buffer)
+    assert parser.method == "GET"
+
+
+def test_pipelined_request_is_left_in_buffer():
+    second = b"POST /b HTTP/1.1\r\nHost: b\r\n\r\n"
+    buffer = _buffer(REQUEST + second)
+    parser = HTTPRequestParser()
+    assert parser.feed(buffer)
+    assert bytes(buffer.view()) == second
+    parser.reset()
+    assert parser.feed(buffer)
+    assert (parser.method, parser.path) == ("POST", "/b")
+    assert len(buffer) == 0
+
+
+def test_malformed_request_line():
+    parser = HTTPRequestParser()
+    with pytest.raises(HTTPParseError) as info:
+        parser.feed(_buffer(b"GET /\r\nHost: x\r\n\r\n"))
+    assert info.value.status_code == 400
+
+
+def test_request_line_too_long_before_it_is_complete():
+    parser = HTTPRequestParser()
+    line = b"GET /" + b"a" * settings.MAX_REQUEST_LINE_SIZE
+    with pytest.raises(HTTPParseError) as info:
+        parser.feed(_buffer(line))  # (no CRLF yet)
+    assert info.value.status_code == 414
+
+
+def test_header_fields_too_large_before_they_are_complete():
+    parser = HTTPRequestParser()
+    buffer = _buffer(b"GET / HTTP/1.1\r\n")
+    assert not parser.feed(buffer)
+    buffer.write(b"X-Big: " + b"a" * settings.MAX_HEADER_SIZE)
+    with pytest.raises(HTTPParseError) as info:
+        parser.feed(buffer)
+    assert info.value.status_code == 431
+
+
+def test_too_many_header_fields():
+    fields = b"".join(
+        b"X-%d: v\r\n" % i for i in range(settings.MAX_HEADERS_COUNT)
+    )
+    with pytest.raises(HTTPParseError) as info:
+        HTTPParser.parse_request_head(b"GET / HTTP/1.1\r\n" + fields)
+    assert info.value.status_code == 431
+
+
+def test_find_resumes_per_pattern():
+    buffer = _buffer(b"GET /" + b"a" * 1000)
+    assert buffer.find(b"\r\n\r\n") == -1
+    assert buffer.find(b"\r\n") == -1
+    # (the other pattern's search doesn't reset this one's position)
+    assert buffer._scan_pos[b"\r\n\r\n"] == len(buffer)
+    buffer.write(b" HTTP/1.1\r\n\r\n")
+    assert buffer.find(b"\r\n") == 1014
+    assert buffer.find(b"\r\n\r\n") == 1014
+
+
+def test_find_pattern_split_across_writes():
+    buffer = _buffer(b"abc\r\n\r")
+    assert buffer.find(b"\r\n\r\n") == -1
+    buffer.write(b"\n")
+    assert buffer.find(b"\r\n\r\n") == 3
+
+
+def test_find_after_skip_and_compaction():
+    buffer = _buffer(b"x" * 40)
+    assert buffer.find(b"\r\n") == -1
+    buffer.skip(30)
+    buffer.write(b"y" * 60 + b"\r\n")  # (compacts, then grows)
+    assert buffer.find(b"\r\n") == 70
+    buffer.skip(72)
+    assert len(buffer) == 0
+    buffer.write(b"\r\n")
+    assert buffer.find(b"\r\n") == 0
@@ -0,0 +1,104 @@
+""" token buckets of RateLimiter (burst, refill, per-IP & per-route limits,
+`429` with `Retry-After`) & the bounded TokenBucketTable
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+import app.ratelimit
+from app.config import Settings
+from app.http.headers import HTTPHeaders
+from app.http.request import HTTPRequest
+from app.ratelimit import MAX_RETRY_AFTER, RateLimiter, TokenBucketTable
+from app.routing import Route, Router
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ a fake `time.monotonic()` of app.ratelimit (advanced by tests) """
+    now = [1000.0]
+    monkeypatch.setattr(
+        app.ratelimit, "time", SimpleNamespace(monotonic=lambda: now[0])
+    )
+    return now
+
+
+def _request(method: str = "GET") -> HTTPRequest:
+    return HTTPRequest(method, "/r", "HTTP/1.1", HTTPHeaders(b""))
+
+
+def _allowed(limiter: RateLimiter, count: int, client="10.0.0.1", **kw):
+    return sum(
+        limiter.check(client, _request(), **kw) is None for _ in range(count)
+    )
+
+
+def test_burst_then_refill(clock):
+    limiter = RateLimiter(rate=10.0, burst=5)
+    assert _allowed(limiter, 8) == 5
+    clock[0] += 0.1  # (one token)
+    assert _allowed(limiter, 3) == 1
+    clock[0] += 60  # (refilled up to burst, no more)
+    assert _allowed(limiter, 8) == 5
+
+
+def test_clients_have_separate_buckets(clock):
+    limiter = RateLimiter(rate=1.0, burst=2)
+    assert _allowed(limiter, 3, "10.0.0.1") == 2
+    assert _allowed(limiter, 3, "10.0.0.2") == 2
+
+
+def test_rejection_is_429_with_retry_after(clock):
+    limiter = RateLimiter(rate=0.25, burst=1)
+    assert limiter.check("10.0.0.1", _request()) is None
+    response = limiter.check("10.0.0.1", _request())
+    assert response.status_code == 429
+    data = response.build_response()
+    assert data.startswith(b"HTTP/1.1 429")
+    assert b"retry-after: 4\r\n" in data.lower()
+    head = limiter.check("10.0.0.1", _request("HEAD")).build_response()
+    assert head.endswith(b"\r\n\r\n")
+
+
+def test_retry_after_is_bounded(clock):
+    limiter = RateLimiter(rate=0.0001, burst=1)
+    limiter.check("10.0.0.1", _request())
+    data = limiter.check("10.0.0.1", _request()).build_response()
+    assert b"retry-after: %d\r\n" % MAX_RETRY_AFTER in data.lower()
+
+
+def test_route_limit_is_per_ip_and_route(clock):
+    limiter = RateLimiter(rate=100.0, burst=100)
+    login, other = Route(None, rate_limit=(1.0, 2)), Route(None)
+    assert _allowed(limiter, 5, route=login) == 2
+    assert _allowed(limiter, 5, "10.0.0.2", route=login) == 2
+    assert _allowed(limiter, 5, route=other) == 5
+
+
+def test_route_rejection_doesnt_use_the_ip_token(clock):
+    limiter = RateLimiter(rate=1.0, burst=10)
+    login = Route(None, rate_limit=(1.0, 1))
+    assert _allowed(limiter, 10, route=login) == 1
+    # (9 route rejections left the IP bucket with 9 tokens)
+    assert _allowed(limiter, 20) == 9
+
+
+def test_table_evicts_least_recently_used_buckets():
+    table = TokenBucketTable(size=4, stripes=1)
+    for key in "abcd":
+        assert table.take(key, 1.0, 1, 0.0) == 0.0
+    assert table.take("a", 1.0, 1, 0.0) > 0  # (a is the most recent now)
+    table.take("e", 1.0, 1, 0.0)  # (evicts b)
+    assert len(table) == 4
+    assert table.take("b", 1.0, 1, 0.0) == 0.0  # (full bucket again)
+    assert table.take("a", 1.0, 1, 0.0) > 0
+
+
+def test_invalid_rates_are_rejected():
+    with pytest.raises(ValueError):
+        Settings(RATE_LIMIT_PER_IP=0.0)
+    with pytest.raises(ValueError):
+        Settings(RATE_LIMIT_BURST=0)
+    with pytest.raises(ValueError):
+        Router(16).add("GET", "/r", lambda request: None, rate_limit=(0, 5))
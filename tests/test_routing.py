@@ -0,0 +1,159 @@
+""" Router (radix tree of path segments): matching, converters, 405/HEAD,
+pattern errors & pre-body admission
+"""
+
+import pytest
+
+from app.http.headers import HTTPHeaders
+from app.http.request import HTTPRequest
+from app.http.response import HTTPResponse
+from app.routing import Router
+
+
+def _handler(name: str):
+    def handler(request, **params):
+        return HTTPResponse(body=name.encode(), mem_type="text/plain")
+    handler.__name__ = name
+    return handler
+
+
+def _request(method: str, path: str) -> HTTPRequest:
+    return HTTPRequest(method, path, "HTTP/1.1", HTTPHeaders(b""))
+
+
+@pytest.fixture
+def router() -> Router:
+    router = Router(cache_size=4)
+    router.add("GET", "/", _handler("index"))
+    router.add("GET", "/users/me", _handler("me"))
+    router.add(("GET", "PUT"), "/users/{user_id:int}", _handler("user"))
+    router.add("GET", "/users/{name}", _handler("user_by_name"))
+    router.add("GET", "/users/{user_id:int}/posts/{slug}", _handler("post"))
+    router.add("GET", "/prices/{value:float}", _handler("price"))
+    router.add("GET", "/files/{rest:path}", _handler("file"))
+    router.add("GET", "/assets/*", _handler("asset"))
+    router.add("POST", "/a/{x}/c", _handler("a_x_c"))
+    router.add("POST", "/a/b/d", _handler("a_b_d"))
+    return router
+
+
+@pytest.mark.parametrize("path, name, params", [
+    ("/", "index", {}),
+    ("/users/me", "me", {}),  # (static before params)
+    ("/users/7", "user", {"user_id": 7}),  # (int before str)
+    ("/users/bob", "user_by_name", {"name": "bob"}),
+    ("/users/7/posts/hello", "post", {"user_id": 7, "slug": "hello"}),
+    ("/prices/1.5", "price", {"value": 1.5}),
+    ("/files/a/b/c.txt", "file", {"rest": "a/b/c.txt"}),
+    ("/files/", "file", {"rest": ""}),
+    ("/files", "file", {"rest": ""}),
+    ("/assets/css/site.css", "asset", {}),
+    ("/users/7?tab=posts", "user", {"user_id": 7}),  # (query is ignored)
+])
+def test_resolve(router, path, name, params):
+    match = router.resolve("GET", path)
+    assert match.handler.__name__ == name
+    assert match.params == params
+
+
+def test_backtracking_from_static_branch(router):
+    # (`/a/b` is static, but only `/a/{x}/c` has a route for `.../c`)
+    match = router.resolve("POST", "/a/b/c")
+    assert match.handler.__name__ == "a_x_c"
+    assert match.params == {"x": "b"}
+
+
+def test_no_route(router):
+    for path in ("/nothing", "/users/7/posts", "/prices/cheap", "/users/"):
+        match = router.resolve("GET", path)
+        assert match.route is None and not match.allowed, path
+
+
+def test_int_converter_takes_ascii_digits_only(router):
+    # (-> the `str` parameter of the same position)
+    match = router.resolve("GET", "/users/\u00b2")
+    assert match.handler.__name__ == "user_by_name"
+    assert match.params == {"name": "\u00b2"}
+    assert router.resolve("GET", "/users/\u0663/posts/x").route is None
+
+
+def test_head_falls_back_to_get(router):
+    assert router.resolve("HEAD", "/users/7").handler.__name__ == "user"
+    response = router.dispatch(_request("HEAD", "/users/7"))
+    assert response.is_for_head_method
+
+
+def test_method_not_allowed(router):
+    match = router.resolve("DELETE", "/users/7")
+    assert match.route is None
+    assert match.allowed == ("GET", "HEAD", "PUT")
+    response = router.dispatch(_request("DELETE", "/users/7"))
+    assert response.status_code == 405
+    assert response.headers["allow"] == "GET, HEAD, PUT"
+    assert router.dispatch(_request("GET", "/nothing")) is None
+
+
+def test_dispatch_passes_params():
+    router = Router()
+    router.add(
+        "GET", "/sum/{a:int}/{b:int}",
+        lambda request, a, b: HTTPResponse(body=str(a + b).encode()),
+    )
+    assert router.dispatch(_request("GET", "/sum/2/3")).body == b"5"
+
+
+def test_routes_added_later_invalidate_cache(router):
+    assert router.resolve("GET", "/new").route is None
+    router.add("GET", "/new", _handler("new"))
+    assert router.resolve("GET", "/new").handler.__name__ == "new"
+
+
+def test_cache_is_bounded(router):
+    for i in range(20):
+        router.resolve("GET", f"/users/{i}")
+    assert len(router._cache) == 4
+
+
+@pytest.mark.parametrize("pattern", [
+    "/files/{rest:path}/more",
+    "/x/*/y",
+    "/users/{user_id:uuid}",
+    "/users/{1st}",
+    "/users/{id:int}",  # (conflicts with `user_id` of the same converter)
+    "/files/*",  # (conflicts with `rest` wildcard)
+])
+def test_invalid_patterns(router, pattern):
+    with pytest.raises(ValueError):
+        router.add("GET", pattern, _handler("invalid"))
+
+
+def test_duplicated_route(router):
+    with pytest.raises(ValueError):
+        router.add("put", "/users/{user_id:int}", _handler("again"))
+
+
+def test_route_decorator():
+    router = Router()
+
+    @router.route("/items/{item_id:int}", methods=("GET", "DELETE"))
+    def item(request, item_id):
+        return HTTPResponse(body=b"item")
+
+    assert router.resolve("DELETE", "/items/3").handler is item
+
+
+def test_admit():
+    rejected = HTTPResponse(status_code=403)
+    router = Router()
+    router.add("POST", "/upload", _handler("upload"), max_body_size=100)
+    router.add(
+        "POST", "/private/{name}", _handler("private"),
+        admit=lambda request, name: rejected if name == "x" else None,
+    )
+    assert router.admit(_request("POST", "/upload"), 100) is None
+    assert router.admit(_request("POST", "/upload"), None) is None
+    assert router.admit(_request("POST", "/upload"), 101).status_code == 413
+    assert router.admit(_request("GET", "/upload"), 0).status_code == 405
+    assert router.admit(_request("POST", "/private/x"), 0) is rejected
+    assert router.admit(_request("POST", "/private/y"), 0) is None
+    assert router.admit(_request("POST", "/nothing"), 0) is None
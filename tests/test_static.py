@@ -0,0 +1,79 @@
+""" StaticFilesHandler: path resolution (traversal & symlinks out of the
+root are refused) and file responses
+"""
+
+import os
+
+import pytest
+
+from app.http.headers import HTTPHeaders
+from app.http.request import HTTPRequest
+from app.static import StaticFilesHandler
+
+
+@pytest.fixture
+def handler(tmp_path):
+    root, outside = tmp_path / "root", tmp_path / "outside"
+    (root / "docs").mkdir(parents=True)
+    (root / "linked").mkdir()
+    outside.mkdir()
+    (root / "index.html").write_bytes(b"<h1>home</h1>")
+    (root / "docs" / "a.txt").write_bytes(b"hello")
+    (root / "docs" / "index.html").write_bytes(b"<h1>docs</h1>")
+    (outside / "secret.txt").write_bytes(b"secret")
+    (outside / "index.html").write_bytes(b"secret page")
+    os.symlink(outside / "secret.txt", root / "secret.txt")
+    os.symlink(outside / "index.html", root / "linked" / "index.html")
+    os.symlink(root / "docs" / "a.txt", root / "alias.txt")
+    return StaticFilesHandler(str(root), "/static")
+
+
+def _get(handler, path: str, method: str = "GET"):
+    request = HTTPRequest(method, path, "HTTP/1.1", HTTPHeaders(b""))
+    response = handler.handle(request)
+    body = b""
+    if response.file_body is not None:
+        file_body = response.file_body
+        body = os.pread(file_body.fd, file_body.count, file_body.offset)
+        file_body.close()
+    return response, body
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/static/docs/a.txt", b"hello"),
+    ("/static/docs/a.txt?v=2", b"hello"),
+    ("/static/docs%2Fa.txt", b"hello"),
+    ("/static/", b"<h1>home</h1>"),
+    ("/static/docs/", b"<h1>docs</h1>"),
+    ("/static/docs", b"<h1>docs</h1>"),
+    ("/static/alias.txt", b"hello"),  # (symlink inside the root)
+])
+def test_serves_files(handler, path, body):
+    response, received = _get(handler, path)
+    assert response.status_code == 200
+    assert received == body
+
+
+@pytest.mark.parametrize("path", [
+    "/static/../outside/secret.txt",
+    "/static/%2e%2e/outside/secret.txt",
+    "/static/docs/..%5c..%5coutside/secret.txt",
+    "/static/docs/a.txt%00.png",
+    "/static/secret.txt",  # (symlink out of the root)
+    "/static/linked/",  # (its `index.html` is a symlink out of the root)
+    "/static/linked",
+    "/static/missing.txt",
+])
+def test_refuses_paths_out_of_root(handler, path):
+    response, body = _get(handler, path)
+    assert response.status_code == 404
+    assert b"secret" not in body
+
+
+def test_head_and_methods(handler):
+    response, body = _get(handler, "/static/docs/a.txt", "HEAD")
+    assert response.is_for_head_method
+    assert response.headers["content-length"] == "5"
+    response, _ = _get(handler, "/static/docs/a.txt", "POST")
+    assert response.status_code == 405
+    assert response.headers["allow"] == "GET, HEAD"
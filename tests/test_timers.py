@@ -0,0 +1,159 @@
+""" TimerWheel (firing, cancellation, timers beyond one turn),
+ConnectionDeadlines & KeepAlivePolicy (8 requests / 10s while idle)
+"""
+
+import socket
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import app.timers
+from app.config import settings
+from app.connection import ConnectionHandler
+from app.timers import ConnectionDeadlines, KeepAlivePolicy, TimerWheel
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ a fake `time.monotonic()` of app.timers """
+    now = [1000.0]
+    monkeypatch.setattr(
+        app.timers, "time", SimpleNamespace(monotonic=lambda: now[0])
+    )
+    return now
+
+
+def _policy(load: float = 0.0) -> KeepAlivePolicy:
+    return KeepAlivePolicy(
+        lambda: load,
+        settings.KEEPALIVE_TIMEOUT,
+        settings.KEEPALIVE_TIMEOUT_MIN,
+        settings.MAX_REQUESTS_PER_CONNECTION,
+        settings.MAX_REQUESTS_PER_CONNECTION_MIN,
+        settings.KEEPALIVE_LOW_WATERMARK,
+    )
+
+
+def test_timer_fires_at_its_deadline_never_early(clock):
+    wheel, fired = TimerWheel(0.1, 16), []
+    wheel.schedule(0.35, fired.append, "a")
+    assert len(wheel) == 1
+    wheel.advance(clock[0] + 0.3)
+    assert fired == []
+    wheel.advance(clock[0] + 0.4)  # (at most one tick late)
+    assert fired == ["a"]
+    assert len(wheel) == 0
+    wheel.advance(clock[0] + 10)
+    assert fired == ["a"]
+
+
+def test_cancelled_timer_never_fires(clock):
+    wheel, fired = TimerWheel(0.1, 16), []
+    timer = wheel.schedule(0.2, fired.append, "a")
+    wheel.schedule(0.2, fired.append, "b")
+    timer.cancel()
+    timer.cancel()  # (no-op)
+    assert len(wheel) == 1
+    wheel.advance(clock[0] + 1)
+    assert fired == ["b"]
+    timer.cancel()  # (after the others have fired)
+    assert len(wheel) == 0
+
+
+def test_timers_beyond_one_turn_of_the_wheel(clock):
+    wheel, fired = TimerWheel(0.1, 8), []  # (one turn = 0.8s)
+    wheel.schedule(0.5, fired.append, "near")
+    wheel.schedule(2.05, fired.append, "far")  # (same slot as "near")
+    wheel.advance(clock[0] + 0.6)
+    assert fired == ["near"]
+    wheel.advance(clock[0] + 1.6)
+    assert fired == ["near"]
+    wheel.advance(clock[0] + 2.2)
+    assert fired == ["near", "far"]
+
+
+def test_advance_after_a_long_pause(clock):
+    wheel, fired = TimerWheel(0.1, 8), []
+    for delay in (0.1, 0.5, 3.0, 30.0):
+        wheel.schedule(delay, fired.append, delay)
+    wheel.advance(clock[0] + 100)
+    assert sorted(fired) == [0.1, 0.5, 3.0, 30.0]
+
+
+def test_callback_errors_dont_stop_the_wheel(clock):
+    wheel, fired = TimerWheel(0.1, 16), []
+    wheel.schedule(0.1, lambda: 1 / 0)
+    wheel.schedule(0.1, fired.append, "ok")
+    wheel.advance(clock[0] + 1)
+    assert fired == ["ok"]
+
+
+def test_background_thread_advances_the_wheel():
+    wheel, fired = TimerWheel(0.01, 16), threading.Event()
+    wheel.start()
+    try:
+        wheel.schedule(0.02, fired.set)
+        assert fired.wait(2)
+    finally:
+        wheel.stop()
+
+
+def test_phases_replace_each_other(clock):
+    wheel, expired = TimerWheel(0.1, 64), []
+    deadlines = ConnectionDeadlines(wheel, expired.append)
+    deadlines.phase("idle", 1.0)
+    deadlines.phase("header", 2.0)  # (replaces idle)
+    deadlines.start_request(3.0)  # (runs alongside)
+    wheel.advance(clock[0] + 1.5)
+    assert expired == []
+    wheel.advance(clock[0] + 2.5)
+    assert expired == ["header"]
+    deadlines.phase("body", None)  # (no timeout -> no deadline)
+    deadlines.end_request()
+    wheel.advance(clock[0] + 10)
+    assert expired == ["header"]
+    assert len(wheel) == 0
+
+
+def test_idle_keepalive_deadline_is_ten_seconds_when_idle(clock):
+    wheel, expired = TimerWheel(0.1, 512), []
+    deadlines = ConnectionDeadlines(wheel, expired.append)
+    deadlines.phase("idle", _policy().keepalive_timeout())
+    wheel.advance(clock[0] + 9.9)
+    assert expired == []
+    wheel.advance(clock[0] + 10.1)
+    assert expired == ["idle"]
+
+
+@pytest.mark.parametrize("load, timeout, max_requests", [
+    (0.0, 10.0, 8),
+    (0.5, 10.0, 8),  # (up to the low-watermark)
+    (0.75, 5.25, 6),
+    (1.0, 0.5, 4),
+    (3.0, 0.5, 4),
+])
+def test_keepalive_policy_by_load(load, timeout, max_requests):
+    policy = _policy(load)
+    assert policy.keepalive_timeout() == pytest.approx(timeout)
+    assert policy.max_requests() == max_requests
+
+
+def test_connection_is_closed_after_max_requests():
+    server, client = socket.socketpair()
+    handler = ConnectionHandler(
+        server, ("127.0.0.1", 1), 5.0, TimerWheel(), _policy()
+    )
+    request = b"GET /nope HTTP/1.1\r\nHost: x\r\n\r\n"
+    client.sendall(request * 10)
+    thread = threading.Thread(target=handler.handle_connection)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    server.close()  # (as the server does when the handler returns)
+    client.settimeout(5)
+    received = b""
+    while chunk := client.recv(65536):
+        received += chunk
+    client.close()
+    assert received.count(b"HTTP/1.1 ") == 8
@@ -0,0 +1,134 @@
+""" TLS termination (with a self-signed certificate, made by `openssl`):
+handshake, ALPN selection (h2 / http/1.1), requests over TLS and
+close_notify on shutdown
+"""
+
+import shutil
+import socket
+import ssl
+import subprocess
+import threading
+
+import pytest
+
+from app.connection import ConnectionHandler
+from app.timers import KeepAlivePolicy, TimerWheel
+from app.tls import (
+    alpn_protocol, alpn_protocols, close_socket, create_server_context,
+    handshake,
+)
+
+
+@pytest.fixture(scope="module")
+def context(tmp_path_factory) -> ssl.SSLContext:
+    """ server context of a self-signed certificate (ECDSA P-256) """
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl isn't available")
+    directory = tmp_path_factory.mktemp("tls")
+    certfile, keyfile = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "ec",
+         "-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes",
+         "-keyout", str(keyfile), "-out", str(certfile), "-days", "1",
+         "-subj", "/CN=localhost"],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return create_server_context(str(certfile), str(keyfile))
+
+
+def _client_context(protocols: list[str]) -> ssl.SSLContext:
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE  # (self-signed)
+    context.set_alpn_protocols(protocols)
+    return context
+
+
+def _connect(context: ssl.SSLContext, protocols: list[str]):
+    """ handshake over a socketpair -> (server's SSLSocket, client's) """
+    server, client = socket.socketpair()
+    result = {}
+
+    def accept():
+        try:
+            result["server"] = handshake(context, server, 5.0)
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=accept)
+    thread.start()
+    client.settimeout(5)
+    tls_client = _client_context(protocols).wrap_socket(
+        client, server_hostname="localhost", suppress_ragged_eofs=False
+    )
+    thread.join(5)
+    if "error" in result:
+        raise result["error"]
+    return result["server"], tls_client
+
+
+def test_no_certificate_no_context():
+    assert create_server_context() is None  # (TLS_CERTFILE isn't set)
+
+
+def test_alpn_prefers_h2(context):
+    assert alpn_protocols() == ["h2", "http/1.1"]
+    server, client = _connect(context, ["http/1.1", "h2"])
+    with server, client:
+        assert alpn_protocol(server) == "h2"
+        assert client.selected_alpn_protocol() == "h2"
+        assert server.version() in ("TLSv1.2", "TLSv1.3")
+
+
+def test_alpn_http11_only_client(context):
+    server, client = _connect(context, ["http/1.1"])
+    with server, client:
+        assert alpn_protocol(server) == "http/1.1"
+
+
+def test_alpn_of_plain_sockets():
+    server, client = socket.socketpair()
+    with server, client:
+        assert alpn_protocol(server) is None
+
+
+def test_failed_handshake_raises(context):
+    server, client = socket.socketpair()
+    with client:
+        client.sendall(b"GET / HTTP/1.1\r\n\r\n")  # (not a ClientHello)
+        with pytest.raises(ssl.SSLError):
+            handshake(context, server, 5.0)
+    assert server.fileno() == -1
+
+
+def test_close_sends_close_notify(context):
+    server, client = _connect(context, ["http/1.1"])
+    with client:
+        server.sendall(b"bye")
+        close_socket(server)
+        assert client.recv(16) == b"bye"
+        # (a clean TLS EOF: without close_notify this raises SSLEOFError)
+        assert client.recv(16) == b""
+
+
+def test_request_over_tls(context):
+    server, client = _connect(context, ["http/1.1"])
+    policy = KeepAlivePolicy(lambda: 0.0, 5.0, 1.0, 100, 100)
+    handler = ConnectionHandler(
+        server, ("127.0.0.1", 1), 5.0, TimerWheel(), policy
+    )
+    thread = threading.Thread(target=handler.handle_connection)
+    thread.start()
+    with client:
+        client.sendall(
+            b"GET /tls HTTP/1.1\r\nHost: x\r\n\r\n"
+            b"GET /tls HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n"
+        )
+        thread.join(5)
+        assert not thread.is_alive()
+        close_socket(server)  # (as the server does)
+        received = b""
+        while chunk := client.recv(65536):
+            received += chunk
+    assert received.startswith(b"HTTP/1.1 200")
+    assert received.count(b"HTTP/1.1 200") == 2
@@ -0,0 +1,254 @@
+""" WSGIAdapter: environ (lazy `HTTP_*`), start_response (exc_info),
+in-memory / streamed / file responses, close() of iterables & FLUSH
+"""
+
+import sys
+import tempfile
+
+import pytest
+
+from app.http.headers import HTTPHeaders
+from app.http.request import HTTPRequest
+from app.http.streaming import FLUSH
+from app.wsgi import FileWrapper, WSGIAdapter, WSGIInput
+
+
+def _request(
+    path: str = "/app/p", method: str = "GET", body: bytes = b"", **fields
+) -> HTTPRequest:
+    raw = "".join(
+        f"{name.replace('_', '-')}: {value}\r\n"
+        for name, value in fields.items()
+    )
+    request = HTTPRequest(
+        method, path, "HTTP/1.1", HTTPHeaders(raw.encode("latin-1")), body
+    )
+    request.client = ("10.0.0.1", 5555)
+    return request
+
+
+class _Iterable:
+    """ a WSGI result iterable which records close() """
+
+    def __init__(self, chunks, start=None):
+        self.chunks = chunks
+        self.start = start  # (-> start_response() on the first iteration)
+        self.closed = False
+
+    def __iter__(self):
+        if self.start is not None:
+            self.start("200 OK", [("Content-Type", "text/plain")])
+        yield from self.chunks
+
+    def close(self):
+        self.closed = True
+
+
+def _app(status="200 OK", headers=(), result=(b"ok",)):
+    def app(environ, start_response):
+        start_response(status, list(headers))
+        return result
+    return app
+
+
+def test_environ():
+    adapter = WSGIAdapter(_app(), "/app/")
+    environ = adapter.environ(_request(
+        "/app/a%20b%E9?x=1&y=2", "post", b"data",
+        content_type="text/plain", content_length="4",
+        x_custom="1", cookie="a=1",
+    ))
+    assert environ["REQUEST_METHOD"] == "POST"
+    assert environ["SCRIPT_NAME"] == "/app"
+    assert environ["PATH_INFO"] == "/a b\xe9"  # (latin-1 `str`)
+    assert environ["QUERY_STRING"] == "x=1&y=2"
+    assert environ["RAW_URI"] == "/app/a%20b%E9?x=1&y=2"
+    assert environ["SERVER_PROTOCOL"] == "HTTP/1.1"
+    assert (environ["REMOTE_ADDR"], environ["REMOTE_PORT"]) == (
+        "10.0.0.1", "5555"
+    )
+    assert environ["CONTENT_TYPE"] == "text/plain"
+    assert environ["CONTENT_LENGTH"] == "4"
+    assert environ["wsgi.version"] == (1, 0)
+    assert environ["wsgi.input"].read() == b"data"
+    assert environ["wsgi.file_wrapper"] is FileWrapper
+
+
+def test_environ_resolves_http_variables_lazily():
+    environ = WSGIAdapter(_app()).environ(_request(
+        x_custom="1", accept="text/html", content_type="text/plain",
+    ))
+    assert not dict.__contains__(environ, "HTTP_X_CUSTOM")
+    assert environ["HTTP_X_CUSTOM"] == "1"
+    assert environ.get("HTTP_ACCEPT") == "text/html"
+    assert "HTTP_MISSING" not in environ
+    assert environ.get("HTTP_MISSING", "-") == "-"
+    with pytest.raises(KeyError):
+        environ["HTTP_MISSING"]
+    assert "HTTP_CONTENT_TYPE" not in environ  # (only `CONTENT_TYPE`)
+    keys = set(environ)  # (iteration loads all of them)
+    assert {"HTTP_X_CUSTOM", "HTTP_ACCEPT"} <= keys
+    assert "HTTP_CONTENT_TYPE" not in keys
+
+
+def test_environ_joins_repeated_fields_and_skips_underscores():
+    request = HTTPRequest("GET", "/", "HTTP/1.1", HTTPHeaders(
+        b"Cookie: a=1\r\nCookie: b=2\r\nX-A: 1\r\nX-A: 2\r\nX_B: 3\r\n"
+    ))
+    environ = WSGIAdapter(_app()).environ(request)
+    assert environ["HTTP_COOKIE"] == "a=1; b=2"
+    assert environ["HTTP_X_A"] == "1, 2"
+    assert "HTTP_X_B" not in dict(environ)
+
+
+def test_mount_point():
+    adapter = WSGIAdapter(_app(), "/app")
+    assert adapter.matches("/app") and adapter.matches("/app/x?y=1")
+    assert not adapter.matches("/application")
+    assert WSGIAdapter(_app()).matches("/anything")
+
+
+def test_wsgi_input_lines():
+    class Stream:
+        def __init__(self, data):
+            self.data = data
+
+        def read(self, size=-1):
+            size = len(self.data) if size < 0 else min(size, 3)
+            data, self.data = self.data[:size], self.data[size:]
+            return data
+
+    wsgi_input = WSGIInput(Stream(b"one\ntwo\nthree"))
+    assert wsgi_input.readline() == b"one\n"
+    assert wsgi_input.readline(2) == b"tw"
+    assert wsgi_input.read(3) == b"o\nt"
+    assert list(wsgi_input) == [b"hree"]
+    assert WSGIInput(Stream(b"a\nb\n")).readlines() == [b"a\n", b"b\n"]
+
+
+def test_in_memory_response_and_hop_by_hop_headers():
+    response = WSGIAdapter(_app("201 Created", [
+        ("Content-Type", "text/plain"), ("Connection", "close"),
+        ("Set-Cookie", "a=1"), ("Set-Cookie", "b=2"),
+    ], [b"hello, ", b"world"]))(_request())
+    assert response.status_code == 201
+    assert "connection" not in response.headers
+    assert response.headers["set-cookie"] == ["a=1", "b=2"]
+    assert response.body_parts == [b"hello, ", b"world"]
+    assert not response.chunked and response.iter_body is None
+
+
+def test_start_response_with_exc_info_before_headers_are_sent():
+    def app(environ, start_response):
+        start_response("200 OK", [("X-A", "1")])
+        try:
+            raise ValueError("oops")
+        except ValueError:
+            start_response(
+                "500 Internal Server Error", [("X-B", "1")], sys.exc_info()
+            )
+        return [b"error"]
+
+    response = WSGIAdapter(app)(_request())
+    assert response.status_code == 500
+    assert "x-a" not in response.headers and response.headers["x-b"] == "1"
+
+
+def test_start_response_with_exc_info_after_headers_are_sent():
+    result = []
+
+    def app(environ, start_response):
+        start_response("200 OK", [])
+
+        def body():
+            yield b"first"
+            try:
+                raise ValueError("late")
+            except ValueError:
+                start_response("500 Oops", [], sys.exc_info())
+            yield b"never"
+
+        result.append(body())
+        return result[0]
+
+    response = WSGIAdapter(app)(_request())
+    assert response.status_code == 200
+    with pytest.raises(ValueError, match="late"):
+        list(response.iter_body())
+
+
+def test_start_response_twice_without_exc_info():
+    def app(environ, start_response):
+        start_response("200 OK", [])
+        start_response("200 OK", [])
+        return []
+
+    with pytest.raises(RuntimeError):
+        WSGIAdapter(app)(_request())
+
+
+def test_streamed_iterable_is_flushed_and_closed():
+    result = _Iterable([b"a", b"", b"b"])
+    response = WSGIAdapter(_app(result=result))(_request())
+    assert response.chunked and response.length is None
+    assert not result.closed  # (consumed while the response is sent)
+    assert list(response.iter_body()) == [b"a", FLUSH, b"b", FLUSH]
+    assert result.closed
+
+
+def test_start_response_on_the_first_iteration():
+    def app(environ, start_response):
+        return _Iterable([b"lazy"], start_response)
+
+    response = WSGIAdapter(app)(_request())
+    assert response.status_code == 200
+    assert list(response.iter_body()) == [b"lazy", FLUSH]
+
+
+def test_streamed_body_with_content_length():
+    result = _Iterable([b"abc", b"defgh"])
+    response = WSGIAdapter(
+        _app(headers=[("Content-Length", "5")], result=result)
+    )(_request())
+    assert not response.chunked and response.length == 5
+    assert b"".join(
+        chunk for chunk in response.iter_body() if chunk is not FLUSH
+    ) == b"abcde"
+    assert result.closed
+
+    result = _Iterable([b"abc", b"d"])
+    response = WSGIAdapter(
+        _app(headers=[("Content-Length", "10")], result=result)
+    )(_request())
+    with pytest.raises(ValueError):  # (short body)
+        list(response.iter_body())
+    assert result.closed
+
+
+def test_head_and_errors_close_the_iterable():
+    result = _Iterable([b"a", b"b"])
+    response = WSGIAdapter(_app(result=result))(_request(method="HEAD"))
+    assert result.closed and response.is_for_head_method
+
+    def app(environ, start_response):  # (start_response() is never called)
+        return result
+
+    result = _Iterable([b"a"])
+    with pytest.raises(RuntimeError):
+        WSGIAdapter(app)(_request())
+    assert result.closed
+
+
+def test_file_wrapper_of_a_regular_file_is_sent_by_sendfile():
+    with tempfile.TemporaryFile() as file:
+        file.write(b"0123456789")
+        file.seek(2)
+
+        def app(environ, start_response):
+            start_response("200 OK", [("Content-Length", "5")])
+            return environ["wsgi.file_wrapper"](file)
+
+        response = WSGIAdapter(app)(_request())
+        body = response.file_body
+        assert (body.offset, body.count) == (2, 5)
+        assert response.iter_body is None